@@ -0,0 +1,40 @@
+-- Script for adding change tracking of deleted courses and of section and
+-- lab changes to an existing CourseRegistration database (created prior to
+-- the triggers being added to CreateDatabase.sql). Must be run after
+-- AddSeatVersions.sql. Not needed for databases created with the current
+-- CreateDatabase.sql.
+
+USE CourseRegistration;
+
+
+-- Create change tracking triggers. For Section/Lab rows, ParentID is the
+-- CourseID
+CREATE TRIGGER CourseDeleteLog AFTER DELETE ON Course FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID)
+	VALUES ('Course', 'DELETE', OLD.ID);
+CREATE TRIGGER SectionInsertLog AFTER INSERT ON Section FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID)
+	VALUES ('Section', 'INSERT', NEW.ID, NEW.CourseID);
+-- Seat claims and releases only change Enrolled and Version, so are not
+-- logged as section/lab updates
+CREATE TRIGGER SectionUpdateLog AFTER UPDATE ON Section FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID)
+	SELECT 'Section', 'UPDATE', NEW.ID, NEW.CourseID FROM DUAL
+	WHERE NOT (NEW.CourseID <=> OLD.CourseID AND NEW.Number <=> OLD.Number
+		AND NEW.MaxRegistration <=> OLD.MaxRegistration
+		AND NEW.Time <=> OLD.Time AND NEW.Day <=> OLD.Day);
+CREATE TRIGGER SectionDeleteLog AFTER DELETE ON Section FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID)
+	VALUES ('Section', 'DELETE', OLD.ID, OLD.CourseID);
+CREATE TRIGGER LabInsertLog AFTER INSERT ON Lab FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID)
+	VALUES ('Lab', 'INSERT', NEW.ID, NEW.CourseID);
+CREATE TRIGGER LabUpdateLog AFTER UPDATE ON Lab FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID)
+	SELECT 'Lab', 'UPDATE', NEW.ID, NEW.CourseID FROM DUAL
+	WHERE NOT (NEW.CourseID <=> OLD.CourseID AND NEW.Number <=> OLD.Number
+		AND NEW.MaxRegistration <=> OLD.MaxRegistration
+		AND NEW.Time <=> OLD.Time AND NEW.Day <=> OLD.Day);
+CREATE TRIGGER LabDeleteLog AFTER DELETE ON Lab FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID)
+	VALUES ('Lab', 'DELETE', OLD.ID, OLD.CourseID);
\ No newline at end of file
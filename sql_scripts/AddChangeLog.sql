@@ -0,0 +1,59 @@
+-- Script for adding change tracking to an existing CourseRegistration
+-- database (created prior to the ChangeLog table being added to
+-- CreateDatabase.sql). Not needed for databases created with the current
+-- CreateDatabase.sql.
+
+USE CourseRegistration;
+
+
+-- Create ChangeLog Table. Populated by the triggers below so that other
+-- processes can pick up changes incrementally. For SectionStudent/LabStudent
+-- /Grade rows, ParentID is the SectionID/LabID. Entries which every process
+-- has synced past may be deleted periodically.
+CREATE TABLE ChangeLog(
+	ID INT NOT NULL AUTO_INCREMENT PRIMARY KEY
+	,TableName VARCHAR(30) NOT NULL
+	,Operation VARCHAR(10) NOT NULL
+	,RowID INT NOT NULL
+	,ParentID INT
+	,StudentID INT
+	,ChangedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create change tracking triggers
+CREATE TRIGGER CourseInsertLog AFTER INSERT ON Course FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID)
+	VALUES ('Course', 'INSERT', NEW.ID);
+CREATE TRIGGER CourseUpdateLog AFTER UPDATE ON Course FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID)
+	VALUES ('Course', 'UPDATE', NEW.ID);
+CREATE TRIGGER SectionStudentInsertLog AFTER INSERT ON SectionStudent
+	FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('SectionStudent', 'INSERT', NEW.ID, NEW.SectionID, NEW.StudentID);
+CREATE TRIGGER SectionStudentUpdateLog AFTER UPDATE ON SectionStudent
+	FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('SectionStudent', 'UPDATE', NEW.ID, NEW.SectionID, NEW.StudentID);
+CREATE TRIGGER SectionStudentDeleteLog AFTER DELETE ON SectionStudent
+	FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('SectionStudent', 'DELETE', OLD.ID, OLD.SectionID, OLD.StudentID);
+CREATE TRIGGER LabStudentInsertLog AFTER INSERT ON LabStudent FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('LabStudent', 'INSERT', NEW.ID, NEW.LabID, NEW.StudentID);
+CREATE TRIGGER LabStudentUpdateLog AFTER UPDATE ON LabStudent FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('LabStudent', 'UPDATE', NEW.ID, NEW.LabID, NEW.StudentID);
+CREATE TRIGGER LabStudentDeleteLog AFTER DELETE ON LabStudent FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('LabStudent', 'DELETE', OLD.ID, OLD.LabID, OLD.StudentID);
+CREATE TRIGGER GradeInsertLog AFTER INSERT ON Grade FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('Grade', 'INSERT', NEW.ID, NEW.SectionID, NEW.StudentID);
+CREATE TRIGGER GradeUpdateLog AFTER UPDATE ON Grade FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('Grade', 'UPDATE', NEW.ID, NEW.SectionID, NEW.StudentID);
+CREATE TRIGGER GradeDeleteLog AFTER DELETE ON Grade FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('Grade', 'DELETE', OLD.ID, OLD.SectionID, OLD.StudentID);
\ No newline at end of file
@@ -0,0 +1,24 @@
+-- Script for adding enrollment counts and row versions to sections and labs
+-- of an existing CourseRegistration database (created prior to the columns
+-- being added to CreateDatabase.sql). Must be run after AddWaitlist.sql. Not
+-- needed for databases created with the current CreateDatabase.sql.
+
+USE CourseRegistration;
+
+
+-- Add Enrolled (number of registrations) and Version (incremented whenever
+-- Enrolled changes) columns. Seats are claimed with a conditional update on
+-- both, so that processes with a stale copy of a section/lab cannot
+-- over-register it
+ALTER TABLE Section
+	ADD COLUMN Enrolled INT NOT NULL DEFAULT 0
+	,ADD COLUMN Version INT NOT NULL DEFAULT 0;
+ALTER TABLE Lab
+	ADD COLUMN Enrolled INT NOT NULL DEFAULT 0
+	,ADD COLUMN Version INT NOT NULL DEFAULT 0;
+
+-- Set enrollment counts from existing registrations
+UPDATE Section SET Enrolled = (SELECT COUNT(*) FROM SectionStudent ss
+	WHERE ss.SectionID = Section.ID);
+UPDATE Lab SET Enrolled = (SELECT COUNT(*) FROM LabStudent ls
+	WHERE ls.LabID = Lab.ID);
\ No newline at end of file
@@ -0,0 +1,44 @@
+-- Script for adding waitlists to an existing CourseRegistration database
+-- (created prior to the waitlist tables being added to CreateDatabase.sql).
+-- Must be run after AddChangeLog.sql. Not needed for databases created with
+-- the current CreateDatabase.sql.
+
+USE CourseRegistration;
+
+
+-- Create SectionWaitlist Table. Students are promoted in order of highest
+-- Priority, then lowest ID (i.e. first come first served)
+CREATE TABLE SectionWaitlist(
+	ID INT NOT NULL AUTO_INCREMENT PRIMARY KEY
+	,SectionID INT NOT NULL
+	,StudentID INT NOT NULL
+	,Priority INT NOT NULL DEFAULT 0
+	,FOREIGN KEY (SectionID) REFERENCES Section(ID)
+	,FOREIGN KEY (StudentID) REFERENCES Student(ID)
+);
+
+-- Create LabWaitlist Table
+CREATE TABLE LabWaitlist(
+	ID INT NOT NULL AUTO_INCREMENT PRIMARY KEY
+	,LabID INT NOT NULL
+	,StudentID INT NOT NULL
+	,Priority INT NOT NULL DEFAULT 0
+	,FOREIGN KEY (LabID) REFERENCES Lab(ID)
+	,FOREIGN KEY (StudentID) REFERENCES Student(ID)
+);
+
+-- Create change tracking triggers
+CREATE TRIGGER SectionWaitlistInsertLog AFTER INSERT ON SectionWaitlist
+	FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('SectionWaitlist', 'INSERT', NEW.ID, NEW.SectionID, NEW.StudentID);
+CREATE TRIGGER SectionWaitlistDeleteLog AFTER DELETE ON SectionWaitlist
+	FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('SectionWaitlist', 'DELETE', OLD.ID, OLD.SectionID, OLD.StudentID);
+CREATE TRIGGER LabWaitlistInsertLog AFTER INSERT ON LabWaitlist FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('LabWaitlist', 'INSERT', NEW.ID, NEW.LabID, NEW.StudentID);
+CREATE TRIGGER LabWaitlistDeleteLog AFTER DELETE ON LabWaitlist FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('LabWaitlist', 'DELETE', OLD.ID, OLD.LabID, OLD.StudentID);
\ No newline at end of file
@@ -5,6 +5,9 @@ CREATE DATABASE IF NOT EXISTS CourseRegistration;
 USE CourseRegistration;
 
 /*
+DROP TABLE IF EXISTS ChangeLog;
+DROP TABLE IF EXISTS SectionWaitlist;
+DROP TABLE IF EXISTS LabWaitlist;
 DROP TABLE IF EXISTS SectionStudent;
 DROP TABLE IF EXISTS LabStudent;
 DROP TABLE IF EXISTS Grade;
@@ -54,7 +57,10 @@ CREATE TABLE Course(
 	,FOREIGN KEY (InstructorID) REFERENCES Instructor(ID)
 );
 
--- Create Section Table
+-- Create Section Table. Enrolled counts the registrations in the section, and
+-- Version is incremented whenever Enrolled changes. Seats are claimed with a
+-- conditional update on both, so that processes with a stale copy of the
+-- section cannot over-register it
 CREATE TABLE Section(
 	ID INT NOT NULL AUTO_INCREMENT PRIMARY KEY
 	,CourseID INT
@@ -62,6 +68,8 @@ CREATE TABLE Section(
 	,MaxRegistration INT
 	,Time VARCHAR(30)
 	,Day VARCHAR(30)
+	,Enrolled INT NOT NULL DEFAULT 0
+	,Version INT NOT NULL DEFAULT 0
 	,FOREIGN KEY (CourseID) REFERENCES Course(ID)
 );
 
@@ -73,6 +81,8 @@ CREATE TABLE Lab(
 	,MaxRegistration INT
 	,Time VARCHAR(30)
 	,Day VARCHAR(30)
+	,Enrolled INT NOT NULL DEFAULT 0
+	,Version INT NOT NULL DEFAULT 0
 	,FOREIGN KEY (CourseID) REFERENCES Course(ID)
 );
 
@@ -104,4 +114,121 @@ CREATE TABLE Grade(
 	,Grade INT
 	,FOREIGN KEY (SectionID) REFERENCES Section(ID)
 	,FOREIGN KEY (StudentID) REFERENCES Student(ID)
-);
\ No newline at end of file
+);
+
+-- Create SectionWaitlist Table. Students are promoted in order of highest
+-- Priority, then lowest ID (i.e. first come first served)
+CREATE TABLE SectionWaitlist(
+	ID INT NOT NULL AUTO_INCREMENT PRIMARY KEY
+	,SectionID INT NOT NULL
+	,StudentID INT NOT NULL
+	,Priority INT NOT NULL DEFAULT 0
+	,FOREIGN KEY (SectionID) REFERENCES Section(ID)
+	,FOREIGN KEY (StudentID) REFERENCES Student(ID)
+);
+
+-- Create LabWaitlist Table
+CREATE TABLE LabWaitlist(
+	ID INT NOT NULL AUTO_INCREMENT PRIMARY KEY
+	,LabID INT NOT NULL
+	,StudentID INT NOT NULL
+	,Priority INT NOT NULL DEFAULT 0
+	,FOREIGN KEY (LabID) REFERENCES Lab(ID)
+	,FOREIGN KEY (StudentID) REFERENCES Student(ID)
+);
+
+-- Create ChangeLog Table. Populated by the triggers below so that other
+-- processes can pick up changes incrementally. For Section/Lab rows, ParentID
+-- is the CourseID, and for SectionStudent/LabStudent/Grade/SectionWaitlist/
+-- LabWaitlist rows, the SectionID/LabID. Entries which every process has
+-- synced past may be deleted periodically.
+CREATE TABLE ChangeLog(
+	ID INT NOT NULL AUTO_INCREMENT PRIMARY KEY
+	,TableName VARCHAR(30) NOT NULL
+	,Operation VARCHAR(10) NOT NULL
+	,RowID INT NOT NULL
+	,ParentID INT
+	,StudentID INT
+	,ChangedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create change tracking triggers
+CREATE TRIGGER CourseInsertLog AFTER INSERT ON Course FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID)
+	VALUES ('Course', 'INSERT', NEW.ID);
+CREATE TRIGGER CourseUpdateLog AFTER UPDATE ON Course FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID)
+	VALUES ('Course', 'UPDATE', NEW.ID);
+CREATE TRIGGER CourseDeleteLog AFTER DELETE ON Course FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID)
+	VALUES ('Course', 'DELETE', OLD.ID);
+CREATE TRIGGER SectionInsertLog AFTER INSERT ON Section FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID)
+	VALUES ('Section', 'INSERT', NEW.ID, NEW.CourseID);
+-- Seat claims and releases only change Enrolled and Version, so are not
+-- logged as section/lab updates
+CREATE TRIGGER SectionUpdateLog AFTER UPDATE ON Section FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID)
+	SELECT 'Section', 'UPDATE', NEW.ID, NEW.CourseID FROM DUAL
+	WHERE NOT (NEW.CourseID <=> OLD.CourseID AND NEW.Number <=> OLD.Number
+		AND NEW.MaxRegistration <=> OLD.MaxRegistration
+		AND NEW.Time <=> OLD.Time AND NEW.Day <=> OLD.Day);
+CREATE TRIGGER SectionDeleteLog AFTER DELETE ON Section FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID)
+	VALUES ('Section', 'DELETE', OLD.ID, OLD.CourseID);
+CREATE TRIGGER LabInsertLog AFTER INSERT ON Lab FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID)
+	VALUES ('Lab', 'INSERT', NEW.ID, NEW.CourseID);
+CREATE TRIGGER LabUpdateLog AFTER UPDATE ON Lab FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID)
+	SELECT 'Lab', 'UPDATE', NEW.ID, NEW.CourseID FROM DUAL
+	WHERE NOT (NEW.CourseID <=> OLD.CourseID AND NEW.Number <=> OLD.Number
+		AND NEW.MaxRegistration <=> OLD.MaxRegistration
+		AND NEW.Time <=> OLD.Time AND NEW.Day <=> OLD.Day);
+CREATE TRIGGER LabDeleteLog AFTER DELETE ON Lab FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID)
+	VALUES ('Lab', 'DELETE', OLD.ID, OLD.CourseID);
+CREATE TRIGGER SectionStudentInsertLog AFTER INSERT ON SectionStudent
+	FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('SectionStudent', 'INSERT', NEW.ID, NEW.SectionID, NEW.StudentID);
+CREATE TRIGGER SectionStudentUpdateLog AFTER UPDATE ON SectionStudent
+	FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('SectionStudent', 'UPDATE', NEW.ID, NEW.SectionID, NEW.StudentID);
+CREATE TRIGGER SectionStudentDeleteLog AFTER DELETE ON SectionStudent
+	FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('SectionStudent', 'DELETE', OLD.ID, OLD.SectionID, OLD.StudentID);
+CREATE TRIGGER LabStudentInsertLog AFTER INSERT ON LabStudent FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('LabStudent', 'INSERT', NEW.ID, NEW.LabID, NEW.StudentID);
+CREATE TRIGGER LabStudentUpdateLog AFTER UPDATE ON LabStudent FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('LabStudent', 'UPDATE', NEW.ID, NEW.LabID, NEW.StudentID);
+CREATE TRIGGER LabStudentDeleteLog AFTER DELETE ON LabStudent FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('LabStudent', 'DELETE', OLD.ID, OLD.LabID, OLD.StudentID);
+CREATE TRIGGER GradeInsertLog AFTER INSERT ON Grade FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('Grade', 'INSERT', NEW.ID, NEW.SectionID, NEW.StudentID);
+CREATE TRIGGER GradeUpdateLog AFTER UPDATE ON Grade FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('Grade', 'UPDATE', NEW.ID, NEW.SectionID, NEW.StudentID);
+CREATE TRIGGER GradeDeleteLog AFTER DELETE ON Grade FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('Grade', 'DELETE', OLD.ID, OLD.SectionID, OLD.StudentID);
+CREATE TRIGGER SectionWaitlistInsertLog AFTER INSERT ON SectionWaitlist
+	FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('SectionWaitlist', 'INSERT', NEW.ID, NEW.SectionID, NEW.StudentID);
+CREATE TRIGGER SectionWaitlistDeleteLog AFTER DELETE ON SectionWaitlist
+	FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('SectionWaitlist', 'DELETE', OLD.ID, OLD.SectionID, OLD.StudentID);
+CREATE TRIGGER LabWaitlistInsertLog AFTER INSERT ON LabWaitlist FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('LabWaitlist', 'INSERT', NEW.ID, NEW.LabID, NEW.StudentID);
+CREATE TRIGGER LabWaitlistDeleteLog AFTER DELETE ON LabWaitlist FOR EACH ROW
+	INSERT INTO ChangeLog (TableName, Operation, RowID, ParentID, StudentID)
+	VALUES ('LabWaitlist', 'DELETE', OLD.ID, OLD.LabID, OLD.StudentID);
\ No newline at end of file
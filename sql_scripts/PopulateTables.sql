@@ -135,4 +135,10 @@ VALUES (1, 1, 95),
 (2, 9, 95),
 (2, 9, 85),
 (2, 10, 95),
-(2, 10, 85);
\ No newline at end of file
+(2, 10, 85);
+
+-- Set enrollment counts of sections and labs from the registrations above
+UPDATE Section SET Enrolled = (SELECT COUNT(*) FROM SectionStudent ss
+	WHERE ss.SectionID = Section.ID);
+UPDATE Lab SET Enrolled = (SELECT COUNT(*) FROM LabStudent ls
+	WHERE ls.LabID = Lab.ID);
\ No newline at end of file
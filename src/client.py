@@ -1,12 +1,16 @@
 """
 Module: Command line client interface for interacting with registration system.
 Performs some input validation and prints relevant information.
-Interaction with core system is performed via the Registration Facade.
+Interaction with core system is performed via the Registration Facade, served
+by the registration server (server.py). Usage: python client.py [host] [port]
 """
-from registration import RegistrationFacade
+import sys
+from protocol import DEFAULT_HOST, DEFAULT_PORT, RegistrationClient
 
-reg = RegistrationFacade()
-reg.retrieve_data()
+reg = RegistrationClient(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_HOST,
+                         int(sys.argv[2]) if len(sys.argv) > 2 else
+                         DEFAULT_PORT)
+print(f'Connected to registration server at {reg.host}:{str(reg.port)}')
 print('=============================================')
 print('Welcome to the Course Registration System!')
 print('=============================================')
@@ -15,10 +19,11 @@ while True:
     username = input("[Enter 'E' to exit] Please enter your username: ")
     if username == 'E':
         break
-    elif reg.get_student(username):
+    user_type = reg.get_user_type(username)
+    if user_type == 'student':
         is_student = True
         valid_username = True
-    elif reg.get_instructor(username):
+    elif user_type == 'instructor':
         is_student = False
         valid_username = True
     else:
@@ -41,6 +46,10 @@ while True:
                                '(6) - Reschedule Lab\n' \
                                '(7) - Drop a Course\n' \
                                '(8) - Drop All Courses\n' \
+                               '(9) - Search Courses by Name\n' \
+                               '(10) - Build Conflict-Free Schedule\n' \
+                               '(11) - Find Sections with Open Seats\n' \
+                               '(12) - Register in Cart of Courses\n' \
                                '============================================='
                 print(student_menu)
                 answer = input("[Enter 'L' to logout] Press any key to "
@@ -54,10 +63,11 @@ while True:
                                             "menu action: ")
                         if menu_choice == 'M':
                             break
-                        valid_choices = [1, 2, 3, 4, 5, 6, 7, 8]
+                        valid_choices = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11,
+                                         12]
                         if not menu_choice.isnumeric() or int(menu_choice) not\
                                 in valid_choices:
-                            print('Please enter a number between 1 and 8')
+                            print('Please enter a number between 1 and 12')
                         else:
                             break
                     if menu_choice == 'M':
@@ -138,6 +148,54 @@ while True:
                                 break
                         if answer == 'Y':
                             print(reg.drop_all_courses(username))
+                    elif menu_choice == 9:
+                        query = input('Enter part of a course name, program, '
+                                      'number or instructor name: ')
+                        print(reg.search_courses(query))
+                    elif menu_choice == 10:
+                        course_names = input('Enter course names separated '
+                                             'by commas: ')
+                        print(reg.build_schedules(
+                            username, [course_name.strip() for course_name in
+                                       course_names.split(',') if
+                                       course_name.strip()]))
+                    elif menu_choice == 11:
+                        print('To Find Sections with Open Seats:')
+                        department = input('Enter department, or press enter '
+                                           'to leave filter blank: ')
+                        division = input('Enter division, or press enter to '
+                                         'leave filter blank: ')
+                        day = input('Enter day of the week, or press enter to '
+                                    'leave filter blank: ')
+                        print(reg.view_open_seats(department, division, day))
+                    elif menu_choice == 12:
+                        print('To Register in Cart of Courses (all or none):')
+                        cart = []
+                        while True:
+                            course_name = input('Enter course name, or press '
+                                                'enter to register cart: ')
+                            if not course_name:
+                                break
+                            while True:
+                                section_number = input('Enter section '
+                                                       'number: ')
+                                if not section_number.isnumeric():
+                                    print('Please enter a valid integer for '
+                                          'section number')
+                                else:
+                                    break
+                            while True:
+                                lab_number = input('Enter lab number, or '
+                                                   'press enter if none: ')
+                                if lab_number and not lab_number.isnumeric():
+                                    print('Please enter a valid integer for '
+                                          'lab number')
+                                else:
+                                    break
+                            cart.append((course_name, int(section_number),
+                                         int(lab_number) if lab_number else
+                                         None))
+                        print(reg.register_cart(username, cart))
 
         else:
             while True:
@@ -151,6 +209,7 @@ while True:
                                '(4) - Modify Course Instructor Approval ' \
                              'Required\n' \
                                '(5) - Add Grade to Student\n' \
+                               '(6) - View Course Grade Statistics\n' \
                                '============================================='
                 print(instr_menu)
                 answer = input("[Enter 'L' to logout] Press any key to "
@@ -164,10 +223,10 @@ while True:
                                             "menu action: ")
                         if menu_choice == 'M':
                             break
-                        valid_choices = [1, 2, 3, 4, 5]
+                        valid_choices = [1, 2, 3, 4, 5, 6]
                         if not menu_choice.isnumeric() or int(menu_choice) not\
                                 in valid_choices:
-                            print('Please enter a number between 1 and 5')
+                            print('Please enter a number between 1 and 6')
                         else:
                             break
                     if menu_choice == 'M':
@@ -228,3 +287,8 @@ while True:
                         grade = int(answer)
                         print(reg.add_grade(username, student_username,
                                             course_name, grade))
+                    elif menu_choice == 6:
+                        course_name = input('Enter course name: ')
+                        print(reg.view_grade_statistics(username, course_name))
+
+reg.close()
@@ -0,0 +1,92 @@
+"""
+Module: Benchmark of schedule time conflict checks. Synthetic students with
+classes on their schedules are generated (see rush_benchmark.py) and loaded,
+and checks of whether sections meet at the same time as a class on a
+student's schedule (StudentSchedule.find_conflict, with weekly time slot
+bitmaps) timed against comparing the meeting day and time strings of the
+section with those of each class on the schedule.
+"""
+from argparse import ArgumentParser
+from itertools import chain
+from random import Random
+from timeit import timeit
+from courses import Registerable, _time_pattern, _day_pattern
+from registration import RegistrationFacade
+from rush_benchmark import generate_data, generate_registrations
+
+
+def parse_meeting(registerable):
+    # (set of days, start minute, end minute) of registerable's meetings,
+    # parsed from its time and day strings
+    times = [(int(hour) % 12 + (12 if meridiem.lower() == 'p' else 0)) * 60
+             + int(minute or 0) for hour, minute, meridiem in
+             _time_pattern.findall(registerable.time or '')]
+    days = {name[:3].lower() for name in
+            _day_pattern.findall(registerable.day or '')}
+    if not times or not days:
+        return set(), 0, 0
+    end = times[1] if len(times) > 1 and times[1] > times[0] else \
+        times[0] + Registerable.MEETING_MINUTES
+    return days, times[0], end
+
+
+def find_conflict_pairwise(schedule, registerable):
+    # Other class on schedule meeting on a day and at a time registerable
+    # meets, comparing the meetings of each class in turn
+    days, start, end = parse_meeting(registerable)
+    for registered in chain(schedule.sections.values(),
+                            schedule.labs.values()):
+        if registered is registerable:
+            continue
+        registered_days, registered_start, registered_end = \
+            parse_meeting(registered)
+        if days & registered_days and start < registered_end and \
+                registered_start < end:
+            return registered
+    return None
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--courses', type=int, default=400)
+    parser.add_argument('--courses-per-student', type=int, default=4,
+                        help='courses on each schedule (with labs where '
+                             'required)')
+    parser.add_argument('--checks', type=int, default=100000)
+    args = parser.parse_args()
+
+    data = generate_registrations(
+        generate_data(args.students, args.courses, 2, 2, args.students),
+        args.courses_per_student)
+    reg = RegistrationFacade(test_mode=True, audit_logging=False)
+    reg.load_data(data)
+    rng = Random(0)
+    schedules = [student.get_schedule() for student in
+                 reg.student_library.students.values()]
+    sections = [section for course in reg.course_library.courses.values()
+                for section in course.sections.values()]
+    checks = [(rng.choice(schedules), rng.choice(sections)) for _ in
+              range(args.checks)]
+    conflicts = [schedule.find_conflict(section) is not None for
+                 schedule, section in checks]
+    assert conflicts == [find_conflict_pairwise(schedule, section) is not
+                         None for schedule, section in checks]
+
+    classes = sum(len(schedule.sections) + len(schedule.labs) for schedule
+                  in schedules) / len(schedules)
+    print(f'{str(args.checks)} checks against schedules of {classes:.1f} '
+          f'classes on average ({sum(conflicts) / len(conflicts):.0%} '
+          'conflicting)')
+    for label, find_conflict in (
+            ('time slot bitmaps', lambda schedule, section:
+             schedule.find_conflict(section)),
+            ('pairwise strings', find_conflict_pairwise)):
+        run_time = timeit(lambda: [find_conflict(schedule, section) for
+                                   schedule, section in checks], number=1)
+        print(f'{label:<20} {run_time / len(checks) * 1e6:>6.2f}us per '
+              'check')
+
+
+if __name__ == '__main__':
+    main()
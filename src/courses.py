@@ -1,23 +1,72 @@
 """
 Module: Entities relating to Course Management Bounded Context
 """
-from abc import ABC
+from abc import ABC, abstractmethod
+from enum import IntEnum
+from heapq import heappush, heappop, heapify
+from itertools import chain
+from bisect import bisect_left, insort
+from threading import Lock
+import re
+import numpy as np
+from people import intern_value
+from search import CourseSearchIndex
 
 
 class CourseLibrary:
     """Repository for courses. Implemented as singleton"""
     __instance__ = None
+    # Course attributes indexed for searches
+    INDEXED_ATTRIBUTES = ('number', 'division', 'department', 'program',
+                          'instructor_name', 'approval_required')
 
     def __init__(self):
         if CourseLibrary.__instance__ is None:
             self.courses = {}  # dict of Courses: key = course_name, value =
             # Course
+            self.courses_by_id = {}  # key = course ID in SQL db, value =
+            # Course
+            self.sections_by_id = {}  # key = section ID in SQL db, value =
+            # Section
+            self.labs_by_id = {}  # key = lab ID in SQL db, value = Lab
+            self.indexes = {attribute: {} for attribute in
+                            self.INDEXED_ATTRIBUTES}  # key = attribute, value
+            # = dict: key = attribute value, value = dict of Courses with the
+            # value (key = course_name, value = Course)
+            self.search_index = CourseSearchIndex()  # full-text search over
+            # course names, programs and instructors
+            self.open_seats = OpenSeatIndex()  # sections and labs with seats
+            # remaining
+            self._index_lock = Lock()  # guards the course and search indexes
+            # (approval changes may re-index courses during searches)
         else:
             raise Exception('Cannot create another CourseLibrary class')
 
-    def retrieve_data(self, sql_retrieve, student_lib, instructor_lib):
-        # Populate courses
-        course_list = sql_retrieve.get_courses()
+    def retrieve_data(self, sql_retrieve, student_lib, instructor_lib,
+                      bulk_load=True, lazy_retrieve=None):
+        self.populate_courses(sql_retrieve.get_courses(), instructor_lib)
+        self.populate_sections(sql_retrieve.get_sections())
+        self.populate_labs(sql_retrieve.get_labs())
+        if lazy_retrieve:  # Rosters and grades are loaded on first access
+            lazy_retrieve.attach(student_lib, self)
+        elif bulk_load:
+            self.populate_registrations(
+                student_lib, sql_retrieve.get_all_section_students(),
+                sql_retrieve.get_all_lab_students(),
+                sql_retrieve.get_all_section_grades())
+        else:
+            for section in self.sections_by_id.values():
+                self._retrieve_section_registrations(sql_retrieve, student_lib,
+                                                     section)
+            for lab in self.labs_by_id.values():
+                self._retrieve_lab_registrations(sql_retrieve, student_lib,
+                                                 lab)
+        if not lazy_retrieve:
+            self.populate_waitlists(student_lib,
+                                    sql_retrieve.get_all_section_waitlists(),
+                                    sql_retrieve.get_all_lab_waitlists())
+
+    def populate_courses(self, course_list, instructor_lib):
         for c in course_list:
             current_course = self.add_course(**c)
             # Add course to relevant instructor
@@ -25,52 +74,233 @@ class CourseLibrary:
                 (c['instructor_username'])
             course_instructor.add_course(current_course)
 
-        # Populate sections
-        section_list = sql_retrieve.get_sections()
+    def populate_sections(self, section_list):
         for s in section_list:
-            # Add section to course_library
-            current_section = self.add_section(**s)
-            # Add section to students' schedules and students to section roster
-            section_students = sql_retrieve.get_section_students(
-                s['course_name'], s['section_number'])
-            if section_students:
-                for st in section_students:
-                    current_student = student_lib.get_student(st['student_username'])
-                    current_student.add_section(current_section)
-                    current_section.add_student(current_student, st['status'])
-            # Add section grades to section's gradebook
-            section_grades = sql_retrieve.get_section_grades(
-                s['course_name'], s['section_number'])
-            if section_grades:
-                for g in section_grades:
-                    current_section.add_grade(g['student_username'],
-                                              g['grade'])
-
-        # Populate labs
-        lab_list = sql_retrieve.get_labs()
+            self.add_section(**s)
+
+    def populate_labs(self, lab_list):
         for l in lab_list:
-            # Add lab to course_library
-            current_lab = self.add_lab(**l)
-            # Add lab to students' schedules and students to lab roster
-            lab_students = sql_retrieve.get_lab_students(
-                l['course_name'], l['lab_number'])
-            if lab_students:
-                for st in lab_students:
-                    current_student = student_lib.get_student\
-                        (st['student_username'])
-                    current_student.add_lab(current_lab)
-                    current_lab.add_student(current_student, st['status'])
+            self.add_lab(**l)
+
+    def populate_registrations(self, student_lib, section_students,
+                               lab_students, section_grades):
+        """Populate all rosters and grade books in a single pass over the
+        rows returned by the set-based registration queries"""
+        # Add sections to students' schedules and students to section rosters
+        if section_students:
+            for st in section_students:
+                current_section = self.sections_by_id[st['section_id']]
+                current_student = student_lib.get_student(
+                    st['student_username'])
+                current_student.add_section(current_section)
+                current_section.add_student(current_student, st['status'])
+        # Add labs to students' schedules and students to lab rosters
+        if lab_students:
+            for st in lab_students:
+                current_lab = self.labs_by_id[st['lab_id']]
+                current_student = student_lib.get_student(
+                    st['student_username'])
+                current_student.add_lab(current_lab)
+                current_lab.add_student(current_student, st['status'])
+        # Add grades to sections' gradebooks
+        if section_grades:
+            for g in section_grades:
+                self.sections_by_id[g['section_id']].add_grade(
+                    g['student_username'], g['grade'])
+
+    def populate_waitlists(self, student_lib, section_waitlists,
+                           lab_waitlists):
+        """Populate waitlists from rows in the order students joined them"""
+        if section_waitlists:
+            for w in section_waitlists:
+                self.sections_by_id[w['section_id']].waitlist.add(
+                    student_lib.get_student(w['student_username']),
+                    w['priority'])
+        if lab_waitlists:
+            for w in lab_waitlists:
+                self.labs_by_id[w['lab_id']].waitlist.add(
+                    student_lib.get_student(w['student_username']),
+                    w['priority'])
+
+    def _retrieve_section_registrations(self, sql_retrieve, student_lib,
+                                        section):
+        # Add section to students' schedules and students to section roster
+        section_students = sql_retrieve.get_section_students(
+            section.course_name, section.number)
+        if section_students:
+            for st in section_students:
+                current_student = student_lib.get_student(st['student_username'])
+                current_student.add_section(section)
+                section.add_student(current_student, st['status'])
+        # Add section grades to section's gradebook
+        section_grades = sql_retrieve.get_section_grades(
+            section.course_name, section.number)
+        if section_grades:
+            for g in section_grades:
+                section.add_grade(g['student_username'], g['grade'])
+
+    def _retrieve_lab_registrations(self, sql_retrieve, student_lib, lab):
+        # Add lab to students' schedules and students to lab roster
+        lab_students = sql_retrieve.get_lab_students(lab.course_name,
+                                                     lab.number)
+        if lab_students:
+            for st in lab_students:
+                current_student = student_lib.get_student\
+                    (st['student_username'])
+                current_student.add_lab(lab)
+                lab.add_student(current_student, st['status'])
 
     def add_course(self, **kwargs):
         new_course = Course(**kwargs)
-        self.courses[kwargs['name']] = new_course
+        with self._index_lock:
+            if new_course.name in self.courses:
+                self._unindex_course(self.courses[new_course.name])
+            self.courses[kwargs['name']] = new_course
+            self.courses_by_id[new_course.id] = new_course
+            new_course.library = self
+            self._index_course(new_course)
+            self.search_index.add_course(new_course)
         return new_course
 
+    def _index_course(self, course):
+        for attribute, index in self.indexes.items():
+            value = getattr(course, attribute)
+            if value in index:
+                index[value][course.name] = course
+            else:
+                index[value] = {course.name: course}
+
+    def _unindex_course(self, course):
+        for attribute, index in self.indexes.items():
+            self._unindex_value(course, attribute, index)
+
+    @staticmethod
+    def _unindex_value(course, attribute, index):
+        value = getattr(course, attribute)
+        matches = index.get(value)
+        if matches and matches.get(course.name) is course:
+            del matches[course.name]
+            if not matches:
+                del index[value]
+
+    def reindex_course(self, course, attribute, value):
+        """Set an attribute of a course, keeping the search indexes current"""
+        with self._index_lock:
+            index = self.indexes.get(attribute)
+            if index is None:
+                setattr(course, attribute, value)
+            else:
+                self._unindex_value(course, attribute, index)
+                setattr(course, attribute, value)
+                if value in index:
+                    index[value][course.name] = course
+                else:
+                    index[value] = {course.name: course}
+            if attribute in CourseSearchIndex.FIELDS:
+                self.search_index.add_course(course)
+
+    def find_courses(self, **criteria):
+        """Courses matching all given criteria (key = indexed attribute,
+        value = required value, or None to not filter on the attribute).
+        Candidates from the smallest index entry are probed against the
+        other entries, smallest first, so no full scan of the catalog is
+        needed"""
+        with self._index_lock:
+            candidates = []
+            for attribute, value in criteria.items():
+                if value is None:
+                    continue
+                matches = self.indexes[attribute].get(value)
+                if not matches:
+                    return []
+                candidates.append(matches)
+            if not candidates:
+                return list(self.courses.values())
+            candidates.sort(key=len)
+            smallest, others = candidates[0], candidates[1:]
+            return [course for course_name, course in smallest.items()
+                    if all(course_name in matches for matches in others)]
+
     def add_section(self, **kwargs):
-        return self.courses[kwargs['course_name']].add_section(**kwargs)
+        new_section = self.courses[kwargs['course_name']].add_section(**kwargs)
+        self.sections_by_id[new_section.id] = new_section
+        return new_section
 
     def add_lab(self, **kwargs):
-        return self.courses[kwargs['course_name']].add_lab(**kwargs)
+        new_lab = self.courses[kwargs['course_name']].add_lab(**kwargs)
+        self.labs_by_id[new_lab.id] = new_lab
+        return new_lab
+
+    def remove_registerable(self, registerable):
+        """Remove a section/lab (e.g. deleted from the SQL db by another
+        process) from its course and the library"""
+        registerable.course.remove_registerable(registerable)
+        if isinstance(registerable, Section):
+            self.sections_by_id.pop(registerable.id, None)
+        else:
+            self.labs_by_id.pop(registerable.id, None)
+
+    def remove_course(self, course):
+        """Remove a course (e.g. deleted from the SQL db by another process)
+        and its sections and labs from the library"""
+        for registerable in list(chain(course.sections.values(),
+                                       course.labs.values())):
+            self.remove_registerable(registerable)
+        with self._index_lock:
+            if self.courses.get(course.name) is course:
+                del self.courses[course.name]
+                self._unindex_course(course)
+                self.search_index.remove_course(course.name)
+            self.courses_by_id.pop(course.id, None)
+
+    def find_open_seats(self, department=None, division=None, day=None,
+                        min_seats=1, limit=None):
+        """Sections and labs with at least min_seats seats remaining, most
+        seats remaining first, optionally only of courses in the given
+        department/division or meeting on the given day (e.g. 'Monday').
+        Found through the open-seat index, most seats remaining first, so
+        that only as many sections/labs as are needed to fill the limit are
+        filtered rather than scanning the catalog"""
+        day_slots = get_day_slots(day) if day else None
+        candidates = self.open_seats.find(min_seats)
+        if department or division:
+            candidates = (registerable for registerable in candidates if
+                          (not department or
+                           registerable.course.department == department) and
+                          (not division or
+                           registerable.course.division == division))
+        found = []
+        seen = set()
+        for registerable in candidates:
+            if registerable in seen or day_slots is not None and \
+                    not registerable.time_slots & day_slots:
+                continue
+            # Checking seats remaining loads a lazily loaded roster, which
+            # may re-index registerable (so it may be generated again)
+            seen.add(registerable)
+            if registerable.seats_remaining < min_seats:
+                continue
+            found.append(registerable)
+            if len(found) == limit:
+                break
+        return found
+
+    def view_open_seats(self, department=None, division=None, day=None,
+                        min_seats=1, limit=20):
+        if day and get_day_slots(day) is None:
+            return f'Invalid day: {day}'
+        registerables = self.find_open_seats(department, division, day,
+                                             min_seats, limit)
+        if not registerables:
+            return 'No sections or labs found with open seats matching ' \
+                   'criteria'
+        display_str = '\n============ SECTIONS WITH OPEN SEATS ===========\n'
+        display_str += '\n'.join(
+            f'{str(registerable)} - Seats Remaining: '
+            f'{str(registerable.seats_remaining)}'
+            for registerable in registerables)
+        display_str += '\n=============================================\n'
+        return display_str
 
     def get_course(self, course_name):
         if course_name in self.courses:
@@ -78,13 +308,61 @@ class CourseLibrary:
         else:
             return None
 
-    def view_filtered_courses(self, course_number, division, instructor_name):
-        # Optionally filter by course number, division, and instructor name
-        course_list = list(filter(lambda x:
-            (x.number == int(course_number) if course_number else True) and
-            (x.division == division if division else True) and
-            (x.instructor_name == instructor_name if instructor_name else True)
-            , self.courses.values()))
+    def get_section_grade_statistics(self, department=None, bin_width=10):
+        """Grade statistics of each section with grades, optionally only of
+        courses in the given department: key = (course_name,
+        section_number), value = statistics (see compute_grade_statistics)
+        """
+        keys = []  # (course_name, section_number) of each group
+        counts = []  # number of averages of each group
+        averages = [np.empty(0)]
+        for course in self.courses.values():
+            if department and course.department != department:
+                continue
+            for section in course.sections.values():
+                section_averages = section.grade_book.get_average_column()[1]
+                if len(section_averages):
+                    keys.append((course.name, section.number))
+                    counts.append(len(section_averages))
+                    averages.append(section_averages)
+        groups = np.repeat(np.arange(len(keys)), counts)
+        return dict(zip(keys, compute_grouped_grade_statistics(
+            groups, np.concatenate(averages), len(keys), bin_width)))
+
+    def get_grade_statistics(self, department=None, bin_width=10):
+        """Statistics of students' average grades across all sections,
+        optionally only of courses in the given department"""
+        averages = [np.empty(0)]
+        for course in self.courses.values():
+            if department and course.department != department:
+                continue
+            for section in course.sections.values():
+                averages.append(section.grade_book.get_average_column()[1])
+        return compute_grade_statistics(np.concatenate(averages), bin_width)
+
+    def search_courses(self, query, limit=10):
+        # Rank courses by how well their name, program, number and
+        # instructor match the (possibly partial or misspelled) query
+        with self._index_lock:
+            course_list = self.search_index.search(query, limit)
+        if not course_list:
+            return 'No courses found matching search'
+
+        display_str = '\n=============== SEARCH RESULTS ==============\n'
+        display_str += '\n'.join(f'({str(rank)}) - {str(course)}' for rank,
+                                  course in enumerate(course_list, 1))
+        display_str += '\n=============================================\n'
+        return display_str
+
+    def view_filtered_courses(self, course_number, division, instructor_name,
+                              department=None, program=None):
+        # Optionally filter by course number, division, instructor name,
+        # department and program
+        course_list = self.find_courses(
+            number=int(course_number) if course_number else None,
+            division=division or None,
+            instructor_name=instructor_name or None,
+            department=department or None, program=program or None)
 
         if not course_list:
             return 'No courses found matching criteria'
@@ -102,35 +380,88 @@ class Course:
     """Entity representing course which is composed of sections and labs"""
 
     def __init__(self, **kwargs):
+        self.id = kwargs.get('course_id')  # ID in SQL db
         self.number = kwargs['number']
-        self.name = kwargs['name']
-        self.department = kwargs['department']
-        self.division = kwargs['division']
-        self.program = kwargs['program']
+        self.name = intern_value(kwargs['name'])
+        self.department = intern_value(kwargs['department'])
+        self.division = intern_value(kwargs['division'])
+        self.program = intern_value(kwargs['program'])
         self.lab_required = kwargs['lab_required']
-        self.instructor_name = kwargs['instructor_name']
+        self.instructor_name = intern_value(kwargs['instructor_name'])
         self.approval_required = kwargs['approval_required']
         self.sections = {}  # dict of sections: key = section_number, value =
         # Section
         self.labs = {}  # dict of labs: key = lab_number, value =
         # Lab
+        self.student_sections = {}  # index of registrations maintained by
+        # sections: key = username, value = Section
+        self.student_labs = {}  # index of registrations maintained by labs:
+        # key = username, value = Lab
+        self.loader = None  # callable which populates rosters when loaded
+        # lazily. Set to None once rosters are loaded
+        self.library = None  # CourseLibrary whose search indexes include
+        # course. Set when course is added to library
 
     def add_section(self, **kwargs):
         new_section = Section(kwargs['section_number'], self.name, self.number,
                               self.program, self.instructor_name,
                               kwargs['max_registration'], kwargs['time'],
-                              kwargs['day'])
+                              kwargs['day'], kwargs.get('section_id'), self,
+                              kwargs.get('version', 0))
         self.sections[kwargs['section_number']] = new_section
+        if self.library:
+            self.library.open_seats.update(new_section)
         return new_section
 
     def add_lab(self, **kwargs):
         new_lab = Lab(kwargs['lab_number'], self.name, self.number,
                               self.program, self.instructor_name,
                               kwargs['max_registration'], kwargs['time'],
-                              kwargs['day'])
+                              kwargs['day'], kwargs.get('lab_id'), self,
+                              kwargs.get('version', 0))
         self.labs[kwargs['lab_number']] = new_lab
+        if self.library:
+            self.library.open_seats.update(new_lab)
         return new_lab
 
+    def update_registerable(self, registerable, number, max_registration,
+                            time, day):
+        """Change the number, capacity and meeting time of a section/lab
+        (e.g. changed in the SQL db by another process), keeping the open
+        seat index and registered students' schedules current"""
+        registerables = self.sections if isinstance(registerable, Section) \
+            else self.labs
+        if registerable.number != number:
+            if registerables.get(registerable.number) is registerable:
+                del registerables[registerable.number]
+            registerable.number = number
+            registerables[number] = registerable
+        registerable.max_registration = max_registration
+        if registerable.time != time or registerable.day != day:
+            registerable.set_meeting(time, day)
+        if self.library:
+            self.library.open_seats.update(registerable)
+
+    def remove_registerable(self, registerable):
+        """Remove a section/lab, along with its registrations in students'
+        schedules"""
+        is_section = isinstance(registerable, Section)
+        registerables = self.sections if is_section else self.labs
+        if registerables.get(registerable.number) is registerable:
+            del registerables[registerable.number]
+        if not registerable.loader:  # Roster is only in memory if loaded
+            for student, _ in registerable.get_all_students():
+                schedule = student.get_schedule()
+                if is_section and \
+                        schedule.get_section(self.name) is registerable:
+                    schedule.remove_section(self.name)
+                elif not is_section and \
+                        schedule.get_lab(self.name) is registerable:
+                    schedule.remove_lab(self.name)
+                registerable.remove_student(student.username)
+        if self.library:
+            self.library.open_seats.remove(registerable)
+
     def get_section(self, section_number):
         if section_number in self.sections:
             return self.sections[section_number]
@@ -144,23 +475,32 @@ class Course:
             return None
 
     def set_approval_required(self, is_required):
-        self.approval_required = is_required
+        self._set_indexed('approval_required', is_required)
 
-    def find_student_section(self, username):
-        student_section = None
+    def set_instructor(self, instructor_name):
+        instructor_name = intern_value(instructor_name)
+        self._set_indexed('instructor_name', instructor_name)
         for section in self.sections.values():
-            if section.is_student_in_registerable(username):
-                student_section = section
-                break
-        return student_section
+            section.course_instructor = instructor_name
+        for lab in self.labs.values():
+            lab.course_instructor = instructor_name
+
+    def _set_indexed(self, attribute, value):
+        # Keep the course library's search indexes current
+        if self.library:
+            self.library.reindex_course(self, attribute, value)
+        else:
+            setattr(self, attribute, value)
+
+    def find_student_section(self, username):
+        if self.loader:
+            self.loader()
+        return self.student_sections.get(username)
 
     def find_student_lab(self, username):
-        student_lab = None
-        for lab in self.labs.values():
-            if lab.is_student_in_registerable(username):
-                student_lab = lab
-                break
-        return student_lab
+        if self.loader:
+            self.loader()
+        return self.student_labs.get(username)
 
     def display_course_students(self):
         students = set()
@@ -180,6 +520,27 @@ class Course:
                                  for student in students)
         return display_str
 
+    def display_grade_statistics(self):
+        display_str = str(self)
+        for section in self.sections.values():
+            display_str += '\n---------------------------------------------'
+            display_str += f'\nSection {str(section.number)}:\n'
+            display_str += '---------------------------------------------\n'
+            statistics = section.get_grade_statistics()
+            if not statistics:
+                display_str += 'No grades recorded for this section'
+                continue
+            display_str += f"Students Graded: {str(statistics['count'])}, " \
+                           f"Mean: {statistics['mean']:.1f}, " \
+                           f"Median: {statistics['median']:.1f}, " \
+                           f"Std Dev: {statistics['stddev']:.1f}, " \
+                           f"Min: {statistics['min']:.1f}, " \
+                           f"Max: {statistics['max']:.1f}\n"
+            display_str += 'Histogram: ' + ', '.join(
+                f'{str(bin_start)}+: {str(count)}' for bin_start, count in
+                statistics['histogram'].items() if count)
+        return display_str
+
     def display_course_detail(self):
         display_str = str(self)
         display_str += '\n---------------------------------------------'
@@ -205,21 +566,70 @@ class Course:
         return display_str
 
 
+class RegistrationStatus(IntEnum):
+    """Status of a student's registration in a section/lab. Stored as an
+    int; displayed (and stored in SQL db) by name, e.g. 'Approved'"""
+    APPROVED = 0
+    TENTATIVE = 1
+    PENDING = 2
+    DENIED = 3
+
+    @classmethod
+    def parse(cls, status):
+        if isinstance(status, cls):
+            return status
+        return cls[status.upper()]
+
+    def __str__(self):
+        return self.name.capitalize()
+
+
 class Registerable(ABC):
     """Abstract Base Class for 'registerable' entities (Section & Lab)"""
+    __slots__ = ('id', 'number', 'course_name', 'course_number',
+                 'course_program', 'course_instructor', '_registered_students',
+                 '_statuses', '_waitlist', 'max_registration', 'time', 'day',
+                 'time_slots', 'loader', 'course', 'version')
+    MEETING_MINUTES = 90  # length of meetings given only a start time
 
     def __init__(self, number, course_name, course_number, course_program,
-                 course_instructor, max_registration, time, day):
+                 course_instructor, max_registration, time, day, id=None,
+                 course=None, version=0):
+        self.id = id  # ID in SQL db
+        self.version = version  # Version of the row in SQL db which roster
+        # reflects. Seats are only claimed in the db at this version
+        self.course = course  # Course whose registration index is kept up
+        # to date by add_student/remove_student
         self.number = number
         self.course_name = course_name
         self.course_number = course_number
         self.course_program = course_program
         self.course_instructor = course_instructor
-        self.registered_students = {}  # key: username, value: (Student,
-        # status of registration)
+        self._registered_students = {}  # key: username, value: Student
+        self._statuses = {}  # statuses other than Approved (the common
+        # case), so that most registrations take a single dict entry: key =
+        # username, value = RegistrationStatus
+        self._waitlist = Waitlist()  # students waiting for a seat
         self.max_registration = max_registration
         self.time = time
         self.day = day
+        self.time_slots = parse_meeting_slots(time, day,
+                                              self.MEETING_MINUTES)  # bitmap
+        # of weekly time slots taken by meetings (see parse_meeting_slots)
+        self.loader = None  # callable which populates roster when loaded
+        # lazily. Set to None once roster is loaded
+
+    @property
+    def registered_students(self):
+        if self.loader:
+            self.loader()
+        return self._registered_students
+
+    @property
+    def waitlist(self):
+        if self.loader:
+            self.loader()
+        return self._waitlist
 
     @property
     def space_remaining(self):
@@ -229,33 +639,236 @@ class Registerable(ABC):
         else:
             return False
 
+    @property
+    def seats_remaining(self):
+        return max(self.max_registration - len(self.registered_students), 0)
+
     def add_student(self, student, status):
-        self.registered_students[student.username] = (student, status)
+        self.registered_students[student.username] = student
+        self._set_status(student.username, status)
+        if self.course:
+            self._get_index()[student.username] = self
+            if self.course.library:
+                self.course.library.open_seats.update(self)
 
     def remove_student(self, username):
         del self.registered_students[username]
+        self._statuses.pop(username, None)
+        if self.course:
+            index = self._get_index()
+            if index.get(username) is self:
+                del index[username]
+            if self.course.library:
+                self.course.library.open_seats.update(self)
+
+    @abstractmethod
+    def _get_index(self):
+        # Course registration index for this type of registerable
+        pass
 
     def set_student_status(self, username, status):
-        self.registered_students[username] = \
-            (self.registered_students[username][0], status)
+        if username not in self.registered_students:
+            raise KeyError(username)
+        self._set_status(username, status)
+
+    def _set_status(self, username, status):
+        status = RegistrationStatus.parse(status)
+        if status == RegistrationStatus.APPROVED:
+            self._statuses.pop(username, None)
+        else:
+            self._statuses[username] = status
 
     def get_student(self, username):
-        return self.registered_students[username]
+        # (Student, status of registration)
+        return (self.registered_students[username],
+                self._statuses.get(username, RegistrationStatus.APPROVED))
 
     def get_all_students(self):
-        return list(self.registered_students.values())
+        return [(student, self._statuses.get(username,
+                                             RegistrationStatus.APPROVED))
+                for username, student in self.registered_students.items()]
 
     def is_student_in_registerable(self, username):
         return username in self.registered_students
 
+    def set_meeting(self, time, day):
+        """Change meeting time and days, keeping the occupied time slots of
+        registered students' schedules current"""
+        self.time = time
+        self.day = day
+        self.time_slots = parse_meeting_slots(time, day, self.MEETING_MINUTES)
+        for student in self._registered_students.values():
+            student.get_schedule().reset_occupied_slots()
+
+
+class Waitlist:
+    """Entity representing the queue of students waiting for a seat in a full
+    section/lab. Implemented as a heap ordered by highest priority and then
+    order of joining, so that adding and promoting are O(log n). Students
+    removed from the middle of the queue are skipped once they reach the
+    front. The (-priority, sequence) keys of students on the waitlist are
+    also kept in a sorted list, so that a student's position is found by
+    binary search."""
+    __slots__ = ('_heap', '_entries', '_order', '_sequence')
+
+    def __init__(self):
+        self._heap = []  # heap of entries: [-priority, sequence, Student],
+        # Student set to None when removed
+        self._entries = {}  # key = username, value = heap entry
+        self._order = []  # sorted keys of entries: (-priority, sequence)
+        self._sequence = 0  # order students joined the waitlist
+
+    def add(self, student, priority=0):
+        """Add student to waitlist. Returns False if already on waitlist"""
+        if student.username in self._entries:
+            return False
+        entry = [-priority, self._sequence, student]
+        self._sequence += 1
+        self._entries[student.username] = entry
+        heappush(self._heap, entry)
+        insort(self._order, (entry[0], entry[1]))
+        return True
+
+    def remove(self, username):
+        entry = self._entries.pop(username, None)
+        if entry:
+            entry[2] = None
+            self._remove_key(entry)
+            # Compact heap once it is mostly removed entries
+            if len(self._heap) > 2 * len(self._entries) + 16:
+                self._heap = [e for e in self._heap if e[2]]
+                heapify(self._heap)
+
+    def pop(self):
+        """Remove and return the next student on the waitlist, or None if the
+        waitlist is empty"""
+        while self._heap:
+            entry = heappop(self._heap)
+            student = entry[2]
+            if student:
+                del self._entries[student.username]
+                self._remove_key(entry)
+                return student
+        return None
+
+    def _remove_key(self, entry):
+        del self._order[bisect_left(self._order, (entry[0], entry[1]))]
+
+    def peek(self):
+        """Next student on the waitlist (without removing them), or None"""
+        while self._heap and not self._heap[0][2]:
+            heappop(self._heap)
+        return self._heap[0][2] if self._heap else None
+
+    def clear(self):
+        self._heap = []
+        self._entries = {}
+        self._order = []
+
+    def get_position(self, username):
+        """Position (starting at 1) of student on waitlist, or None"""
+        entry = self._entries.get(username)
+        if not entry:
+            return None
+        return bisect_left(self._order, (entry[0], entry[1])) + 1
+
+    def get_all(self):
+        # (Student, priority) in order of promotion
+        return [(entry[2], -entry[0]) for entry in
+                sorted(self._entries.values(), key=lambda e: e[:2])]
+
+    def __contains__(self, username):
+        return username in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class OpenSeatIndex:
+    """Index of sections and labs with seats remaining, grouped by the
+    number of seats remaining. Sections/labs whose rosters change are only
+    marked, and are re-grouped on the next query, so that a roster being
+    populated costs a set insert per student. Seats are counted from rosters
+    as populated so far (i.e. before loading a lazily loaded roster, all
+    seats count as remaining)"""
+
+    def __init__(self):
+        self._seats_remaining = {}  # key = Section/Lab, value = seats
+        # remaining (only those with seats remaining)
+        self._groups = {}  # key = seats remaining, value = dict of
+        # Sections/Labs with that many seats remaining (values are None)
+        self._sorted_seats = []  # keys of _groups, ascending
+        self._changed = set()  # Sections/Labs to re-group on next query
+        self._lock = Lock()  # guards re-grouping (rosters may change on
+        # other threads)
+
+    def update(self, registerable):
+        """Mark registerable to be re-grouped after its roster changed"""
+        self._changed.add(registerable)
+
+    def _regroup(self):
+        with self._lock:
+            self._regroup_changed()
+
+    def _regroup_changed(self):
+        while self._changed:
+            registerable = self._changed.pop()
+            seats_remaining = registerable.max_registration - \
+                len(registerable._registered_students)
+            if self._seats_remaining.get(registerable) == seats_remaining:
+                continue
+            self._ungroup(registerable)
+            if seats_remaining > 0:
+                self._seats_remaining[registerable] = seats_remaining
+                if seats_remaining in self._groups:
+                    self._groups[seats_remaining][registerable] = None
+                else:
+                    self._groups[seats_remaining] = {registerable: None}
+                    insort(self._sorted_seats, seats_remaining)
+
+    def _ungroup(self, registerable):
+        previous = self._seats_remaining.pop(registerable, None)
+        if previous is not None:
+            group = self._groups[previous]
+            del group[registerable]
+            if not group:
+                del self._groups[previous]
+                del self._sorted_seats[bisect_left(self._sorted_seats,
+                                                   previous)]
+
+    def remove(self, registerable):
+        """Remove a section/lab which no longer exists from the index"""
+        with self._lock:
+            self._regroup_changed()
+            self._ungroup(registerable)
+
+    def get_seats_remaining(self, registerable):
+        self._regroup()
+        return self._seats_remaining.get(registerable, 0)
+
+    def find(self, min_seats=1):
+        """Generate Sections/Labs with at least min_seats seats remaining,
+        most seats remaining first"""
+        self._regroup()
+        start = bisect_left(self._sorted_seats, min_seats)
+        for seats_remaining in reversed(self._sorted_seats[start:]):
+            yield from list(self._groups.get(seats_remaining, ()))
+
+    def __len__(self):
+        self._regroup()
+        return len(self._seats_remaining)
+
 
 class Section(Registerable):
     """Entity representing a section of a course"""
+    __slots__ = ('grade_book',)
 
     def __init__(self, number, course_name, course_number, course_program,
-                 course_instructor, max_registration, time, day):
+                 course_instructor, max_registration, time, day, id=None,
+                 course=None, version=0):
         super().__init__(number, course_name, course_number, course_program,
-                 course_instructor, max_registration, time, day)
+                 course_instructor, max_registration, time, day, id, course,
+                 version)
         self.grade_book = GradeBook()
 
     def add_grade(self, username, grade):
@@ -264,6 +877,23 @@ class Section(Registerable):
     def get_grades(self, username):
         return self.grade_book.get_grades(username)
 
+    def get_grade_statistics(self, bin_width=10):
+        """Statistics of students' average grades in section (see
+        compute_grade_statistics)"""
+        return compute_grade_statistics(
+            self.grade_book.get_average_column()[1], bin_width)
+
+    def get_percentile_rank(self, username):
+        """Percentile rank of student's average grade within section"""
+        usernames, averages = self.grade_book.get_average_column()
+        if username not in usernames:
+            return None
+        return compute_percentile_rank(averages,
+                                       averages[usernames.index(username)])
+
+    def _get_index(self):
+        return self.course.student_sections
+
     def __str__(self):  # Section: MPCS 55001-1: Algorithms, Gerry Brady,
         # Tuesday 2:30PM, Enrollment: 5/10
         return f'{self.course_program} {str(self.course_number)}-'\
@@ -274,31 +904,249 @@ class Section(Registerable):
 
 
 class GradeBook:
-    """Entity representing grade book for section"""
+    """Entity representing grade book for section. Grades are stored in
+    columns: NumPy arrays of the student index and value of each grade, in
+    the order added. Grades added are appended to buffers which are merged
+    into the columns on the next read, so that statistics are computed with
+    vectorized operations over the whole grade book. Grades keep the type
+    they are given (ints, or floats once any grade is fractional)"""
+    __slots__ = ('_usernames', '_student_indexes', '_student_column',
+                 '_grade_column', '_student_buffer', '_grade_buffer',
+                 '_buffer_lock', 'loader')
 
     def __init__(self):
-        self.grades = {}  # key = username, value = list of grades
+        self._buffer_lock = Lock()  # guards student indexes, buffers and
+        # merging them into columns (grades of a section may be added and
+        # read on different threads)
+        self.clear()
+        self.loader = None  # callable which populates grades when loaded
+        # lazily. Set to None once grades are loaded
 
     def add_grade(self, username, grade):
-        if username in self.grades:
-            self.grades[username].append(grade)
-        else:
-            self.grades[username] = [grade]
+        if self.loader:
+            self.loader()
+        with self._buffer_lock:
+            index = self._student_indexes.get(username)
+            if index is None:
+                index = len(self._usernames)
+                self._student_indexes[username] = index
+                self._usernames.append(username)
+            self._student_buffer.append(index)
+            self._grade_buffer.append(grade)
+
+    def clear(self):
+        with self._buffer_lock:
+            self._usernames = []  # username of each student index
+            self._student_indexes = {}  # key = username, value = student
+            # index
+            self._student_column = np.empty(0, np.int32)  # student index of
+            # each grade
+            self._grade_column = np.empty(0, np.int64)  # value of each grade
+            self._student_buffer = []  # grades added since last merged
+            self._grade_buffer = []
+
+    def get_columns(self):
+        """(usernames by student index, array of student index of each
+        grade, array of value of each grade)"""
+        if self.loader:
+            self.loader()
+        with self._buffer_lock:
+            return self._merge_buffers()
+
+    def _merge_buffers(self):
+        # Merge buffers into columns and return columns. Called holding
+        # _buffer_lock
+        if self._grade_buffer:
+            self._student_column = np.concatenate((
+                self._student_column,
+                np.array(self._student_buffer, np.int32)))
+            self._grade_column = np.concatenate((
+                self._grade_column, np.array(self._grade_buffer)))
+            self._student_buffer = []
+            self._grade_buffer = []
+        return self._usernames, self._student_column, self._grade_column
 
     def get_grades(self, username):
-        if username in self.grades:
-            return self.grades[username]
-        else:
+        if self.loader:
+            self.loader()
+        with self._buffer_lock:
+            usernames, students, grades = self._merge_buffers()
+            index = self._student_indexes.get(username)
+        if index is None:
             return None
+        return grades[students == index].tolist()
+
+    def get_all_grades(self):
+        """Grades of each student with grades: key = username, value = list
+        of grades in the order added"""
+        usernames, students, grades = self.get_columns()
+        order = np.argsort(students, kind='stable')
+        ends = np.cumsum(np.bincount(students, minlength=len(usernames)))
+        return {username: student_grades.tolist() for username,
+                student_grades in zip(usernames,
+                                      np.split(grades[order], ends[:-1]))}
+
+    def get_student_columns(self):
+        """(usernames, array of grade count of each, array of average grade
+        of each) of students with grades, computed in one pass over the
+        columns"""
+        usernames, students, grades = self.get_columns()
+        counts = np.bincount(students, minlength=len(usernames))
+        sums = np.bincount(students, weights=grades, minlength=len(usernames))
+        return usernames, counts, sums / np.maximum(counts, 1)
+
+    def get_average_column(self):
+        """(usernames, array of average grade of each) of students with
+        grades"""
+        usernames, counts, averages = self.get_student_columns()
+        return usernames, averages
+
+    def get_averages(self):
+        """Average grade of each student with grades: key = username, value =
+        average grade"""
+        usernames, averages = self.get_average_column()
+        return dict(zip(usernames, averages.tolist()))
+
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+DAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+_time_pattern = re.compile(r'(\d{1,2})(?::(\d{2}))?\s*([ap])\.?m', re.I)
+_day_pattern = re.compile(r'[a-z]+', re.I)
+
+
+def parse_meeting_slots(time, day, meeting_minutes):
+    """Parse meeting time (e.g. '2:30PM', or a range '2:30PM-5:30PM') and
+    days (e.g. 'Tuesday', or several such as 'Tue/Thu') into a bitmap of
+    the 15 minute slots of the week taken by meetings. Bit i is slot
+    i % SLOTS_PER_DAY of day i // SLOTS_PER_DAY (Monday first). Given only a
+    start time, meetings last meeting_minutes. Returns 0 (no conflicts
+    possible) if time or day cannot be parsed"""
+    times = []
+    for hour, minute, meridiem in _time_pattern.findall(time or ''):
+        hour = int(hour) % 12 + (12 if meridiem.lower() == 'p' else 0)
+        times.append(hour * 60 + int(minute or 0))
+    days = [DAYS.index(name[:3].lower()) for name in
+            _day_pattern.findall(day or '') if name[:3].lower() in DAYS]
+    if not times or not days:
+        return 0
+    start = times[0]
+    end = times[1] if len(times) > 1 and times[1] > start else \
+        start + meeting_minutes
+    first_slot = start // SLOT_MINUTES
+    last_slot = min(-(-end // SLOT_MINUTES), SLOTS_PER_DAY)
+    day_slots = ((1 << (last_slot - first_slot)) - 1) << first_slot
+    slots = 0
+    for day_index in days:
+        slots |= day_slots << (day_index * SLOTS_PER_DAY)
+    return slots
+
+
+def get_day_slots(day):
+    """Bitmap of the time slots of a day (e.g. 'Monday'), or None if day is
+    not a day of the week"""
+    day = day.strip()[:3].lower()
+    if day not in DAYS:
+        return None
+    return ((1 << SLOTS_PER_DAY) - 1) << (DAYS.index(day) * SLOTS_PER_DAY)
+
+
+def count_days(time_slots):
+    """Number of days of the week with any slot in a time slot bitmap"""
+    day_mask = (1 << SLOTS_PER_DAY) - 1
+    return sum(1 for day_index in range(len(DAYS)) if
+               time_slots >> (day_index * SLOTS_PER_DAY) & day_mask)
+
+
+def _to_array(values):
+    # Float array of an array or iterable of grades
+    if isinstance(values, np.ndarray):
+        return values.astype(np.float64, copy=False)
+    return np.fromiter(values, np.float64)
+
+
+def compute_grade_statistics(averages, bin_width=10):
+    """Statistics of a distribution of students' average grades (array or
+    iterable). Returns None if there are no grades, otherwise dict of count,
+    mean, median, stddev (population), min, max and histogram: key = lowest
+    grade of bin, value = number of students (the top bin includes 100)"""
+    values = _to_array(averages)
+    return compute_grouped_grade_statistics(
+        np.zeros(len(values), np.intp), values, 1, bin_width)[0]
+
+
+def compute_grouped_grade_statistics(groups, averages, group_count,
+                                     bin_width=10):
+    """Statistics (see compute_grade_statistics) of each of group_count
+    distributions of average grades, given the group index of each average.
+    All groups are computed in one vectorized pass over the averages sorted
+    by group and value. Returns list of statistics by group index"""
+    values = _to_array(averages)
+    if not len(values):
+        return [None] * group_count
+    order = np.lexsort((values, groups)) if group_count > 1 else \
+        np.argsort(values)
+    groups = np.asarray(groups, np.intp)[order]
+    values = values[order]
+    counts = np.bincount(groups, minlength=group_count)
+    divisors = np.maximum(counts, 1)
+    starts = np.cumsum(counts) - counts  # index of lowest value of groups
+    means = np.bincount(groups, values, group_count) / divisors
+    deviations = values - means[groups]
+    stddevs = np.sqrt(np.bincount(groups, deviations * deviations,
+                                  group_count) / divisors)
+    # index of lowest, middle two (same if odd count) and highest value of
+    # groups, clamped to a valid index for groups without grades
+    last = len(values) - 1
+    lows = np.clip(starts, 0, last)
+    highs = np.clip(starts + counts - 1, 0, last)
+    medians = (values[np.clip(starts + (counts - 1) // 2, 0, last)] +
+               values[np.clip(starts + counts // 2, 0, last)]) / 2
+    bin_starts = np.arange(0, 100, bin_width)
+    bins = np.searchsorted(bin_starts, values, 'right') - 1
+    binned = bins >= 0  # averages below 0 are not in any bin
+    histograms = np.bincount(
+        groups[binned] * len(bin_starts) + bins[binned],
+        minlength=group_count * len(bin_starts)).reshape(group_count, -1)
+    bin_starts = bin_starts.tolist()
+    return [{
+        'count': count,
+        'mean': mean,
+        'median': median,
+        'stddev': stddev,
+        'min': low,
+        'max': high,
+        'histogram': dict(zip(bin_starts, histogram))
+    } if count else None for count, mean, median, stddev, low, high,
+        histogram in zip(counts.tolist(), means.tolist(), medians.tolist(),
+                         stddevs.tolist(), values[lows].tolist(),
+                         values[highs].tolist(), histograms.tolist())]
+
+
+def compute_percentile_rank(averages, average):
+    """Percentage of averages below the given average (counting ties as half
+    below), or None if there are no averages"""
+    values = np.sort(_to_array(averages))
+    if not len(values):
+        return None
+    below = np.searchsorted(values, average, 'left')
+    ties = np.searchsorted(values, average, 'right') - below
+    return float(100 * (below + ties / 2) / len(values))
 
 
 class Lab(Registerable):
     """Entity which represents a lab"""
+    __slots__ = ()
 
     def __init__(self, number, course_name, course_number, course_program,
-                 course_instructor, max_registration, time, day):
+                 course_instructor, max_registration, time, day, id=None,
+                 course=None, version=0):
         super().__init__(number, course_name, course_number, course_program,
-                 course_instructor, max_registration, time, day)
+                 course_instructor, max_registration, time, day, id, course,
+                 version)
+
+    def _get_index(self):
+        return self.course.student_labs
 
     def __str__(self):  #Lab: MPCS 55001-Lab1: Algorithms, Gerry Brady,
         # Monday 4:30PM, Enrollment: 0/10
@@ -3,65 +3,515 @@ Module: Classes associated with database management context
 """
 from mysql.connector import connect, Error
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError, BulkWriteError
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, monotonic
+from functools import partial
+from contextlib import contextmanager
+from queue import LifoQueue, Queue, Empty
+from threading import Lock, RLock, Thread, Event, Condition
+from collections import deque
+import atexit
+import json
 
 
 class SQLConnection:
-    """SQL database connection object. Implemented as Singleton"""
+    """SQL database connection object. Implemented as Singleton. Maintains a
+    bounded pool of open connections which are checked out for a unit of
+    work and checked back in afterwards, rather than opening and closing a
+    connection for every unit of work."""
     __instance__ = None
+    HEALTH_CHECK_INTERVAL = 30  # seconds a connection may be idle before it
+    # is pinged on checkout
+    WAIT_POLL_INTERVAL = 1  # seconds between checks for a free pool slot
+    # while waiting for a connection
 
-    def __init__(self, test_mode):
+    def __init__(self, test_mode, pool_size=5):
         if SQLConnection.__instance__ is None:
             self._host = 'localhost'
             self._username = 'root'
             self._password = 'parrot123'
             self._database = 'CourseRegistration'
             self.test_mode = test_mode
-            self._conn = None
+            self.pool_size = pool_size
+            self._idle = LifoQueue()  # idle connections: (connection,
+            # time checked in)
+            self._lock = Lock()  # guards pool counters and metrics
+            self._open_count = 0  # connections open (idle or checked out)
+            self._in_use = 0  # connections checked out
+            self._peak_in_use = 0
+            self._checkouts = 0
+            self._total_wait_time = 0.0
+            self._max_wait_time = 0.0
+            self._prepared_cursors = {}  # key = pooled connection, value =
+            # dict of prepared cursors: key = statement, value = cursor
+            self.write_behind = None  # WriteBehindQueue if enabled
             SQLConnection.__instance__ = self
         else:
             raise Exception('Cannot create another SQLConnection class')
 
-    def open_connection(self):
+    def create_connection(self):
+        """Open and return a new connection to the SQL db"""
         try:
-            conn = connect(
+            return connect(
                 host=self._host,
                 user=self._username,
                 password=self._password,
                 database=self._database
             )
-            self._conn = conn
-
         except Error as e:
             print(e)
-            self._conn = None
+            return None
+
+    @contextmanager
+    def borrow_connection(self):
+        """Context manager which checks out a connection from the pool and
+        checks it back in on exit. Yields None if no connection could be
+        opened"""
+        conn = self.checkout()
+        try:
+            yield conn
+        finally:
+            self.checkin(conn)
+
+    def checkout(self):
+        """Take an idle connection from the pool, open a new one if the pool
+        is not full, or otherwise wait for one to be checked in"""
+        start = perf_counter()
+        conn = None
+        while conn is None:
+            try:
+                conn, checked_in = self._idle.get_nowait()
+            except Empty:
+                with self._lock:
+                    can_open = self._open_count < self.pool_size
+                    if can_open:
+                        self._open_count += 1
+                if can_open:
+                    conn = self.create_connection()
+                    if not conn:
+                        with self._lock:
+                            self._open_count -= 1
+                        return None
+                    break
+                try:
+                    conn, checked_in = self._idle.get(
+                        timeout=self.WAIT_POLL_INTERVAL)
+                except Empty:
+                    continue
+            # Health check connections which have been idle for a while
+            if monotonic() - checked_in > self.HEALTH_CHECK_INTERVAL and \
+                    not self._is_healthy(conn):
+                self._discard(conn)
+                conn = None
+
+        wait_time = perf_counter() - start
+        with self._lock:
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            self._checkouts += 1
+            self._total_wait_time += wait_time
+            self._max_wait_time = max(self._max_wait_time, wait_time)
+        return conn
+
+    def checkin(self, conn):
+        if conn is None:
+            return
+        with self._lock:
+            self._in_use -= 1
+        try:
+            # End any transaction left open, including the read snapshot
+            # started by a SELECT, so the next borrower sees current data
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put((conn, monotonic()))
+        except Error:
+            self._discard(conn)
+
+    def get_prepared_cursor(self, conn, statement):
+        """Cursor for a server-side prepared statement on a checked out
+        connection. Cached so that each statement is only prepared once per
+        pooled connection"""
+        cursors = self._prepared_cursors.setdefault(conn, {})
+        if statement not in cursors:
+            cursors[statement] = conn.cursor(prepared=True)
+        return cursors[statement]
+
+    def enable_write_behind(self, max_batch_size=100, linger_time=0.01):
+        """Queue writes to be flushed in batches on a background thread
+        rather than performing each write before returning"""
+        if not self.write_behind and not self.test_mode:
+            self.write_behind = WriteBehindQueue(self, max_batch_size,
+                                                 linger_time)
+
+    def flush_writes(self):
+        """Block until all queued writes have been committed"""
+        if self.write_behind:
+            self.write_behind.flush()
+
+    def _is_healthy(self, conn):
+        try:
+            return conn.is_connected()
+        except Error:
+            return False
+
+    def _discard(self, conn):
+        self._prepared_cursors.pop(conn, None)
+        try:
+            conn.close()
+        except Error:
+            pass
+        with self._lock:
+            self._open_count -= 1
+
+    def get_pool_metrics(self):
+        with self._lock:
+            return {
+                'pool_size': self.pool_size,
+                'open': self._open_count,
+                'in_use': self._in_use,
+                'peak_in_use': self._peak_in_use,
+                'utilization': self._in_use / self.pool_size,
+                'checkouts': self._checkouts,
+                'total_wait_time': self._total_wait_time,
+                'average_wait_time': self._total_wait_time / self._checkouts
+                if self._checkouts else 0.0,
+                'max_wait_time': self._max_wait_time
+            }
+
+
+class WriteBehindQueue:
+    """Queue of writes to the SQL db which are committed in order on a
+    background thread. Writes queued within the linger time of each other
+    (up to the max batch size) are committed in a single transaction, and
+    consecutive writes of the same statement are combined into a single
+    multi-row statement. Each queued item is the list of writes
+    (statement, params, multi-row form) for one operation (see db_utils)."""
+
+    def __init__(self, sql_conn, max_batch_size=100, linger_time=0.01):
+        self._sql_conn = sql_conn
+        self.max_batch_size = max_batch_size  # max operations per transaction
+        self.linger_time = linger_time  # seconds to wait for further
+        # operations before committing a batch
+        self._queue = Queue()  # items: list of writes, or Event to set once
+        # all preceding writes are committed
+        self._lock = Lock()  # guards pending count and metrics
+        self._pending = 0  # operations queued but not yet committed
+        self.batch_count = 0  # transactions committed
+        self.operation_count = 0  # operations committed
+        self.statement_count = 0  # statements executed
+        self.failed_count = 0  # operations which could not be committed
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def enqueue(self, writes):
+        if not writes:
+            return
+        with self._lock:
+            self._pending += 1
+        self._queue.put(writes)
+
+    def flush(self):
+        """Block until all operations queued so far have been committed"""
+        with self._lock:
+            if not self._pending:
+                return
+        barrier = Event()
+        self._queue.put(barrier)
+        barrier.wait()
+
+    def _run(self):
+        while True:
+            batch = []
+            barriers = []
+            item = self._queue.get()
+            deadline = monotonic() + self.linger_time
+            while True:
+                if isinstance(item, Event):
+                    # Commit immediately rather than lingering
+                    barriers.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.max_batch_size:
+                    break
+                try:
+                    item = self._queue.get(
+                        timeout=max(deadline - monotonic(), 0))
+                except Empty:
+                    break
+            # Waiting flushes are released and the thread kept running even
+            # if the batch could not be committed
+            try:
+                if batch:
+                    self._commit(batch)
+            except Exception as e:
+                print(e)
+            finally:
+                for barrier in barriers:
+                    barrier.set()
+
+    def _commit(self, batch):
+        try:
+            with self._sql_conn.borrow_connection() as conn:
+                if not conn:
+                    self._report_failed(batch, 'no connection to SQL database')
+                    return
+                try:
+                    statement_count = self._execute_batch(conn, batch)
+                    conn.commit()
+                    with self._lock:
+                        self.batch_count += 1
+                        self.operation_count += len(batch)
+                        self.statement_count += statement_count
+                except Exception as e:
+                    print(e)
+                    self._rollback(conn)
+                    # Retry each operation in its own transaction so that
+                    # one failed operation does not lose the rest
+                    for writes in batch:
+                        try:
+                            statement_count = self._execute_batch(conn,
+                                                                  [writes])
+                            conn.commit()
+                            with self._lock:
+                                self.batch_count += 1
+                                self.operation_count += 1
+                                self.statement_count += statement_count
+                        except Exception as e:
+                            self._report_failed([writes], e)
+                            self._rollback(conn)
+        finally:
+            with self._lock:
+                self._pending -= len(batch)
+
+    def _rollback(self, conn):
+        # Roll back a failed transaction, if the connection is still usable
+        try:
+            conn.rollback()
+        except Exception as e:
+            print(e)
 
-    def get_connection(self):
-        return self._conn
+    def _report_failed(self, batch, reason):
+        # Log operations which could not be committed, with their writes
+        with self._lock:
+            self.failed_count += len(batch)
+        for writes in batch:
+            print(f'Queued operation not written to SQL database ({reason}): '
+                  + '; '.join(f'{statement} {str(params)}' for statement,
+                              params, _ in writes))
 
-    def close_connection(self):
-        self._conn.close()
+    def _execute_batch(self, conn, batch):
+        """Execute the writes of a batch of operations in order. Runs of
+        consecutive operations made up of the same statements, all of which
+        have multi-row forms, are executed as one multi-row statement per
+        statement. Returns number of statements executed"""
+        statement_count = 0
+        i = 0
+        while i < len(batch):
+            shape = [statement for statement, _, _ in batch[i]]
+            j = i + 1
+            if all(multi_row for _, _, multi_row in batch[i]):
+                while j < len(batch) and \
+                        [statement for statement, _, _ in batch[j]] == shape:
+                    j += 1
+            if j - i > 1:
+                for k, (_, _, multi_row) in enumerate(batch[i]):
+                    prefix, row, suffix = multi_row
+                    statement = prefix + ', '.join([row] * (j - i)) + suffix
+                    params = tuple(p for operation in batch[i:j]
+                                   for p in operation[k][1])
+                    # Not prepared since the statement varies with row count
+                    with conn.cursor() as cursor:
+                        cursor.execute(statement, params)
+                    statement_count += 1
+            else:
+                for statement, params, _ in batch[i]:
+                    cursor = self._sql_conn.get_prepared_cursor(conn,
+                                                                statement)
+                    cursor.execute(statement, params)
+                    statement_count += 1
+            i = j
+        return statement_count
 
 
 class MongoConnection:
-    """MongoDB database connection object. Implemented as Singleton"""
+    """MongoDB database connection object. Implemented as Singleton. Logs are
+    queued in a bounded in-process queue and written in batches by a
+    background thread, so that logging does not add to the latency of the
+    change being logged. When the queue is full, the overflow policy
+    determines whether the caller blocks ('block'), the oldest queued log is
+    dropped ('drop_oldest') or the log is appended to a local file
+    ('spill'). Callers block for at most block_timeout seconds, after which
+    their logs are spilled, so that a slow or unavailable MongoDB cannot
+    stall registrations. Logs which fail to be written are also spilled, as
+    are logs still queued flush_timeout seconds into the flush at exit. If
+    not enabled (e.g. to benchmark without a MongoDB), no MongoDB client is
+    created and logs are discarded."""
     __instance__ = None
+    OVERFLOW_POLICIES = ('block', 'drop_oldest', 'spill')
 
-    def __init__(self):
+    def __init__(self, batch_size=100, flush_interval=1.0,
+                 max_queue_size=10000, overflow_policy='block',
+                 spill_path='audit_log_spill.jsonl', block_timeout=1.0,
+                 flush_timeout=10.0, enabled=True):
         if MongoConnection.__instance__ is None:
-            self._client = MongoClient()
-            self._db = self._client.RegistrationLogging
+            if overflow_policy not in self.OVERFLOW_POLICIES:
+                raise ValueError(f'Invalid overflow policy: {overflow_policy}')
+            self.enabled = enabled
+            self._client = MongoClient() if enabled else None
+            self._db = self._client.RegistrationLogging if enabled else None
+            self.batch_size = batch_size  # max logs per insert_many
+            self.flush_interval = flush_interval  # max seconds a log waits
+            # in the queue before being written
+            self.max_queue_size = max_queue_size
+            self.overflow_policy = overflow_policy
+            self.spill_path = spill_path
+            self.block_timeout = block_timeout  # max seconds a caller blocks
+            # on a full queue
+            self.flush_timeout = flush_timeout  # max seconds the flush at
+            # exit waits for logs to be written
+            self._queue = deque()  # log dicts waiting to be written
+            self._in_flight = 0  # logs taken from queue but not yet written
+            self._flush_requested = False
+            self._stalled = False  # whether blocking on a full queue timed
+            # out since the writer last took a batch
+            self._cond = Condition()  # guards queue, in flight and counters
+            self.queued_count = 0
+            self.flushed_count = 0
+            self.dropped_count = 0
+            self.spilled_count = 0
+            self.timed_out_count = 0  # logs spilled after blocking timed out
+            if enabled:
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+                atexit.register(self._flush_at_exit)
             MongoConnection.__instance__ = self
         else:
             raise Exception('Cannot create another MongoConnection class')
 
     def insert_log(self, log):
-        log_dict = {
-            'time': datetime.now(),
-            'log': log
-        }
-        logging = self._db.logging
-        logging.insert_one(log_dict)
+        self.insert_logs([log])
+
+    def insert_logs(self, logs):
+        """Queue several logs at once (e.g. of the registrations in a cart),
+        so that they are written together"""
+        if not self.enabled:
+            return
+        time = datetime.now()
+        deadline = monotonic() + self.block_timeout
+        with self._cond:
+            for log in logs:
+                log_dict = {
+                    'time': time,
+                    'log': log
+                }
+                if len(self._queue) >= self.max_queue_size:
+                    if self.overflow_policy == 'block':
+                        # Once blocking has timed out, logs are spilled
+                        # without blocking until the writer takes a batch
+                        if self._stalled or not self._cond.wait_for(
+                                lambda: len(self._queue) <
+                                self.max_queue_size,
+                                timeout=max(deadline - monotonic(), 0)):
+                            self._stalled = True
+                            self.timed_out_count += 1
+                            self._spill([log_dict])
+                            continue
+                    elif self.overflow_policy == 'drop_oldest':
+                        self._queue.popleft()
+                        self.dropped_count += 1
+                    else:
+                        self._spill([log_dict])
+                        continue
+                self._queue.append(log_dict)
+                self.queued_count += 1
+                # A flush waiting on the writer also covers logs queued
+                # since it was requested
+                if len(self._queue) >= self.batch_size or \
+                        self._flush_requested:
+                    self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Block until all queued logs have been written (or spilled), or
+        for at most timeout seconds. Returns whether all were written"""
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            flushed = self._cond.wait_for(lambda: not self._queue and
+                                          not self._in_flight, timeout)
+            self._flush_requested = False
+            return flushed
+
+    def _flush_at_exit(self):
+        # Logs MongoDB has not taken within the flush timeout are spilled
+        # rather than holding up exit (logs being written are lost if the
+        # write is still in progress)
+        if not self.flush(self.flush_timeout):
+            with self._cond:
+                self._spill(list(self._queue))
+                self._queue.clear()
+
+    def get_log_metrics(self):
+        with self._cond:
+            return {
+                'queued': self.queued_count,
+                'flushed': self.flushed_count,
+                'dropped': self.dropped_count,
+                'spilled': self.spilled_count,
+                'timed_out': self.timed_out_count,
+                'pending': len(self._queue) + self._in_flight
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: len(self._queue) >= self.batch_size or
+                    (self._queue and self._flush_requested),
+                    timeout=self.flush_interval)
+                batch = [self._queue.popleft() for _ in
+                         range(min(self.batch_size, len(self._queue)))]
+                self._in_flight = len(batch)
+                if batch:
+                    self._stalled = False
+                # Wake callers blocked on a full queue
+                self._cond.notify_all()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        failed = []
+        try:
+            # Unordered so that one failed insert does not stop the rest
+            self._db.logging.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            print(e)
+            failed = [batch[error['index']]
+                      for error in e.details.get('writeErrors', [])]
+        except PyMongoError as e:
+            print(e)
+            failed = batch
+        with self._cond:
+            if failed:
+                self._spill(failed)
+            self.flushed_count += len(batch) - len(failed)
+            self._in_flight = 0
+            self._cond.notify_all()
+
+    def _spill(self, log_dicts):
+        # Append logs to the local spill file as JSON lines
+        try:
+            with open(self.spill_path, 'a') as spill_file:
+                for log_dict in log_dicts:
+                    spill_file.write(json.dumps({
+                        'time': log_dict['time'].isoformat(),
+                        'log': log_dict['log']
+                    }) + '\n')
+            self.spilled_count += len(log_dicts)
+        except OSError as e:
+            print(e)
+            self.dropped_count += len(log_dicts)
 
 
 class SQLRetrieve:
@@ -71,16 +521,22 @@ class SQLRetrieve:
 
     def __init__(self, conn):
         self._conn = conn
+        self.query_count = 0  # number of queries executed against db
+
+    def _execute(self, cursor, statement):
+        cursor.execute(statement)
+        self.query_count += 1
 
     def get_students(self):
         try:
             student_list = []
             with self._conn.cursor() as cursor:
                 statement = "SELECT * FROM Student;"
-                cursor.execute(statement)
+                self._execute(cursor, statement)
                 result = cursor.fetchall()
                 for row in result:
                     student_list.append({
+                        'student_id': int(row[0]),
                         'university_id': int(row[1]),
                         'username': row[2],
                         'first_name': row[3],
@@ -99,7 +555,7 @@ class SQLRetrieve:
             instructor_list = []
             with self._conn.cursor() as cursor:
                 statement = "SELECT * FROM Instructor;"
-                cursor.execute(statement)
+                self._execute(cursor, statement)
                 result = cursor.fetchall()
                 for row in result:
                     instructor_list.append({
@@ -116,17 +572,19 @@ class SQLRetrieve:
         except Error as e:
             print(e)
 
-    def get_courses(self):
+    def get_courses(self, course_ids=None):
         try:
             course_list = []
             with self._conn.cursor() as cursor:
                 statement = "SELECT i.FirstName, i.LastName, i.UserName, c.* "\
                         "FROM COURSE c INNER JOIN Instructor i ON " \
-                            "c.InstructorID = i.ID;"
-                cursor.execute(statement)
+                            "c.InstructorID = i.ID" + \
+                            self._id_filter('c.ID', course_ids) + ';'
+                self._execute(cursor, statement)
                 result = cursor.fetchall()
                 for row in result:
                     course_list.append({
+                        'course_id': int(row[3]),
                         'instructor_name': row[0] + ' ' + row[1],
                         'instructor_username': row[2],
                         'number': int(row[5]),
@@ -142,41 +600,47 @@ class SQLRetrieve:
         except Error as e:
             print(e)
 
-    def get_sections(self):
+    def get_sections(self, section_ids=None):
         try:
             section_list = []
             with self._conn.cursor() as cursor:
                 statement = "SELECT c.name, s.* FROM Section s " \
-                            "INNER JOIN Course c ON s.CourseID = c.ID;"
-                cursor.execute(statement)
+                            "INNER JOIN Course c ON s.CourseID = c.ID" + \
+                            self._id_filter('s.ID', section_ids) + ';'
+                self._execute(cursor, statement)
                 result = cursor.fetchall()
                 for row in result:
                     section_list.append({
+                        'section_id': int(row[1]),
                         'course_name': row[0],
                         'section_number': int(row[3]),
                         'max_registration': int(row[4]),
                         'time': row[5],
-                        'day': row[6]
+                        'day': row[6],
+                        'version': int(row[8])
                     })
             return section_list
         except Error as e:
             print(e)
 
-    def get_labs(self):
+    def get_labs(self, lab_ids=None):
         try:
             lab_list = []
             with self._conn.cursor() as cursor:
                 statement = "SELECT c.name, l.* FROM Lab l " \
-                            "INNER JOIN Course c ON l.CourseID = c.ID;"
-                cursor.execute(statement)
+                            "INNER JOIN Course c ON l.CourseID = c.ID" + \
+                            self._id_filter('l.ID', lab_ids) + ';'
+                self._execute(cursor, statement)
                 result = cursor.fetchall()
                 for row in result:
                     lab_list.append({
+                        'lab_id': int(row[1]),
                         'course_name': row[0],
                         'lab_number': int(row[3]),
                         'max_registration': int(row[4]),
                         'time': row[5],
-                        'day': row[6]
+                        'day': row[6],
+                        'version': int(row[8])
                     })
             return lab_list
         except Error as e:
@@ -193,7 +657,7 @@ class SQLRetrieve:
                             "INNER JOIN Student s ON ss.StudentID = s.ID " \
                             f"WHERE sec.Number = {str(section_number)} AND " \
                             f"c.Name = '{course_name}';"
-                cursor.execute(statement)
+                self._execute(cursor, statement)
                 result = cursor.fetchall()
                 for row in result:
                     section_students.append({
@@ -215,7 +679,7 @@ class SQLRetrieve:
                             "INNER JOIN Student s ON ls.StudentID = s.ID " \
                             f"WHERE l.Number = {str(lab_number)} AND " \
                             f"c.Name = '{course_name}';"
-                cursor.execute(statement)
+                self._execute(cursor, statement)
                 result = cursor.fetchall()
                 for row in result:
                     lab_students.append({
@@ -236,7 +700,7 @@ class SQLRetrieve:
                             "INNER JOIN Course c ON sec.CourseID = c.ID " \
                             f"WHERE sec.Number = {str(section_number)} AND " \
                             f"c.Name = '{course_name}';"
-                cursor.execute(statement)
+                self._execute(cursor, statement)
                 result = cursor.fetchall()
                 for row in result:
                     section_grades.append({
@@ -247,7 +711,743 @@ class SQLRetrieve:
         except Error as e:
             print(e)
 
+    def get_fingerprint(self):
+        """Row count, max ID and a checksum of the columns of each table.
+        Used to detect whether a snapshot of the system is stale, including
+        rows edited in place (e.g. a student's name or major)."""
+        tables = (
+            ('Student', 'UniversityID, UserName, FirstName, LastName, Major, '
+                        'Program, Department, IsFullTime'),
+            ('Instructor', 'UniversityID, UserName, FirstName, LastName, '
+                           'Division, Department, IsDepartmentChair'),
+            ('Course', 'InstructorID, Number, Name, Division, Department, '
+                       'Program, LabRequired, ApprovalRequired'),
+            ('Section', 'CourseID, Number, MaxRegistration, Time, Day, '
+                        'Version'),
+            ('Lab', 'CourseID, Number, MaxRegistration, Time, Day, Version'),
+            ('SectionStudent', 'SectionID, StudentID, Status'),
+            ('LabStudent', 'LabID, StudentID, Status'),
+            ('Grade', 'SectionID, StudentID, Grade'),
+            ('SectionWaitlist', 'SectionID, StudentID, Priority'),
+            ('LabWaitlist', 'LabID, StudentID, Priority')
+        )
+        try:
+            fingerprint = []
+            with self._conn.cursor() as cursor:
+                statement = ' UNION ALL '.join(
+                    f"SELECT COUNT(*), COALESCE(MAX(ID), 0), "
+                    f"COALESCE(BIT_XOR(CRC32(CONCAT_WS(':', ID, {columns}))), "
+                    f"0) FROM {table}" for table, columns in tables) + ';'
+                self._execute(cursor, statement)
+                result = cursor.fetchall()
+                for row in result:
+                    fingerprint.extend(int(value) for value in row)
+            return fingerprint
+        except Error as e:
+            print(e)
+
+    @staticmethod
+    def _id_filter(column, ids):
+        # Optional WHERE clause restricting query to given internal IDs
+        if ids is None:
+            return ''
+        return f" WHERE {column} IN ({', '.join(str(i) for i in ids)})"
+
+    def get_versions(self, table_name, ids):
+        """Versions of the given Section/Lab (table_name) IDs: key = ID,
+        value = version"""
+        try:
+            with self._conn.cursor() as cursor:
+                statement = f"SELECT ID, Version FROM {table_name}" + \
+                            self._id_filter('ID', ids) + ';'
+                self._execute(cursor, statement)
+                return {int(row[0]): int(row[1]) for row in
+                        cursor.fetchall()}
+        except Error as e:
+            print(e)
+
+    def get_all_section_students(self, section_ids=None):
+        """Registrations in all sections, or only in the given section IDs"""
+        try:
+            section_students = []
+            with self._conn.cursor() as cursor:
+                statement = "SELECT ss.SectionID, s.UserName, ss.Status " \
+                            "FROM SectionStudent ss " \
+                            "INNER JOIN Student s ON ss.StudentID = s.ID" + \
+                            self._id_filter('ss.SectionID', section_ids) + ';'
+                self._execute(cursor, statement)
+                result = cursor.fetchall()
+                for row in result:
+                    section_students.append({
+                        'section_id': int(row[0]),
+                        'student_username': row[1],
+                        'status': row[2]
+                    })
+            return section_students
+        except Error as e:
+            print(e)
+
+    def get_all_lab_students(self, lab_ids=None):
+        """Registrations in all labs, or only in the given lab IDs"""
+        try:
+            lab_students = []
+            with self._conn.cursor() as cursor:
+                statement = "SELECT ls.LabID, s.UserName, ls.Status " \
+                            "FROM LabStudent ls " \
+                            "INNER JOIN Student s ON ls.StudentID = s.ID" + \
+                            self._id_filter('ls.LabID', lab_ids) + ';'
+                self._execute(cursor, statement)
+                result = cursor.fetchall()
+                for row in result:
+                    lab_students.append({
+                        'lab_id': int(row[0]),
+                        'student_username': row[1],
+                        'status': row[2]
+                    })
+            return lab_students
+        except Error as e:
+            print(e)
+
+    def get_all_section_grades(self, section_ids=None):
+        """Grades in all sections, or only in the given section IDs"""
+        try:
+            section_grades = []
+            with self._conn.cursor() as cursor:
+                statement = "SELECT g.SectionID, s.UserName, g.Grade " \
+                            "FROM Grade g " \
+                            "INNER JOIN Student s ON g.StudentID = s.ID" + \
+                            self._id_filter('g.SectionID', section_ids) + \
+                            " ORDER BY g.ID;"
+                self._execute(cursor, statement)
+                result = cursor.fetchall()
+                for row in result:
+                    section_grades.append({
+                        'section_id': int(row[0]),
+                        'student_username': row[1],
+                        'grade': row[2]
+                    })
+            return section_grades
+        except Error as e:
+            print(e)
+
+    def get_all_section_waitlists(self, section_ids=None):
+        """Waitlist entries of all sections, or only of the given section
+        IDs, in the order students joined"""
+        try:
+            section_waitlists = []
+            with self._conn.cursor() as cursor:
+                statement = "SELECT w.SectionID, s.UserName, w.Priority " \
+                            "FROM SectionWaitlist w " \
+                            "INNER JOIN Student s ON w.StudentID = s.ID" + \
+                            self._id_filter('w.SectionID', section_ids) + \
+                            " ORDER BY w.ID;"
+                self._execute(cursor, statement)
+                result = cursor.fetchall()
+                for row in result:
+                    section_waitlists.append({
+                        'section_id': int(row[0]),
+                        'student_username': row[1],
+                        'priority': int(row[2])
+                    })
+            return section_waitlists
+        except Error as e:
+            print(e)
+
+    def get_all_lab_waitlists(self, lab_ids=None):
+        """Waitlist entries of all labs, or only of the given lab IDs, in the
+        order students joined"""
+        try:
+            lab_waitlists = []
+            with self._conn.cursor() as cursor:
+                statement = "SELECT w.LabID, s.UserName, w.Priority " \
+                            "FROM LabWaitlist w " \
+                            "INNER JOIN Student s ON w.StudentID = s.ID" + \
+                            self._id_filter('w.LabID', lab_ids) + \
+                            " ORDER BY w.ID;"
+                self._execute(cursor, statement)
+                result = cursor.fetchall()
+                for row in result:
+                    lab_waitlists.append({
+                        'lab_id': int(row[0]),
+                        'student_username': row[1],
+                        'priority': int(row[2])
+                    })
+            return lab_waitlists
+        except Error as e:
+            print(e)
+
+    def get_student_registrations(self, student_id):
+        """A student's section and lab registrations in a single query"""
+        try:
+            registrations = []
+            with self._conn.cursor() as cursor:
+                statement = "SELECT 'section', SectionID, Status " \
+                            "FROM SectionStudent " \
+                            f"WHERE StudentID = {str(student_id)} " \
+                            "UNION ALL " \
+                            "SELECT 'lab', LabID, Status " \
+                            "FROM LabStudent " \
+                            f"WHERE StudentID = {str(student_id)};"
+                self._execute(cursor, statement)
+                result = cursor.fetchall()
+                for row in result:
+                    registrations.append({
+                        'registerable_type': row[0],
+                        'registerable_id': int(row[1]),
+                        'status': row[2]
+                    })
+            return registrations
+        except Error as e:
+            print(e)
+
+    def get_last_change_id(self):
+        try:
+            with self._conn.cursor() as cursor:
+                statement = "SELECT COALESCE(MAX(ID), 0) FROM ChangeLog;"
+                self._execute(cursor, statement)
+                return int(cursor.fetchone()[0])
+        except Error as e:
+            print(e)
+
+    def get_changes(self, after_change_id):
+        """ChangeLog entries made after the given change ID, in order"""
+        try:
+            changes = []
+            with self._conn.cursor() as cursor:
+                statement = "SELECT cl.ID, cl.TableName, cl.RowID, " \
+                            "cl.ParentID, s.UserName FROM ChangeLog cl " \
+                            "LEFT JOIN Student s ON cl.StudentID = s.ID " \
+                            f"WHERE cl.ID > {str(after_change_id)} " \
+                            "ORDER BY cl.ID;"
+                self._execute(cursor, statement)
+                result = cursor.fetchall()
+                for row in result:
+                    changes.append({
+                        'change_id': int(row[0]),
+                        'table_name': row[1],
+                        'row_id': int(row[2]),
+                        'parent_id': int(row[3]) if row[3] is not None else
+                        None,
+                        'student_username': row[4]
+                    })
+            return changes
+        except Error as e:
+            print(e)
+
+
+class ParallelRetrieve:
+    """Class which runs the independent SQLRetrieve queries used to populate
+    the registration system concurrently on a pool of worker threads. Each
+    query is performed over its own pooled connection since a connection
+    cannot be shared between threads (so concurrency is also bounded by the
+    connection pool size)."""
+    queries = ('get_students', 'get_instructors', 'get_courses',
+               'get_sections', 'get_labs', 'get_all_section_students',
+               'get_all_lab_students', 'get_all_section_grades',
+               'get_all_section_waitlists', 'get_all_lab_waitlists')
+
+    def __init__(self, sql_conn, workers):
+        self._sql_conn = sql_conn
+        self.workers = workers
+        self.query_count = 0  # number of queries executed against db
+        self.timings = {}  # key = query name, value = seconds taken
+
+    def _run_query(self, query):
+        start = perf_counter()
+        with self._sql_conn.borrow_connection() as conn:
+            if not conn:
+                return None, 0, perf_counter() - start
+            sql_retrieve = SQLRetrieve(conn)
+            result = getattr(sql_retrieve, query)()
+        return result, sql_retrieve.query_count, perf_counter() - start
+
+    def retrieve_all(self):
+        """Run all queries and return their results: key = query name,
+        value = result of the SQLRetrieve query"""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {query: executor.submit(self._run_query, query)
+                       for query in self.queries}
+        results = {}
+        for query, future in futures.items():
+            results[query], query_count, self.timings[query] = \
+                future.result()
+            self.query_count += query_count
+        return results
+
+
+class LazyRetrieve:
+    """Class which populates rosters, grade books and student schedules on
+    first access rather than at startup. Rosters and grade books are loaded
+    for a whole course at once, and a student's schedule with a single
+    query. Each load opens its own connection since it may happen long
+    after the startup connection has been closed."""
+
+    def __init__(self, sql_conn):
+        self._sql_conn = sql_conn
+        self._student_lib = None
+        self._courses = {}  # key = course_name, value = Course
+        self._sections_by_id = {}  # key = section ID in SQL db, value =
+        # Section
+        self._labs_by_id = {}  # key = lab ID in SQL db, value = Lab
+        self._lock = RLock()  # held while loading, so that other threads
+        # accessing data being loaded wait for it to be populated
+        self._loading = set()  # course names and schedules being populated
+
+    def attach(self, student_lib, course_lib):
+        """Set loaders on all sections, labs, grade books and schedules"""
+        self._student_lib = student_lib
+        self._courses = course_lib.courses
+        self._sections_by_id = course_lib.sections_by_id
+        self._labs_by_id = course_lib.labs_by_id
+        for section in self._sections_by_id.values():
+            section.loader = partial(self.load_course, section.course_name)
+            section.grade_book.loader = section.loader
+        for lab in self._labs_by_id.values():
+            lab.loader = partial(self.load_course, lab.course_name)
+        for course in self._courses.values():
+            course.loader = partial(self.load_course, course.name)
+        for student in student_lib.students.values():
+            schedule = student.get_schedule()
+            schedule.loader = partial(self.load_schedule, schedule,
+                                      student.id)
+
+    def load_course(self, course_name):
+        # Loaders are only cleared once populated so that other threads wait
+        # for the load. Loads triggered by populating are skipped. The
+        # course's sections and labs are those it has now (which may have
+        # been added or removed by a sync)
+        with self._lock:
+            course = self._courses.get(course_name)
+            if not course or not course.loader or \
+                    course_name in self._loading:
+                return
+            self._loading.add(course_name)
+            sections = list(course.sections.values())
+            labs = list(course.labs.values())
+            try:
+                self._load_course([section.id for section in sections],
+                                  [lab.id for lab in labs])
+            finally:
+                self._loading.discard(course_name)
+                course.loader = None
+                for section in sections:
+                    section.loader = None
+                    section.grade_book.loader = None
+                for lab in labs:
+                    lab.loader = None
+
+    def _load_course(self, section_ids, lab_ids):
+        # Queued writes must be committed for the db to be current
+        self._sql_conn.flush_writes()
+        with self._sql_conn.borrow_connection() as conn:
+            if not conn:
+                return
+            sql_retrieve = SQLRetrieve(conn)
+            # Versions are read before rosters, so that they are never newer
+            # than the rosters read
+            section_versions = sql_retrieve.get_versions(
+                'Section', section_ids) if section_ids else None
+            lab_versions = sql_retrieve.get_versions('Lab', lab_ids) \
+                if lab_ids else None
+            section_students = sql_retrieve.get_all_section_students(
+                section_ids) if section_ids else None
+            section_grades = sql_retrieve.get_all_section_grades(
+                section_ids) if section_ids else None
+            lab_students = sql_retrieve.get_all_lab_students(lab_ids) \
+                if lab_ids else None
+            section_waitlists = sql_retrieve.get_all_section_waitlists(
+                section_ids) if section_ids else None
+            lab_waitlists = sql_retrieve.get_all_lab_waitlists(lab_ids) \
+                if lab_ids else None
+
+        if section_versions:
+            for section_id, version in section_versions.items():
+                self._sections_by_id[section_id].version = version
+        if lab_versions:
+            for lab_id, version in lab_versions.items():
+                self._labs_by_id[lab_id].version = version
+        if section_students:
+            for st in section_students:
+                self._sections_by_id[st['section_id']].add_student(
+                    self._student_lib.get_student(st['student_username']),
+                    st['status'])
+        if section_grades:
+            for g in section_grades:
+                self._sections_by_id[g['section_id']].add_grade(
+                    g['student_username'], g['grade'])
+        if lab_students:
+            for st in lab_students:
+                self._labs_by_id[st['lab_id']].add_student(
+                    self._student_lib.get_student(st['student_username']),
+                    st['status'])
+        if section_waitlists:
+            for w in section_waitlists:
+                self._sections_by_id[w['section_id']].waitlist.add(
+                    self._student_lib.get_student(w['student_username']),
+                    w['priority'])
+        if lab_waitlists:
+            for w in lab_waitlists:
+                self._labs_by_id[w['lab_id']].waitlist.add(
+                    self._student_lib.get_student(w['student_username']),
+                    w['priority'])
+
+    def load_schedule(self, schedule, student_id):
+        with self._lock:
+            if not schedule.loader or schedule in self._loading:
+                return
+            self._loading.add(schedule)
+            try:
+                self._load_schedule(schedule, student_id)
+            finally:
+                self._loading.discard(schedule)
+                schedule.loader = None
+
+    def _load_schedule(self, schedule, student_id):
+        self._sql_conn.flush_writes()
+        with self._sql_conn.borrow_connection() as conn:
+            if not conn:
+                return
+            registrations = SQLRetrieve(conn).get_student_registrations(
+                student_id)
+
+        if registrations:
+            for r in registrations:
+                if r['registerable_type'] == 'section':
+                    schedule.add_section(
+                        self._sections_by_id[r['registerable_id']])
+                else:
+                    schedule.add_lab(self._labs_by_id[r['registerable_id']])
+
+
+class IncrementalRetrieve:
+    """Class which applies changes made to the SQL database by other
+    processes since the last sync to the in-memory system, using the
+    ChangeLog table. Changes are applied by re-reading the current state of
+    the changed rows, so applying a change more than once (e.g. one made by
+    this process) has no effect. Data which has not been loaded yet in lazy
+    mode is skipped since it will be read from the database when loaded.
+    ChangeLog IDs are allocated when a change is made but become visible when
+    its transaction commits, so they may appear out of order. IDs missing
+    below the highest ID read are re-read by the following syncs until they
+    appear, or until GAP_TIMEOUT has passed (their transaction rolled back)."""
+    GAP_TIMEOUT = 60  # seconds a missing ChangeLog ID is waited for
+
+    def __init__(self, sql_conn):
+        self._sql_conn = sql_conn
+        self.last_change_id = 0  # ID below which every ChangeLog entry has
+        # been synced (or given up on)
+        self._synced_ids = set()  # IDs above last_change_id synced
+        self._missing_ids = {}  # key = ID above last_change_id not read yet,
+        # value = time first found missing
+
+    def mark(self):
+        """Record the current end of the change log. Called before the system
+        is populated so that changes made during population are not missed"""
+        with self._sql_conn.borrow_connection() as conn:
+            if not conn:
+                return
+            last_change_id = SQLRetrieve(conn).get_last_change_id()
+        if last_change_id is not None:
+            self.last_change_id = last_change_id
+            self._synced_ids.clear()
+            self._missing_ids.clear()
+
+    def sync(self, student_lib, instructor_lib, course_lib):
+        """Apply changes since the last sync. Returns number of changes"""
+        # Commit queued writes first, otherwise re-reading a changed row
+        # would undo a write still in the queue
+        self._sql_conn.flush_writes()
+        with self._sql_conn.borrow_connection() as conn:
+            if not conn:
+                return 0
+            sql_retrieve = SQLRetrieve(conn)
+            changes = sql_retrieve.get_changes(self.last_change_id)
+            if changes is None:
+                return 0
+            # Entries after last_change_id already synced are skipped
+            changes = [c for c in changes if c['change_id'] not in
+                       self._synced_ids]
+            if not changes:
+                self._advance(())
+                return 0
+
+            course_ids = set()
+            section_ids = set()  # sections added, changed or deleted
+            lab_ids = set()
+            section_regs = set()  # (section ID, username) pairs changed
+            lab_regs = set()  # (lab ID, username) pairs changed
+            grade_section_ids = set()
+            waitlist_section_ids = set()
+            waitlist_lab_ids = set()
+            for c in changes:
+                if c['table_name'] == 'Course':
+                    course_ids.add(c['row_id'])
+                elif c['table_name'] == 'Section':
+                    section_ids.add(c['row_id'])
+                elif c['table_name'] == 'Lab':
+                    lab_ids.add(c['row_id'])
+                elif c['table_name'] == 'SectionStudent':
+                    section_regs.add((c['parent_id'], c['student_username']))
+                elif c['table_name'] == 'LabStudent':
+                    lab_regs.add((c['parent_id'], c['student_username']))
+                elif c['table_name'] == 'Grade':
+                    grade_section_ids.add(c['parent_id'])
+                elif c['table_name'] == 'SectionWaitlist':
+                    waitlist_section_ids.add(c['parent_id'])
+                elif c['table_name'] == 'LabWaitlist':
+                    waitlist_lab_ids.add(c['parent_id'])
+
+            # Read current state of changed rows
+            courses = sql_retrieve.get_courses(course_ids) if course_ids \
+                else None
+            sections = sql_retrieve.get_sections(section_ids) if section_ids \
+                else None
+            labs = sql_retrieve.get_labs(lab_ids) if lab_ids else None
+            # Versions are read before rosters, so that they are never newer
+            # than the rosters read
+            section_versions = sql_retrieve.get_versions(
+                'Section', {section_id for section_id, _ in section_regs}) \
+                if section_regs else None
+            lab_versions = sql_retrieve.get_versions(
+                'Lab', {lab_id for lab_id, _ in lab_regs}) if lab_regs \
+                else None
+            section_students = sql_retrieve.get_all_section_students(
+                {section_id for section_id, _ in section_regs}) \
+                if section_regs else None
+            lab_students = sql_retrieve.get_all_lab_students(
+                {lab_id for lab_id, _ in lab_regs}) if lab_regs else None
+            section_grades = sql_retrieve.get_all_section_grades(
+                grade_section_ids) if grade_section_ids else None
+            section_waitlists = sql_retrieve.get_all_section_waitlists(
+                waitlist_section_ids) if waitlist_section_ids else None
+            lab_waitlists = sql_retrieve.get_all_lab_waitlists(
+                waitlist_lab_ids) if waitlist_lab_ids else None
+
+        if courses is not None:
+            self._apply_courses(courses, course_ids, instructor_lib,
+                                course_lib)
+        if sections is not None:
+            self._apply_registerables(sections, 'section_id', 'section_number',
+                                      section_ids, course_lib.sections_by_id,
+                                      course_lib)
+        if labs is not None:
+            self._apply_registerables(labs, 'lab_id', 'lab_number', lab_ids,
+                                      course_lib.labs_by_id, course_lib)
+        if section_students is not None:
+            current = {(st['section_id'], st['student_username']):
+                       st['status'] for st in section_students}
+            for section_id, username in section_regs:
+                self._apply_registration(
+                    course_lib.sections_by_id.get(section_id),
+                    student_lib.get_student(username),
+                    current.get((section_id, username)), True)
+        if lab_students is not None:
+            current = {(st['lab_id'], st['student_username']): st['status']
+                       for st in lab_students}
+            for lab_id, username in lab_regs:
+                self._apply_registration(
+                    course_lib.labs_by_id.get(lab_id),
+                    student_lib.get_student(username),
+                    current.get((lab_id, username)), False)
+        if section_versions:
+            self._apply_versions(section_versions, course_lib.sections_by_id)
+        if lab_versions:
+            self._apply_versions(lab_versions, course_lib.labs_by_id)
+        if section_grades is not None:
+            self._apply_grades(section_grades, grade_section_ids, course_lib)
+        if section_waitlists is not None:
+            self._apply_waitlists(section_waitlists, 'section_id',
+                                  waitlist_section_ids,
+                                  course_lib.sections_by_id, student_lib)
+        if lab_waitlists is not None:
+            self._apply_waitlists(lab_waitlists, 'lab_id', waitlist_lab_ids,
+                                  course_lib.labs_by_id, student_lib)
+
+        self._advance(c['change_id'] for c in changes)
+        return len(changes)
+
+    def _advance(self, change_ids):
+        # Record the IDs synced and any IDs they skip over, then move
+        # last_change_id up to the first ID still missing
+        now = monotonic()
+        for change_id in change_ids:
+            self._synced_ids.add(change_id)
+            self._missing_ids.pop(change_id, None)
+        last_id = max(self._synced_ids, default=self.last_change_id)
+        for change_id in range(self.last_change_id + 1, last_id):
+            if change_id not in self._synced_ids:
+                self._missing_ids.setdefault(change_id, now)
+        for change_id, missing_since in list(self._missing_ids.items()):
+            if now - missing_since >= self.GAP_TIMEOUT:
+                del self._missing_ids[change_id]
+                self._synced_ids.add(change_id)
+        self.last_change_id = min(self._missing_ids) - 1 if \
+            self._missing_ids else last_id
+        self._synced_ids = {change_id for change_id in self._synced_ids
+                            if change_id > self.last_change_id}
+
+    def refresh_registerable(self, registerable, is_section, student_lib):
+        """Re-read the version, roster and waitlist of a section/lab, e.g.
+        after claiming a seat in it failed since another process changed it.
+        The schedules of students registered in or dropped from it by other
+        processes are reconciled as in sync"""
+        if registerable.loader:  # Not loaded yet, so load it now
+            registerable.loader()
+            return
+        # Queued writes must be committed for the db to be current
+        self._sql_conn.flush_writes()
+        registerable_ids = [registerable.id]
+        with self._sql_conn.borrow_connection() as conn:
+            if not conn:
+                return
+            sql_retrieve = SQLRetrieve(conn)
+            if is_section:
+                versions = sql_retrieve.get_versions('Section',
+                                                     registerable_ids)
+                students = sql_retrieve.get_all_section_students(
+                    registerable_ids)
+                waitlist = sql_retrieve.get_all_section_waitlists(
+                    registerable_ids)
+            else:
+                versions = sql_retrieve.get_versions('Lab', registerable_ids)
+                students = sql_retrieve.get_all_lab_students(
+                    registerable_ids)
+                waitlist = sql_retrieve.get_all_lab_waitlists(
+                    registerable_ids)
+        if not versions or students is None or waitlist is None:
+            return
+
+        current = {st['student_username']: st['status'] for st in students}
+        for username, student in list(
+                registerable.registered_students.items()):
+            if username not in current:
+                self._apply_registration(registerable, student, None,
+                                         is_section)
+        for username, status in current.items():
+            self._apply_registration(registerable,
+                                     student_lib.get_student(username),
+                                     status, is_section)
+        self._apply_waitlists(waitlist, 'section_id' if is_section else
+                              'lab_id', registerable_ids,
+                              {registerable.id: registerable}, student_lib)
+        registerable.version = versions[registerable.id]
+
+    @staticmethod
+    def _apply_courses(courses, course_ids, instructor_lib, course_lib):
+        # Courses in course_ids which are not in courses have been deleted
+        for course_id in course_ids - {c['course_id'] for c in courses}:
+            course = course_lib.courses_by_id.get(course_id)
+            if course:
+                for instructor in instructor_lib.instructors.values():
+                    if instructor.get_course(course.name) is course:
+                        del instructor.courses[course.name]
+                course_lib.remove_course(course)
+        for c in courses:
+            course = course_lib.courses_by_id.get(c['course_id'])
+            if course:
+                course.set_approval_required(c['approval_required'])
+                course.lab_required = c['lab_required']
+                if course.instructor_name != c['instructor_name']:
+                    # Course has been reassigned to another instructor
+                    for instructor in instructor_lib.instructors.values():
+                        if instructor.get_course(course.name) is course:
+                            del instructor.courses[course.name]
+                    instructor_lib.get_instructor(c['instructor_username'])\
+                        .add_course(course)
+                    course.set_instructor(c['instructor_name'])
+            else:
+                new_course = course_lib.add_course(**c)
+                instructor_lib.get_instructor(c['instructor_username'])\
+                    .add_course(new_course)
+
+    @staticmethod
+    def _apply_registerables(rows, id_key, number_key, registerable_ids,
+                             registerables, course_lib):
+        # Add new sections/labs, update changed ones and remove those in
+        # registerable_ids which are not in rows (deleted)
+        current_ids = set()
+        for r in rows:
+            current_ids.add(r[id_key])
+            registerable = registerables.get(r[id_key])
+            if registerable and registerable.course_name != r['course_name']:
+                # Moved to another course
+                course_lib.remove_registerable(registerable)
+                registerable = None
+            if registerable:
+                registerable.course.update_registerable(
+                    registerable, r[number_key], r['max_registration'],
+                    r['time'], r['day'])
+            elif course_lib.get_course(r['course_name']):
+                if id_key == 'section_id':
+                    course_lib.add_section(**r)
+                else:
+                    course_lib.add_lab(**r)
+        for registerable_id in registerable_ids - current_ids:
+            registerable = registerables.get(registerable_id)
+            if registerable:
+                course_lib.remove_registerable(registerable)
+
+    @staticmethod
+    def _apply_registration(registerable, student, status, is_section):
+        # status is None if the registration no longer exists in the db
+        if not registerable or not student:
+            return
+        if not registerable.loader:
+            if status is None:
+                if registerable.is_student_in_registerable(student.username):
+                    registerable.remove_student(student.username)
+            elif registerable.is_student_in_registerable(student.username):
+                registerable.set_student_status(student.username, status)
+            else:
+                registerable.add_student(student, status)
 
+        schedule = student.get_schedule()
+        if not schedule.loader:
+            if is_section:
+                scheduled = schedule.get_section(registerable.course_name)
+            else:
+                scheduled = schedule.get_lab(registerable.course_name)
+            if status is None and scheduled is registerable:
+                if is_section:
+                    schedule.remove_section(registerable.course_name)
+                else:
+                    schedule.remove_lab(registerable.course_name)
+            elif status is not None and scheduled is not registerable:
+                if is_section:
+                    schedule.add_section(registerable)
+                else:
+                    schedule.add_lab(registerable)
 
+    @staticmethod
+    def _apply_versions(versions, registerables):
+        for registerable_id, version in versions.items():
+            registerable = registerables.get(registerable_id)
+            if registerable and not registerable.loader:
+                registerable.version = version
 
+    @staticmethod
+    def _apply_grades(section_grades, section_ids, course_lib):
+        # Grade books of changed sections are replaced with the db's grades
+        for section_id in section_ids:
+            section = course_lib.sections_by_id.get(section_id)
+            if section and not section.grade_book.loader:
+                section.grade_book.clear()
+        for g in section_grades:
+            section = course_lib.sections_by_id.get(g['section_id'])
+            if section and not section.grade_book.loader:
+                section.add_grade(g['student_username'], g['grade'])
 
+    @staticmethod
+    def _apply_waitlists(waitlists, id_key, registerable_ids, registerables,
+                         student_lib):
+        # Rebuild changed waitlists from their current rows
+        for registerable_id in registerable_ids:
+            registerable = registerables.get(registerable_id)
+            if registerable and not registerable.loader:
+                registerable.waitlist.clear()
+        for w in waitlists:
+            registerable = registerables.get(w[id_key])
+            if registerable and not registerable.loader:
+                registerable.waitlist.add(
+                    student_lib.get_student(w['student_username']),
+                    w['priority'])
@@ -2,228 +2,338 @@
 Module: Module which includes a set of functions which encapsulate
 necessary SQL queries for use in maintaining data permanence. Implemented
 as a set of functions since encapsulating in classes is largely unnecessary.
+Each function borrows a connection from the SQL connection pool and issues
+server-side prepared statements keyed on the IDs carried by the entities.
+If write-behind is enabled on the SQL connection, the writes are instead
+queued to be flushed in batches on a background thread.
+
+Writes are given as (statement, params, multi-row form) where the
+multi-row form, (prefix, row placeholder, suffix), is used by the
+write-behind queue to combine consecutive writes of the same statement
+into a single statement. It is None for writes which cannot be combined.
+
+Writes which register a student in a section/lab first claim a seat with a
+conditional update of its Enrolled count and Version, so that a process
+with a stale copy of the section/lab (e.g. another app node) cannot
+over-register it. These are always performed immediately since whether
+the claim succeeded must be known, and raise ClaimError if it could not be
+attempted (no connection or a database error), as distinct from the claim
+failing on a stale version. They first wait for queued writes to be
+committed (a synchronous flush of the write-behind queue, only when writes
+are queued), since the queued writes may free the seat being claimed or
+delete the student's earlier registration in the same section/lab.
+
+Writes which drop a student's registrations release their seats with an
+update counting the registrations being deleted in each section/lab, so
+that drops by several students can be combined by the write-behind queue.
 """
 from mysql.connector import Error
 
 
-def db_add_section_reg(status, sql_conn, student_username, section_number,
-                       course_name):
-    """Add a student's registration in a section to the SQL db"""
-    if not sql_conn.test_mode:
-        sql_conn.open_connection()
-        try:
-            conn = sql_conn.get_connection()
-            with conn.cursor() as cursor:
-                statement1 = "SELECT ID FROM Student " \
-                             f"WHERE UserName = " \
-                             f"'{student_username}';"
-                cursor.execute(statement1)
-                result1 = cursor.fetchone()
-                if not result1:
-                    return
-                student_id = result1[0]
-                statement2 = "SELECT s.ID FROM Section s " \
-                             "INNER JOIN Course c ON s.CourseID = c.ID " \
-                             f"WHERE s.Number = {section_number} " \
-                             f"AND c.Name = '{course_name}';"
-                cursor.execute(statement2)
-                result2 = cursor.fetchone()
-                if not result2:
-                    return
-                section_id = result2[0]
-                statement3 = "INSERT INTO SectionStudent " \
-                             "(SectionID, StudentID, Status) VALUES " \
-                             f"({section_id}, {student_id}, '{status}');"
-                cursor.execute(statement3)
-                conn.commit()
-        except Error as e:
-            print(e)
-        sql_conn.close_connection()
+class ClaimError(Exception):
+    """Raised when a seat claim could not be attempted in the SQL db"""
 
 
-def db_add_lab_reg(status, sql_conn, student_username, lab_number, course_name):
-    """Add a student's registration in a lab to the SQL db"""
-    if not sql_conn.test_mode:
-        sql_conn.open_connection()
+def _write(sql_conn, writes):
+    # Perform writes in a single transaction, or queue them for write-behind
+    if sql_conn.test_mode:
+        return
+    if sql_conn.write_behind:
+        sql_conn.write_behind.enqueue(writes)
+        return
+    with sql_conn.borrow_connection() as conn:
+        if not conn:
+            return
         try:
-            conn = sql_conn.get_connection()
-            with conn.cursor() as cursor:
-                statement1 = "SELECT ID FROM Student " \
-                             f"WHERE UserName = '{student_username}';"
-                cursor.execute(statement1)
-                result1 = cursor.fetchone()
-                if not result1:
-                    return
-                student_id = result1[0]
-                statement2 = "SELECT l.ID FROM Lab l " \
-                             "INNER JOIN Course c ON l.CourseID = c.ID " \
-                             f"WHERE l.Number = {lab_number} " \
-                             f"AND c.Name = '{course_name}';"
-                cursor.execute(statement2)
-                result2 = cursor.fetchone()
-                if not result2:
-                    return
-                lab_id = result2[0]
-                statement3 = "INSERT INTO LabStudent " \
-                             "(LabID, StudentID, Status) VALUES " \
-                             f"({lab_id}, {student_id}, '{status}');"
-                cursor.execute(statement3)
-                conn.commit()
+            for statement, params, _ in writes:
+                cursor = sql_conn.get_prepared_cursor(conn, statement)
+                cursor.execute(statement, params)
+            conn.commit()
         except Error as e:
             print(e)
-        sql_conn.close_connection()
 
 
-def db_delete_lab_reg(sql_conn, course_name, student_username):
-    """Delete a student's registration in a lab from the SQL db"""
-    if not sql_conn.test_mode:
-        sql_conn.open_connection()
-        conn = sql_conn.get_connection()
+def _claim(sql_conn, table_name, registerable_id, version, writes):
+    # Claim a seat in a section/lab (table_name 'Section' or 'Lab') and
+    # perform writes in a single transaction, if its version in the db is
+    # still version and it has a seat remaining. Returns whether the seat
+    # was claimed (raises ClaimError if the claim could not be attempted)
+    return _claim_all(sql_conn, [(table_name, [(registerable_id, version)])],
+                      writes)
+
+
+def _claim_all(sql_conn, claims, writes):
+    # Claim seats in several sections/labs and perform writes in a single
+    # transaction, if every section/lab still has its version in the db and
+    # a seat remaining. Claims are (table_name, list of (ID, version)), each
+    # made with a single (multi-row) statement. Returns whether the seats
+    # were claimed (False if a version is stale or a seat is not remaining).
+    # Raises ClaimError if the claim could not be attempted
+    if sql_conn.test_mode:
+        return True
+    # Queued writes (e.g. dropping the same course) must be committed first
+    sql_conn.flush_writes()
+    with sql_conn.borrow_connection() as conn:
+        if not conn:
+            raise ClaimError('no connection to SQL database')
         try:
-            with conn.cursor() as cursor:
-                statement = "DELETE ls FROM LabStudent ls " \
-                            "INNER JOIN Student s ON ls.StudentID = s.ID "\
-                            "INNER JOIN Lab l ON ls.LabID = " \
-                            "l.ID " \
-                            "INNER JOIN Course c ON l.CourseID = c.ID " \
-                            f"WHERE c.Name = '{course_name}' AND " \
-                            f"s.UserName = '{student_username}';"
-                cursor.execute(statement)
-                conn.commit()
+            for table_name, ids_versions in claims:
+                if len(ids_versions) == 1:
+                    condition = "ID = %s AND Version = %s"
+                else:
+                    condition = "(ID, Version) IN (" + \
+                                ", ".join(["(%s, %s)"] * len(ids_versions)) + \
+                                ")"
+                statement = f"UPDATE {table_name} SET Enrolled = Enrolled + " \
+                            f"1, Version = Version + 1 WHERE {condition} " \
+                            f"AND Enrolled < MaxRegistration;"
+                cursor = sql_conn.get_prepared_cursor(conn, statement)
+                cursor.execute(statement, tuple(
+                    p for id_version in ids_versions for p in id_version))
+                # Stale version or no seat remaining
+                if cursor.rowcount != len(ids_versions):
+                    conn.rollback()
+                    return False
+            for statement, params, _ in writes:
+                cursor = sql_conn.get_prepared_cursor(conn, statement)
+                cursor.execute(statement, params)
+            conn.commit()
+            return True
         except Error as e:
-            print(e)
-        sql_conn.close_connection()
+            try:
+                conn.rollback()
+            except Error:
+                pass  # Connection lost, so transaction rolled back anyway
+            raise ClaimError(str(e)) from e
+
+
+def _combine(writes):
+    # Combine writes of the same statement into a single multi-row write
+    _, _, (prefix, row, suffix) = writes[0]
+    return (prefix + ', '.join([row] * len(writes)) + suffix,
+            tuple(p for _, params, _ in writes for p in params),
+            None)
+
+
+def _release_seats(table_name, key, row, params):
+    # Release the seats of the registrations in sections/labs (table_name
+    # 'Section' or 'Lab') whose key column(s) match params, before they are
+    # deleted. Seats are counted per section/lab, so the multi-row form is
+    # correct when a section/lab is released more than once in a batch
+    prefix = f"UPDATE {table_name} JOIN (SELECT {table_name}ID AS ID, " \
+             f"COUNT(*) AS Released FROM {table_name}Student WHERE {key} IN ("
+    suffix = f") GROUP BY {table_name}ID) AS r ON {table_name}.ID = r.ID " \
+             f"SET {table_name}.Enrolled = {table_name}.Enrolled - " \
+             f"r.Released, {table_name}.Version = {table_name}.Version + 1;"
+    return prefix + row + suffix, params, (prefix, row, suffix)
+
+
+def _insert_section_reg(status, student_id, section_id):
+    return ("INSERT INTO SectionStudent (SectionID, StudentID, Status) "
+            "VALUES (%s, %s, %s);",
+            (section_id, student_id, status),
+            ("INSERT INTO SectionStudent (SectionID, StudentID, Status) "
+             "VALUES ", "(%s, %s, %s)", ";"))
+
+
+def _insert_lab_reg(status, student_id, lab_id):
+    return ("INSERT INTO LabStudent (LabID, StudentID, Status) "
+            "VALUES (%s, %s, %s);",
+            (lab_id, student_id, status),
+            ("INSERT INTO LabStudent (LabID, StudentID, Status) VALUES ",
+             "(%s, %s, %s)", ";"))
+
+
+def db_add_section_reg(status, sql_conn, student_id, section_id, version):
+    """Add a student's registration in a section to the SQL db, claiming a
+    seat. Returns False if the section's version in the db is no longer
+    version (or it is full), in which case nothing is written"""
+    return _claim(sql_conn, 'Section', section_id, version,
+                  [_insert_section_reg(status, student_id, section_id)])
+
+
+def db_add_lab_reg(status, sql_conn, student_id, lab_id, version):
+    """Add a student's registration in a lab to the SQL db, claiming a seat.
+    Returns False if the lab's version in the db is no longer version (or it
+    is full), in which case nothing is written"""
+    return _claim(sql_conn, 'Lab', lab_id, version,
+                  [_insert_lab_reg(status, student_id, lab_id)])
+
+
+def db_add_cart_reg(sql_conn, student_id, section_regs, lab_regs):
+    """Add a student's registrations in several sections and labs (lists of
+    (status, ID, version)) to the SQL db in a single transaction, claiming a
+    seat in each with one statement per table and adding the registrations
+    with one multi-row statement per table. Returns False if any section's/
+    lab's version in the db is no longer its version (or it is full), in
+    which case nothing is written"""
+    claims = [('Section', [(section_id, version) for _, section_id, version
+                           in section_regs])]
+    writes = [_combine([_insert_section_reg(status, student_id, section_id)
+                        for status, section_id, _ in section_regs])]
+    if lab_regs:
+        claims.append(('Lab', [(lab_id, version) for _, lab_id, version in
+                               lab_regs]))
+        writes.append(_combine([_insert_lab_reg(status, student_id, lab_id)
+                                for status, lab_id, _ in lab_regs]))
+    return _claim_all(sql_conn, claims, writes)
+
+
+def db_add_section_waitlist(sql_conn, student_id, section_id, priority):
+    """Add a student to a section's waitlist in the SQL db"""
+    _write(sql_conn, [(
+        "INSERT INTO SectionWaitlist (SectionID, StudentID, Priority) "
+        "VALUES (%s, %s, %s);",
+        (section_id, student_id, priority),
+        ("INSERT INTO SectionWaitlist (SectionID, StudentID, Priority) "
+         "VALUES ", "(%s, %s, %s)", ";")
+    )])
+
+
+def db_add_lab_waitlist(sql_conn, student_id, lab_id, priority):
+    """Add a student to a lab's waitlist in the SQL db"""
+    _write(sql_conn, [(
+        "INSERT INTO LabWaitlist (LabID, StudentID, Priority) "
+        "VALUES (%s, %s, %s);",
+        (lab_id, student_id, priority),
+        ("INSERT INTO LabWaitlist (LabID, StudentID, Priority) VALUES ",
+         "(%s, %s, %s)", ";")
+    )])
+
 
+def _delete_section_waitlist(student_id, section_id):
+    return ("DELETE FROM SectionWaitlist "
+            "WHERE SectionID = %s AND StudentID = %s;",
+            (section_id, student_id),
+            ("DELETE FROM SectionWaitlist WHERE (SectionID, StudentID) IN (",
+             "(%s, %s)", ");"))
 
-def db_delete_course_reg(sql_conn, course_name, student_username):
-    """Delete a student's registration in a course (section and lab)
+
+def _delete_lab_waitlist(student_id, lab_id):
+    return ("DELETE FROM LabWaitlist WHERE LabID = %s AND StudentID = %s;",
+            (lab_id, student_id),
+            ("DELETE FROM LabWaitlist WHERE (LabID, StudentID) IN (",
+             "(%s, %s)", ");"))
+
+
+def db_delete_section_waitlist(sql_conn, student_id, section_id):
+    """Remove a student from a section's waitlist in the SQL db"""
+    _write(sql_conn, [_delete_section_waitlist(student_id, section_id)])
+
+
+def db_delete_lab_waitlist(sql_conn, student_id, lab_id):
+    """Remove a student from a lab's waitlist in the SQL db"""
+    _write(sql_conn, [_delete_lab_waitlist(student_id, lab_id)])
+
+
+def db_promote_section_waitlist(status, sql_conn, student_id, section_id,
+                                version):
+    """Move a student from a section's waitlist into the section in the SQL
+     db, in a single transaction claiming a seat. Returns False if the
+     section's version in the db is no longer version (or it is full)"""
+    return _claim(sql_conn, 'Section', section_id, version,
+                  [_delete_section_waitlist(student_id, section_id),
+                   _insert_section_reg(status, student_id, section_id)])
+
+
+def db_promote_lab_waitlist(status, sql_conn, student_id, lab_id, version):
+    """Move a student from a lab's waitlist into the lab in the SQL db, in a
+     single transaction claiming a seat. Returns False if the lab's version
+     in the db is no longer version (or it is full)"""
+    return _claim(sql_conn, 'Lab', lab_id, version,
+                  [_delete_lab_waitlist(student_id, lab_id),
+                   _insert_lab_reg(status, student_id, lab_id)])
+
+
+def db_reschedule_lab_reg(status, sql_conn, student_id, old_lab_id,
+                          new_lab_id, version):
+    """Move a student's registration from one lab to another in the SQL db,
+    claiming a seat in the new lab and releasing the old lab's. Returns
+    False if the new lab's version in the db is no longer version (or it is
+    full)"""
+    return _claim(sql_conn, 'Lab', new_lab_id, version, [
+        _release_seats('Lab', '(LabID, StudentID)', '(%s, %s)',
+                       (old_lab_id, student_id)),
+        ("UPDATE LabStudent SET LabID = %s, Status = %s "
+         "WHERE LabID = %s AND StudentID = %s;",
+         (new_lab_id, status, old_lab_id, student_id),
+         None)
+    ])
+
+
+def db_delete_course_reg(sql_conn, student_id, section_id, lab_id):
+    """Delete a student's registration in a course (section and/or lab)
      from the SQL db"""
-    if not sql_conn.test_mode:
-        sql_conn.open_connection()
-        conn = sql_conn.get_connection()
-        try:
-            with conn.cursor() as cursor:
-                statement1 = "DELETE ss FROM SectionStudent ss " \
-                            "INNER JOIN Student s ON ss.StudentID = s.ID "\
-                            "INNER JOIN Section sec ON ss.SectionID = " \
-                            "sec.ID " \
-                            "INNER JOIN Course c ON sec.CourseID = c.ID " \
-                            f"WHERE c.Name = '{course_name}' AND " \
-                            f"s.UserName = '{student_username}';"
-                cursor.execute(statement1)
-                statement2 = "DELETE ls FROM LabStudent ls " \
-                            "INNER JOIN Student s ON ls.StudentID = s.ID "\
-                            "INNER JOIN Lab l ON ls.LabID = " \
-                            "l.ID " \
-                            "INNER JOIN Course c ON l.CourseID = c.ID " \
-                            f"WHERE c.Name = '{course_name}' AND " \
-                            f"s.UserName = '{student_username}';"
-                cursor.execute(statement2)
-                conn.commit()
-        except Error as e:
-            print(e)
-        sql_conn.close_connection()
+    writes = []
+    if section_id is not None:
+        writes.append(_release_seats('Section', '(SectionID, StudentID)',
+                                     '(%s, %s)', (section_id, student_id)))
+        writes.append((
+            "DELETE FROM SectionStudent "
+            "WHERE SectionID = %s AND StudentID = %s;",
+            (section_id, student_id),
+            ("DELETE FROM SectionStudent WHERE (SectionID, StudentID) IN (",
+             "(%s, %s)", ");")
+        ))
+    if lab_id is not None:
+        writes.append(_release_seats('Lab', '(LabID, StudentID)', '(%s, %s)',
+                                     (lab_id, student_id)))
+        writes.append((
+            "DELETE FROM LabStudent WHERE LabID = %s AND StudentID = %s;",
+            (lab_id, student_id),
+            ("DELETE FROM LabStudent WHERE (LabID, StudentID) IN (",
+             "(%s, %s)", ");")
+        ))
+    _write(sql_conn, writes)
 
 
-def db_delete_all_reg(sql_conn, student_username):
+def db_delete_all_reg(sql_conn, student_id):
     """Delete a student's registration in all courses (sections and labs)
      from the SQL db"""
-    if not sql_conn.test_mode:
-        sql_conn.open_connection()
-        conn = sql_conn.get_connection()
-        try:
-            with conn.cursor() as cursor:
-                statement1 = "DELETE ss FROM SectionStudent ss " \
-                            "INNER JOIN Student s ON ss.StudentID = s.ID "\
-                            f"WHERE s.UserName = '{student_username}';"
-                cursor.execute(statement1)
-                statement2 = "DELETE ls FROM LabStudent ls " \
-                            "INNER JOIN Student s ON ls.StudentID = s.ID "\
-                            f"WHERE s.UserName = '{student_username}';"
-                cursor.execute(statement2)
-                conn.commit()
-        except Error as e:
-            print(e)
-        sql_conn.close_connection()
+    _write(sql_conn, [
+        _release_seats('Section', 'StudentID', '%s', (student_id,)),
+        _release_seats('Lab', 'StudentID', '%s', (student_id,)),
+        ("DELETE FROM SectionStudent WHERE StudentID = %s;", (student_id,),
+         ("DELETE FROM SectionStudent WHERE StudentID IN (", "%s", ");")),
+        ("DELETE FROM LabStudent WHERE StudentID = %s;", (student_id,),
+         ("DELETE FROM LabStudent WHERE StudentID IN (", "%s", ");"))
+    ])
 
 
-def db_update_reg_status(status, sql_conn, student_username,
-                         course_name):
-    """Update a student's registration status in a course (section and lab)
-     in the SQL db"""
-    if not sql_conn.test_mode:
-        sql_conn.open_connection()
-        conn = sql_conn.get_connection()
-        try:
-            with conn.cursor() as cursor:
-                statement1 = "UPDATE SectionStudent ss " \
-                             "INNER JOIN Student s ON ss.StudentID = s.ID"\
-                             " INNER JOIN Section sec ON ss.SectionID = " \
-                             "sec.ID "\
-                             "INNER JOIN Course c ON sec.CourseID = c.ID "\
-                             f"SET ss.Status = '{status}' " \
-                             f"WHERE s.UserName = '{student_username}' " \
-                             f"AND c.Name = '{course_name}';"
-                cursor.execute(statement1)
-                statement2 = "UPDATE LabStudent ls " \
-                             "INNER JOIN Student s ON ls.StudentID = s.ID"\
-                             " INNER JOIN Lab l ON ls.LabID = l.ID " \
-                             "INNER JOIN Course c ON l.CourseID = c.ID "\
-                             f"SET ls.Status = '{status}' " \
-                             f"WHERE s.UserName = '{student_username}' " \
-                             f"AND c.Name = '{course_name}';"
-                cursor.execute(statement2)
-                conn.commit()
-        except Error as e:
-            print(e)
-        sql_conn.close_connection()
+def db_update_reg_status(status, sql_conn, student_id, section_id, lab_id):
+    """Update a student's registration status in a course (section and/or
+     lab) in the SQL db"""
+    writes = []
+    if section_id is not None:
+        writes.append((
+            "UPDATE SectionStudent SET Status = %s "
+            "WHERE SectionID = %s AND StudentID = %s;",
+            (status, section_id, student_id),
+            None
+        ))
+    if lab_id is not None:
+        writes.append((
+            "UPDATE LabStudent SET Status = %s "
+            "WHERE LabID = %s AND StudentID = %s;",
+            (status, lab_id, student_id),
+            None
+        ))
+    _write(sql_conn, writes)
 
 
-def db_update_approval_required(sql_conn, app_req, course_name):
+def db_update_approval_required(sql_conn, app_req, course_id):
     """Update a course's approval required state in SQL db"""
-    if not sql_conn.test_mode:
-        sql_conn.open_connection()
-        conn = sql_conn.get_connection()
-        try:
-            with conn.cursor() as cursor:
-                statement = "UPDATE Course " \
-                            f"SET ApprovalRequired = {str(app_req)} " \
-                            f"WHERE Name = '{course_name}';"
-                cursor.execute(statement)
-                conn.commit()
-        except Error as e:
-            print(e)
-        sql_conn.close_connection()
+    _write(sql_conn, [(
+        "UPDATE Course SET ApprovalRequired = %s WHERE ID = %s;",
+        (app_req, course_id),
+        None
+    )])
 
 
-def db_add_grade(sql_conn, course_name, section_number, student_username,
-                 grade):
-    if not sql_conn.test_mode:
-        sql_conn.open_connection()
-        conn = sql_conn.get_connection()
-        try:
-            with conn.cursor() as cursor:
-                statement1 = "SELECT ID FROM Student " \
-                             f"WHERE UserName = '{student_username}';"
-                cursor.execute(statement1)
-                result1 = cursor.fetchone()
-                if not result1:
-                    return
-                student_id = result1[0]
-                statement2 = "SELECT sec.ID FROM Section sec " \
-                             "INNER JOIN Course c ON sec.CourseID = c.ID " \
-                             f"WHERE sec.Number = {section_number} " \
-                             f"AND c.Name = '{course_name}';"
-                cursor.execute(statement2)
-                result2 = cursor.fetchone()
-                if not result2:
-                    return
-                section_id = result2[0]
-                statement3 = "INSERT INTO Grade " \
-                             "(SectionID, StudentID, Grade) VALUES " \
-                             f"({section_id}, {student_id}, {grade});"
-                cursor.execute(statement3)
-                conn.commit()
-        except Error as e:
-            print(e)
-        sql_conn.close_connection()
\ No newline at end of file
+def db_add_grade(sql_conn, section_id, student_id, grade):
+    _write(sql_conn, [(
+        "INSERT INTO Grade (SectionID, StudentID, Grade) VALUES (%s, %s, %s);",
+        (section_id, student_id, grade),
+        ("INSERT INTO Grade (SectionID, StudentID, Grade) VALUES ",
+         "(%s, %s, %s)", ";")
+    )])
@@ -0,0 +1,69 @@
+"""
+Module: Benchmark of grade statistics. Synthetic sections with grades are
+generated (see rush_benchmark.py) and loaded, and the statistics of every
+section computed in one vectorized pass over all sections
+(CourseLibrary.get_section_grade_statistics) timed against computing them
+section by section, along with the statistics of a department and of a
+single section (best of --repeat runs).
+"""
+from argparse import ArgumentParser
+from timeit import repeat
+from courses import compute_grade_statistics
+from registration import RegistrationFacade
+from rush_benchmark import generate_data, generate_registrations
+
+
+def get_statistics_by_section(course_library):
+    # Statistics of each section with grades, computed section by section
+    statistics = {}
+    for course in course_library.courses.values():
+        for section in course.sections.values():
+            averages = section.grade_book.get_average_column()[1]
+            if len(averages):
+                statistics[(course.name, section.number)] = \
+                    compute_grade_statistics(averages)
+    return statistics
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--courses', type=int, default=2000)
+    parser.add_argument('--sections', type=int, default=1,
+                        help='sections per course')
+    parser.add_argument('--courses-per-student', type=int, default=4)
+    parser.add_argument('--grades', type=int, default=10,
+                        help='grades per student per course')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    data = generate_registrations(
+        generate_data(args.students, args.courses, args.sections, 0,
+                      args.students), args.courses_per_student, args.grades)
+    reg = RegistrationFacade(test_mode=True, audit_logging=False)
+    reg.load_data(data)
+    course_library = reg.course_library
+    department = data['get_courses'][0]['department']
+    course = reg.get_course(data['get_courses'][0]['name'])
+    section = course.get_section(1)
+    assert course_library.get_section_grade_statistics().keys() == \
+        get_statistics_by_section(course_library).keys()
+
+    print(f"{str(len(data['get_sections']))} sections, "
+          f"{str(len(data['get_all_section_grades']))} grades "
+          f"(best of {str(args.repeat)})")
+    for label, statistics in (
+            ('all sections, grouped',
+             course_library.get_section_grade_statistics),
+            ('all sections, by section',
+             lambda: get_statistics_by_section(course_library)),
+            (f'department ({department})',
+             lambda: course_library.get_grade_statistics(department)),
+            ('single section', lambda: compute_grade_statistics(
+                section.grade_book.get_average_column()[1]))):
+        run_time = min(repeat(statistics, number=1, repeat=args.repeat))
+        print(f'{label:<36} {run_time * 1000:>9.3f}ms')
+
+
+if __name__ == '__main__':
+    main()
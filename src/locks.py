@@ -0,0 +1,176 @@
+"""
+Module: Locks guarding students, sections and labs so that registration
+actions can be run from several threads at once
+"""
+from contextlib import contextmanager
+from threading import Condition, RLock, get_ident, local
+from courses import Section, Lab
+from people import Student
+
+
+class LockManager:
+    """Per-student, per-section and per-lab locks. An action holds the locks
+    of every student and section/lab it reads or modifies, acquired in a
+    fixed global order (students by username, then sections, then labs, each
+    by course name and number) so that actions holding several locks (e.g.
+    lab reschedules and dropping all courses) cannot deadlock. Locks are
+    created on first use and are re-entrant, but a thread holding locks may
+    only take further locks which come later in the order. Work which needs
+    locks earlier in the order (e.g. promoting a student from the waitlist
+    of a section being dropped) is deferred with after_release.
+
+    Bulk operations over the whole system (e.g. syncing from the database or
+    writing a snapshot) instead hold the exclusive lock, which waits for
+    every action holding locks to finish and keeps new ones waiting until it
+    is released. Actions holding locks share it, taking it on their
+    outermost hold. Actions left waiting by the exclusive lock are let in
+    before it can be taken again, so that back-to-back bulk operations
+    cannot starve them."""
+    ORDER = (Student, Section, Lab)
+
+    def __init__(self):
+        self._locks = {}  # key = lock key (see get_key), value = RLock
+        self._entries = {}  # key = student/section/lab, value = (lock key,
+        # RLock). Entities replaced by a new object with the same key (e.g.
+        # by a sync) share the lock
+        self._local = local()  # per thread: state = (held, deferred): list of
+        # the (lock key, RLock) entries of each hold entered, and list of
+        # (callback, args) to call once no locks are held
+        self._condition = Condition()  # guards shared count and exclusive
+        # owner
+        self._shared_count = 0  # threads in an outermost hold
+        self._shared_waiting = 0  # threads waiting to take the shared lock
+        self._admitting = 0  # threads left waiting by the last exclusive
+        # hold which are yet to take the shared lock
+        self._exclusive_owner = None  # ident of thread holding (or waiting
+        # for) the exclusive lock
+
+    @classmethod
+    def get_key(cls, entity):
+        """Key of entity's lock. Keys sort in the order locks are acquired"""
+        if type(entity) is Student:
+            return 0, entity.username
+        return cls.ORDER.index(type(entity)), entity.course_name, \
+            entity.number
+
+    def _add_entry(self, entity):
+        # setdefault is atomic, so threads creating the same lock at once
+        # all get the one stored
+        key = self.get_key(entity)
+        entry = key, self._locks.get(key) or self._locks.setdefault(key,
+                                                                    RLock())
+        self._entries[entity] = entry
+        return entry
+
+    def _get_state(self):
+        # (held, deferred) of the current thread
+        try:
+            return self._local.state
+        except AttributeError:
+            self._local.state = ([], [])
+            return self._local.state
+
+    def hold(self, *entities):
+        """Context manager holding the locks of the given students, sections
+        and labs (None is ignored) for the duration of the with block"""
+        entries = [self._entries.get(entity) or self._add_entry(entity) for
+                   entity in entities if entity is not None]
+        if len(entries) > 1:
+            entries.sort()  # entries with equal keys share their lock
+        return _HeldLocks(self, entries)
+
+    @contextmanager
+    def hold_exclusive(self):
+        """Context manager holding the exclusive lock for the duration of the
+        with block. Must not be entered while holding locks"""
+        held, deferred = self._get_state()
+        if held:
+            raise RuntimeError('Exclusive lock acquired while holding locks')
+        with self._condition:
+            self._condition.wait_for(lambda: self._exclusive_owner is None
+                                     and not self._admitting)
+            self._exclusive_owner = get_ident()
+            self._condition.wait_for(lambda: not self._shared_count)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._exclusive_owner = None
+                self._admitting = self._shared_waiting
+                self._condition.notify_all()
+            while deferred:
+                callback, args = deferred.pop(0)
+                callback(*args)
+
+    def _acquire_shared(self):
+        # Taken by a thread's outermost hold, unless it holds the exclusive
+        # lock. Returns whether it was taken
+        owner = self._exclusive_owner
+        if owner == get_ident():
+            return False
+        with self._condition:
+            if self._exclusive_owner is not None:
+                self._shared_waiting += 1
+                self._condition.wait_for(
+                    lambda: self._exclusive_owner is None)
+                self._shared_waiting -= 1
+                if self._admitting:
+                    self._admitting -= 1
+                    if not self._admitting:
+                        self._condition.notify_all()
+            self._shared_count += 1
+        return True
+
+    def _release_shared(self):
+        with self._condition:
+            self._shared_count -= 1
+            if not self._shared_count:
+                self._condition.notify_all()
+
+    def after_release(self, callback, *args):
+        """Call callback(*args) once the current thread holds no locks
+        (immediately if it holds none)"""
+        held, deferred = self._get_state()
+        if held:
+            deferred.append((callback, args))
+        else:
+            callback(*args)
+
+
+class _HeldLocks:
+    # Context manager returned by LockManager.hold
+
+    __slots__ = ('manager', 'entries', 'state', 'shared')
+
+    def __init__(self, manager, entries):
+        self.manager = manager
+        self.entries = entries  # (lock key, RLock), in order of lock key
+        self.state = None
+        self.shared = False  # whether this hold took the shared lock
+
+    def __enter__(self):
+        self.state = self.manager._get_state()
+        held = self.state[0]
+        if held:  # Only locks later in the order may be taken
+            held_keys = {key for entries in held for key, _ in entries}
+            new_keys = [key for key, _ in self.entries if
+                        key not in held_keys]
+            if new_keys and held_keys and new_keys[0] < max(held_keys):
+                raise RuntimeError(f'Lock {new_keys[0]} acquired out of '
+                                   f'order')
+        else:
+            self.shared = self.manager._acquire_shared()
+        for _, lock in self.entries:
+            lock.acquire()
+        held.append(self.entries)
+
+    def __exit__(self, *exc_info):
+        held, deferred = self.state
+        held.pop()
+        for _, lock in reversed(self.entries):
+            lock.release()
+        if self.shared:
+            self.manager._release_shared()
+        while deferred and not held:
+            callback, args = deferred.pop(0)
+            callback(*args)
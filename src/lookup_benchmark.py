@@ -0,0 +1,84 @@
+"""
+Module: Benchmark of finding the section/lab of a course a student is
+registered in (Course.find_student_section/find_student_lab) with the
+course's registration index, against scanning every section/lab of the
+course for the student as before the index. A synthetic course (see
+rush_benchmark.py) with every section and lab full is loaded, and lookups of
+registered students (hits) and of students not registered (misses) timed.
+"""
+from argparse import ArgumentParser
+from timeit import timeit
+from registration import RegistrationFacade
+from rush_benchmark import generate_data
+
+
+def scan_sections(course, username):
+    # Lookup before the index: first section the student is registered in
+    for section in course.sections.values():
+        if section.is_student_in_registerable(username):
+            return section
+    return None
+
+
+def scan_labs(course, username):
+    for lab in course.labs.values():
+        if lab.is_student_in_registerable(username):
+            return lab
+    return None
+
+
+def build_course(sections, capacity):
+    """Facade with a course of sections sections and labs, each with
+    capacity students registered, and as many students not registered"""
+    data = generate_data(2 * sections * capacity, 1, sections, sections,
+                         capacity, lab_share=1, approval_share=0)
+    for i, student in enumerate(data['get_students'][:sections * capacity]):
+        data['get_all_section_students'].append({
+            'section_id': i // capacity + 1,
+            'student_username': student['username'], 'status': 'Approved'})
+        data['get_all_lab_students'].append({
+            'lab_id': i // capacity + 1,
+            'student_username': student['username'], 'status': 'Approved'})
+    reg = RegistrationFacade(test_mode=True, audit_logging=False)
+    reg.load_data(data)
+    return reg.get_course(data['get_courses'][0]['name']), \
+        [s['username'] for s in data['get_students']]
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--sections', type=int, default=60,
+                        help='sections (and labs) of the course')
+    parser.add_argument('--capacity', type=int, default=40,
+                        help='students per section/lab')
+    parser.add_argument('--lookups', type=int, default=10000,
+                        help='lookups of each kind timed (about)')
+    args = parser.parse_args()
+
+    course, usernames = build_course(args.sections, args.capacity)
+    registered = len(usernames) // 2
+    # Spread over the sections, so that scans stop at each in turn
+    hits = usernames[:registered:max(registered // args.lookups, 1)]
+    misses = usernames[registered:][:len(hits)]
+    print(f'{len(course.sections)} sections and labs of '
+          f'{str(args.capacity)} students, {len(hits)} lookups of each kind '
+          '(time per lookup)')
+    print(f"{'lookup':<16} {'index':>10} {'scan':>10}")
+    for label, lookups in (('section (hit)', hits),
+                           ('section (miss)', misses),
+                           ('lab (hit)', hits), ('lab (miss)', misses)):
+        index, scan = (course.find_student_section, scan_sections) if \
+            label.startswith('section') else (course.find_student_lab,
+                                               scan_labs)
+        assert all(index(username) is scan(course, username) for username in
+                   lookups)
+        index_time = timeit(lambda: [index(username) for username in
+                                     lookups], number=1)
+        scan_time = timeit(lambda: [scan(course, username) for username in
+                                    lookups], number=1)
+        print(f'{label:<16} {index_time / len(lookups) * 1e6:>8.2f}us '
+              f'{scan_time / len(lookups) * 1e6:>8.2f}us')
+
+
+if __name__ == '__main__':
+    main()
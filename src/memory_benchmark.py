@@ -0,0 +1,253 @@
+"""
+Module: Benchmark of the memory held by the loaded system per student, with
+the current entity layout (slotted entities, int registration statuses,
+interned strings and rosters without a tuple per registration) against the
+layout before it (entities with attribute dicts, rosters of (Student, status
+string) tuples and grade books of lists, holding the strings of the rows
+read). Synthetic students, courses and registrations are generated (see
+rush_benchmark.py) for each number of students and loaded into each layout
+with tracemalloc tracing. The rows are read one at a time as from the
+database, with equal values as distinct strings, so only the memory held by
+the loaded system remains traced. Reported is that memory, per student and
+(for the current layout) by the source file allocating it.
+"""
+from argparse import ArgumentParser
+import gc
+import os
+from time import perf_counter
+import tracemalloc
+from courses import CourseLibrary
+from db_management import SQLConnection, MongoConnection
+from people import StudentLibrary, InstructorLibrary
+from registration import RegistrationFacade
+from rush_benchmark import generate_data, generate_registrations
+
+SINGLETONS = (StudentLibrary, InstructorLibrary, CourseLibrary,
+              SQLConnection, MongoConnection)
+
+
+class LegacyStudent:
+    """Student (and schedule) as laid out before slotted entities"""
+
+    def __init__(self, **kwargs):
+        self.first_name = kwargs['first_name']
+        self.last_name = kwargs['last_name']
+        self.university_id = kwargs['university_id']
+        self.username = kwargs['username']
+        self.department = kwargs['department']
+        self.id = kwargs.get('student_id')
+        self.is_full_time = kwargs['is_full_time']
+        self.major = kwargs['major']
+        self.program = kwargs['program']
+        self.schedule = LegacySchedule()
+
+
+class LegacySchedule:
+
+    def __init__(self):
+        self.sections = {}  # key = course_name, value = LegacyRegisterable
+        self.labs = {}
+        self.loader = None
+
+
+class LegacyInstructor:
+
+    def __init__(self, **kwargs):
+        self.first_name = kwargs['first_name']
+        self.last_name = kwargs['last_name']
+        self.university_id = kwargs['university_id']
+        self.username = kwargs['username']
+        self.department = kwargs['department']
+        self.division = kwargs['division']
+        self.is_department_chair = kwargs['is_department_chair']
+        self.courses = {}  # key = course_name, value = LegacyCourse
+
+
+class LegacyCourse:
+
+    def __init__(self, **kwargs):
+        self.id = kwargs.get('course_id')
+        self.number = kwargs['number']
+        self.name = kwargs['name']
+        self.department = kwargs['department']
+        self.division = kwargs['division']
+        self.program = kwargs['program']
+        self.lab_required = kwargs['lab_required']
+        self.instructor_name = kwargs['instructor_name']
+        self.approval_required = kwargs['approval_required']
+        self.sections = {}  # key = section_number, value =
+        # LegacyRegisterable
+        self.labs = {}
+        self.student_sections = {}  # key = username, value =
+        # LegacyRegisterable
+        self.student_labs = {}
+        self.loader = None
+
+
+class LegacyRegisterable:
+    """Section/lab as laid out before slotted entities, with a grade book
+    (of lists of grades by username) if a section"""
+
+    def __init__(self, course, number, max_registration, time, day, id,
+                 is_section):
+        self.id = id
+        self.course = course
+        self.number = number
+        self.course_name = course.name
+        self.course_number = course.number
+        self.course_program = course.program
+        self.course_instructor = course.instructor_name
+        self.registered_students = {}  # key = username, value = (Student,
+        # status string)
+        self.max_registration = max_registration
+        self.time = time
+        self.day = day
+        self.loader = None
+        if is_section:
+            self.grade_book = {}
+
+
+def load_legacy(data):
+    """Libraries (dicts of entities by key) populated from rows (see
+    RegistrationFacade.load_data) in the layout before slotted entities"""
+    students = {row['username']: LegacyStudent(**row) for row in
+                data['get_students']}
+    instructors = {row['username']: LegacyInstructor(**row) for row in
+                   data['get_instructors']}
+    courses = {}
+    courses_by_id = {}
+    for row in data['get_courses']:
+        course = courses[row['name']] = courses_by_id[row['course_id']] = \
+            LegacyCourse(**row)
+        instructors[row['instructor_username']].courses[course.name] = course
+    registerables_by_id = {}  # key = 'section'/'lab', value = dict: key =
+    # ID, value = LegacyRegisterable
+    for kind, number_key in (('section', 'section_number'),
+                             ('lab', 'lab_number')):
+        by_id = registerables_by_id[kind] = {}
+        for row in data[f'get_{kind}s']:
+            course = courses[row['course_name']]
+            by_id[row[f'{kind}_id']] = getattr(course, f'{kind}s')[
+                row[number_key]] = LegacyRegisterable(
+                course, row[number_key], row['max_registration'],
+                row['time'], row['day'], row[f'{kind}_id'],
+                kind == 'section')
+    for kind in ('section', 'lab'):
+        for row in data[f'get_all_{kind}_students']:
+            registerable = registerables_by_id[kind][row[f'{kind}_id']]
+            student = students[row['student_username']]
+            getattr(student.schedule, f'{kind}s')[
+                registerable.course_name] = registerable
+            registerable.registered_students[student.username] = \
+                (student, row['status'])
+            getattr(registerable.course, f'student_{kind}s')[
+                student.username] = registerable
+    for row in data['get_all_section_grades']:
+        registerables_by_id['section'][row['section_id']].grade_book\
+            .setdefault(row['student_username'], []).append(row['grade'])
+    return (students, instructors, courses, courses_by_id,
+            registerables_by_id)
+
+
+def load_current(data):
+    """Facade populated from rows, with fresh libraries"""
+    for singleton in SINGLETONS:
+        singleton.__instance__ = None
+    reg = RegistrationFacade(test_mode=True, audit_logging=False)
+    reg.load_data(data)
+    return reg
+
+
+def compact_rows(data):
+    """Rows of each query as (keys, list of tuples of values), taking less
+    memory than the rows while they wait to be read (see read_rows)"""
+    compact = {}
+    for query in list(data):
+        rows = data.pop(query)
+        compact[query] = (tuple(rows[0]) if rows else (),
+                          [tuple(row.values()) for row in rows])
+    return compact
+
+
+def read_rows(compact):
+    # Rows of each query as read from the database, one at a time: equal
+    # values are distinct strings (unlike the generated rows, which share
+    # the strings of each value)
+    def read(keys, values):
+        for row_values in values:
+            yield dict(zip(keys, (value.encode().decode() if
+                                  isinstance(value, str) else value for
+                                  value in row_values)))
+    return {query: read(keys, values) for query, (keys, values) in
+            compact.items()}
+
+
+def measure(args, student_count, load, by_file):
+    """(Rows loaded of each query, seconds taken, bytes held once loaded,
+    top statistics by source file if by_file) of loading student_count
+    synthetic students with load"""
+    compact = compact_rows(generate_registrations(
+        generate_data(student_count, args.courses, args.sections, args.labs,
+                      args.capacity), args.courses_per_student, args.grades,
+        args.non_approved))
+    counts = {query: len(values) for query, (_, values) in compact.items()}
+    gc.collect()
+    tracemalloc.start()
+    start = perf_counter()
+    loaded = load(read_rows(compact))
+    load_time = perf_counter() - start
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0]
+    statistics = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)]).statistics(
+        'filename')[:5] if by_file else None
+    tracemalloc.stop()
+    del loaded
+    return counts, load_time, held, statistics
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--students', type=int, nargs='+',
+                        default=[100000, 1000000])
+    parser.add_argument('--courses', type=int, default=2000)
+    parser.add_argument('--sections', type=int, default=2,
+                        help='sections per course')
+    parser.add_argument('--labs', type=int, default=2,
+                        help='labs per course requiring a lab')
+    parser.add_argument('--capacity', type=int, default=200,
+                        help='seats per section/lab')
+    parser.add_argument('--courses-per-student', type=int, default=3)
+    parser.add_argument('--grades', type=int, default=0,
+                        help='grades per student per course')
+    parser.add_argument('--non-approved', type=float, default=0.2,
+                        help="share of registrations 'Pending' or "
+                             "'Tentative'")
+    args = parser.parse_args()
+
+    for student_count in args.students:
+        results = [(label, measure(args, student_count, load,
+                                   label == 'current')) for
+                   label, load in (('before', load_legacy),
+                                   ('current', load_current))]
+        counts = results[0][1][0]
+        print(f"{str(student_count)} students, "
+              f"{str(counts['get_all_section_students'])} section and "
+              f"{str(counts['get_all_lab_students'])} lab registrations, "
+              f"{str(counts['get_all_section_grades'])} grades")
+        print(f"{'layout':<10} {'held':>10} {'per student':>12} "
+              f"{'load (traced)':>14}")
+        for label, (_, load_time, held, _) in results:
+            print(f'{label:<10} {held / 2 ** 20:>6.1f} MiB '
+                  f'{held / student_count:>10.0f} B {load_time:>13.2f}s')
+        # Strings read from the rows are allocated by this module, as is
+        # everything held before
+        print('  current by file: ' + ', '.join(
+            f'{os.path.basename(stat.traceback[0].filename)} '
+            f'{stat.size / 2 ** 20:.1f} MiB' for stat in results[1][1][3]
+            if stat.size >= 2 ** 20))
+        print()
+
+
+if __name__ == '__main__':
+    main()
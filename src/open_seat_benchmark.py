@@ -0,0 +1,92 @@
+"""
+Module: Benchmark of finding sections and labs with open seats
+(CourseLibrary.find_open_seats, through the open-seat index) against scanning
+every section and lab of the catalog. A synthetic catalog (see
+rush_benchmark.py) with most sections full is loaded, and queries without
+filters and filtered by department, day and minimum seats timed (best of
+--repeat runs).
+"""
+from argparse import ArgumentParser
+from itertools import chain
+from random import Random
+from timeit import repeat
+from courses import get_day_slots
+from registration import RegistrationFacade
+from rush_benchmark import generate_data
+
+STUDENT_COUNT = 4000
+
+
+def find_open_seats_scan(course_library, department=None, day=None,
+                         min_seats=1, limit=None):
+    # Sections/labs with at least min_seats seats remaining, most first,
+    # found by scanning the catalog
+    day_slots = get_day_slots(day) if day else None
+    found = [registerable for course in course_library.courses.values()
+             if not department or course.department == department
+             for registerable in chain(course.sections.values(),
+                                       course.labs.values())
+             if registerable.seats_remaining >= min_seats and
+             (day_slots is None or registerable.time_slots & day_slots)]
+    found.sort(key=lambda registerable: registerable.seats_remaining,
+               reverse=True)
+    return found[:limit]
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--courses', type=int, default=20000)
+    parser.add_argument('--capacity', type=int, default=2,
+                        help='seats per section')
+    parser.add_argument('--open-share', type=float, default=0.1,
+                        help='share of sections with seats remaining')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # Two sections per course, each full or with some seats remaining
+    data = generate_data(STUDENT_COUNT, args.courses, 2, 0, args.capacity,
+                         lab_share=0)
+    rng = Random(0)
+    for i, section in enumerate(data['get_sections']):
+        registered = rng.randrange(args.capacity) if \
+            rng.random() < args.open_share else args.capacity
+        for n in range(registered):
+            # Students of a course's two sections are distinct
+            data['get_all_section_students'].append({
+                'section_id': section['section_id'],
+                'student_username':
+                    f'student{str((i * args.capacity + n) % STUDENT_COUNT)}',
+                'status': 'Approved'})
+    reg = RegistrationFacade(test_mode=True, audit_logging=False)
+    reg.load_data(data)
+    course_library = reg.course_library
+    department = data['get_courses'][0]['department']
+
+    print(f"{str(len(data['get_sections']))} sections, "
+          f'{str(len(course_library.open_seats))} with seats remaining '
+          f'(top {str(args.limit)}, best of {str(args.repeat)})')
+    print(f"{'query':<28} {'index':>9} {'scan':>9}")
+    for label, kwargs in (('no filter', {}),
+                          (f'department ({department})',
+                           {'department': department}),
+                          ('day (Monday)', {'day': 'Monday'}),
+                          (f'min seats {str(args.capacity)}',
+                           {'min_seats': args.capacity})):
+        found = course_library.find_open_seats(limit=args.limit, **kwargs)
+        # Sections with as many seats remaining may be listed in a different
+        # order
+        assert [r.seats_remaining for r in found] == \
+            [r.seats_remaining for r in find_open_seats_scan(
+                course_library, limit=args.limit, **kwargs)]
+        index_time = min(repeat(lambda: course_library.find_open_seats(
+            limit=args.limit, **kwargs), number=1, repeat=args.repeat))
+        scan_time = min(repeat(lambda: find_open_seats_scan(
+            course_library, limit=args.limit, **kwargs), number=1,
+            repeat=args.repeat))
+        print(f'{label:<28} {index_time * 1000:>7.3f}ms '
+              f'{scan_time * 1000:>7.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
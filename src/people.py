@@ -2,6 +2,14 @@
 Module: Repositories/Entities relating to People (Student & Instructor) Context
 """
 from abc import ABC
+from itertools import chain
+from sys import intern
+
+
+def intern_value(value):
+    """Intern strings (e.g. program, department) repeated across many
+    entities so that each distinct value is stored once"""
+    return intern(value) if isinstance(value, str) else value
 
 
 class StudentLibrary:
@@ -16,7 +24,9 @@ class StudentLibrary:
             raise Exception('Cannot create another StudentLibrary class')
 
     def retrieve_data(self, sql_retrieve):
-        student_list = sql_retrieve.get_students()
+        self.populate(sql_retrieve.get_students())
+
+    def populate(self, student_list):
         for s in student_list:
             current_student = Student(**s)
             self.add_student(s['username'], current_student)
@@ -43,7 +53,9 @@ class InstructorLibrary:
             raise Exception('Cannot create another InstructorLibrary class')
 
     def retrieve_data(self, sql_retrieve):
-        instructor_list = sql_retrieve.get_instructors()
+        self.populate(sql_retrieve.get_instructors())
+
+    def populate(self, instructor_list):
         for i in instructor_list:
             current_instructor = Instructor(**i)
             self.add_instructor(i['username'], current_instructor)
@@ -60,6 +72,8 @@ class InstructorLibrary:
 
 class Person(ABC):
     """Abstract base class for person entity in registration system"""
+    __slots__ = ('first_name', 'last_name', 'university_id', 'username',
+                 'department')
 
     def __init__(self, first_name, last_name, university_id, username,
                  department):
@@ -67,34 +81,33 @@ class Person(ABC):
         self.last_name = last_name
         self.university_id = university_id
         self.username = username
-        self.department = department
+        self.department = intern_value(department)
 
 
 class Student(Person):
     """Entity representing student in registration system"""
+    __slots__ = ('id', 'is_full_time', 'major', 'program', 'schedule')
 
     def __init__(self, **kwargs):
         super().__init__(kwargs['first_name'], kwargs['last_name'],
                          kwargs['university_id'], kwargs['username'],
                          kwargs['department'])
+        self.id = kwargs.get('student_id')  # ID in SQL db
         self.is_full_time = kwargs['is_full_time']
-        self.major = kwargs['major']
-        self.program = kwargs['program']
+        self.major = intern_value(kwargs['major'])
+        self.program = intern_value(kwargs['program'])
         self.schedule = StudentSchedule()
 
     @property
     def is_fully_registered(self):
-        section_count = self.schedule.get_section_count()
-        if self.is_full_time:
-            if section_count >= 3:
-                return True
-            else:
-                return False
-        else:
-            if section_count >= 2:
-                return True
-            else:
-                return False
+        return self.remaining_load == 0
+
+    @property
+    def remaining_load(self):
+        """Number of further sections student may register in before
+        overloading"""
+        full_load = 3 if self.is_full_time else 2
+        return max(full_load - self.schedule.get_section_count(), 0)
 
     def add_section(self, section):
         self.schedule.add_section(section)
@@ -124,23 +137,97 @@ class Student(Person):
 
 class StudentSchedule:
     """Entity representing a student's schedule"""
+    __slots__ = ('_sections', '_labs', '_occupied_slots', 'loader')
 
     def __init__(self):
-        self.sections = {}  # sections registered: key = course_name, value =
+        self._sections = {}  # sections registered: key = course_name, value =
         # Section
-        self.labs = {}  # labs registered: key = course_name, value = Lab
+        self._labs = {}  # labs registered: key = course_name, value = Lab
+        self._occupied_slots = 0  # bitmap of weekly time slots taken by
+        # sections and labs registered (union of their time_slots)
+        self.loader = None  # callable which populates schedule when loaded
+        # lazily. Set to None once schedule is loaded
+
+    @property
+    def sections(self):
+        if self.loader:
+            self.loader()
+        return self._sections
+
+    @sections.setter
+    def sections(self, sections):
+        self._sections = sections
+        self.reset_occupied_slots()
+
+    @property
+    def labs(self):
+        if self.loader:
+            self.loader()
+        return self._labs
+
+    @labs.setter
+    def labs(self, labs):
+        self._labs = labs
+        self.reset_occupied_slots()
+
+    @property
+    def occupied_slots(self):
+        if self.loader:
+            self.loader()
+        return self._occupied_slots
 
     def add_section(self, section):
+        replaced = self.sections.get(section.course_name)
         self.sections[section.course_name] = section
+        if replaced:
+            self._release_slots(replaced.time_slots)
+        self._occupied_slots |= section.time_slots
 
     def add_lab(self, lab):
+        replaced = self.labs.get(lab.course_name)
         self.labs[lab.course_name] = lab
+        if replaced:
+            self._release_slots(replaced.time_slots)
+        self._occupied_slots |= lab.time_slots
 
     def remove_section(self, course_name):
-        del self.sections[course_name]
+        self._release_slots(self.sections.pop(course_name).time_slots)
 
     def remove_lab(self, course_name):
-        del self.labs[course_name]
+        self._release_slots(self.labs.pop(course_name).time_slots)
+
+    def _release_slots(self, time_slots):
+        # Clear time slots from occupied slots, then restore those still
+        # taken by another section/lab (possible only if registrations
+        # loaded from the db overlap)
+        self._occupied_slots &= ~time_slots
+        for registerable in chain(self._sections.values(),
+                                  self._labs.values()):
+            if registerable.time_slots & time_slots:
+                self._occupied_slots |= registerable.time_slots
+
+    def reset_occupied_slots(self):
+        """Recompute occupied slots, e.g. after the meeting time of a
+        section/lab registered changed"""
+        self._occupied_slots = 0
+        for registerable in chain(self._sections.values(),
+                                  self._labs.values()):
+            self._occupied_slots |= registerable.time_slots
+
+    def find_conflict(self, registerable, replacing=None):
+        """Section/lab registered whose meetings overlap registerable's,
+        ignoring replacing (e.g. lab being rescheduled out of), or None.
+        Registrations are only compared pairwise if registerable's time
+        slots overlap the occupied slots"""
+        if not registerable.time_slots & self.occupied_slots:
+            return None
+        for registered in chain(self._sections.values(),
+                                self._labs.values()):
+            if registered is not replacing and registered is not \
+                    registerable and \
+                    registered.time_slots & registerable.time_slots:
+                return registered
+        return None
 
     def get_section_count(self):
         return len(self.sections)
@@ -203,6 +290,7 @@ class StudentSchedule:
 
 class Instructor(Person):
     """Entity representing an instructor in registration system"""
+    __slots__ = ('division', 'is_department_chair', 'courses')
 
     def __init__(self, **kwargs):
         super().__init__(kwargs['first_name'], kwargs['last_name'],
@@ -238,3 +326,13 @@ class Instructor(Person):
             display_str += course.display_course_students()
             display_str += '\n=============================================\n'
             return display_str
+
+    def view_grade_statistics(self, course_name):
+        course = self.get_course(course_name)
+        if not course:
+            return f'Instructor does not teach course: {course_name}'
+        else:
+            display_str = '\n============== GRADE STATISTICS ==============\n'
+            display_str += course.display_grade_statistics()
+            display_str += '\n=============================================\n'
+            return display_str
@@ -0,0 +1,92 @@
+"""
+Module: JSON-over-TCP protocol between the registration server and its
+clients. Each message is a JSON object on its own line. Requests are
+{"id": ..., "method": ..., "args": [...]} and responses {"id": ..., "result":
+...} or {"id": ..., "error": ...}, with the id of the request. A client may
+send further requests before earlier ones are answered (pipelining), in which
+case responses are sent as each request completes and matched by id.
+"""
+import json
+import socket
+from itertools import count
+
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 8642
+# Facade methods which clients may call
+METHODS = {'get_user_type', 'view_schedule', 'view_grades',
+           'view_filtered_courses', 'search_courses', 'view_open_seats',
+           'build_schedules', 'register_in_section', 'register_in_lab',
+           'register_cart', 'reschedule_lab', 'drop_course',
+           'drop_all_courses', 'view_courses_teaching', 'view_course_students',
+           'approve_deny_reg', 'modify_approval_required', 'add_grade',
+           'view_grade_statistics'}
+
+
+class RemoteError(Exception):
+    """Error handling a request on the registration server"""
+
+
+def encode_message(message):
+    return json.dumps(message, separators=(',', ':')).encode() + b'\n'
+
+
+def decode_message(line):
+    return json.loads(line)
+
+
+class RegistrationClient:
+    """Blocking client of the registration server. Facade methods (see
+    METHODS) may be called on it as on RegistrationFacade"""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self._socket = socket.create_connection((host, port))
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._socket.makefile('rwb')
+        self._request_ids = count()
+
+    def call(self, method, *args):
+        return self.pipeline([(method, args)])[0]
+
+    def pipeline(self, requests):
+        """Send all requests ((method, args) pairs) before reading any
+        response. Returns their results in the order of requests, or
+        RemoteError for requests which failed"""
+        request_ids = []
+        for method, args in requests:
+            request_id = next(self._request_ids)
+            request_ids.append(request_id)
+            self._file.write(encode_message({'id': request_id,
+                                             'method': method,
+                                             'args': list(args)}))
+        self._file.flush()
+        results = {}  # key = request id, value = result
+        while len(results) < len(request_ids):
+            line = self._file.readline()
+            if not line:
+                raise ConnectionError('Registration server closed the '
+                                      'connection')
+            response = decode_message(line)
+            if response.get('id') is None:  # Request could not be read
+                raise RemoteError(response.get('error'))
+            elif 'error' in response:
+                results[response['id']] = RemoteError(response['error'])
+            else:
+                results[response['id']] = response['result']
+        return [results[request_id] for request_id in request_ids]
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __getattr__(self, name):
+        if name not in METHODS:
+            raise AttributeError(name)
+
+        def call(*args):
+            result = self.call(name, *args)
+            if isinstance(result, RemoteError):
+                raise result
+            return result
+        return call
@@ -5,11 +5,41 @@ from people import *
 from courses import *
 from db_management import *
 from services import *
+from snapshot import LibrarySnapshot
+from transcripts import TranscriptReport
+from locks import LockManager
+from shards import ShardRouter
+from functools import wraps
+from inspect import signature
+from time import perf_counter
+
+
+def routed(method):
+    """Decorator for facade methods which are sent to the shard worker
+    processes when the facade is sharded (see retrieve_data)"""
+    method_signature = signature(method)
+    parameter_count = len(method_signature.parameters) - 1  # excluding self
+
+    @wraps(method)
+    def route(self, *args, **kwargs):
+        if not self.shard_router:
+            return method(self, *args, **kwargs)
+        if kwargs or len(args) < parameter_count:  # Pass all arguments by
+            # position
+            bound = method_signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            args = bound.args[1:]
+        return self.shard_router.route(method.__name__, args, {})
+    return route
 
 
 class IRegistrationFacade(ABC):
     """Interface for Registration Facade"""
 
+    @abstractmethod
+    def get_user_type(self, username) -> str:
+        pass
+
     # ---------- STUDENT USER FUNCTIONALITY ---------- #
 
     @abstractmethod
@@ -24,6 +54,20 @@ class IRegistrationFacade(ABC):
     def view_filtered_courses(self, username) -> str:
         pass
 
+    @abstractmethod
+    def search_courses(self, query, limit) -> str:
+        pass
+
+    @abstractmethod
+    def view_open_seats(self, department, division, day, min_seats,
+                        limit) -> str:
+        pass
+
+    @abstractmethod
+    def build_schedules(self, username, course_names, limit,
+                        time_budget) -> str:
+        pass
+
     @abstractmethod
     def register_in_section(self, username, course_name, section_number) -> \
             str:
@@ -37,6 +81,10 @@ class IRegistrationFacade(ABC):
     def reschedule_lab(self, username, course_name, lab_number) -> str:
         pass
 
+    @abstractmethod
+    def register_cart(self, username, cart) -> str:
+        pass
+
     @abstractmethod
     def drop_course(self, username, course_name) -> str:
         pass
@@ -69,40 +117,286 @@ class IRegistrationFacade(ABC):
     def add_grade(self, username, student_username, course_name, grade) -> str:
         pass
 
+    @abstractmethod
+    def view_grade_statistics(self, username, course_name) -> str:
+        pass
+
 
 class RegistrationFacade(IRegistrationFacade):
     """Facade which provides client access to the registration functionality"""
 
-    def __init__(self, test_mode=False):
+    def __init__(self, test_mode=False, pool_size=5, audit_logging=True):
         self.student_library = StudentLibrary()  # Singleton - repository of
         # Student objects
         self.instructor_library = InstructorLibrary()  # Singleton -
         # repository of Instructor objects
         self.course_library = CourseLibrary()  # Singleton - repository of
         # Course objects
-        self.sql_conn = SQLConnection(test_mode)  # Singleton - SQL connection
-        self.mongo_conn = MongoConnection()  # Singleton - MongoDB connection
-
-    def retrieve_data(self):
+        self.sql_conn = SQLConnection(test_mode, pool_size)  # Singleton - SQL
+        # connection pool
+        self.mongo_conn = MongoConnection(enabled=audit_logging)  #
+        # Singleton - MongoDB connection (discards logs if audit logging is
+        # disabled)
+        self.incremental_retrieve = IncrementalRetrieve(self.sql_conn)  #
+        # Tracks changes made by other processes since data was retrieved
+        self.lock_manager = LockManager()  # Per student/section/lab locks so
+        # that the facade can be used from several threads
+        self.shard_router = None  # ShardRouter if sharded (see
+        # retrieve_data)
+        self._shard_kwargs = {'test_mode': test_mode, 'pool_size': pool_size,
+                              'audit_logging': audit_logging}
+
+    def retrieve_data(self, bulk_load=True, workers=1, snapshot_path=None,
+                      use_mmap=False, lazy_load=False, shards=1,
+                      shard_threads=1):
         """Method which retrieves existing data from SQL database to populate
-        the registration system.
+        the registration system. With bulk_load, rosters and grades are
+        loaded with a handful of set-based queries instead of per
+        section/lab queries. With more than one worker, the (bulk) queries
+        are run in parallel over separate connections. With lazy_load, only
+        students, instructors, courses, sections and labs are loaded at
+        startup; rosters and grades are loaded per course on first access
+        and schedules per student on first access. If a snapshot path is
+        given (without lazy_load), the system is populated from the snapshot
+        unless it is stale, in which case the database is used and the
+        snapshot rewritten. With more than one shard, the data is instead
+        retrieved by that many worker processes, each owning a share of the
+        courses (see ShardRouter), and requests to this facade are sent to
+        them (handled by shard_threads threads in each). Shards do not load
+        lazily, since rosters and schedules read from the database later
+        could be ahead of the changes replicated to the shard. Returns a
+        report of the queries executed and the time taken by each phase.
+        """
+        if shards > 1:
+            return self._start_shards(shards, shard_threads,
+                                      {'bulk_load': bulk_load,
+                                       'workers': workers,
+                                       'snapshot_path': snapshot_path,
+                                       'use_mmap': use_mmap})
+        query_count = 0
+        timings = {}  # key = load phase, value = seconds taken
+        snapshot_data = None
+        start = perf_counter()
+        self.incremental_retrieve.mark()
+        query_count += 1
+        timings['change log'] = perf_counter() - start
+        if snapshot_path and not lazy_load:
+            snapshot = LibrarySnapshot(snapshot_path)
+            start = perf_counter()
+            fingerprint = self._get_fingerprint()
+            query_count += 1
+            timings['fingerprint'] = perf_counter() - start
+            if fingerprint:
+                start = perf_counter()
+                snapshot_data = snapshot.load(fingerprint, use_mmap)
+                timings['snapshot read'] = perf_counter() - start
+
+        if snapshot_data:
+            start = perf_counter()
+            self._populate(snapshot_data)
+            timings['wiring'] = perf_counter() - start
+            source = 'snapshot'
+        else:
+            if workers > 1 and not lazy_load:
+                load_query_count, load_timings = \
+                    self._retrieve_data_parallel(workers)
+            else:
+                load_query_count, load_timings = \
+                    self._retrieve_data_sequential(bulk_load, lazy_load)
+            query_count += load_query_count
+            timings.update(load_timings)
+            source = 'database'
+            if snapshot_path and not lazy_load and fingerprint:
+                start = perf_counter()
+                snapshot.save(fingerprint, self.student_library,
+                              self.instructor_library, self.course_library)
+                timings['snapshot write'] = perf_counter() - start
+
+        display_str = f'Data retrieved from {source} using ' \
+                      f'{str(query_count)} queries in ' \
+                      f'{sum(timings.values()):.3f}s'
+        for phase, seconds in timings.items():
+            display_str += f'\n  {phase}: {seconds:.3f}s'
+        return display_str
+
+    def load_data(self, data):
+        """Method which populates the registration system from rows keyed by
+        SQLRetrieve query name (e.g. synthetic data generated for load tests)
+        rather than from the SQL database"""
+        self._populate(data)
+
+    def stop_shards(self):
+        """Method which stops the shard worker processes of a sharded
+        facade, once their changes are written to the databases"""
+        if self.shard_router:
+            self.shard_router.close()
+            self.shard_router = None
+
+    @routed
+    def refresh_data(self):
+        """Method which applies changes made to the SQL database by other
+        processes since data was last retrieved/refreshed, without a full
+        reload. Returns a report of the number of changes applied.
         """
-        # Open db connection (rather than constantly opening and closing)
-        self.sql_conn.open_connection()
-        # Get connection to sql database
-        sql_conn = self.sql_conn.get_connection()
-        # Instantiate SQLRetrieve object for relevant queries passing open sql
-        # connection
-        sql_retrieve = SQLRetrieve(sql_conn)
-        # Populate student_library
-        self.student_library.retrieve_data(sql_retrieve)
-        # Populate instructor_library
-        self.instructor_library.retrieve_data(sql_retrieve)
-        # Populate course_library
-        self.course_library.retrieve_data(sql_retrieve, self.student_library,
-                                          self.instructor_library)
-        # Close db connection
-        self.sql_conn.close_connection()
+        with self.lock_manager.hold_exclusive():
+            change_count = self.incremental_retrieve.sync(
+                self.student_library, self.instructor_library,
+                self.course_library)
+        return f'{str(change_count)} changes synchronized from database'
+
+    @routed
+    def enable_write_behind(self, max_batch_size=100, linger_time=0.01):
+        """Method which makes registration changes be written to the SQL
+        database in batches on a background thread rather than before each
+        operation returns. Writes queued within linger_time seconds of each
+        other (up to max_batch_size operations) are committed together. Use
+        flush for durability"""
+        self.sql_conn.enable_write_behind(max_batch_size, linger_time)
+
+    @routed
+    def flush(self):
+        """Method which blocks until all registration changes made so far
+        have been committed to the SQL database and their audit logs
+        written to MongoDB"""
+        self.sql_conn.flush_writes()
+        self.mongo_conn.flush()
+        write_behind = self.sql_conn.write_behind
+        if not write_behind:
+            return 'All changes written to database'
+        display_str = f'All changes written to database: ' \
+                      f'{str(write_behind.operation_count)} operations in ' \
+                      f'{str(write_behind.batch_count)} transactions using ' \
+                      f'{str(write_behind.statement_count)} statements'
+        if write_behind.failed_count:
+            display_str += f', {str(write_behind.failed_count)} operations ' \
+                           f'failed'
+        return display_str
+
+    @routed
+    def view_pool_metrics(self):
+        """Method which reports SQL connection pool wait time and
+        utilization"""
+        metrics = self.sql_conn.get_pool_metrics()
+        return f"Connection pool: {str(metrics['in_use'])}/" \
+               f"{str(metrics['pool_size'])} in use " \
+               f"({metrics['utilization']:.0%} utilization, peak " \
+               f"{str(metrics['peak_in_use'])}), {str(metrics['open'])} " \
+               f"open, {str(metrics['checkouts'])} checkouts, average wait " \
+               f"{metrics['average_wait_time'] * 1000:.2f}ms, max wait " \
+               f"{metrics['max_wait_time'] * 1000:.2f}ms"
+
+    @routed
+    def view_log_metrics(self):
+        """Method which reports counts of audit logs queued, written to
+        MongoDB, dropped and spilled to file"""
+        if not self.mongo_conn.enabled:
+            return 'Audit logging disabled'
+        metrics = self.mongo_conn.get_log_metrics()
+        return f"Audit logs: {str(metrics['queued'])} queued, " \
+               f"{str(metrics['flushed'])} written, " \
+               f"{str(metrics['pending'])} pending, " \
+               f"{str(metrics['dropped'])} dropped, " \
+               f"{str(metrics['spilled'])} spilled to file (" \
+               f"{str(metrics['timed_out'])} after blocking timed out)"
+
+    @routed
+    def save_snapshot(self, snapshot_path):
+        """Write a snapshot of the system (e.g. at shutdown) for use by the
+        next call to retrieve_data"""
+        with self.lock_manager.hold_exclusive():
+            self.sql_conn.flush_writes()
+            fingerprint = self._get_fingerprint()
+            if fingerprint:
+                LibrarySnapshot(snapshot_path).save(fingerprint,
+                                                    self.student_library,
+                                                    self.instructor_library,
+                                                    self.course_library)
+
+    @routed
+    def export_transcripts(self, transcript_path, gpa_path):
+        """Write the transcripts (average and letter grade per course) of all
+        students to transcript_path and their GPAs and academic standing to
+        gpa_path, as CSV files"""
+        with self.lock_manager.hold_exclusive():
+            transcript_count, gpa_count = TranscriptReport(
+                self.student_library, self.course_library).write(
+                transcript_path, gpa_path)
+        return f'{str(transcript_count)} transcript rows written to ' \
+               f'{transcript_path}, {str(gpa_count)} student GPAs written ' \
+               f'to {gpa_path}'
+
+    def _start_shards(self, shard_count, threads, retrieve_kwargs):
+        start = perf_counter()
+        self.shard_router = ShardRouter(shard_count, self._shard_kwargs,
+                                        retrieve_kwargs, threads)
+        display_str = f'Data retrieved into {str(shard_count)} shards in ' \
+                      f'{perf_counter() - start:.3f}s'
+        for index, report in enumerate(self.shard_router.reports):
+            display_str += f'\n  shard {str(index)}: ' + \
+                           report.replace('\n', '\n  ')
+        return display_str
+
+    def _get_fingerprint(self):
+        with self.sql_conn.borrow_connection() as conn:
+            if not conn:
+                return None
+            return SQLRetrieve(conn).get_fingerprint()
+
+    def _retrieve_data_sequential(self, bulk_load, lazy_load):
+        timings = {}  # key = load phase, value = seconds taken
+        # Borrow a single db connection for all queries (rather than
+        # constantly checking out and in)
+        with self.sql_conn.borrow_connection() as sql_conn:
+            # Instantiate SQLRetrieve object for relevant queries passing
+            # borrowed sql connection
+            sql_retrieve = SQLRetrieve(sql_conn)
+            # Populate student_library
+            start = perf_counter()
+            self.student_library.retrieve_data(sql_retrieve)
+            timings['students'] = perf_counter() - start
+            # Populate instructor_library
+            start = perf_counter()
+            self.instructor_library.retrieve_data(sql_retrieve)
+            timings['instructors'] = perf_counter() - start
+            # Populate course_library
+            start = perf_counter()
+            lazy_retrieve = LazyRetrieve(self.sql_conn) if lazy_load else None
+            self.course_library.retrieve_data(sql_retrieve,
+                                              self.student_library,
+                                              self.instructor_library,
+                                              bulk_load, lazy_retrieve)
+            timings['courses'] = perf_counter() - start
+        return sql_retrieve.query_count, timings
+
+    def _retrieve_data_parallel(self, workers):
+        timings = {}  # key = load phase, value = seconds taken
+        # Fetch all independent tables concurrently
+        start = perf_counter()
+        parallel_retrieve = ParallelRetrieve(self.sql_conn, workers)
+        data = parallel_retrieve.retrieve_all()
+        timings['fetch'] = perf_counter() - start
+        # Wire fetched rows into the libraries
+        start = perf_counter()
+        self._populate(data)
+        timings['wiring'] = perf_counter() - start
+        return parallel_retrieve.query_count, timings
+
+    def _populate(self, data):
+        """Populate the libraries from rows keyed by SQLRetrieve query name,
+        performing the dependent wiring (instructor -> course, student <->
+        section/lab)"""
+        self.student_library.populate(data['get_students'])
+        self.instructor_library.populate(data['get_instructors'])
+        self.course_library.populate_courses(data['get_courses'],
+                                             self.instructor_library)
+        self.course_library.populate_sections(data['get_sections'])
+        self.course_library.populate_labs(data['get_labs'])
+        self.course_library.populate_registrations(
+            self.student_library, data['get_all_section_students'],
+            data['get_all_lab_students'], data['get_all_section_grades'])
+        self.course_library.populate_waitlists(
+            self.student_library, data['get_all_section_waitlists'],
+            data['get_all_lab_waitlists'])
 
     def get_student(self, username):
         return self.student_library.get_student(username)
@@ -113,22 +407,102 @@ class RegistrationFacade(IRegistrationFacade):
     def get_course(self, course_name):
         return self.course_library.get_course(course_name)
 
+    @routed
+    def get_user_type(self, username):
+        """'student' or 'instructor' if username is a user, otherwise None"""
+        if self.get_student(username):
+            return 'student'
+        elif self.get_instructor(username):
+            return 'instructor'
+        return None
+
+    def _run_locked(self, action, student, get_registrations=None,
+                    *registerables):
+        """Call action holding the locks of student, registerables and the
+        sections/labs returned by get_registrations (the student's
+        registrations which action may change). Registrations are looked up
+        before their locks are taken, so are looked up again once the locks
+        are held, and the locks retaken if they changed in the meantime"""
+        while True:
+            registrations = get_registrations() if get_registrations else []
+            with self.lock_manager.hold(student, *registerables,
+                                        *registrations):
+                if not get_registrations or \
+                        get_registrations() == registrations:
+                    return action()
+
+    def _refresh_registerable(self, registerable):
+        # Re-read a section/lab from the sql db after claiming a seat in it
+        # failed since another app node changed it
+        self.incremental_retrieve.refresh_registerable(
+            registerable, isinstance(registerable, Section),
+            self.student_library)
+
+    def _hold_course(self, course):
+        # Hold the locks of all of course's sections and labs (if course is
+        # not None)
+        if not course:
+            return self.lock_manager.hold()
+        return self.lock_manager.hold(*course.sections.values(),
+                                      *course.labs.values())
+
     # ---------- STUDENT USER FUNCTIONALITY ---------- #
 
+    @routed
     def view_schedule(self, username):
         student = self.get_student(username)
-        return student.view_schedule()
+        with self.lock_manager.hold(student):
+            return student.view_schedule()
 
+    @routed
     def view_grades(self, username):
         student = self.get_student(username)
-        return student.view_grades()
+        with self.lock_manager.hold(student):
+            return student.view_grades()
 
+    @routed
     def view_filtered_courses(self, course_number=None, division=None,
-                              instructor_name=None):
-        return self.course_library.view_filtered_courses(course_number,
-                                                        division,
-                                                        instructor_name)
-
+                              instructor_name=None, department=None,
+                              program=None):
+        # Hold no locks, but wait out bulk operations (see LockManager)
+        with self.lock_manager.hold():
+            return self.course_library.view_filtered_courses(
+                course_number, division, instructor_name, department, program)
+
+    @routed
+    def search_courses(self, query, limit=10):
+        with self.lock_manager.hold():
+            return self.course_library.search_courses(query, limit)
+
+    @routed
+    def view_open_seats(self, department=None, division=None, day=None,
+                        min_seats=1, limit=20):
+        with self.lock_manager.hold():
+            return self.course_library.view_open_seats(department, division,
+                                                       day, min_seats, limit)
+
+    @routed
+    def build_schedules(self, username, course_names, limit=5,
+                        time_budget=0.5):
+        """Method which lists up to limit schedules of sections (and
+        required labs) with open seats in the given courses which do not
+        conflict with each other or the student's other classes, fewest
+        days on campus first. Searching stops after time_budget seconds"""
+        if not course_names:
+            return 'No courses given to build schedule from'
+        student = self.get_student(username)
+        courses = []
+        for course_name in course_names:
+            course = self.get_course(course_name)
+            if not course:
+                return f'Course not found: {course_name}'
+            courses.append(course)
+        schedule_builder = ScheduleBuilder(student, courses, limit,
+                                           time_budget)
+        with self.lock_manager.hold(student):
+            return schedule_builder.view_schedules()
+
+    @routed
     def register_in_section(self, username, course_name, section_number):
         student = self.get_student(username)
         course = self.get_course(course_name)
@@ -136,47 +510,92 @@ class RegistrationFacade(IRegistrationFacade):
                                                    section_number,
                                                    self.sql_conn,
                                                    self.mongo_conn)
-        registration_context.set_strategy(SectionRegistration())
-        return registration_context.register()
+        registration_context.set_strategy(SectionRegistration(
+            self.lock_manager, self._refresh_registerable))
+        section = course.get_section(section_number) if course else None
+        with self.lock_manager.hold(student, section):
+            return registration_context.register()
 
+    @routed
     def register_in_lab(self, username, course_name, lab_number):
         student = self.get_student(username)
         course = self.get_course(course_name)
         registration_context = RegistrationContext(student, course, lab_number,
                                      self.sql_conn, self.mongo_conn)
-        registration_context.set_strategy(LabRegistration())
-        return registration_context.register()
+        registration_context.set_strategy(LabRegistration(
+            self.lock_manager, self._refresh_registerable))
+        lab = course.get_lab(lab_number) if course else None
+        with self.lock_manager.hold(student, lab):
+            return registration_context.register()
 
+    @routed
     def reschedule_lab(self, username, course_name, lab_number):
         student = self.get_student(username)
         course = self.get_course(course_name)
         registration_context = RegistrationContext(student, course, lab_number,
                                      self.sql_conn, self.mongo_conn)
-        registration_context.set_strategy(LabReschedule())
-        return registration_context.register()
-
+        registration_context.set_strategy(LabReschedule(
+            self.lock_manager, self._refresh_registerable))
+        lab = course.get_lab(lab_number) if course else None
+        return self._run_locked(
+            registration_context.register, student,
+            lambda: [course.find_student_lab(username)] if course else [],
+            lab)
+
+    @routed
+    def register_cart(self, username, cart):
+        """Register student in all of the courses in cart (list of (course
+        name, section number, lab number or None)), or in none of them if
+        any cannot be registered (see CartRegistration)"""
+        student = self.get_student(username)
+        cart_registration = CartRegistration(
+            student, cart, {course_name: self.get_course(course_name) for
+                            course_name, _, _ in cart},
+            self.sql_conn, self.mongo_conn, self._refresh_registerable)
+        with self.lock_manager.hold(student,
+                                    *cart_registration.get_registerables()):
+            return cart_registration.register_cart()
+
+    @routed
     def drop_course(self, username, course_name):
         student = self.get_student(username)
         course_dropper = CourseDropper(student, course_name, self.sql_conn,
-                                       self.mongo_conn)
-        return course_dropper.drop_course()
-
+                                       self.mongo_conn, self.lock_manager,
+                                       self._refresh_registerable)
+        schedule = student.get_schedule()
+        return self._run_locked(
+            course_dropper.drop_course, student,
+            lambda: [schedule.get_section(course_name),
+                     schedule.get_lab(course_name)])
+
+    @routed
     def drop_all_courses(self, username):
         student = self.get_student(username)
         all_course_dropper = AllCourseDropper(student, self.sql_conn,
-                                              self.mongo_conn)
-        return all_course_dropper.drop_all_courses()
+                                              self.mongo_conn,
+                                              self.lock_manager,
+                                              self._refresh_registerable)
+        schedule = student.get_schedule()
+        return self._run_locked(
+            all_course_dropper.drop_all_courses, student,
+            lambda: list(schedule.sections.values()) +
+            list(schedule.labs.values()))
 
     # -----------INSTRUCTOR USER FUNCTIONALITY ------- #
 
+    @routed
     def view_courses_teaching(self, username):
         instructor = self.get_instructor(username)
-        return instructor.view_courses_teaching()
+        with self.lock_manager.hold():
+            return instructor.view_courses_teaching()
 
+    @routed
     def view_course_students(self, username, course_name):
         instructor = self.get_instructor(username)
-        return instructor.view_course_students(course_name)
+        with self._hold_course(instructor.get_course(course_name)):
+            return instructor.view_course_students(course_name)
 
+    @routed
     def approve_deny_reg(self, username, student_username, course_name,
                          is_approved):
         instructor = self.get_instructor(username)
@@ -185,17 +604,38 @@ class RegistrationFacade(IRegistrationFacade):
                                                    course_name, is_approved,
                                                    self.sql_conn,
                                                    self.mongo_conn)
-        return approve_deny_reg.approve_deny_reg()
-
+        course = instructor.get_course(course_name)
+        return self._run_locked(
+            approve_deny_reg.approve_deny_reg,
+            self.get_student(student_username),
+            lambda: [course.find_student_section(student_username),
+                     course.find_student_lab(student_username)]
+            if course else [])
+
+    @routed
     def modify_approval_required(self, username, course_name, is_required):
         instructor = self.get_instructor(username)
         app_req_modifier = ApprovalRequiredModifier(instructor, course_name,
                                                     is_required, self.sql_conn,
                                                     self.mongo_conn)
-        return app_req_modifier.modify_approval_required()
+        # Registrations read whether approval is required holding only the
+        # locks of the course's sections/labs
+        with self._hold_course(instructor.get_course(course_name)):
+            return app_req_modifier.modify_approval_required()
 
+    @routed
     def add_grade(self, username, student_username, course_name, grade):
         instructor = self.get_instructor(username)
         grader = Grader(instructor, student_username, course_name, grade,
                         self.sql_conn, self.mongo_conn)
-        return grader.add_grade()
\ No newline at end of file
+        course = instructor.get_course(course_name)
+        return self._run_locked(
+            grader.add_grade, self.get_student(student_username),
+            lambda: [course.find_student_section(student_username)]
+            if course else [])
+
+    @routed
+    def view_grade_statistics(self, username, course_name):
+        instructor = self.get_instructor(username)
+        with self._hold_course(instructor.get_course(course_name)):
+            return instructor.view_grade_statistics(course_name)
\ No newline at end of file
@@ -0,0 +1,386 @@
+"""
+Module: Registration-rush load generator. Builds synthetic students,
+instructors, courses, sections and labs at a configurable scale and has every
+student register at once from many concurrent client threads, as when
+registration opens. Each student's session browses for open seats,
+registers in sections (and labs where required) of courses chosen by
+popularity, sometimes reschedules a lab or drops a course, and views their
+schedule. With --carts, students register in all of their courses at once
+with register_cart instead. Reports throughput, and the latency percentiles and
+success/waitlist/denial/error rates of each operation. Runs in test mode
+(SQL changes are not written), so no SQL database is needed; audit logs are
+written to the local MongoDB as usual, unless disabled with --no-audit-log
+so that no MongoDB is needed either.
+"""
+from argparse import ArgumentParser
+from collections import Counter, defaultdict
+from itertools import accumulate
+from random import Random
+from threading import Thread
+from time import perf_counter
+from registration import RegistrationFacade
+
+# (program, department, division, major) of synthetic students and courses
+PROGRAMS = (('MPCS', 'Computer Science', 'Physical Sciences',
+             'Computer Science'),
+            ('MACSS', 'Social Sciences', 'Social Sciences',
+             'Computational Social Science'),
+            ('Booth', 'Business', 'Booth', 'Business'),
+            ('MSFM', 'Mathematics', 'Physical Sciences',
+             'Financial Mathematics'),
+            ('MAPSS', 'Social Sciences', 'Social Sciences', 'Social Sciences'))
+FIRST_NAMES = ('Ava', 'Ben', 'Chloe', 'Dev', 'Elena', 'Farah', 'Gus', 'Hana',
+               'Ivan', 'Jun', 'Kira', 'Luis', 'Mei', 'Nate', 'Omar', 'Priya')
+LAST_NAMES = ('Abbott', 'Baker', 'Chen', 'Diaz', 'Evans', 'Fischer', 'Garcia',
+              'Hughes', 'Ito', 'Jensen', 'Khan', 'Lopez', 'Moreau', 'Novak')
+TIMES = ('8:30AM', '10:30AM', '12:30PM', '1:30PM', '3:30PM', '5:30PM',
+         '7:00PM')
+DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday')
+COURSES_PER_INSTRUCTOR = 3
+OVERLOAD_SHARE = 0.1  # share of students registering in one course more
+# than a full load
+RESCHEDULE_SHARE = 0.15  # share of sessions rescheduling a lab
+DROP_SHARE = 0.1  # share of sessions dropping a course
+CART_ATTEMPTS = 3  # carts (of other courses) tried by a student whose cart
+# is denied
+# Prefixes of results of requests refused by a registration rule, and of
+# requests which failed
+DENIAL_PREFIXES = ('Registration denied', 'Cart not registered',
+                   'Student already', 'Student must', 'Student is not')
+ERROR_PREFIXES = ('Registration could not be completed', 'Course not found',
+                  'Section not found', 'Lab not found')
+
+
+def generate_data(student_count, course_count, sections_per_course,
+                  labs_per_course, capacity, lab_share=0.3,
+                  approval_share=0.1, seed=0):
+    """Synthetic rows keyed by SQLRetrieve query name (see
+    RegistrationFacade.load_data), with no registrations, grades or
+    waitlists"""
+    rng = Random(seed)
+    data = {'get_students': [], 'get_instructors': [], 'get_courses': [],
+            'get_sections': [], 'get_labs': [],
+            'get_all_section_students': [], 'get_all_lab_students': [],
+            'get_all_section_grades': [], 'get_all_section_waitlists': [],
+            'get_all_lab_waitlists': []}
+    for i in range(student_count):
+        program, department, _, major = rng.choice(PROGRAMS)
+        data['get_students'].append({
+            'student_id': i + 1,
+            'university_id': 10000000 + i,
+            'username': f'student{str(i)}',
+            'first_name': rng.choice(FIRST_NAMES),
+            'last_name': rng.choice(LAST_NAMES),
+            'major': major,
+            'program': program,
+            'department': department,
+            'is_full_time': rng.random() < 0.7
+        })
+    for i in range(-(-course_count // COURSES_PER_INSTRUCTOR)):
+        _, department, division, _ = rng.choice(PROGRAMS)
+        data['get_instructors'].append({
+            'university_id': 20000000 + i,
+            'username': f'instructor{str(i)}',
+            'first_name': rng.choice(FIRST_NAMES),
+            'last_name': rng.choice(LAST_NAMES),
+            'division': division,
+            'department': department,
+            'is_department_chair': i < len(PROGRAMS)
+        })
+    for i in range(course_count):
+        instructor = data['get_instructors'][i // COURSES_PER_INSTRUCTOR]
+        program, department, division, _ = rng.choice(PROGRAMS)
+        name = f'{program} {str(50000 + i)}'
+        lab_required = rng.random() < lab_share
+        data['get_courses'].append({
+            'course_id': i + 1,
+            'instructor_name': instructor['first_name'] + ' ' +
+            instructor['last_name'],
+            'instructor_username': instructor['username'],
+            'number': 50000 + i,
+            'name': name,
+            'division': division,
+            'department': department,
+            'program': program,
+            'lab_required': lab_required,
+            'approval_required': rng.random() < approval_share
+        })
+        for number in range(1, sections_per_course + 1):
+            data['get_sections'].append({
+                'section_id': len(data['get_sections']) + 1,
+                'course_name': name,
+                'section_number': number,
+                'max_registration': capacity,
+                'time': rng.choice(TIMES),
+                'day': rng.choice(DAYS),
+                'version': 0
+            })
+        for number in range(1, labs_per_course + 1 if lab_required else 1):
+            data['get_labs'].append({
+                'lab_id': len(data['get_labs']) + 1,
+                'course_name': name,
+                'lab_number': number,
+                'max_registration': capacity,
+                'time': rng.choice(TIMES),
+                'day': rng.choice(DAYS),
+                'version': 0
+            })
+    return data
+
+
+def generate_registrations(data, courses_per_student=3, grades_per_course=0,
+                           non_approved_share=0.0, seed=0):
+    """Add registrations (in a random section, and lab if required, of
+    courses_per_student distinct courses per student, ignoring capacity and
+    meeting times) and grades_per_course grades of each student's sections to
+    rows from generate_data. A non_approved_share of registrations are
+    'Pending' or 'Tentative'"""
+    rng = Random(seed)
+    sections = {}  # key = course name, value = section IDs
+    labs = {}  # key = course name, value = lab IDs
+    for s in data['get_sections']:
+        sections.setdefault(s['course_name'], []).append(s['section_id'])
+    for l in data['get_labs']:
+        labs.setdefault(l['course_name'], []).append(l['lab_id'])
+    course_names = list(sections)
+    for student in data['get_students']:
+        username = student['username']
+        for course_name in rng.sample(course_names, courses_per_student):
+            status = rng.choice(('Pending', 'Tentative')) if \
+                rng.random() < non_approved_share else 'Approved'
+            section_id = rng.choice(sections[course_name])
+            data['get_all_section_students'].append({
+                'section_id': section_id, 'student_username': username,
+                'status': status})
+            for _ in range(grades_per_course):
+                data['get_all_section_grades'].append({
+                    'section_id': section_id, 'student_username': username,
+                    'grade': rng.randint(50, 100)})
+            if course_name in labs:
+                data['get_all_lab_students'].append({
+                    'lab_id': rng.choice(labs[course_name]),
+                    'student_username': username, 'status': status})
+    return data
+
+
+def classify(result):
+    """Outcome of a request: 'ok', 'waitlisted', 'denied' (refused by a
+    registration rule) or 'error' (raised, could not be completed or named
+    something not found)"""
+    if isinstance(result, Exception):
+        return 'error'
+    result = str(result)
+    if result.startswith(ERROR_PREFIXES):
+        return 'error'
+    elif result.startswith(DENIAL_PREFIXES):
+        return 'denied'
+    elif result.startswith(('Section is full', 'Lab is full')):
+        return 'waitlisted'
+    return 'ok'
+
+
+class RushClient:
+    """Runs the registration sessions of a share of the students against the
+    facade, recording the latency and outcome of each request"""
+
+    def __init__(self, reg, data, usernames, popularity, seed,
+                 use_carts=False):
+        self.reg = reg
+        self.usernames = usernames
+        self.use_carts = use_carts
+        self.rng = Random(seed)
+        self.students = {s['username']: s for s in data['get_students']}
+        self.courses = data['get_courses']
+        self.cumulative_popularity = list(accumulate(popularity))
+        # key = course name, value = (section numbers, lab numbers)
+        self.catalog = {c['name']: ([], []) for c in self.courses}
+        for s in data['get_sections']:
+            self.catalog[s['course_name']][0].append(s['section_number'])
+        for l in data['get_labs']:
+            self.catalog[l['course_name']][1].append(l['lab_number'])
+        self.latencies = defaultdict(list)  # key = operation, value =
+        # latencies in seconds
+        self.outcomes = defaultdict(Counter)  # key = operation, value =
+        # Counter of outcomes
+
+    def request(self, method, *args):
+        start = perf_counter()
+        try:
+            result = getattr(self.reg, method)(*args)
+        except Exception as e:
+            result = e
+        self.latencies[method].append(perf_counter() - start)
+        outcome = classify(result)
+        self.outcomes[method][outcome] += 1
+        return outcome
+
+    def run(self):
+        for username in self.usernames:
+            self.run_session(self.students[username])
+
+    def run_session(self, student):
+        username = student['username']
+        self.request('view_open_seats', student['department'])
+        course_count = 3 if student['is_full_time'] else 2
+        if self.rng.random() < OVERLOAD_SHARE:
+            course_count += 1
+        if self.use_carts:
+            registered, with_labs = self.register_cart(username, course_count)
+        else:
+            registered, with_labs = self.register_courses(
+                username, self.choose_courses(course_count))
+        if with_labs and self.rng.random() < RESCHEDULE_SHARE:
+            course_name = self.rng.choice(with_labs)
+            self.request('reschedule_lab', username, course_name,
+                         self.rng.choice(self.catalog[course_name][1]))
+        if registered and self.rng.random() < DROP_SHARE:
+            self.request('drop_course', username,
+                         self.rng.choice(registered))
+        self.request('view_schedule', username)
+
+    def choose_courses(self, course_count):
+        # Distinct courses, chosen by popularity
+        return list({c['name']: c for c in self.rng.choices(
+            self.courses, cum_weights=self.cumulative_popularity,
+            k=course_count * 2)}.values())[:course_count]
+
+    def register_courses(self, username, courses):
+        # Register in courses one section/lab at a time, trying other
+        # sections/labs of a course after a denial (e.g. a time conflict).
+        # Returns names of (courses registered in, courses registered in
+        # with a lab)
+        registered = []
+        with_labs = []
+        for course in courses:
+            section_numbers, lab_numbers = self.catalog[course['name']]
+            outcome = None
+            for number in self.rng.sample(section_numbers,
+                                          len(section_numbers)):
+                outcome = self.request('register_in_section', username,
+                                       course['name'], number)
+                if outcome != 'denied':
+                    break
+            if outcome != 'ok':
+                continue
+            registered.append(course['name'])
+            if not lab_numbers:
+                continue
+            for number in self.rng.sample(lab_numbers, len(lab_numbers)):
+                outcome = self.request('register_in_lab', username,
+                                       course['name'], number)
+                if outcome != 'denied':
+                    break
+            if outcome == 'ok':
+                with_labs.append(course['name'])
+        return registered, with_labs
+
+    def register_cart(self, username, course_count):
+        # Register in course_count courses with a single cart, choosing other
+        # courses if it is denied (e.g. a section is full). Returns as
+        # register_courses
+        for _ in range(CART_ATTEMPTS):
+            cart = []
+            for course in self.choose_courses(course_count):
+                section_numbers, lab_numbers = self.catalog[course['name']]
+                cart.append((course['name'], self.rng.choice(section_numbers),
+                             self.rng.choice(lab_numbers) if lab_numbers else
+                             None))
+            if self.request('register_cart', username, cart) == 'ok':
+                return [course_name for course_name, _, _ in cart], \
+                       [course_name for course_name, _, lab_number in cart if
+                        lab_number is not None]
+        return [], []
+
+
+def run_rush(reg, data, clients, skew=1.0, seed=0, use_carts=False):
+    """Run every student's session, split between clients threads. Course
+    popularity follows a Zipf distribution with exponent skew. With
+    use_carts, students register with register_cart. Returns
+    (seconds taken, dict of latencies and dict of outcome Counters, each
+    keyed by operation)"""
+    popularity = [1 / (rank + 1) ** skew for rank in
+                  range(len(data['get_courses']))]
+    Random(seed).shuffle(popularity)
+    usernames = [s['username'] for s in data['get_students']]
+    rush_clients = [RushClient(reg, data, usernames[i::clients], popularity,
+                               seed + i, use_carts) for i in range(clients)]
+    threads = [Thread(target=c.run) for c in rush_clients]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - start
+    latencies = defaultdict(list)
+    outcomes = defaultdict(Counter)
+    for rush_client in rush_clients:
+        for method, method_latencies in rush_client.latencies.items():
+            latencies[method].extend(method_latencies)
+        for method, method_outcomes in rush_client.outcomes.items():
+            outcomes[method].update(method_outcomes)
+    return elapsed, latencies, outcomes
+
+
+def get_percentile(sorted_values, percentile):
+    return sorted_values[min(len(sorted_values) - 1,
+                             int(len(sorted_values) * percentile / 100))]
+
+
+def format_report(elapsed, latencies, outcomes):
+    request_count = sum(len(l) for l in latencies.values())
+    display_str = f'{str(request_count)} requests in {elapsed:.2f}s: ' \
+                  f'{request_count / elapsed:.0f} req/s\n' \
+                  f"{'operation':<20} {'count':>7} {'req/s':>7} " \
+                  f"{'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'ok':>6} " \
+                  f"{'wait':>6} {'denied':>6} {'error':>6}"
+    for method in sorted(latencies):
+        method_latencies = sorted(latencies[method])
+        count = len(method_latencies)
+        display_str += f'\n{method:<20} {count:>7} {count / elapsed:>7.0f}'
+        for percentile in (50, 95, 99):
+            latency = get_percentile(method_latencies, percentile)
+            display_str += f' {latency * 1000:>7.3f}'
+        for outcome in ('ok', 'waitlisted', 'denied', 'error'):
+            display_str += f' {outcomes[method][outcome] / count:>6.1%}'
+    return display_str
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--courses', type=int, default=400)
+    parser.add_argument('--sections', type=int, default=2,
+                        help='sections per course')
+    parser.add_argument('--labs', type=int, default=2,
+                        help='labs per course requiring a lab')
+    parser.add_argument('--capacity', type=int, default=40,
+                        help='seats per section/lab')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--skew', type=float, default=1.0,
+                        help='Zipf exponent of course popularity')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--carts', action='store_true',
+                        help='register with register_cart')
+    parser.add_argument('--no-audit-log', action='store_true',
+                        help='discard audit logs instead of writing them to '
+                             'MongoDB')
+    args = parser.parse_args()
+
+    reg = RegistrationFacade(test_mode=True,
+                             audit_logging=not args.no_audit_log)
+    start = perf_counter()
+    data = generate_data(args.students, args.courses, args.sections,
+                         args.labs, args.capacity, seed=args.seed)
+    reg.load_data(data)
+    print(f"{str(len(data['get_students']))} students, "
+          f"{str(len(data['get_courses']))} courses, "
+          f"{str(len(data['get_sections']))} sections, "
+          f"{str(len(data['get_labs']))} labs generated in "
+          f"{perf_counter() - start:.2f}s")
+    print(format_report(*run_rush(reg, data, args.clients, args.skew,
+                                  args.seed, args.carts)))
+    print(reg.view_log_metrics())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Module: Benchmark of building conflict-free schedules (see ScheduleBuilder)
+for a student taking several synthetic courses (see rush_benchmark.py) with
+many sections, half of them requiring a lab. Reports, for each time budget,
+the search time, the schedules found and their days on campus, and whether
+the budget ran out before the search completed.
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+from registration import RegistrationFacade
+from rush_benchmark import generate_data
+from services import ScheduleBuilder
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--courses', type=int, default=6)
+    parser.add_argument('--sections', type=int, default=30,
+                        help='sections per course')
+    parser.add_argument('--labs', type=int, default=10,
+                        help='labs per course requiring a lab')
+    parser.add_argument('--limit', type=int, default=5,
+                        help='schedules to list')
+    parser.add_argument('--budgets', type=float, nargs='+',
+                        default=[0.05, 0.5, 5],
+                        help='time budgets (seconds) to search with')
+    args = parser.parse_args()
+
+    data = generate_data(1, args.courses, args.sections, args.labs, 30,
+                         lab_share=1, approval_share=0)
+    # Only the first half of the courses require a lab
+    lab_courses = {c['name'] for c in
+                   data['get_courses'][:(args.courses + 1) // 2]}
+    for row in data['get_courses']:
+        row['lab_required'] = row['name'] in lab_courses
+    data['get_labs'] = [row for row in data['get_labs'] if
+                        row['course_name'] in lab_courses]
+    reg = RegistrationFacade(test_mode=True, audit_logging=False)
+    reg.load_data(data)
+    student = reg.get_student('student0')
+    courses = list(reg.course_library.courses.values())
+
+    print(f'{str(args.courses)} courses of {str(args.sections)} sections, '
+          f'{str(len(lab_courses))} of them with {str(args.labs)} labs')
+    for time_budget in args.budgets:
+        builder = ScheduleBuilder(student, courses, args.limit, time_budget)
+        start = perf_counter()
+        schedules = builder.build_schedules()
+        run_time = perf_counter() - start
+        print(f'budget {time_budget:>5.2f}s: {run_time * 1000:>7.0f}ms, '
+              f'{str(len(schedules))} schedules meeting on '
+              f"{', '.join(str(days) for days, _ in schedules) or '-'} days"
+              f"{' (budget ran out)' if builder.timed_out else ''}")
+
+
+if __name__ == '__main__':
+    main()
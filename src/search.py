@@ -0,0 +1,174 @@
+"""
+Module: In-memory full-text search over the course catalog, used to find
+courses from partial or misspelled course names, programs and instructors
+"""
+from bisect import bisect_left
+from collections import Counter
+import re
+
+_word_pattern = re.compile(r'[a-z0-9]+')
+
+
+def get_words(text):
+    return _word_pattern.findall(text.lower())
+
+
+def get_trigrams(word):
+    """Set of trigrams of word, padded so that the start and end of the word
+    form trigrams of their own (e.g. '  a', ' al', ..., 'ms ')"""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CourseSearchIndex:
+    """Search index over the name, program, number and instructor of each
+    course. Query words are matched against the vocabulary of indexed words
+    rather than against each course: by binary search in a sorted array of
+    the words for words they are a prefix of, and through a trigram
+    inverted index of the words for similar (e.g. misspelled) words. Only
+    then are the courses containing the matched words scored, with set
+    operations. Courses are keyed by course name."""
+    FIELDS = ('name', 'program', 'number', 'instructor_name')
+    MIN_PREFIX_LENGTH = 2  # shorter query words are only matched exactly
+    MAX_PREFIX_WORDS = 100  # most words a query word is expanded to by prefix
+
+    def __init__(self):
+        self._courses = {}  # key = course_name, value = Course
+        self._course_words = {}  # key = course_name, value = set of words
+        self._length_courses = {}  # key = number of words, value = set of
+        # course_names with that many words (used to rank shorter courses
+        # first among equal matches)
+        self._word_courses = {}  # key = word, value = set of course_names
+        self._trigram_words = {}  # key = trigram, value = set of words.
+        # Numbers are only matched by prefix so are not included
+        self._sorted_words = None  # sorted words of _word_courses. Rebuilt
+        # on the next search after words are added or removed
+
+    def add_course(self, course):
+        """Index course, replacing any earlier entry for the course"""
+        self.remove_course(course.name)
+        words = set(get_words(' '.join(str(getattr(course, field))
+                                       for field in self.FIELDS)))
+        self._courses[course.name] = course
+        self._course_words[course.name] = words
+        if len(words) in self._length_courses:
+            self._length_courses[len(words)].add(course.name)
+        else:
+            self._length_courses[len(words)] = {course.name}
+        for word in words:
+            if word in self._word_courses:
+                self._word_courses[word].add(course.name)
+                continue
+            self._word_courses[word] = {course.name}
+            self._sorted_words = None
+            if not word.isdigit():
+                for trigram in get_trigrams(word):
+                    if trigram in self._trigram_words:
+                        self._trigram_words[trigram].add(word)
+                    else:
+                        self._trigram_words[trigram] = {word}
+
+    def remove_course(self, course_name):
+        if course_name not in self._courses:
+            return
+        del self._courses[course_name]
+        words = self._course_words.pop(course_name)
+        self._length_courses[len(words)].discard(course_name)
+        if not self._length_courses[len(words)]:
+            del self._length_courses[len(words)]
+        for word in words:
+            course_names = self._word_courses[word]
+            course_names.discard(course_name)
+            if course_names:
+                continue
+            del self._word_courses[word]
+            self._sorted_words = None
+            if not word.isdigit():
+                for trigram in get_trigrams(word):
+                    self._trigram_words[trigram].discard(word)
+                    if not self._trigram_words[trigram]:
+                        del self._trigram_words[trigram]
+
+    def search(self, query, limit=10, min_similarity=0.4):
+        """Courses best matching query, best first (at most limit). A course
+        scores 1 for each query word which is a prefix of one of its words.
+        Query words which are not a prefix of any indexed word (e.g.
+        misspelled words) instead score the highest trigram similarity
+        (Jaccard index, at least min_similarity) to one of the course's
+        words. Courses with equal scores are ranked by fewest words."""
+        if limit < 1:
+            return []
+        if self._sorted_words is None:
+            self._sorted_words = sorted(self._word_courses)
+        word_matches = []  # per query word, set of course_names matched by
+        # prefix or dict of course_names matched by similarity (key =
+        # course_name, value = similarity)
+        for word in set(get_words(query)):
+            prefix_matches = self._get_prefix_matches(word)
+            if prefix_matches or word.isdigit():
+                word_matches.append(prefix_matches)
+                continue
+            # Add each course's best similarity, taking similar words from
+            # most to least similar
+            best_similarities = {}  # key = course_name, value = similarity
+            for similar_word, similarity in sorted(
+                    self._get_similar_words(word, min_similarity),
+                    key=lambda item: item[1], reverse=True):
+                best_similarities.update(dict.fromkeys(
+                    self._word_courses[similar_word].difference(
+                        best_similarities), similarity))
+            word_matches.append(best_similarities)
+        # Sum scores. Counter only adds a dict in C when it is empty, so the
+        # largest dict is added first
+        word_matches.sort(key=lambda matches: (isinstance(matches, dict),
+                                               len(matches)), reverse=True)
+        scores = Counter()  # key = course_name, value = score
+        for matches in word_matches:
+            scores.update(matches)
+        return [self._courses[course_name] for course_name in
+                self._get_best(scores, limit)]
+
+    def _get_prefix_matches(self, word):
+        # Courses with a word starting with word, found by binary search
+        if len(word) < self.MIN_PREFIX_LENGTH:
+            return set(self._word_courses.get(word, ()))
+        matches = set()
+        start = bisect_left(self._sorted_words, word)
+        for indexed_word in self._sorted_words[start:start +
+                                               self.MAX_PREFIX_WORDS]:
+            if not indexed_word.startswith(word):
+                break
+            matches |= self._word_courses[indexed_word]
+        return matches
+
+    def _get_similar_words(self, word, min_similarity):
+        # Indexed words whose trigrams overlap word's, with their similarity
+        trigrams = get_trigrams(word)
+        shared_counts = Counter()  # key = indexed word, value = number of
+        # trigrams shared with word
+        for trigram in trigrams:
+            shared_counts.update(self._trigram_words.get(trigram, ()))
+        for similar_word, shared in shared_counts.items():
+            # Trigrams of a padded word number len(word) + 1
+            similarity = shared / (len(trigrams) + len(similar_word) + 1 -
+                                   shared)
+            if similarity >= min_similarity:
+                yield similar_word, similarity
+
+    def _get_best(self, scores, limit):
+        # Highest scoring course_names. Only the groups of equal scores which
+        # are needed are gathered, and the shortest courses of the last
+        # group are found by intersecting it with the courses of each length
+        best = []
+        distinct_scores = set(scores.values())
+        for score in sorted(distinct_scores, reverse=True):
+            if len(distinct_scores) == 1:
+                group = scores.keys()
+            else:
+                group = {course_name for course_name, course_score in
+                         scores.items() if course_score == score}
+            for length in sorted(self._length_courses):
+                best.extend(group & self._length_courses[length])
+                if len(best) >= limit:
+                    return best[:limit]
+        return best
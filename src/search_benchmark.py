@@ -0,0 +1,114 @@
+"""
+Module: Benchmark of ranked course search (see CourseSearchIndex) over a
+synthetic catalog (see rush_benchmark.py) of courses named from a vocabulary
+of course name words, e.g. 'Applied Algorithms 3'. Each query is timed
+through the search index, and against scoring every course's (already
+split) words in turn: the same scores, without the index. Times are the best
+of --runs and --scan-runs runs respectively.
+"""
+from argparse import ArgumentParser
+from timeit import repeat
+from registration import RegistrationFacade
+from rush_benchmark import generate_data
+from search import get_words, get_trigrams
+
+QUALIFIERS = ('Introduction to', 'Advanced', 'Applied', 'Discrete',
+              'Computational', 'Distributed', 'Operating', 'Machine',
+              'Financial', 'Quantitative', 'Topics in', 'Principles of',
+              'Foundations of', 'Modern', 'Parallel', 'Statistical', 'Data',
+              'Network', 'Social', 'Behavioral')
+SUBJECTS = ('Algorithms', 'Databases', 'Networks', 'Compilers', 'Statistics',
+            'Mathematics', 'Economics', 'Finance', 'Accounting', 'Marketing',
+            'Systems', 'Security', 'Learning', 'Vision', 'Graphics',
+            'Theory', 'Analysis', 'Design', 'Programming', 'Languages',
+            'Computing', 'Optimization', 'Probability', 'Policy',
+            'Sociology', 'Psychology', 'History', 'Physics', 'Chemistry',
+            'Biology')
+QUERIES = ('algorithms', 'algoritms', 'discrete math', 'comp', 'data',
+           'machine learning', 'machien lerning', 'stat', 'statistcs',
+           'intro', 'applied econ', 'mpcs', 'booth finance', '500',
+           'topics in security', 'psychology 4', 'quantum')
+
+
+def get_course_name(i):
+    # Distinct name of the ith course
+    level, rest = divmod(i, len(QUALIFIERS) * len(SUBJECTS))
+    name = f'{QUALIFIERS[rest % len(QUALIFIERS)]} ' \
+           f'{SUBJECTS[rest // len(QUALIFIERS)]}'
+    return f'{name} {str(level)}' if level else name
+
+
+def get_course_words(courses):
+    # (course, set of words) of each course, as indexed for search
+    return [(course, set(get_words(
+        f'{course.name} {course.program} {str(course.number)} '
+        f'{course.instructor_name}'))) for course in courses]
+
+
+def scan_search(course_words, query, limit=10, min_similarity=0.4):
+    # Scores of CourseSearchIndex.search computed by scoring each course's
+    # words against each query word
+    vocabulary = set().union(*(words for _, words in course_words))
+    # (word, whether a prefix of an indexed word, trigrams) of query words
+    query_words = [(word, any(w.startswith(word) for w in vocabulary),
+                    get_trigrams(word)) for word in set(get_words(query))]
+    scores = []
+    for course, words in course_words:
+        score = 0
+        for word, is_prefix, trigrams in query_words:
+            if is_prefix:
+                score += any(w.startswith(word) for w in words)
+            elif not word.isdigit():
+                best = max((len(trigrams & t) / len(trigrams | t) for t in
+                            (get_trigrams(w) for w in words
+                             if not w.isdigit())), default=0)
+                score += best if best >= min_similarity else 0
+        if score:
+            scores.append((-score, len(words), course.name))
+    return [name for _, _, name in sorted(scores)[:limit]]
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--courses', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=200,
+                        help='runs of each query through the index')
+    parser.add_argument('--scan-runs', type=int, default=1,
+                        help='runs of each query scanning every course')
+    args = parser.parse_args()
+
+    data = generate_data(0, args.courses, 1, 0, 30)
+    names = {c['name']: get_course_name(i) for i, c in
+             enumerate(data['get_courses'])}
+    for row in data['get_courses']:
+        row['name'] = names[row['name']]
+    for row in data['get_sections'] + data['get_labs']:
+        row['course_name'] = names[row['course_name']]
+    reg = RegistrationFacade(test_mode=True, audit_logging=False)
+    reg.load_data(data)
+    search_index = reg.course_library.search_index
+    course_words = get_course_words(reg.course_library.courses.values())
+    search_index.search('')  # sorts the indexed words
+
+    print(f'{str(args.courses)} courses (time per query)')
+    print(f"{'query':<20} {'index':>9} {'scan':>9}  best match")
+    index_times = []
+    for query in QUERIES:
+        results = [course.name for course in search_index.search(query)]
+        index_time = min(repeat(lambda: search_index.search(query),
+                                number=1, repeat=args.runs))
+        scan_time = min(repeat(lambda: scan_search(course_words, query),
+                               number=1, repeat=args.scan_runs))
+        # Ties may be ranked in a different order
+        scan_results = scan_search(course_words, query)
+        assert len(results) == len(scan_results)
+        index_times.append(index_time)
+        print(f'{query:<20} {index_time * 1000:>7.2f}ms '
+              f'{scan_time * 1000:>7.0f}ms  '
+              f"{results[0] if results else '-'}")
+    print(f'mean {sum(index_times) / len(index_times) * 1000:.2f}ms per '
+          f'query through the index')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Module: Registration server. Serves the registration facade to many clients
+at once over the JSON-over-TCP protocol (see protocol.py), so that one
+loaded system serves every user rather than only the user of a command line
+client.
+"""
+from argparse import ArgumentParser
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from signal import signal, SIGTERM
+from protocol import DEFAULT_HOST, DEFAULT_PORT, METHODS, encode_message, \
+    decode_message
+from registration import RegistrationFacade
+
+
+class RegistrationServer:
+    """asyncio server in front of the registration facade, handling each
+    connection in its own coroutine. Facade calls block (on locks and the
+    SQL and Mongo databases), so they are run on a pool of threads rather
+    than on the event loop. Up to max_pipelined requests per connection are
+    handled at once; requests beyond that are not read until one
+    completes."""
+
+    def __init__(self, reg, host=DEFAULT_HOST, port=DEFAULT_PORT, threads=32,
+                 max_pipelined=64):
+        self.reg = reg
+        self.host = host
+        self.port = port
+        self.max_pipelined = max_pipelined
+        self._executor = ThreadPoolExecutor(threads)
+        self.connection_count = 0  # connections open
+        self.request_count = 0  # requests handled
+
+    async def serve(self, started=None):
+        """Serve until cancelled. started (asyncio.Event) is set once
+        connections are accepted"""
+        server = await asyncio.start_server(self._handle_connection,
+                                            self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]  # if port 0 given
+        if started:
+            started.set()
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_connection(self, reader, writer):
+        self.connection_count += 1
+        slots = asyncio.Semaphore(self.max_pipelined)
+        write_lock = asyncio.Lock()
+        tasks = set()  # requests in progress
+        try:
+            while True:
+                await slots.acquire()
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, ValueError):  # ValueError: line too
+                    # long
+                    break
+                if not line:
+                    break
+                task = asyncio.create_task(
+                    self._handle_request(line, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(lambda _: slots.release())
+            if tasks:
+                await asyncio.wait(tasks)
+        finally:
+            self.connection_count -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _handle_request(self, line, writer, write_lock):
+        request_id = None
+        try:
+            request = decode_message(line)
+            request_id = request.get('id')
+            method = request['method']
+            if method not in METHODS:
+                raise ValueError(f'Unknown method {method}')
+            result = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._call, method, request.get('args', []))
+            response = {'id': request_id, 'result': result}
+        except Exception as e:
+            response = {'id': request_id, 'error': f'{type(e).__name__}: '
+                                                   f'{str(e)}'}
+        self.request_count += 1
+        async with write_lock:
+            writer.write(encode_message(response))
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    def _call(self, method, args):
+        return getattr(self.reg, method)(*args)
+
+    def close(self):
+        self._executor.shutdown()
+
+
+def _stop(signal_number, frame):
+    # Shut down on SIGTERM as on Ctrl-C, writing queued changes
+    raise KeyboardInterrupt
+
+
+def main():
+    parser = ArgumentParser(description='Run the registration server')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--shards', type=int, default=1)
+    args = parser.parse_args()
+
+    reg = RegistrationFacade()
+    print(reg.retrieve_data(shards=args.shards))
+    server = RegistrationServer(reg, args.host, args.port, args.threads)
+    print(f'Serving registration system on {args.host}:{str(args.port)}')
+    signal(SIGTERM, _stop)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        print(reg.flush())
+        reg.stop_shards()
+
+
+if __name__ == '__main__':
+    main()
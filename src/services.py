@@ -3,6 +3,10 @@ Module: Classes which are "services" that encapsulate domain logic.
 Utilizing Strategy pattern for course registration-related functionality.
 """
 from abc import ABC, abstractmethod
+from heapq import heappush, heapreplace
+from itertools import chain, count
+from time import perf_counter
+from courses import count_days, RegistrationStatus
 import db_utils
 
 
@@ -33,17 +37,81 @@ class RegistrationContext:
 
 
 class IRegistrationStrategy(ABC):
-    """Interface for concrete registration strategies"""
+    """Interface for concrete registration strategies. Seats are claimed in
+    the sql db at the version of the section/lab held in memory. If the claim
+    fails since another process (e.g. another app node) has changed the
+    section/lab, it is refreshed from the sql db and the registration
+    attempted again. If the claim could not be attempted (see
+    db_utils.ClaimError), the registration fails without retrying."""
+    MAX_ATTEMPTS = 5  # attempts to claim a seat before giving up
+    CHANGED_MESSAGE = 'Registration could not be completed as the class is ' \
+                      'being changed by other users. Please try again'
+    UNAVAILABLE_MESSAGE = 'Registration could not be completed as the ' \
+                          'registration database is unavailable. Please ' \
+                          'try again later'
+
+    def __init__(self, lock_manager=None, refresh=None):
+        self.lock_manager = lock_manager  # LockManager if run concurrently
+        self.refresh = refresh  # callable which re-reads a section/lab from
+        # the sql db (see IncrementalRetrieve.refresh_registerable)
 
-    @abstractmethod
     def execute(self, student, course, registerable_num, sql_conn, mongo_conn):
+        try:
+            for _ in range(self.MAX_ATTEMPTS):
+                display_str = self.attempt(student, course, registerable_num,
+                                           sql_conn, mongo_conn)
+                if display_str is not None:
+                    return display_str
+        except db_utils.ClaimError as e:
+            print(e)
+            return self.UNAVAILABLE_MESSAGE
+        return self.CHANGED_MESSAGE
+
+    @abstractmethod
+    def attempt(self, student, course, registerable_num, sql_conn,
+                mongo_conn):
+        """Attempt registration action. Returns None if claiming a seat
+        failed (once the section/lab has been refreshed)"""
         pass
 
+    @staticmethod
+    def get_status(student, course, earlier_sections=0):
+        """Status of a student's new registration in a course: 'Pending' if
+        student is overloading (before department chair approval),
+        'Tentative' if course requires instructor approval, otherwise
+        'Approved'. earlier_sections is the number of sections being
+        registered in before this one at the same time (see
+        CartRegistration)"""
+        if earlier_sections >= student.remaining_load:
+            return 'Pending'
+        elif course.approval_required:
+            return 'Tentative'
+        else:
+            return 'Approved'
+
+    def refresh_registerable(self, registerable):
+        if self.refresh:
+            self.refresh(registerable)
+
+    @staticmethod
+    def check_conflict(student, registerable, replacing=None):
+        """Message denying registration if registerable meets at the same
+        time as a section/lab on student's schedule (other than replacing),
+        otherwise None"""
+        conflict = student.get_schedule().find_conflict(registerable,
+                                                        replacing)
+        if conflict:
+            return f'Registration denied. Meeting time ({registerable.day} ' \
+                   f'{registerable.time}) conflicts with ' \
+                   f'{conflict.course_name} ({conflict.day} ' \
+                   f'{conflict.time}) on student\'s schedule'
+        return None
+
 
 class SectionRegistration(IRegistrationStrategy):
     """Strategy for student registering in section"""
 
-    def execute(self, student, course, section_number, sql_conn, mongo_conn):
+    def attempt(self, student, course, section_number, sql_conn, mongo_conn):
         # Check if student already registered in course section
         if course.find_student_section(student.username):
             return f'Student already registered for section in ' \
@@ -52,30 +120,51 @@ class SectionRegistration(IRegistrationStrategy):
         section = course.get_section(section_number)
         if not section:
             return 'Section not found'
-        # Check if section has space remaining
+        # Check if section meets at the same time as student's other classes
+        conflict_str = self.check_conflict(student, section)
+        if conflict_str:
+            return conflict_str
+        # Check if section has space remaining. If not, add to waitlist
         elif not section.space_remaining:
-            return f'Registration denied. Section is full: ' \
-                   f'{str(section.max_registration)} ' \
-                   f'{str(section.max_registration)} students registered'
+            display_str = f'Section is full: ' \
+                          f'{str(section.max_registration)} / ' \
+                          f'{str(section.max_registration)} students ' \
+                          f'registered. '
+            if section.waitlist.add(student):
+                # Add waitlist entry to sql db
+                db_utils.db_add_section_waitlist(sql_conn, student.id,
+                                                 section.id, 0)
+                # Insert log of change in mongo db
+                log = f"Student '{student.username}' added to waitlist " \
+                      f"for {course.name} section {str(section.number)}"
+                mongo_conn.insert_log(log)
+                display_str += 'Student has been added to the waitlist '
+            else:
+                display_str += 'Student is already on the waitlist '
+            position = section.waitlist.get_position(student.username)
+            return display_str + f'at position {str(position)}'
+
+        status = self.get_status(student, course)
+        # Add section registration to sql db, claiming a seat
+        if not db_utils.db_add_section_reg(status, sql_conn, student.id,
+                                           section.id, section.version):
+            self.refresh_registerable(section)
+            return None
+        section.version += 1
+        section.add_student(student, status)
         # Check if student is overloading
-        elif student.is_fully_registered:
-            status = 'Pending'
-            section.add_student(student, 'Pending')
+        if status == 'Pending':
             display_str = "Student is overloading on registered " \
                            "classes, and has been added to section as "\
                            "'Pending' before department chair "\
                            "approval."
         # Check if course requires instructor approval
-        elif course.approval_required:
-            status = 'Tentative'
-            section.add_student(student, 'Tentative')
+        elif status == 'Tentative':
             display_str = f"{course.name} course requires " \
                           f"approval from instructor. Student has " \
                           f"been added to section as 'Tentative' " \
                           f"before instructor approval."
         else:  # No restrictions - student is approved
-            status = 'Approved'
-            section.add_student(student, 'Approved')
             display_str = f"Student successfully registered for " \
                            f"{course.name} Section " \
                           f"{str(section_number)}"
@@ -88,9 +177,6 @@ class SectionRegistration(IRegistrationStrategy):
         # Add section to student's schedule
         student.add_section(section)
 
-        # Add section registration to sql db
-        db_utils.db_add_section_reg(status, sql_conn, student.username,
-                                    section_number, course.name)
         # Insert log of change in mongo db
         log = f"Student '{student.username}' registered in " \
               f"{course.name} section {str(section.number)} with " \
@@ -103,7 +189,7 @@ class SectionRegistration(IRegistrationStrategy):
 class LabRegistration(IRegistrationStrategy):
     """Strategy for student registering in lab"""
 
-    def execute(self, student, course, lab_number, sql_conn, mongo_conn):
+    def attempt(self, student, course, lab_number, sql_conn, mongo_conn):
         # Check if student is already registered in course section
         if not course.find_student_section(student.username):
             return 'Student must first register in a section in ' \
@@ -117,38 +203,54 @@ class LabRegistration(IRegistrationStrategy):
         lab = course.get_lab(lab_number)
         if not lab:
             return 'Lab not found'
-        # Check if lab has space remaining
+        # Check if lab meets at the same time as student's other classes
+        conflict_str = self.check_conflict(student, lab)
+        if conflict_str:
+            return conflict_str
+        # Check if lab has space remaining. If not, add to waitlist
         elif not lab.space_remaining:
-            return f'Registration denied. Lab is full: ' \
-                   f'{str(lab.max_registration)} / ' \
-                   f'{str(lab.max_registration)} students registered',
+            display_str = f'Lab is full: ' \
+                          f'{str(lab.max_registration)} / ' \
+                          f'{str(lab.max_registration)} students ' \
+                          f'registered. '
+            if lab.waitlist.add(student):
+                # Add waitlist entry to sql db
+                db_utils.db_add_lab_waitlist(sql_conn, student.id, lab.id, 0)
+                # Insert log of change in mongo db
+                log = f"Student '{student.username}' added to waitlist " \
+                      f"for {course.name} lab {str(lab.number)}"
+                mongo_conn.insert_log(log)
+                display_str += 'Student has been added to the waitlist '
+            else:
+                display_str += 'Student is already on the waitlist '
+            position = lab.waitlist.get_position(student.username)
+            return display_str + f'at position {str(position)}'
+
+        status = self.get_status(student, course)
+        # Add lab registration to sql db, claiming a seat
+        if not db_utils.db_add_lab_reg(status, sql_conn, student.id, lab.id,
+                                       lab.version):
+            self.refresh_registerable(lab)
+            return None
+        lab.version += 1
+        lab.add_student(student, status)
         # Check if student is overloading
-        elif student.is_fully_registered:
-            status = 'Pending'
-            lab.add_student(student, 'Pending')
+        if status == 'Pending':
             display_str = "Student is overloading on registered classes," \
                            " and has been added to lab as 'Pending' " \
                            "before department chair approval."
         # Check if course requires instructor approval
-        elif course.approval_required:
-            status = 'Tentative'
-            lab.add_student(student, 'Tentative')
+        elif status == 'Tentative':
             display_str = f"{course.name} course requires approval " \
                            f"from instructor. Student has been added " \
                            f"to lab as 'Tentative' before instructor approval."
         else:  # No restrictions - student is approved
-            status = 'Approved'
-            lab.add_student(student, 'Approved')
             display_str = f"Student successfully registered for " \
                            f"{course.name} Lab {str(lab_number)}"
 
         # Add lab to student's schedule
         student.add_lab(lab)
 
-        # Add lab registration to sql db
-        db_utils.db_add_lab_reg(status, sql_conn, student.username, lab_number,
-                            course.name)
-
         # Insert log of change in mongo db
         log = f"Student '{student.username}' registered in " \
               f"{course.name} lab {str(lab.number)} with " \
@@ -161,13 +263,14 @@ class LabRegistration(IRegistrationStrategy):
 class LabReschedule(IRegistrationStrategy):
     """Strategy for student rescheduling lab"""
 
-    def execute(self, student, course, lab_number, sql_conn, mongo_conn):
+    def attempt(self, student, course, lab_number, sql_conn, mongo_conn):
         # Check if student is already registered in course section
         if not course.find_student_section(student.username):
             return 'Student must first register in a section in ' \
                           f'{course.name} before registering in a lab'
         # Check if student not already registered in lab
-        if not course.find_student_lab(student.username):
+        old_lab = course.find_student_lab(student.username)
+        if not old_lab:
             return f'Student is not already registered for lab in ' \
                    f'{course.name}. Please use register in lab menu ' \
                    f'option to register for a lab in this course'
@@ -175,58 +278,274 @@ class LabReschedule(IRegistrationStrategy):
         lab = course.get_lab(lab_number)
         if not lab:
             return 'Lab not found'
+        # Check if requested lab is not the lab already registered in
+        if lab is old_lab:
+            return f'Student is already registered for {course.name} lab ' \
+                   f'{str(lab_number)}'
+        # Check if lab meets at the same time as student's other classes
+        # (other than the lab being rescheduled out of)
+        conflict_str = self.check_conflict(student, lab, old_lab)
+        if conflict_str:
+            return conflict_str
         # Check if lab has space remaining
         elif not lab.space_remaining:
             return f'Registration denied. Lab is full: ' \
                    f'{str(lab.max_registration)} / ' \
-                   f'{str(lab.max_registration)} students registered',
+                   f'{str(lab.max_registration)} students registered'
+
+        status = self.get_status(student, course)
+        # Move lab registration to new lab in sql db, claiming a seat
+        if not db_utils.db_reschedule_lab_reg(status, sql_conn, student.id,
+                                              old_lab.id, lab.id,
+                                              lab.version):
+            self.refresh_registerable(lab)
+            return None
+        lab.version += 1
+        old_lab.version += 1  # Seat released
+        lab.add_student(student, status)
         # Check if student is overloading
-        elif student.is_fully_registered:
-            status = 'Pending'
-            lab.add_student(student, 'Pending')
+        if status == 'Pending':
             display_str = "Student is overloading on registered classes," \
                            " and has been added to rescheduled lab as " \
                           "'Pending' before department chair approval."
         # Check if course requires instructor approval
-        elif course.approval_required:
-            status = 'Tentative'
-            lab.add_student(student, 'Tentative')
+        elif status == 'Tentative':
             display_str = f"{course.name} course requires approval " \
                            f"from instructor. Student has been added " \
                            f"to rescheduled lab as 'Tentative' before " \
                           f"instructor approval."
         else:  # No restrictions - student is approved
-            status = 'Approved'
-            lab.add_student(student, 'Approved')
             display_str = f"Student successfully rescheduled into " \
                            f"{course.name} lab {str(lab_number)}"
 
-        # Add lab to student's schedule
+        # Remove student from old lab and add new lab to student's schedule
+        old_lab.remove_student(student.username)
         student.add_lab(lab)
 
-        # Remove old lab registration from sql db
-        db_utils.db_delete_lab_reg(sql_conn, course.name, student.username)
-        # Add new lab registration to sql db
-        db_utils.db_add_lab_reg(status, sql_conn, student.username,
-                                lab_number, course.name)
-
         # Insert log of change in mongo db
         log = f"Student '{student.username}' rescheduled into " \
               f"{course.name} lab {str(lab.number)} with " \
               f"status '{status}'"
         mongo_conn.insert_log(log)
 
+        # Fill seat freed in old lab from its waitlist
+        WaitlistPromoter(sql_conn, mongo_conn, self.lock_manager,
+                         self.refresh).promote_lab(old_lab)
+
+        return display_str
+
+
+class CartRegistration:
+    """Class for student registering in several courses at once, from a cart
+    of (course name, section number, lab number or None) items. The whole
+    cart is validated before anything is registered, and is registered
+    all-or-nothing: seats are claimed and registrations added in a single
+    transaction in the sql db, and logged with a single batched write to
+    mongo db. Students are not waitlisted for full sections/labs in a cart.
+    As in IRegistrationStrategy, if claiming the seats fails since another
+    process has changed a section/lab, the cart's sections/labs are refreshed
+    and the cart attempted again."""
+    REGISTERED_MESSAGE = 'Student registered in all courses in cart:'
+    DENIED_MESSAGE = 'Cart not registered. '  # followed by the reason
+
+    def __init__(self, student, cart, courses, sql_conn, mongo_conn,
+                 refresh=None):
+        self.student = student
+        self.cart = cart
+        self.courses = courses  # key = course name, value = Course (None if
+        # not found)
+        self.sql_conn = sql_conn
+        self.mongo_conn = mongo_conn
+        self.refresh = refresh  # see IRegistrationStrategy
+
+    def get_registerables(self):
+        """Sections and labs in the cart (e.g. to lock)"""
+        registerables = []
+        for course_name, section_number, lab_number in self.cart:
+            course = self.courses[course_name]
+            if course:
+                registerables.append(course.get_section(section_number))
+                if lab_number is not None:
+                    registerables.append(course.get_lab(lab_number))
+        return registerables
+
+    def register_cart(self):
+        try:
+            for _ in range(IRegistrationStrategy.MAX_ATTEMPTS):
+                display_str = self.attempt()
+                if display_str is not None:
+                    return display_str
+        except db_utils.ClaimError as e:
+            print(e)
+            return IRegistrationStrategy.UNAVAILABLE_MESSAGE
+        return IRegistrationStrategy.CHANGED_MESSAGE
+
+    def validate(self):
+        """Check the whole cart. Returns (reason the cart is denied, None), or
+        (None, list of (course, section, lab or None, status)) if every item
+        can be registered"""
+        if not self.cart:
+            return 'Cart is empty', None
+        items = []
+        for course_name, section_number, lab_number in self.cart:
+            course = self.courses[course_name]
+            # Check if course exists and is in cart once
+            if not course:
+                return f'Course not found: {course_name}', None
+            if any(item[0] is course for item in items):
+                return f'{course_name} is in cart more than once', None
+            # Check if student already registered in course section
+            if course.find_student_section(self.student.username):
+                return f'Student already registered for section in ' \
+                       f'{course_name}', None
+            # Check if requested section (and lab) exist, and the lab
+            # prerequisite of courses requiring one
+            section = course.get_section(section_number)
+            if not section:
+                return f'Section not found: {course_name} section ' \
+                       f'{str(section_number)}', None
+            lab = None
+            if lab_number is not None:
+                lab = course.get_lab(lab_number)
+                if not lab:
+                    return f'Lab not found: {course_name} lab ' \
+                           f'{str(lab_number)}', None
+            elif course.lab_required:
+                return f'{course_name} requires a lab', None
+            # Check that section (and lab) have space remaining and do not
+            # meet at the same time as other classes
+            denial = self._check_registerable(section, 'section', items) or \
+                (lab and self._check_registerable(lab, 'lab', items, section))
+            if denial:
+                return denial, None
+            # Check if student is overloading (counting the sections earlier
+            # in the cart) and if course requires instructor approval
+            status = IRegistrationStrategy.get_status(self.student, course,
+                                                      len(items))
+            items.append((course, section, lab, status))
+        return None, items
+
+    def _check_registerable(self, registerable, kind, items, section=None):
+        # Reason registerable (kind 'section' or 'lab') cannot be registered
+        # in: it is full, or meets at the same time as a class on student's
+        # schedule, in items (earlier in the cart) or the section of its
+        # course in the cart (for a lab). None if it can be
+        description = f'{registerable.course_name} {kind} ' \
+                      f'{str(registerable.number)}'
+        if not registerable.space_remaining:
+            return f'{description} is full: ' \
+                   f'{str(registerable.max_registration)} / ' \
+                   f'{str(registerable.max_registration)} students registered'
+        conflict = self.student.get_schedule().find_conflict(registerable)
+        where = "on student's schedule"
+        if not conflict:
+            in_cart = [other for _, item_section, item_lab, _ in items for
+                       other in (item_section, item_lab) if other]
+            if section:
+                in_cart.append(section)
+            conflict = next((other for other in in_cart if
+                             other.time_slots & registerable.time_slots),
+                            None)
+            where = 'in cart'
+        if conflict:
+            return f'Meeting time of {description} ({registerable.day} ' \
+                   f'{registerable.time}) conflicts with ' \
+                   f'{conflict.course_name} ({conflict.day} ' \
+                   f'{conflict.time}) {where}'
+        return None
+
+    def attempt(self):
+        """Attempt registering the cart. Returns None if claiming the seats
+        failed (once the cart's sections/labs have been refreshed)"""
+        denial, items = self.validate()
+        if denial:
+            return self.DENIED_MESSAGE + denial
+        # Add all registrations to sql db, claiming their seats
+        if not db_utils.db_add_cart_reg(
+                self.sql_conn, self.student.id,
+                [(status, section.id, section.version) for
+                 _, section, _, status in items],
+                [(status, lab.id, lab.version) for _, _, lab, status in items
+                 if lab]):
+            if self.refresh:
+                for _, section, lab, _ in items:
+                    self.refresh(section)
+                    if lab:
+                        self.refresh(lab)
+            return None
+        display_str = self.REGISTERED_MESSAGE
+        logs = []
+        for course, section, lab, status in items:
+            for registerable in (section, lab) if lab else (section,):
+                registerable.version += 1
+                registerable.add_student(self.student, status)
+            self.student.add_section(section)
+            display_str += f'\n  {course.name} Section {str(section.number)}'
+            log = f"Student '{self.student.username}' registered in " \
+                  f"{course.name} section {str(section.number)} with " \
+                  f"status '{status}'"
+            logs.append(log)
+            if lab:
+                self.student.add_lab(lab)
+                display_str += f', Lab {str(lab.number)}'
+                log = f"Student '{self.student.username}' registered in " \
+                      f"{course.name} lab {str(lab.number)} with " \
+                      f"status '{status}'"
+                logs.append(log)
+            if status == 'Pending':
+                display_str += " - 'Pending' (overloading) before " \
+                               "department chair approval"
+            elif status == 'Tentative':
+                display_str += " - 'Tentative' before instructor approval"
+        # Insert logs of changes in mongo db
+        self.mongo_conn.insert_logs(logs)
         return display_str
 
+    def release(self):
+        """Undo registering the cart (e.g. once another part of a cart split
+        between processes was denied): the student is removed from the
+        cart's sections/labs and their seats are released. Unlike a drop,
+        no waitlisted student is promoted into the seats and nothing is
+        logged, as the cart is as if never registered. Returns the names of
+        the courses released"""
+        schedule = self.student.get_schedule()
+        course_names = []
+        for course_name, section_number, lab_number in self.cart:
+            course = self.courses[course_name]
+            section = course.get_section(section_number) if course else None
+            if not section or schedule.get_section(course_name) is not \
+                    section:
+                continue
+            lab = course.get_lab(lab_number) if lab_number is not None \
+                else None
+            if lab and schedule.get_lab(course_name) is not lab:
+                lab = None
+            for registerable in (section, lab) if lab else (section,):
+                registerable.remove_student(self.student.username)
+                registerable.version += 1
+            schedule.remove_section(course_name)
+            if lab:
+                schedule.remove_lab(course_name)
+            # Delete registration from sql db, releasing the seats
+            db_utils.db_delete_course_reg(self.sql_conn, self.student.id,
+                                          section.id, lab.id if lab else None)
+            course_names.append(course_name)
+        return course_names
+
 
 class CourseDropper:
     """Class for student dropping specific course"""
+    DROPPED_MESSAGE = 'Student has successfully dropped '  # followed by the
+    # course name
 
-    def __init__(self, student, course_name, sql_conn, mongo_conn):
+    def __init__(self, student, course_name, sql_conn, mongo_conn,
+                 lock_manager=None, refresh=None):
         self.student = student
         self.course_name = course_name
         self.sql_conn = sql_conn
         self.mongo_conn = mongo_conn
+        self.lock_manager = lock_manager  # LockManager if run concurrently
+        self.refresh = refresh  # see IRegistrationStrategy
 
     def drop_course(self):
         schedule = self.student.get_schedule()
@@ -246,24 +565,41 @@ class CourseDropper:
             schedule.remove_lab(self.course_name)
 
         # Delete course registration from sql db
-        db_utils.db_delete_course_reg(self.sql_conn, self.course_name,
-                                  self.student.username)
+        db_utils.db_delete_course_reg(self.sql_conn, self.student.id,
+                                      section.id if section else None,
+                                      lab.id if lab else None)
+        # Seats released
+        if section:
+            section.version += 1
+        if lab:
+            lab.version += 1
 
         # Insert log of change in mongo db
         log = f"Student '{self.student.username}' has dropped " \
               f"{self.course_name}"
         self.mongo_conn.insert_log(log)
 
-        return f'Student has successfully dropped {self.course_name}'
+        # Fill seats freed from waitlists
+        promoter = WaitlistPromoter(self.sql_conn, self.mongo_conn,
+                                    self.lock_manager, self.refresh)
+        if section:
+            promoter.promote_section(section)
+        if lab:
+            promoter.promote_lab(lab)
+
+        return self.DROPPED_MESSAGE + self.course_name
 
 
 class AllCourseDropper:
     """Class for student dropping all courses"""
 
-    def __init__(self, student, sql_conn, mongo_conn):
+    def __init__(self, student, sql_conn, mongo_conn, lock_manager=None,
+                 refresh=None):
         self.student = student
         self.sql_conn = sql_conn
         self.mongo_conn = mongo_conn
+        self.lock_manager = lock_manager  # LockManager if run concurrently
+        self.refresh = refresh  # see IRegistrationStrategy
 
     def drop_all_courses(self):
         schedule = self.student.get_schedule()
@@ -274,6 +610,8 @@ class AllCourseDropper:
         if not sections and not labs:
             return 'Student is not currently registered in any course'
         else:
+            sections = list(sections)
+            labs = list(labs)
             for section in sections:
                 section.remove_student(self.student.username)
             for lab in labs:
@@ -282,16 +620,165 @@ class AllCourseDropper:
             schedule.labs = {}
 
             # Delete all student's registrations from sql db
-            db_utils.db_delete_all_reg(self.sql_conn, self.student.username)
+            db_utils.db_delete_all_reg(self.sql_conn, self.student.id)
+            for registerable in sections + labs:  # Seats released
+                registerable.version += 1
 
             # Insert log of change in mongo db
             log = f"Student '{self.student.username}' has dropped all courses"
             self.mongo_conn.insert_log(log)
 
+            # Fill seats freed from waitlists
+            promoter = WaitlistPromoter(self.sql_conn, self.mongo_conn,
+                                        self.lock_manager, self.refresh)
+            for section in sections:
+                promoter.promote_section(section)
+            for lab in labs:
+                promoter.promote_lab(lab)
+
             return 'Student has successfully dropped all courses from ' \
                    'schedule'
 
 
+class WaitlistPromoter:
+    """Class for promoting students from the waitlist of a section/lab into
+    seats freed by a drop. Students are given the status they would have
+    been given registering directly (see IRegistrationStrategy.get_status).
+    Students no longer eligible (e.g. registered in another section of the
+    course, or in a class at the same time, since joining the waitlist) are
+    removed from the waitlist. With a lock manager, students are promoted one
+    at a time holding the locks of the student and the section/lab, once the
+    caller has released its locks (students are locked before sections/labs,
+    so their locks cannot be taken while a section/lab lock is held). As in
+    IRegistrationStrategy, a seat whose claim fails is retried once the
+    section/lab has been refreshed, and promotion stops (leaving the student
+    at the head of the waitlist) if a claim could not be attempted."""
+
+    def __init__(self, sql_conn, mongo_conn, lock_manager=None, refresh=None):
+        self.sql_conn = sql_conn
+        self.mongo_conn = mongo_conn
+        self.lock_manager = lock_manager
+        self.refresh = refresh  # see IRegistrationStrategy
+
+    def promote_section(self, section):
+        self._promote(section, self._promote_next_section)
+
+    def promote_lab(self, lab):
+        self._promote(lab, self._promote_next_lab)
+
+    def _promote(self, registerable, promote_next):
+        if not registerable.waitlist:
+            return
+        if self.lock_manager:
+            self.lock_manager.after_release(self._promote_locked,
+                                            registerable, promote_next)
+        else:
+            failed_claims = 0
+            try:
+                while failed_claims < IRegistrationStrategy.MAX_ATTEMPTS:
+                    promoted = promote_next(registerable)
+                    if promoted is None:
+                        failed_claims += 1
+                    elif not promoted:
+                        break
+            except db_utils.ClaimError as e:
+                print(e)
+
+    def _promote_locked(self, registerable, promote_next):
+        failed_claims = 0
+        try:
+            while failed_claims < IRegistrationStrategy.MAX_ATTEMPTS:
+                with self.lock_manager.hold(registerable):
+                    student = registerable.waitlist.peek() if \
+                        registerable.space_remaining else None
+                if not student:
+                    break
+                with self.lock_manager.hold(student, registerable):
+                    # Check student was not promoted or removed while unlocked
+                    if registerable.waitlist.peek() is student and \
+                            promote_next(registerable) is None:
+                        failed_claims += 1
+        except db_utils.ClaimError as e:
+            print(e)
+
+    def _promote_next_section(self, section):
+        # Take the next student off the waitlist if there is a seat.
+        # Returns False if none was taken, or None if claiming the seat
+        # failed (once the section has been refreshed)
+        course = section.course
+        if not section.space_remaining:
+            return False
+        student = section.waitlist.peek()
+        if not student:
+            return False
+        # Check student is not already registered in course section and
+        # has no other classes at the same time
+        if course.find_student_section(student.username) or \
+                student.get_schedule().find_conflict(section):
+            section.waitlist.pop()
+            db_utils.db_delete_section_waitlist(self.sql_conn, student.id,
+                                                section.id)
+            return True
+        status = IRegistrationStrategy.get_status(student, course)
+        # Move student from waitlist into section in sql db, claiming a seat
+        if not db_utils.db_promote_section_waitlist(status, self.sql_conn,
+                                                    student.id, section.id,
+                                                    section.version):
+            if self.refresh:
+                self.refresh(section)
+            return None
+        section.version += 1
+        section.waitlist.pop()
+        section.add_student(student, status)
+        student.add_section(section)
+
+        # Insert log of change in mongo db
+        log = f"Student '{student.username}' promoted from waitlist " \
+              f"into {course.name} section {str(section.number)} with " \
+              f"status '{status}'"
+        self.mongo_conn.insert_log(log)
+        return True
+
+    def _promote_next_lab(self, lab):
+        # Take the next student off the waitlist if there is a seat.
+        # Returns False if none was taken, or None if claiming the seat
+        # failed (once the lab has been refreshed)
+        course = lab.course
+        if not lab.space_remaining:
+            return False
+        student = lab.waitlist.peek()
+        if not student:
+            return False
+        # Check student is registered in course section but not in a lab,
+        # and has no other classes at the same time
+        if not course.find_student_section(student.username) or \
+                course.find_student_lab(student.username) or \
+                student.get_schedule().find_conflict(lab):
+            lab.waitlist.pop()
+            db_utils.db_delete_lab_waitlist(self.sql_conn, student.id,
+                                            lab.id)
+            return True
+        status = IRegistrationStrategy.get_status(student, course)
+        # Move student from waitlist into lab in sql db, claiming a seat
+        if not db_utils.db_promote_lab_waitlist(status, self.sql_conn,
+                                                student.id, lab.id,
+                                                lab.version):
+            if self.refresh:
+                self.refresh(lab)
+            return None
+        lab.version += 1
+        lab.waitlist.pop()
+        lab.add_student(student, status)
+        student.add_lab(lab)
+
+        # Insert log of change in mongo db
+        log = f"Student '{student.username}' promoted from waitlist " \
+              f"into {course.name} lab {str(lab.number)} with status " \
+              f"'{status}'"
+        self.mongo_conn.insert_log(log)
+        return True
+
+
 class ApproveDenyRegistration:
     """Class for instructor approving/denying student's registration in a
     course"""
@@ -318,9 +805,9 @@ class ApproveDenyRegistration:
             return f'Student {self.student_username} not registered in ' \
                    f'{self.course_name}'
         # Get student's current registration status
-        student_status = section.get_student(self.student_username)[0]
+        student_status = section.get_student(self.student_username)[1]
         #  Only department chair can approve/deny students who are overloading
-        if student_status == 'Pending' and not \
+        if student_status == RegistrationStatus.PENDING and not \
                 self.instructor.is_department_chair:
             return f"Only department chair can approve / deny 'Pending' " \
                    f"student registrations. No action taken."
@@ -351,8 +838,10 @@ class ApproveDenyRegistration:
 
             # Update status in sql db
             status = 'Approved' if self.is_approved else 'Denied'
-            db_utils.db_update_reg_status(status, self.sql_conn,
-                                      self.student_username, self.course_name)
+            student = section.get_student(self.student_username)[0]
+            db_utils.db_update_reg_status(status, self.sql_conn, student.id,
+                                          section.id,
+                                          lab.id if lab else None)
 
             # Insert log of change in mongo db
             log = f"Instructor '{self.instructor.username}' has {status} " \
@@ -391,7 +880,7 @@ class ApprovalRequiredModifier:
             # Update approval required in sql db
             app_req = 1 if self.approval_required else 0
             db_utils.db_update_approval_required(self.sql_conn, app_req,
-                                             self.course_name)
+                                                 course.id)
 
             # Insert log of change in mongo db
             app_str = "approval required" if self.approval_required else \
@@ -434,8 +923,9 @@ class Grader:
                    f"{str(section.number)}"
 
             # Add grade to sql db
-            db_utils.db_add_grade(self.sql_conn, self.course_name, section.number,
-                              self.student_username, self.grade)
+            student = section.get_student(self.student_username)[0]
+            db_utils.db_add_grade(self.sql_conn, section.id, student.id,
+                                  self.grade)
 
             # Insert log of change in mongo db
             log = f"Instructor '{self.instructor.username}' has added " \
@@ -444,3 +934,118 @@ class Grader:
             self.mongo_conn.insert_log(log)
 
             return display_str
+
+
+class ScheduleBuilder:
+    """Class for finding the conflict-free combinations of sections (and labs
+    of courses requiring a lab) with open seats for a set of courses, which
+    fit around the student's other classes. Combinations are searched by
+    backtracking over the meeting time bitmaps of the sections/labs,
+    pruning any branch which conflicts or which already meets on more days
+    than the worst of the best schedules found so far. Search stops once
+    time_budget seconds have passed, returning the best schedules found."""
+
+    def __init__(self, student, courses, limit=5, time_budget=0.5):
+        self.student = student
+        self.courses = courses
+        self.limit = limit
+        self.time_budget = time_budget
+        self.timed_out = False
+
+    def build_schedules(self):
+        """Return up to limit schedules, fewest days on campus first, as
+        (days on campus, list of (course, section, lab or None))"""
+        schedule = self.student.get_schedule()
+        course_names = {course.name for course in self.courses}
+        # Slots taken by registrations in courses not being scheduled
+        occupied = 0
+        for registerable in chain(schedule.sections.values(),
+                                  schedule.labs.values()):
+            if registerable.course_name not in course_names:
+                occupied |= registerable.time_slots
+        # Schedule courses with the fewest options first to prune early
+        # and, within each course, try options meeting on fewest days first
+        course_options = sorted(
+            ((course, sorted(self._get_options(course, schedule),
+                             key=lambda option: count_days(option[2])))
+             for course in self.courses), key=lambda item: len(item[1]))
+        if not course_options or not all(options for _, options in
+                                         course_options):
+            return []
+
+        best = []  # heap of the best schedules found: (-days, -order found,
+        # choices), so that the worst schedule is best[0]
+        found = count()
+        deadline = perf_counter() + self.time_budget
+        choices = []  # (course, section, lab) chosen for courses so far
+        self.timed_out = False
+
+        def search(depth, occupied):
+            days = count_days(occupied)
+            # A schedule only gains days as courses are added
+            if len(best) == self.limit and days >= -best[0][0]:
+                return
+            if depth == len(course_options):
+                entry = (-days, -next(found), list(choices))
+                if len(best) < self.limit:
+                    heappush(best, entry)
+                else:
+                    heapreplace(best, entry)
+                return
+            if perf_counter() > deadline:
+                self.timed_out = True
+                return
+            course, options = course_options[depth]
+            for section, lab, time_slots in options:
+                if time_slots & occupied or self.timed_out:
+                    continue
+                choices.append((course, section, lab))
+                search(depth + 1, occupied | time_slots)
+                choices.pop()
+
+        search(0, occupied)
+        return [(-days, choices) for days, _, choices in
+                sorted(best, reverse=True)]
+
+    def _get_options(self, course, schedule):
+        # (section, lab, combined time slots) for each combination of
+        # section and (if required) lab with open seats which do not
+        # conflict with each other. Student's current registrations in the
+        # course are always options
+        current_section = schedule.get_section(course.name)
+        current_lab = schedule.get_lab(course.name)
+        sections = [section for section in course.sections.values() if
+                    section is current_section or section.space_remaining]
+        if not course.lab_required:
+            return [(section, None, section.time_slots) for section in
+                    sections]
+        labs = [lab for lab in course.labs.values() if
+                lab is current_lab or lab.space_remaining]
+        return [(section, lab, section.time_slots | lab.time_slots) for
+                section in sections for lab in labs if
+                not section.time_slots & lab.time_slots]
+
+    def view_schedules(self):
+        schedules = self.build_schedules()
+        if not schedules:
+            if self.timed_out:
+                return 'Search time limit reached before any schedule was ' \
+                       'found for ' + ', '.join(course.name for course in
+                                                self.courses)
+            return 'No conflict-free schedule with open seats found for ' + \
+                   ', '.join(course.name for course in self.courses)
+        display_str = '\n============= SCHEDULE OPTIONS =============\n'
+        for option, (days, choices) in enumerate(schedules, 1):
+            display_str += '---------------------------------------------\n'
+            display_str += f'Option {str(option)} - {str(days)} days on ' \
+                           f'campus\n'
+            display_str += '---------------------------------------------\n'
+            for course, section, lab in choices:
+                display_str += f'{str(section)}\n'
+                if lab:
+                    display_str += f'{str(lab)}\n'
+        if self.timed_out:
+            display_str += '(Search time limit reached. More schedules may ' \
+                           'exist)\n'
+        display_str += '=============================================\n'
+        return display_str
@@ -0,0 +1,110 @@
+"""
+Module: Throughput benchmark of the registration system run in a single
+process and sharded across 2 to N worker processes. Replays a mix of
+registration requests from several client threads against the students and
+courses in the SQL database, in test mode (changes are not written).
+"""
+from argparse import ArgumentParser
+from random import Random
+from threading import Thread
+from time import perf_counter
+from db_management import SQLRetrieve
+from registration import RegistrationFacade
+
+# (cumulative share of requests, facade method) of the request mix
+REQUEST_MIX = ((0.45, 'register_in_section'), (0.65, 'register_in_lab'),
+               (0.75, 'reschedule_lab'), (0.93, 'drop_course'),
+               (0.95, 'drop_all_courses'), (1.0, 'view_schedule'))
+
+
+def get_catalog(reg):
+    """Usernames of students, and section and lab numbers of each course:
+    key = course name, value = (section numbers, lab numbers)"""
+    with reg.sql_conn.borrow_connection() as conn:
+        sql_retrieve = SQLRetrieve(conn)
+        usernames = [s['username'] for s in sql_retrieve.get_students()]
+        catalog = {c['name']: ([], []) for c in sql_retrieve.get_courses()}
+        for s in sql_retrieve.get_sections():
+            catalog[s['course_name']][0].append(s['section_number'])
+        for l in sql_retrieve.get_labs():
+            catalog[l['course_name']][1].append(l['lab_number'])
+    return usernames, catalog
+
+
+def run_client(reg, usernames, catalog, seed, request_count, latencies):
+    rng = Random(seed)
+    course_names = list(catalog)
+    for _ in range(request_count):
+        username = rng.choice(usernames)
+        course_name = rng.choice(course_names)
+        section_numbers, lab_numbers = catalog[course_name]
+        draw = rng.random()
+        method = next(name for share, name in REQUEST_MIX if draw < share)
+        start = perf_counter()
+        if method == 'register_in_section' and section_numbers:
+            reg.register_in_section(username, course_name,
+                                    rng.choice(section_numbers))
+        elif method in ('register_in_lab', 'reschedule_lab') and lab_numbers:
+            getattr(reg, method)(username, course_name,
+                                 rng.choice(lab_numbers))
+        elif method == 'drop_course':
+            reg.drop_course(username, course_name)
+        elif method == 'drop_all_courses':
+            reg.drop_all_courses(username)
+        else:
+            reg.view_schedule(username)
+        latencies.append(perf_counter() - start)
+
+
+def run_benchmark(reg, usernames, catalog, clients, request_count):
+    """Replay request_count requests from clients threads. Returns
+    (requests per second, sorted latencies in seconds)"""
+    latencies = []
+    threads = [Thread(target=run_client,
+                      args=(reg, usernames, catalog, seed,
+                            request_count // clients, latencies))
+               for seed in range(clients)]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - start
+    latencies.sort()
+    return len(latencies) / elapsed, latencies
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--max-shards', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--shard-threads', type=int, default=1)
+    parser.add_argument('--no-audit-log', action='store_true',
+                        help='discard audit logs instead of writing them to '
+                             'MongoDB')
+    args = parser.parse_args()
+
+    reg = RegistrationFacade(test_mode=True,
+                             audit_logging=not args.no_audit_log)
+    usernames, catalog = get_catalog(reg)
+    print(f'{len(usernames)} students, {len(catalog)} courses, '
+          f'{args.clients} clients, {args.requests} requests')
+    print(f"{'shards':>6} {'req/s':>9} {'speedup':>8} {'p50 ms':>8} "
+          f"{'p99 ms':>8}")
+    base_throughput = None
+    for shard_count in range(1, args.max_shards + 1):
+        reg.retrieve_data(shards=shard_count,
+                          shard_threads=args.shard_threads)
+        throughput, latencies = run_benchmark(reg, usernames, catalog,
+                                              args.clients, args.requests)
+        reg.stop_shards()
+        base_throughput = base_throughput or throughput
+        print(f'{shard_count:>6} {throughput:>9.0f} '
+              f'{throughput / base_throughput:>7.2f}x '
+              f'{latencies[len(latencies) // 2] * 1000:>8.3f} '
+              f'{latencies[int(len(latencies) * 0.99)] * 1000:>8.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,562 @@
+"""
+Module: Sharded execution of the registration system across worker
+processes, so that registration work is not limited to one core by the GIL
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from itertools import count
+from multiprocessing import get_context
+from pickle import dumps, loads
+from threading import Lock, Thread
+from zlib import crc32
+from courses import RegistrationStatus
+from services import CartRegistration, CourseDropper
+
+# Facade methods sent to the shards by the router: key = method name, value =
+# (route, position of student username argument, position of course name
+# argument). Routes: 'course' - the shard owning the course, 'student' - the
+# student's home shard, 'any' - shards in turn, 'all' - every shard (results
+# joined by lines), 'drop_all' - the owners of each of the student's courses,
+# 'cart' - the owners of each of the courses in the cart
+ROUTES = {
+    'get_user_type': ('any', None, None),
+    'view_schedule': ('student', 0, None),
+    'view_grades': ('student', 0, None),
+    'view_filtered_courses': ('any', None, None),
+    'search_courses': ('any', None, None),
+    'view_open_seats': ('any', None, None),
+    'build_schedules': ('student', 0, None),
+    'register_in_section': ('course', 0, 1),
+    'register_in_lab': ('course', 0, 1),
+    'register_cart': ('cart', 0, None),
+    'reschedule_lab': ('course', 0, 1),
+    'drop_course': ('course', 0, 1),
+    'drop_all_courses': ('drop_all', 0, None),
+    'view_courses_teaching': ('any', None, None),
+    'view_course_students': ('course', None, 1),
+    'approve_deny_reg': ('course', 1, 2),
+    'modify_approval_required': ('course', None, 1),
+    'add_grade': ('course', 1, 2),
+    'view_grade_statistics': ('course', None, 1),
+    'refresh_data': ('all', None, None),
+    'enable_write_behind': ('all', None, None),
+    'flush': ('all', None, None),
+    'view_pool_metrics': ('all', None, None),
+    'view_log_metrics': ('all', None, None),
+    'save_snapshot': ('any', None, None),
+    'export_transcripts': ('any', None, None),
+}
+# Facade methods which may change the sections/labs of the course they are
+# routed by, and so are replicated to the other shards
+MUTATING = {'register_in_section', 'register_in_lab', 'reschedule_lab',
+            'drop_course', 'approve_deny_reg', 'modify_approval_required',
+            'add_grade'}
+
+
+def get_shard_index(key, shard_count):
+    """Shard owning a course (or home shard of a student) by name. Python's
+    hash of strings differs between processes, so CRC32 is used"""
+    return crc32(key.encode()) % shard_count
+
+
+class ShardRouter:
+    """Router sending facade requests to shard worker processes. The course
+    library is partitioned by course: each shard owns the courses whose name
+    hashes to it, and only the owner registers students in, drops students
+    from, grades or approves the course's sections and labs. Every shard
+    loads the whole system, so the rest of the catalog is a replica kept up
+    to date by the owners.
+
+    Student-level state (each student's schedule, and so the section count
+    used by is_fully_registered and the time slots used to find conflicts)
+    is replicated as follows. Requests changing a student are routed one at
+    a time per student. The owning shard replies with the resulting state
+    (roster, statuses, waitlist and version) of each section/lab it changed
+    (or the student's grades, for a grade added), and the router sends that
+    state to every other shard before the student's next request is sent.
+    Shards handle messages from the router in the order sent, so the owner
+    of any course the student registers in next sees every earlier
+    registration of the student. Students promoted from a waitlist by a drop
+    are replicated with the drop, but (not being locked by it) may have a
+    request handled elsewhere in the meantime against their earlier
+    schedule. Seats are claimed in the sql db by the owner alone, at the
+    version it holds (see IRegistrationStrategy)."""
+
+    def __init__(self, shard_count, facade_kwargs, retrieve_kwargs,
+                 threads=1):
+        context = get_context('spawn')  # Connections and threads of this
+        # process must not be inherited
+        self._shards = []  # _ShardConnection of each shard
+        self._request_ids = count()
+        self._next_shard = count()  # for requests routed to any shard
+        self._student_locks = {}  # key = username, value = Lock held while
+        # a request changing the student is handled and replicated
+        self.reports = []  # retrieve_data report of each shard
+        for index in range(shard_count):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=run_shard, args=(child_conn, facade_kwargs,
+                                        retrieve_kwargs, threads),
+                name=f'registration-shard-{str(index)}', daemon=True)
+            process.start()
+            child_conn.close()
+            self._shards.append(_ShardConnection(process, parent_conn))
+            if retrieve_kwargs.get('snapshot_path') and index == 0:
+                # Let the first shard rewrite a stale snapshot before the
+                # others read it
+                self.reports.append(self._shards[0].wait_ready())
+        for shard in self._shards[len(self.reports):]:
+            self.reports.append(shard.wait_ready())
+
+    @property
+    def shard_count(self):
+        return len(self._shards)
+
+    def route(self, method_name, args, kwargs):
+        """Handle a facade request on the shard(s) it is routed to"""
+        route, student_position, course_position = ROUTES[method_name]
+        if route == 'course':
+            shard = self._get_shard(args[course_position])
+            if student_position is None or method_name not in MUTATING:
+                return self._call(shard, method_name, args, kwargs)
+            with self._get_student_lock(args[student_position]):
+                return self._call(shard, method_name, args, kwargs)
+        elif route == 'student':
+            return self._call(self._get_shard(args[student_position]),
+                              method_name, args, kwargs)
+        elif route == 'any':
+            return self._call(self._shards[next(self._next_shard) %
+                                           len(self._shards)],
+                              method_name, args, kwargs)
+        elif route == 'all':
+            futures = [self._send(shard, method_name, args, kwargs) for
+                       shard in self._shards]
+            results = [self._receive(shard, future) for shard, future in
+                       zip(self._shards, futures)]
+            if all(result is None for result in results):
+                return None
+            return '\n'.join(str(result) for result in results)
+        elif route == 'drop_all':
+            return self._drop_all_courses(args[student_position])
+        else:
+            return self._register_cart(*args)
+
+    def close(self):
+        """Stop the shards once their changes are written to the databases"""
+        for shard in self._shards:
+            shard.send(None)
+        for shard in self._shards:
+            shard.process.join()
+
+    def _drop_all_courses(self, username):
+        # Dropped course by course by the owner of each. If a course is not
+        # dropped (e.g. its owner stopped), the remaining courses are not
+        # dropped either and the courses already dropped are reported
+        with self._get_student_lock(username):
+            course_names = self._call(self._get_shard(username),
+                                      'get_registered_courses', (username,),
+                                      {})
+            if not course_names:
+                return 'Student is not currently registered in any course'
+            dropped = []
+            for course_name in course_names:
+                try:
+                    result = self._call(self._get_shard(course_name),
+                                        'drop_course', (username, course_name),
+                                        {})
+                except Exception as e:
+                    result = str(e)
+                if result != CourseDropper.DROPPED_MESSAGE + course_name:
+                    display_str = f'Could not drop {course_name}: {result}'
+                    if dropped:
+                        display_str += '\nCourses dropped: ' + \
+                                       ', '.join(dropped)
+                    return display_str
+                dropped.append(course_name)
+            return 'Student has successfully dropped all courses from ' \
+                   'schedule'
+
+    def _register_cart(self, username, cart):
+        # Registered by the owner of each course in turn, courses with the
+        # same owner together, once the student's home shard has validated
+        # the whole cart. If an owner denies its part (e.g. a seat has since
+        # been taken) or fails to register it (e.g. it stopped), the parts
+        # already registered are released again, without promoting
+        # waitlisted students into the seats or logging drops (see
+        # CartRegistration.release)
+        parts = {}  # key = shard index, value = cart items of its courses
+        for item in cart:
+            parts.setdefault(get_shard_index(item[0], len(self._shards)),
+                             []).append(item)
+        with self._get_student_lock(username):
+            if len(parts) <= 1:
+                return self._call(self._get_shard(cart[0][0] if cart else
+                                                  username),
+                                  'register_cart', (username, cart), {})
+            denial = self._call(self._get_shard(username), 'validate_cart',
+                                (username, cart), {})
+            if denial:
+                return denial
+            message = CartRegistration.REGISTERED_MESSAGE
+            display_str = message
+            registered = []  # (shard index, cart items) of parts registered
+            for index, items in parts.items():
+                try:
+                    result = self._call(self._shards[index], 'register_cart',
+                                        (username, items), {})
+                except Exception as e:
+                    result = CartRegistration.DENIED_MESSAGE + str(e)
+                if not result.startswith(message):
+                    for registered_index, registered_items in registered:
+                        try:
+                            self._call(self._shards[registered_index],
+                                       'release_cart', (username,
+                                                        registered_items),
+                                       {})
+                        except Exception as e:
+                            result += '\nCould not release ' + ', '.join(
+                                course_name for course_name, _, _ in
+                                registered_items) + f': {str(e)}'
+                    return result
+                registered.append((index, items))
+                display_str += result[len(message):]  # lines of courses
+            return display_str
+
+    def _get_shard(self, name):
+        return self._shards[get_shard_index(name, len(self._shards))]
+
+    def _get_student_lock(self, username):
+        # setdefault is atomic, so threads creating the same lock at once
+        # all get the one stored
+        return self._student_locks.get(username) or \
+            self._student_locks.setdefault(username, Lock())
+
+    def _call(self, shard, method_name, args, kwargs):
+        return self._receive(shard, self._send(shard, method_name, args,
+                                               kwargs))
+
+    def _send(self, shard, method_name, args, kwargs):
+        request_id = next(self._request_ids)
+        future = shard.add_pending(request_id)
+        shard.send((request_id, method_name, args, kwargs))
+        return future
+
+    def _receive(self, shard, future):
+        result, changes = future.result()
+        if changes:  # Replicate to the other shards
+            message = dumps((None, 'apply_changes', changes, None))
+            for other in self._shards:
+                if other is not shard:
+                    other.send_bytes(message)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class _ShardConnection:
+    # Router's end of the pipe to a shard. Replies are read by a thread and
+    # passed to the Future of the request, so several requests (from
+    # different threads) can be in flight to a shard at once
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self._send_lock = Lock()
+        self._pending = {}  # key = request id, value = Future of (result,
+        # changes)
+        self._ready = Future()  # retrieve_data report, once loaded
+        Thread(target=self._read, daemon=True).start()
+
+    def wait_ready(self):
+        return self._ready.result()
+
+    def add_pending(self, request_id):
+        future = Future()
+        self._pending[request_id] = future
+        return future
+
+    def send(self, message):
+        self.send_bytes(dumps(message))
+
+    def send_bytes(self, message):
+        with self._send_lock:
+            self.conn.send_bytes(message)
+
+    def _read(self):
+        try:
+            while True:
+                request_id, result, changes = loads(self.conn.recv_bytes())
+                if request_id is None:
+                    self._ready.set_result(result)
+                else:
+                    self._pending.pop(request_id).set_result((result,
+                                                              changes))
+        except (EOFError, OSError):
+            error = RuntimeError(f'Shard {self.process.name} stopped')
+            if not self._ready.done():
+                self._ready.set_exception(error)
+            for future in list(self._pending.values()):
+                future.set_exception(error)
+
+
+def run_shard(conn, facade_kwargs, retrieve_kwargs, threads):
+    """Entry point of a shard worker process"""
+    from registration import RegistrationFacade
+    facade = RegistrationFacade(**facade_kwargs)
+    report = facade.retrieve_data(**retrieve_kwargs)
+    ShardWorker(facade, threads).serve(conn, report)
+
+
+class ShardWorker:
+    """Handles the requests sent to a shard by the router, on the thread
+    reading them or on a pool of threads. Requests changing a course are
+    handled one at a time per course, so that the state of the sections/labs
+    each may change (see get_changed_keys) before and after it can be
+    compared to find what to replicate. Changes replicated from other shards
+    are applied as soon as they are read, in the order sent."""
+
+    def __init__(self, facade, threads=1):
+        self.facade = facade
+        self._executor = ThreadPoolExecutor(threads) if threads > 1 else \
+            None  # Requests are handled on the reading thread if None
+        self._send_lock = Lock()
+        self._course_locks = {}  # key = course_name, value = Lock
+
+    def serve(self, conn, report):
+        conn.send_bytes(dumps((None, report, None)))
+        while True:
+            try:
+                message = loads(conn.recv_bytes())
+            except EOFError:
+                break
+            if message is None:  # Router closing
+                break
+            request_id, method_name, args, kwargs = message
+            if request_id is None:
+                for course_changes in args:
+                    self.apply_changes(course_changes)
+            elif self._executor:
+                self._executor.submit(self._handle, conn, request_id,
+                                      method_name, args, kwargs)
+            else:
+                self._handle(conn, request_id, method_name, args, kwargs)
+        if self._executor:
+            self._executor.shutdown()
+        self.facade.flush()
+        conn.close()
+
+    def _handle(self, conn, request_id, method_name, args, kwargs):
+        try:
+            result, changes = self.handle(method_name, args, kwargs)
+        except Exception as e:
+            result, changes = e, None
+        message = dumps((request_id, result, changes))
+        with self._send_lock:
+            conn.send_bytes(message)
+
+    def handle(self, method_name, args, kwargs):
+        """Call facade method. Returns (result, changes to replicate: list of
+        (course name, changed state) of each course changed)"""
+        if method_name == 'get_registered_courses':
+            return self.get_registered_courses(*args), None
+        elif method_name == 'validate_cart':
+            return self.validate_cart(*args), None
+        method = self.release_cart if method_name == 'release_cart' else \
+            getattr(self.facade, method_name)
+        if method_name in ('register_cart', 'release_cart'):
+            course_names = {course_name for course_name, _, _ in args[1]}
+        elif method_name in MUTATING:
+            course_names = {args[ROUTES[method_name][2]]}
+        else:
+            return method(*args, **kwargs), None
+        courses = [course for course in map(self.facade.get_course,
+                                            sorted(course_names)) if course]
+        with ExitStack() as stack:
+            for course in courses:  # in order of name, so cannot deadlock
+                stack.enter_context(
+                    self._course_locks.get(course.name) or
+                    self._course_locks.setdefault(course.name, Lock()))
+            keys = [self.get_changed_keys(course, method_name, args) for
+                    course in courses]
+            before = [self.get_course_state(course, course_keys) for
+                      course, course_keys in zip(courses, keys)]
+            result = method(*args, **kwargs)
+            after = [self.get_course_state(course, course_keys) for
+                     course, course_keys in zip(courses, keys)]
+        changes = []
+        for course, course_before, course_after in zip(courses, before,
+                                                       after):
+            changed = {key: state for key, state in course_after.items() if
+                       course_before.get(key) != state}
+            if changed:
+                changes.append((course.name, changed))
+        return result, changes or None
+
+    def get_registered_courses(self, username):
+        student = self.facade.get_student(username)
+        schedule = student.get_schedule()
+        with self.facade.lock_manager.hold(student):
+            return sorted(set(schedule.sections) | set(schedule.labs))
+
+    def validate_cart(self, username, cart):
+        # Reason the cart would be denied (see CartRegistration), or None
+        student = self.facade.get_student(username)
+        cart_registration = CartRegistration(
+            student, cart, {course_name: self.facade.get_course(course_name)
+                            for course_name, _, _ in cart}, None, None)
+        with self.facade.lock_manager.hold(
+                student, *cart_registration.get_registerables()):
+            denial, _ = cart_registration.validate()
+        return CartRegistration.DENIED_MESSAGE + denial if denial else None
+
+    def release_cart(self, username, cart):
+        # Undo registering the part of a cart registered by this shard (see
+        # CartRegistration.release)
+        student = self.facade.get_student(username)
+        cart_registration = CartRegistration(
+            student, cart, {course_name: self.facade.get_course(course_name)
+                            for course_name, _, _ in cart},
+            self.facade.sql_conn, None)
+        schedule = student.get_schedule()
+        with self.facade.lock_manager.hold(student, *(
+                registerable for course_name, _, _ in cart for registerable in
+                (schedule.get_section(course_name),
+                 schedule.get_lab(course_name)))):
+            return cart_registration.release()
+
+    @staticmethod
+    def get_changed_keys(course, method_name, args):
+        """Keys (see get_course_state) of the state of course which a request
+        may change: the sections/labs of the course the student is
+        registered in and those requested, whether approval is required
+        (modify_approval_required) or the student's grades (add_grade)"""
+        if method_name == 'modify_approval_required':
+            return {'approval'}
+        username = args[0] if method_name == 'release_cart' else \
+            args[ROUTES[method_name][1]]
+        if method_name == 'add_grade':
+            return {('grades', username)}
+        keys = set()
+        section = course.find_student_section(username)
+        lab = course.find_student_lab(username)
+        if section:
+            keys.add((True, section.number))
+        if lab:
+            keys.add((False, lab.number))
+        if method_name == 'register_in_section':
+            keys.add((True, args[2]))
+        elif method_name in ('register_in_lab', 'reschedule_lab'):
+            keys.add((False, args[2]))
+        elif method_name in ('register_cart', 'release_cart'):
+            for course_name, section_number, lab_number in args[1]:
+                if course_name == course.name:
+                    keys.add((True, section_number))
+                    if lab_number is not None:
+                        keys.add((False, lab_number))
+        return keys
+
+    @staticmethod
+    def get_course_state(course, keys):
+        """State of course replicated to other shards, of the given keys:
+        key = 'approval', (is_section, number) or ('grades', username),
+        value = whether approval is required, (version, roster, waitlist) of
+        the section/lab, or (section number, grades) of the student in the
+        section they are registered in. Sections/labs which do not exist are
+        left out"""
+        state = {}
+        for key in keys:
+            if key == 'approval':
+                state[key] = course.approval_required
+            elif key[0] == 'grades':
+                section = course.find_student_section(key[1])
+                state[key] = (section.number,
+                              section.get_grades(key[1]) or []) if \
+                    section else None
+            else:
+                registerable = course.get_section(key[1]) if key[0] else \
+                    course.get_lab(key[1])
+                if registerable:
+                    state[key] = (
+                        registerable.version,
+                        {student.username: int(status) for student, status
+                         in registerable.get_all_students()},
+                        [(student.username, priority) for student, priority
+                         in registerable.waitlist.get_all()])
+        return state
+
+    def apply_changes(self, changes):
+        """Bring the replica of a course owned by another shard up to date
+        with the state (see get_course_state) sent by the owner"""
+        course_name, changed = changes
+        course = self.facade.get_course(course_name)
+        if 'approval' in changed:
+            course.set_approval_required(changed.pop('approval'))
+        for key in [key for key in changed if key[0] == 'grades']:
+            self._apply_grades(course, key[1], changed.pop(key))
+        registerables = [(course.sections[number] if is_section else
+                          course.labs[number], is_section, state) for
+                         (is_section, number), state in changed.items()]
+        usernames = set()  # students registered before or after
+        for registerable, _, (_, roster, _) in registerables:
+            usernames.update(registerable.registered_students, roster)
+        students = [self.facade.get_student(username) for username in
+                    usernames]
+        with self.facade.lock_manager.hold(*students, *(
+                registerable for registerable, _, _ in registerables)):
+            # Remove students first, so that students moving between labs
+            # are added to the new lab last
+            for registerable, is_section, (_, roster, _) in registerables:
+                for username in list(registerable.registered_students):
+                    if username not in roster:
+                        registerable.remove_student(username)
+                        self._set_registered(username, registerable,
+                                             is_section, False)
+            # Schedules are also checked for students already on the roster,
+            # since a sync may have updated one side before the change
+            # arrived
+            for registerable, is_section, (version, roster,
+                                           waitlist) in registerables:
+                for username, status in roster.items():
+                    status = RegistrationStatus(status)
+                    if registerable.is_student_in_registerable(username):
+                        registerable.set_student_status(username, status)
+                    else:
+                        registerable.add_student(
+                            self.facade.get_student(username), status)
+                    self._set_registered(username, registerable, is_section,
+                                         True)
+                registerable.waitlist.clear()
+                for username, priority in waitlist:
+                    registerable.waitlist.add(
+                        self.facade.get_student(username), priority)
+                registerable.version = version
+
+    def _apply_grades(self, course, username, state):
+        # Add the grades of student missing from the replica of their section
+        if not state:
+            return
+        number, grades = state
+        section = course.sections[number]
+        with self.facade.lock_manager.hold(self.facade.get_student(username),
+                                           section):
+            for grade in grades[len(section.get_grades(username) or []):]:
+                section.add_grade(username, grade)
+
+    def _set_registered(self, username, registerable, is_section,
+                        is_registered):
+        # Add/remove registerable to/from student's schedule if needed
+        student = self.facade.get_student(username)
+        schedule = student.get_schedule()
+        course_name = registerable.course_name
+        registered = schedule.get_section(course_name) if is_section else \
+            schedule.get_lab(course_name)
+        if is_registered and registered is not registerable:
+            if is_section:
+                student.add_section(registerable)
+            else:
+                student.add_lab(registerable)
+        elif not is_registered and registered is registerable:
+            if is_section:
+                schedule.remove_section(course_name)
+            else:
+                schedule.remove_lab(course_name)
@@ -0,0 +1,173 @@
+"""
+Module: Binary snapshot of the registration system's in-memory libraries,
+used to warm restart the system without rebuilding it from the SQL database
+"""
+import marshal
+import mmap
+import struct
+
+
+class LibrarySnapshot:
+    """Reads/writes the object graph of the student, instructor and course
+    libraries from/to a versioned binary file. The graph is stored as the
+    same rows the SQL load produces so that it can be wired back together
+    by the libraries' populate methods.
+
+    File layout: header (magic, format version, marshal version, fingerprint
+    length), marshalled database fingerprint, marshalled rows."""
+    MAGIC = b'CRSNAP'
+    FORMAT_VERSION = 5
+    _header = struct.Struct('<6sHHI')
+
+    def __init__(self, path):
+        self.path = path
+
+    def save(self, fingerprint, student_lib, instructor_lib, course_lib):
+        data = self._export(student_lib, instructor_lib, course_lib)
+        fingerprint_bytes = marshal.dumps(fingerprint)
+        with open(self.path, 'wb') as f:
+            f.write(self._header.pack(self.MAGIC, self.FORMAT_VERSION,
+                                      marshal.version,
+                                      len(fingerprint_bytes)))
+            f.write(fingerprint_bytes)
+            f.write(marshal.dumps(data))
+
+    def load(self, fingerprint, use_mmap=False):
+        """Return the snapshot's rows (key = SQLRetrieve query name, value =
+        rows), or None if the snapshot is missing, of another version, or
+        stale with respect to the given database fingerprint"""
+        try:
+            with open(self.path, 'rb') as f:
+                if use_mmap:
+                    with mmap.mmap(f.fileno(), 0,
+                                   access=mmap.ACCESS_READ) as mm:
+                        with memoryview(mm) as buffer:
+                            return self._decode(buffer, fingerprint)
+                else:
+                    return self._decode(f.read(), fingerprint)
+        except (OSError, ValueError, EOFError, TypeError):
+            return None
+
+    def _decode(self, buffer, fingerprint):
+        if len(buffer) < self._header.size:
+            return None
+        magic, format_version, marshal_version, fingerprint_len = \
+            self._header.unpack_from(buffer)
+        if magic != self.MAGIC or format_version != self.FORMAT_VERSION or \
+                marshal_version != marshal.version:
+            return None
+        start = self._header.size
+        end = start + fingerprint_len
+        if marshal.loads(buffer[start:end]) != fingerprint:
+            return None
+        return marshal.loads(buffer[end:])
+
+    @staticmethod
+    def _export(student_lib, instructor_lib, course_lib):
+        data = {
+            'get_students': [],
+            'get_instructors': [],
+            'get_courses': [],
+            'get_sections': [],
+            'get_labs': [],
+            'get_all_section_students': [],
+            'get_all_lab_students': [],
+            'get_all_section_grades': [],
+            'get_all_section_waitlists': [],
+            'get_all_lab_waitlists': []
+        }
+        for student in student_lib.students.values():
+            data['get_students'].append({
+                'student_id': student.id,
+                'university_id': student.university_id,
+                'username': student.username,
+                'first_name': student.first_name,
+                'last_name': student.last_name,
+                'major': student.major,
+                'program': student.program,
+                'department': student.department,
+                'is_full_time': student.is_full_time
+            })
+        for instructor in instructor_lib.instructors.values():
+            data['get_instructors'].append({
+                'university_id': instructor.university_id,
+                'username': instructor.username,
+                'first_name': instructor.first_name,
+                'last_name': instructor.last_name,
+                'division': instructor.division,
+                'department': instructor.department,
+                'is_department_chair': instructor.is_department_chair
+            })
+            for course in instructor.courses.values():
+                data['get_courses'].append({
+                    'course_id': course.id,
+                    'instructor_name': course.instructor_name,
+                    'instructor_username': instructor.username,
+                    'number': course.number,
+                    'name': course.name,
+                    'division': course.division,
+                    'department': course.department,
+                    'program': course.program,
+                    'lab_required': course.lab_required,
+                    'approval_required': course.approval_required
+                })
+
+        for course in course_lib.courses.values():
+            for section in course.sections.values():
+                data['get_sections'].append({
+                    'section_id': section.id,
+                    'course_name': course.name,
+                    'section_number': section.number,
+                    'max_registration': section.max_registration,
+                    'time': section.time,
+                    'day': section.day,
+                    'version': section.version
+                })
+                usernames, students, grades = \
+                    section.grade_book.get_columns()
+                for index, grade in zip(students.tolist(), grades.tolist()):
+                    data['get_all_section_grades'].append({
+                        'section_id': section.id,
+                        'student_username': usernames[index],
+                        'grade': grade
+                    })
+                for student, priority in section.waitlist.get_all():
+                    data['get_all_section_waitlists'].append({
+                        'section_id': section.id,
+                        'student_username': student.username,
+                        'priority': priority
+                    })
+            for lab in course.labs.values():
+                data['get_labs'].append({
+                    'lab_id': lab.id,
+                    'course_name': course.name,
+                    'lab_number': lab.number,
+                    'max_registration': lab.max_registration,
+                    'time': lab.time,
+                    'day': lab.day,
+                    'version': lab.version
+                })
+                for student, priority in lab.waitlist.get_all():
+                    data['get_all_lab_waitlists'].append({
+                        'lab_id': lab.id,
+                        'student_username': student.username,
+                        'priority': priority
+                    })
+
+        # Registrations are exported in schedule order so that students'
+        # schedules are rebuilt in the same order
+        for student in student_lib.students.values():
+            schedule = student.get_schedule()
+            for section in schedule.sections.values():
+                data['get_all_section_students'].append({
+                    'section_id': section.id,
+                    'student_username': student.username,
+                    'status': str(section.get_student(student.username)[1])
+                })
+            for lab in schedule.labs.values():
+                data['get_all_lab_students'].append({
+                    'lab_id': lab.id,
+                    'student_username': student.username,
+                    'status': str(lab.get_student(student.username)[1])
+                })
+        return data
@@ -0,0 +1,104 @@
+"""
+Module: Benchmark of warm restarts from a snapshot (see LibrarySnapshot)
+against loading the system from its rows. Synthetic students, courses and
+registrations are generated (see rush_benchmark.py), loaded, written to a
+snapshot and loaded back from it, reporting the time of each phase and the
+snapshot size. With --database, the system is instead loaded from the SQL
+database and then from a snapshot of it, reporting the phases of each
+retrieve_data (so a MySQL database is needed).
+"""
+from argparse import ArgumentParser
+import os
+import tempfile
+from time import perf_counter
+from courses import CourseLibrary
+from db_management import SQLConnection, MongoConnection
+from people import StudentLibrary, InstructorLibrary
+from registration import RegistrationFacade
+from rush_benchmark import generate_data, generate_registrations
+from snapshot import LibrarySnapshot
+
+SINGLETONS = (StudentLibrary, InstructorLibrary, CourseLibrary,
+              SQLConnection, MongoConnection)
+
+
+def new_facade():
+    # Facade with empty libraries, so that the system can be loaded again in
+    # this process
+    for singleton in SINGLETONS:
+        singleton.__instance__ = None
+    return RegistrationFacade(test_mode=True, audit_logging=False)
+
+
+def run_synthetic(args, path):
+    start = perf_counter()
+    data = generate_registrations(
+        generate_data(args.students, args.courses, args.sections, args.labs,
+                      args.capacity), args.courses_per_student, args.grades)
+    print(f"{str(len(data['get_students']))} students, "
+          f"{str(len(data['get_all_section_students']))} section and "
+          f"{str(len(data['get_all_lab_students']))} lab registrations, "
+          f"{str(len(data['get_all_section_grades']))} grades generated in "
+          f"{perf_counter() - start:.2f}s")
+    reg = new_facade()
+    start = perf_counter()
+    reg.load_data(data)
+    print(f'populate from rows:     {perf_counter() - start:.3f}s')
+    snapshot = LibrarySnapshot(path)
+    start = perf_counter()
+    snapshot.save([0], reg.student_library, reg.instructor_library,
+                  reg.course_library)
+    print(f'snapshot write:         {perf_counter() - start:.3f}s '
+          f'({os.path.getsize(path) / 2 ** 20:.1f} MiB)')
+    for use_mmap in (False, True):
+        reg = new_facade()
+        start = perf_counter()
+        snapshot_data = snapshot.load([0], use_mmap)
+        read_time = perf_counter() - start
+        start = perf_counter()
+        reg.load_data(snapshot_data)
+        label = 'snapshot read (mmap):' if use_mmap else 'snapshot read:'
+        print(f'{label:<23} {read_time:.3f}s, populate '
+              f'{perf_counter() - start:.3f}s')
+
+
+def run_database(args, path):
+    reg = new_facade()
+    print(reg.retrieve_data(workers=args.workers))
+    reg.save_snapshot(path)
+    for use_mmap in (False, True):
+        reg = new_facade()
+        print(reg.retrieve_data(snapshot_path=path, use_mmap=use_mmap))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--students', type=int, default=100000)
+    parser.add_argument('--courses', type=int, default=2000)
+    parser.add_argument('--sections', type=int, default=2,
+                        help='sections per course')
+    parser.add_argument('--labs', type=int, default=2,
+                        help='labs per course requiring a lab')
+    parser.add_argument('--capacity', type=int, default=200,
+                        help='seats per section/lab')
+    parser.add_argument('--courses-per-student', type=int, default=3)
+    parser.add_argument('--grades', type=int, default=5,
+                        help='grades per student per course')
+    parser.add_argument('--database', action='store_true',
+                        help='load from the SQL database instead of '
+                             'synthetic rows')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='parallel queries when loading from the SQL '
+                             'database')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'libraries.snapshot')
+        if args.database:
+            run_database(args, path)
+        else:
+            run_synthetic(args, path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+Module: Count of the SQL statements each registration operation sends to the
+database (excluding COMMIT), and of the statements a batch of the same
+operations is combined into by the write-behind queue, against the
+statements the db_utils functions sent before IDs were carried on the
+entities (SELECTs of the student and section/lab IDs by name before each
+INSERT, and DELETEs/UPDATEs joining tables by name). Operations are run in
+test mode against a small synthetic catalog (see rush_benchmark.py), with
+the statements recorded instead of executed, so no database is needed.
+"""
+from argparse import ArgumentParser
+import re
+from db_management import WriteBehindQueue
+from registration import RegistrationFacade
+from rush_benchmark import generate_data
+import db_utils
+
+_statement_pattern = re.compile(r'(\w+) (?:INTO |FROM )?(\w+)')
+
+# Statements sent by each db_utils function before IDs were carried on the
+# entities, each in its own connection (as verb and table; joins by name)
+LEGACY_STATEMENTS = {
+    'db_add_section_reg': ('SELECT Student', 'SELECT Section (join)',
+                           'INSERT SectionStudent'),
+    'db_add_lab_reg': ('SELECT Student', 'SELECT Lab (join)',
+                       'INSERT LabStudent'),
+    'db_delete_lab_reg': ('DELETE LabStudent (join)',),
+    'db_delete_course_reg': ('DELETE SectionStudent (join)',
+                             'DELETE LabStudent (join)'),
+    'db_delete_all_reg': ('DELETE SectionStudent (join)',
+                          'DELETE LabStudent (join)'),
+    'db_update_reg_status': ('UPDATE SectionStudent (join)',
+                             'UPDATE LabStudent (join)'),
+    'db_update_approval_required': ('UPDATE Course',),
+    'db_add_grade': ('SELECT Student', 'SELECT Section (join)',
+                     'INSERT Grade')
+}
+
+
+class StatementRecorder:
+    """Records the statements of the writes and seat claims made by db_utils
+    (which are skipped in test mode)"""
+
+    def __init__(self):
+        self.statements = []
+        self.operations = []  # writes of each operation (see db_utils)
+        self._write = db_utils._write
+        self._claim_all = db_utils._claim_all
+        db_utils._write = self.write
+        db_utils._claim_all = self.claim_all
+
+    def write(self, sql_conn, writes):
+        self.operations.append(writes)
+        self.statements.extend(statement for statement, _, _ in writes)
+        return self._write(sql_conn, writes)
+
+    def claim_all(self, sql_conn, claims, writes):
+        self.statements.extend(f'UPDATE {table_name} (claim)' for
+                               table_name, _ in claims)
+        self.statements.extend(statement for statement, _, _ in writes)
+        return self._claim_all(sql_conn, claims, writes)
+
+    def take(self):
+        # Statements recorded since last taken, summarized as verb and table
+        statements = [' '.join(_statement_pattern.match(statement).groups())
+                      + (' (claim)' if statement.endswith('(claim)') else '')
+                      for statement in self.statements]
+        self.statements = []
+        return statements
+
+
+def build_catalog():
+    # Algorithms (one seat), Networks (requires one of two labs) and
+    # Databases, taught by instructor0 and meeting at different times
+    data = generate_data(4, 3, 1, 0, 30, lab_share=0, approval_share=0)
+    data['get_sections'][0]['max_registration'] = 1
+    data['get_courses'][1]['lab_required'] = True
+    for number in (1, 2):
+        data['get_labs'].append({
+            'lab_id': number, 'course_name': data['get_courses'][1]['name'],
+            'lab_number': number, 'max_registration': 30, 'time': '',
+            'day': '', 'version': 0})
+    for i, row in enumerate(data['get_sections'] + data['get_labs']):
+        row['time'], row['day'] = '10:30AM', ('Monday', 'Tuesday',
+                                              'Wednesday', 'Thursday',
+                                              'Friday')[i]
+    return data
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--batch', type=int, default=100,
+                        help='operations per write-behind batch')
+    args = parser.parse_args()
+
+    reg = RegistrationFacade(test_mode=True, audit_logging=False)
+    data = build_catalog()
+    reg.load_data(data)
+    algorithms, networks, databases = (c['name'] for c in
+                                       data['get_courses'])
+    # (name, method, args, db_utils functions which made the same changes
+    # before, or None if there was no equivalent)
+    operations = (
+        ('register in section', reg.register_in_section,
+         ('student0', algorithms, 1), ('db_add_section_reg',)),
+        ('join waitlist', reg.register_in_section,
+         ('student1', algorithms, 1), None),
+        ('register in section', reg.register_in_section,
+         ('student0', networks, 1), ('db_add_section_reg',)),
+        ('register in lab', reg.register_in_lab, ('student0', networks, 1),
+         ('db_add_lab_reg',)),
+        ('reschedule lab', reg.reschedule_lab, ('student0', networks, 2),
+         ('db_delete_lab_reg', 'db_add_lab_reg')),
+        ('add grade', reg.add_grade,
+         ('instructor0', 'student0', algorithms, 90), ('db_add_grade',)),
+        # The promotion registered as a registration in the section
+        ('drop course (promotes)', reg.drop_course,
+         ('student0', algorithms),
+         ('db_delete_course_reg', 'db_add_section_reg')),
+        ('modify approval', reg.modify_approval_required,
+         ('instructor0', databases, True),
+         ('db_update_approval_required',)),
+        ('register (tentative)', reg.register_in_section,
+         ('student2', databases, 1), ('db_add_section_reg',)),
+        ('approve registration', reg.approve_deny_reg,
+         ('instructor0', 'student2', databases, True),
+         ('db_update_reg_status',)),
+        ('drop course', reg.drop_course, ('student2', databases),
+         ('db_delete_course_reg',)),
+        # The cart registered part by part
+        ('register cart', reg.register_cart,
+         ('student3', [(networks, 1, 1), (databases, 1, None)]),
+         ('db_add_section_reg', 'db_add_lab_reg', 'db_add_section_reg')),
+        ('drop all courses', reg.drop_all_courses, ('student3',),
+         ('db_delete_all_reg',))
+    )
+    recorder = StatementRecorder()
+    totals = [0, 0]  # statements before and after, of operations with an
+    # equivalent before
+    print(f"{'operation':<24} {'before':>6} {'after':>6}  statements sent "
+          '(before / after)')
+    for name, method, method_args, functions in operations:
+        result = method(*method_args)
+        statements = recorder.take()
+        if functions is None:
+            before = '-'
+            legacy = ['(no equivalent)']
+        else:
+            legacy = [statement for function in functions for statement in
+                      LEGACY_STATEMENTS[function]]
+            before = str(len(legacy))
+            totals[0] += len(legacy)
+            totals[1] += len(statements)
+        print(f"{name:<24} {before:>6} {len(statements):>6}  "
+              f"{', '.join(legacy)}")
+        print(f"{'':<38}/ {', '.join(statements) or '-'}")
+        if not statements:
+            print(f'  (nothing written: {result})')
+    print(f"{'total':<24} {totals[0]:>6} {totals[1]:>6}")
+
+    # Batches of the same operation, as combined by the write-behind queue
+    # (each operation was written on its own before)
+    print(f"\n{'batch of ' + str(args.batch):<24} {'before':>6} {'after':>6}")
+    connection = NullConnection()
+    for name, writes, function in (
+            ('drop course', recorder.operations[-2], 'db_delete_course_reg'),
+            ('drop all courses', recorder.operations[-1],
+             'db_delete_all_reg')):
+        queue = WriteBehindQueue.__new__(WriteBehindQueue)
+        queue._sql_conn = connection
+        print(f'{name:<24} '
+              f'{len(LEGACY_STATEMENTS[function]) * args.batch:>6} '
+              f'{queue._execute_batch(connection, [writes] * args.batch):>6}')
+
+
+class NullConnection:
+    """Stands in for the SQL connection, its connections and cursors,
+    executing nothing"""
+
+    def get_prepared_cursor(self, conn, statement):
+        return self
+
+    def cursor(self):
+        return self
+
+    def execute(self, statement, params):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+if __name__ == '__main__':
+    main()
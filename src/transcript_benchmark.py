@@ -0,0 +1,113 @@
+"""
+Module: Benchmark of the batch transcript and GPA export (see
+TranscriptReport). Synthetic students with grades are generated (see
+rush_benchmark.py) and loaded, and the export computing each section's rows
+and students' totals with vectorized operations over its grade book columns
+timed against an export looping over each section's students, along with
+the time taken to compute the transcript rows without writing them and the
+peak memory traced (with tracemalloc) by each. The files written by both
+must be identical.
+"""
+from argparse import ArgumentParser
+from collections import deque
+import filecmp
+import os
+import tempfile
+from time import perf_counter
+import tracemalloc
+import numpy as np
+from registration import RegistrationFacade
+from rush_benchmark import generate_data, generate_registrations
+from transcripts import TranscriptReport, get_letter_grade
+
+
+class SectionLoopReport(TranscriptReport):
+    """TranscriptReport computing each student's average and letter grade in
+    a loop over each section's students"""
+
+    def _write_transcripts(self, writer):
+        totals = {}
+        row_count = 0
+        writer.writerow(self.TRANSCRIPT_FIELDS)
+        for course in self.course_lib.courses.values():
+            for section in course.sections.values():
+                rows = []
+                for username, grades in \
+                        section.grade_book.get_all_grades().items():
+                    average = sum(grades) / len(grades)
+                    letter_grade, grade_points = get_letter_grade(average)
+                    rows.append((username, course.name, section.number,
+                                 len(grades), round(average, 2),
+                                 letter_grade, grade_points))
+                    total = totals.setdefault(username, [0, 0, 0])
+                    total[0] += 1
+                    total[1] += average
+                    total[2] += grade_points
+                writer.writerows(rows)
+                row_count += len(rows)
+        # Totals by student of the student library, in order
+        return row_count, [np.array(column) for column in zip(
+            *(totals.get(username, (0, 0, 0)) for username in
+              self.student_lib.students))]
+
+
+class NullWriter:
+    """Stands in for a CSV writer, building the rows but writing nothing"""
+
+    def writerow(self, row):
+        pass
+
+    def writerows(self, rows):
+        deque(rows, maxlen=0)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--students', type=int, default=100000)
+    parser.add_argument('--courses', type=int, default=2000)
+    parser.add_argument('--courses-per-student', type=int, default=4)
+    parser.add_argument('--grades', type=int, default=10,
+                        help='grades per student per course')
+    args = parser.parse_args()
+
+    data = generate_registrations(
+        generate_data(args.students, args.courses, 1, 0, args.students),
+        args.courses_per_student, args.grades)
+    reg = RegistrationFacade(test_mode=True, audit_logging=False)
+    reg.load_data(data)
+    # Grades loaded are merged into the grade book columns on first read
+    for course in reg.course_library.courses.values():
+        for section in course.sections.values():
+            section.grade_book.get_columns()
+    print(f"{str(args.students)} students, "
+          f"{str(len(data['get_all_section_grades']))} grades")
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []  # (transcript path, GPA path) written by each
+        for label, report_class in (('vectorized by section',
+                                     TranscriptReport),
+                                    ('loop over sections',
+                                     SectionLoopReport)):
+            report = report_class(reg.student_library, reg.course_library)
+            paths.append(tuple(os.path.join(directory, f'{name}'
+                                            f'{str(len(paths))}.csv')
+                               for name in ('transcripts', 'gpa')))
+            start = perf_counter()
+            rows = report.write(*paths[-1])
+            run_time = perf_counter() - start
+            start = perf_counter()
+            report._write_transcripts(NullWriter())
+            compute_time = perf_counter() - start
+            tracemalloc.start()
+            report.write(*paths[-1])
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f'{label:<22} {run_time:>7.3f}s ({compute_time:.3f}s '
+                  f'computing transcripts), peak {peak / 2 ** 20:>6.1f} MiB '
+                  f'traced ({str(rows[0])} transcript rows)')
+        for written in zip(*paths):
+            assert filecmp.cmp(*written, shallow=False)
+
+
+if __name__ == '__main__':
+    main()
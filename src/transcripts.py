@@ -0,0 +1,118 @@
+"""
+Module: Batch computation of students' course averages, GPA and academic
+standing across the whole registration system, written to CSV files
+"""
+import csv
+from bisect import bisect_right
+import numpy as np
+
+# Grade scale: lowest average for each letter grade (ascending), with the
+# letter grades and grade points at the same positions
+GRADE_THRESHOLDS = (60, 67, 70, 73, 77, 80, 83, 87, 90, 93)
+LETTER_GRADES = ('F', 'D', 'D+', 'C-', 'C', 'C+', 'B-', 'B', 'B+', 'A-', 'A')
+GRADE_POINTS = (0.0, 1.0, 1.3, 1.7, 2.0, 2.3, 2.7, 3.0, 3.3, 3.7, 4.0)
+
+
+def get_letter_grade(average):
+    """Return (letter grade, grade points) for an average grade"""
+    position = bisect_right(GRADE_THRESHOLDS, average)
+    return LETTER_GRADES[position], GRADE_POINTS[position]
+
+
+def get_standing(gpa):
+    if gpa is None:
+        return 'No Grades'
+    elif gpa >= 3.5:
+        return "Dean's List"
+    elif gpa >= 2.0:
+        return 'Good Standing'
+    else:
+        return 'Academic Probation'
+
+
+class TranscriptReport:
+    """Computes the transcripts (average and letter grade of each graded
+    course) and GPAs of all students from the course library's grade books,
+    rather than walking each student's schedule and building display strings
+    per student. The transcript rows are streamed section by section: each
+    section's averages come from its grade book columns, letter grades are
+    looked up and the students' totals accumulated with vectorized
+    operations over them, so only one section's columns and the totals
+    (arrays with an entry per student) are held at a time."""
+    TRANSCRIPT_FIELDS = ('username', 'course_name', 'section_number',
+                         'grade_count', 'average', 'letter_grade',
+                         'grade_points')
+    GPA_FIELDS = ('username', 'first_name', 'last_name', 'program',
+                  'courses_graded', 'average', 'gpa', 'standing')
+
+    def __init__(self, student_lib, course_lib):
+        self.student_lib = student_lib
+        self.course_lib = course_lib
+
+    def write(self, transcript_path, gpa_path):
+        """Write one transcript row per student per graded course (grouped
+        by section) to transcript_path and one GPA row per student to
+        gpa_path. Returns (transcript rows written, GPA rows written)"""
+        with open(transcript_path, 'w', newline='') as f:
+            row_count, totals = self._write_transcripts(csv.writer(f))
+        with open(gpa_path, 'w', newline='') as f:
+            gpa_count = self._write_gpas(csv.writer(f), totals)
+        return row_count, gpa_count
+
+    def _write_transcripts(self, writer):
+        # Returns (rows written, totals: (array of courses graded, array of
+        # sum of course averages, array of sum of grade points), with an
+        # entry per student of the student library in order, and a last
+        # entry for graded students no longer in it)
+        student_indexes = {username: index for index, username in
+                           enumerate(self.student_lib.students)}
+        student_count = len(student_indexes)
+        courses_graded = np.zeros(student_count + 1, np.int64)
+        average_sums = np.zeros(student_count + 1)
+        point_sums = np.zeros(student_count + 1)
+        grade_point_column = np.array(GRADE_POINTS)
+        row_count = 0
+        writer.writerow(self.TRANSCRIPT_FIELDS)
+        for course in self.course_lib.courses.values():
+            for section in course.sections.values():
+                usernames, counts, averages = \
+                    section.grade_book.get_student_columns()
+                if not usernames:
+                    continue
+                grades = np.searchsorted(GRADE_THRESHOLDS, averages, 'right')
+                # Each student is listed once per section, so the totals can
+                # be added to by index
+                students = np.fromiter(
+                    (student_indexes.get(username, student_count) for
+                     username in usernames), np.int64, len(usernames))
+                courses_graded[students] += 1
+                average_sums[students] += averages
+                point_sums[students] += grade_point_column[grades]
+                writer.writerows(
+                    (username, course.name, section.number, count,
+                     round(average, 2), LETTER_GRADES[grade],
+                     GRADE_POINTS[grade])
+                    for username, count, average, grade in zip(
+                        usernames, counts.tolist(), averages.tolist(),
+                        grades.tolist()))
+                row_count += len(usernames)
+        return row_count, (courses_graded, average_sums, point_sums)
+
+    def _write_gpas(self, writer, totals):
+        writer.writerow(self.GPA_FIELDS)
+        count = 0
+        for student, courses_graded, average_sum, point_sum in zip(
+                self.student_lib.students.values(), *(
+                    total.tolist() for total in totals)):
+            if courses_graded:
+                average = round(average_sum / courses_graded, 2)
+                gpa = round(point_sum / courses_graded, 2)
+            else:
+                average, gpa = '', None
+            writer.writerow((student.username, student.first_name,
+                             student.last_name, student.program,
+                             courses_graded, average,
+                             '' if gpa is None else gpa,
+                             get_standing(gpa)))
+            count += 1
+        return count
@@ -0,0 +1,197 @@
+"""
+Fixtures for registration facade tests. The facade runs in test mode with
+audit logging disabled, so neither a SQL database nor MongoDB is needed.
+"""
+from contextlib import contextmanager
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import db_management  # noqa: E402
+import registration  # noqa: E402
+from courses import CourseLibrary  # noqa: E402
+from db_management import SQLConnection, MongoConnection  # noqa: E402
+from people import StudentLibrary, InstructorLibrary  # noqa: E402
+from registration import RegistrationFacade  # noqa: E402
+
+SINGLETONS = (StudentLibrary, InstructorLibrary, CourseLibrary,
+              SQLConnection, MongoConnection)
+
+
+def build_data(student_count, courses):
+    """Rows keyed by SQLRetrieve query name (see
+    RegistrationFacade.load_data) of full-time students student0 ...
+    studentN-1, an instructor (department chair) teaching every course, and
+    the given courses: list of (name, lab_required, sections, labs), where
+    sections/labs are lists of (max registration, time, day)"""
+    data = {'get_students': [], 'get_instructors': [], 'get_courses': [],
+            'get_sections': [], 'get_labs': [],
+            'get_all_section_students': [], 'get_all_lab_students': [],
+            'get_all_section_grades': [], 'get_all_section_waitlists': [],
+            'get_all_lab_waitlists': []}
+    for i in range(student_count):
+        data['get_students'].append({
+            'student_id': i + 1,
+            'university_id': 10000000 + i,
+            'username': f'student{str(i)}',
+            'first_name': 'Student',
+            'last_name': str(i),
+            'major': 'Computer Science',
+            'program': 'MPCS',
+            'department': 'Computer Science',
+            'is_full_time': True
+        })
+    data['get_instructors'].append({
+        'university_id': 20000000,
+        'username': 'instructor',
+        'first_name': 'Ada',
+        'last_name': 'Lovelace',
+        'division': 'Physical Sciences',
+        'department': 'Computer Science',
+        'is_department_chair': True
+    })
+    for i, (name, lab_required, sections, labs) in enumerate(courses):
+        data['get_courses'].append({
+            'course_id': i + 1,
+            'instructor_name': 'Ada Lovelace',
+            'instructor_username': 'instructor',
+            'number': 50000 + i,
+            'name': name,
+            'division': 'Physical Sciences',
+            'department': 'Computer Science',
+            'program': 'MPCS',
+            'lab_required': lab_required,
+            'approval_required': False
+        })
+        for number, (capacity, time, day) in enumerate(sections, 1):
+            data['get_sections'].append({
+                'section_id': len(data['get_sections']) + 1,
+                'course_name': name,
+                'section_number': number,
+                'max_registration': capacity,
+                'time': time,
+                'day': day,
+                'version': 0
+            })
+        for number, (capacity, time, day) in enumerate(labs, 1):
+            data['get_labs'].append({
+                'lab_id': len(data['get_labs']) + 1,
+                'course_name': name,
+                'lab_number': number,
+                'max_registration': capacity,
+                'time': time,
+                'day': day,
+                'version': 0
+            })
+    return data
+
+
+class FakeRetrieve:
+    """Stands in for SQLRetrieve, serving rows keyed by query name (see
+    build_data) rather than querying a SQL database. Queries made are
+    recorded in queries"""
+    ID_KEYS = {'get_courses': 'course_id', 'get_sections': 'section_id',
+               'get_labs': 'lab_id',
+               'get_all_section_students': 'section_id',
+               'get_all_lab_students': 'lab_id',
+               'get_all_section_grades': 'section_id',
+               'get_all_section_waitlists': 'section_id',
+               'get_all_lab_waitlists': 'lab_id'}
+
+    def __init__(self, data, queries):
+        self._data = data
+        self.queries = queries
+        self.query_count = 0
+
+    def _record(self, query):
+        self.queries.append(query)
+        self.query_count += 1
+
+    def __getattr__(self, query):
+        if query not in self.ID_KEYS and query not in self._data:
+            raise AttributeError(query)
+
+        def retrieve(ids=None):
+            self._record(query)
+            rows = self._data.get(query, [])
+            if ids is None:
+                return list(rows)
+            return [r for r in rows if r[self.ID_KEYS[query]] in ids]
+        return retrieve
+
+    def get_fingerprint(self):
+        self._record('get_fingerprint')
+        return self._data.get('fingerprint')
+
+    def get_last_change_id(self):
+        self._record('get_last_change_id')
+        return 0
+
+    def get_versions(self, table_name, ids):
+        self._record('get_versions')
+        id_key = 'section_id' if table_name == 'Section' else 'lab_id'
+        return {r[id_key]: r['version'] for r in
+                self._data[f'get_{table_name.lower()}s'] if r[id_key] in ids}
+
+    def get_student_registrations(self, student_id):
+        self._record('get_student_registrations')
+        username = next(st['username'] for st in self._data['get_students']
+                        if st['student_id'] == student_id)
+        return [{'registerable_type': registerable_type,
+                 'registerable_id': r[f'{registerable_type}_id'],
+                 'status': r['status']}
+                for registerable_type in ('section', 'lab')
+                for r in self._data[f'get_all_{registerable_type}_students']
+                if r['student_username'] == username]
+
+
+@pytest.fixture
+def make_facade(monkeypatch):
+    """Factory of facades with fresh singletons, populated from rows (see
+    build_data) unless data is None"""
+    def make(data):
+        for singleton in SINGLETONS:
+            monkeypatch.setattr(singleton, '__instance__', None)
+        facade = RegistrationFacade(test_mode=True, audit_logging=False)
+        # Never connect to a SQL database (e.g. to refresh a section)
+        monkeypatch.setattr(facade.sql_conn, 'create_connection',
+                            lambda: None)
+        if data is not None:
+            facade.load_data(data)
+        return facade
+    return make
+
+
+@pytest.fixture
+def serve_data(monkeypatch):
+    """Function which makes the SQL database serve the given rows (see
+    FakeRetrieve) and returns the list of queries made"""
+    def serve(data):
+        queries = []
+
+        @contextmanager
+        def borrow_connection(sql_conn):
+            yield object()
+
+        monkeypatch.setattr(SQLConnection, 'borrow_connection',
+                            borrow_connection)
+        for module in (db_management, registration):
+            monkeypatch.setattr(module, 'SQLRetrieve',
+                                lambda conn: FakeRetrieve(data, queries))
+        return queries
+    return serve
+
+
+@pytest.fixture
+def facade(make_facade):
+    """Facade with 10 students and three courses: Algorithms (one section of
+    one seat), Networks (requires a lab) and Databases (meets at the same
+    time as Networks section 1)"""
+    return make_facade(build_data(10, [
+        ('Algorithms', False, [(1, '10:30AM', 'Monday')], []),
+        ('Networks', True, [(30, '8:30AM', 'Monday')],
+         [(30, '8:30AM', 'Wednesday')]),
+        ('Databases', False, [(30, '8:30AM', 'Monday')], [])
+    ]))
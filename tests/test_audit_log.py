@@ -0,0 +1,116 @@
+"""
+Tests of the batched audit log queue (see MongoConnection): what happens to
+logs queued while the queue is full under each overflow policy, and to logs
+MongoDB fails to write. MongoDB is a fake recording the logs inserted, and
+the writer thread only takes logs from the queue when it is flushed.
+"""
+import json
+from threading import Thread
+import pytest
+from pymongo.errors import BulkWriteError, PyMongoError
+import db_management
+from db_management import MongoConnection
+
+
+class FakeMongoClient:
+    """Client whose RegistrationLogging.logging collection records the logs
+    inserted, or raises error if set"""
+
+    def __init__(self):
+        self.RegistrationLogging = self.logging = self
+        self.inserted = []
+        self.error = None
+
+    def insert_many(self, documents, ordered=True):
+        if self.error:
+            raise self.error
+        self.inserted.extend(document['log'] for document in documents)
+
+
+@pytest.fixture
+def make_logger(monkeypatch, tmp_path):
+    client = FakeMongoClient()
+    monkeypatch.setattr(db_management, 'MongoClient', lambda: client)
+    loggers = []
+
+    def make_logger(overflow_policy, block_timeout=1.0):
+        MongoConnection.__instance__ = None
+        logger = MongoConnection(
+            batch_size=100, flush_interval=60, max_queue_size=2,
+            overflow_policy=overflow_policy,
+            spill_path=str(tmp_path / 'spill.jsonl'),
+            block_timeout=block_timeout)
+        loggers.append(logger)
+        return logger, client
+
+    yield make_logger
+    # Nothing left queued for the flush at exit
+    for logger in loggers:
+        client.error = None
+        logger.flush()
+    MongoConnection.__instance__ = None
+
+
+def read_spilled(logger):
+    with open(logger.spill_path) as spill_file:
+        return [json.loads(line)['log'] for line in spill_file]
+
+
+def test_drop_oldest(make_logger):
+    logger, client = make_logger('drop_oldest')
+    logger.insert_logs(['log 1', 'log 2', 'log 3'])
+    assert logger.flush(5)
+    assert client.inserted == ['log 2', 'log 3']
+    assert logger.get_log_metrics() == {
+        'queued': 3, 'flushed': 2, 'dropped': 1, 'spilled': 0,
+        'timed_out': 0, 'pending': 0}
+
+
+def test_spill(make_logger):
+    logger, client = make_logger('spill')
+    logger.insert_logs(['log 1', 'log 2', 'log 3'])
+    logger.insert_log('log 4')
+    assert logger.flush(5)
+    assert client.inserted == ['log 1', 'log 2']
+    assert read_spilled(logger) == ['log 3', 'log 4']
+    assert logger.get_log_metrics()['spilled'] == 2
+
+
+def test_block_until_writer_takes_batch(make_logger):
+    logger, client = make_logger('block', block_timeout=10)
+    logger.insert_logs(['log 1', 'log 2'])
+    caller = Thread(target=logger.insert_log, args=('log 3',))
+    caller.start()
+    caller.join(0.1)
+    assert caller.is_alive()  # blocked on the full queue
+    logger.flush(5)
+    caller.join(5)
+    assert logger.flush(5)
+    assert client.inserted == ['log 1', 'log 2', 'log 3']
+    assert logger.get_log_metrics()['timed_out'] == 0
+
+
+def test_block_timed_out_spilled(make_logger):
+    logger, client = make_logger('block', block_timeout=0.05)
+    logger.insert_logs(['log 1', 'log 2', 'log 3'])
+    # Spilled without blocking again until the writer takes a batch
+    logger.block_timeout = 10
+    logger.insert_log('log 4')
+    assert read_spilled(logger) == ['log 3', 'log 4']
+    assert logger.flush(5)
+    logger.insert_logs(['log 5', 'log 6'])
+    assert logger.flush(5)
+    assert client.inserted == ['log 1', 'log 2', 'log 5', 'log 6']
+    assert logger.get_log_metrics()['timed_out'] == 2
+
+
+def test_failed_writes_spilled(make_logger):
+    logger, client = make_logger('block')
+    client.error = BulkWriteError({'writeErrors': [{'index': 1}]})
+    logger.insert_logs(['log 1', 'log 2'])
+    assert logger.flush(5)
+    client.error = PyMongoError('Server selection timed out')
+    logger.insert_log('log 3')
+    assert logger.flush(5)
+    assert read_spilled(logger) == ['log 2', 'log 3']
+    assert logger.get_log_metrics()['flushed'] == 1
@@ -0,0 +1,133 @@
+"""
+Multi-threaded stress test of the facade: students register, reschedule and
+drop concurrently (while bulk operations run) and seats must never be
+oversubscribed, with rosters and schedules agreeing once done. Reports
+throughput for each thread count (shown with pytest -s).
+"""
+from random import Random
+from threading import Event, Thread
+from time import perf_counter, sleep
+import pytest
+from conftest import build_data
+
+STUDENT_COUNT = 200
+OPERATION_COUNT = 8000  # split between the client threads
+TIMES = ('8:30AM', '10:30AM', '1:30PM', '3:30PM')
+DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday')
+
+
+@pytest.fixture
+def rush_facade(make_facade):
+    # 12 courses of two small sections, every other requiring a lab
+    courses = []
+    for i in range(12):
+        sections = [(5, TIMES[(i + n) % 4], DAYS[(i * 3 + n) % 4]) for n in
+                    range(2)]
+        labs = [(4, TIMES[(i + n + 2) % 4], DAYS[(i + n) % 4]) for n in
+                range(2)] if i % 2 else []
+        courses.append((f'Course{str(i)}', bool(labs), sections, labs))
+    return make_facade(build_data(STUDENT_COUNT, courses))
+
+
+def run_client(facade, seed, operation_count, errors):
+    rng = Random(seed)
+    course_names = list(facade.course_library.courses)
+    try:
+        for _ in range(operation_count):
+            username = f'student{str(rng.randrange(STUDENT_COUNT))}'
+            course_name = rng.choice(course_names)
+            course = facade.get_course(course_name)
+            action = rng.random()
+            if action < 0.4:
+                facade.register_in_section(username, course_name,
+                                           rng.randint(1, 2))
+            elif action < 0.55 and course.lab_required:
+                facade.register_in_lab(username, course_name,
+                                       rng.randint(1, 2))
+            elif action < 0.6 and course.lab_required:
+                facade.reschedule_lab(username, course_name,
+                                      rng.randint(1, 2))
+            elif action < 0.7:
+                facade.register_cart(username, [
+                    (name, 1, 1 if facade.get_course(name).lab_required
+                     else None) for name in rng.sample(course_names, 2)])
+            elif action < 0.9:
+                facade.drop_course(username, course_name)
+            elif action < 0.95:
+                facade.drop_all_courses(username)
+            else:
+                facade.view_schedule(username)
+    except Exception as e:
+        errors.append(e)
+
+
+def run_bulk(facade, tmp_path, done, errors):
+    # Bulk operations (exclusive) and course-wide changes while the rush runs
+    try:
+        while not done.is_set():
+            facade.export_transcripts(str(tmp_path / 'transcripts.csv'),
+                                      str(tmp_path / 'gpas.csv'))
+            facade.refresh_data()
+            facade.modify_approval_required('instructor', 'Course0', True)
+            facade.modify_approval_required('instructor', 'Course0', False)
+    except Exception as e:
+        errors.append(e)
+
+
+def check_capacity(facade, done, violations):
+    # Sample seat counts while the rush runs
+    registerables = [registerable for course in
+                     facade.course_library.courses.values() for registerable
+                     in (*course.sections.values(), *course.labs.values())]
+    while not done.is_set():
+        for registerable in registerables:
+            if len(registerable.registered_students) > \
+                    registerable.max_registration:
+                violations.append(registerable)
+        sleep(0.001)
+
+
+@pytest.mark.parametrize('thread_count', [1, 4, 16])
+def test_concurrent_register_drop(rush_facade, tmp_path, thread_count):
+    errors = []
+    violations = []
+    done = Event()
+    clients = [Thread(target=run_client,
+                      args=(rush_facade, seed, OPERATION_COUNT // thread_count,
+                            errors)) for seed in range(thread_count)]
+    monitors = [Thread(target=run_bulk,
+                       args=(rush_facade, tmp_path, done, errors)),
+                Thread(target=check_capacity,
+                       args=(rush_facade, done, violations))]
+    for monitor in monitors:
+        monitor.start()
+    start = perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = perf_counter() - start
+    done.set()
+    for monitor in monitors:
+        monitor.join()
+    print(f'\n{str(thread_count)} threads: '
+          f'{OPERATION_COUNT / elapsed:.0f} operations/s')
+
+    assert not errors
+    assert not violations
+    for course in rush_facade.course_library.courses.values():
+        for registerable in (*course.sections.values(),
+                             *course.labs.values()):
+            assert len(registerable.registered_students) <= \
+                registerable.max_registration
+            for username in registerable.registered_students:
+                schedule = rush_facade.get_student(username).get_schedule()
+                scheduled = schedule.get_section(course.name) if \
+                    registerable in course.sections.values() else \
+                    schedule.get_lab(course.name)
+                assert scheduled is registerable
+    for student in rush_facade.student_library.students.values():
+        schedule = student.get_schedule()
+        for registerable in (*schedule.sections.values(),
+                             *schedule.labs.values()):
+            assert registerable.is_student_in_registerable(student.username)
@@ -0,0 +1,96 @@
+"""
+Tests of time conflict detection with weekly time slot bitmaps, and of
+registrations denied for sections/labs meeting at the same time as a class on
+the student's schedule
+"""
+import pytest
+from conftest import build_data
+from courses import parse_meeting_slots, count_days, get_day_slots, \
+    SLOTS_PER_DAY
+
+
+@pytest.fixture
+def lab_facade(make_facade):
+    # Networks labs 1 and 2 meet at the same time as Algorithms and
+    # Databases respectively, lab 3 at no other class's time and lab 4 at the
+    # same time as lab 2
+    return make_facade(build_data(2, [
+        ('Networks', True, [(30, '8:30AM', 'Monday')],
+         [(30, '1:30PM', 'Tuesday'), (30, '3:30PM', 'Thursday'),
+          (1, '5:30PM', 'Friday'), (30, '4:00PM', 'Thursday')]),
+        ('Algorithms', False, [(30, '1:30PM-3:00PM', 'Tue/Thu')], []),
+        ('Databases', False, [(30, '4:00PM', 'Thursday')], [])
+    ]))
+
+
+def test_meeting_slots():
+    slots = parse_meeting_slots('2:30PM', 'Tuesday', 90)
+    first_slot = SLOTS_PER_DAY + 14 * 4 + 2  # Tuesday 2:30PM
+    assert slots == ((1 << 6) - 1) << first_slot
+    assert parse_meeting_slots('2:30PM-5:30PM', 'Tue/Thu', 90) == \
+        parse_meeting_slots('2:30 pm', 'Tuesday', 180) | \
+        parse_meeting_slots('2:30PM', 'Thursday', 180)
+    assert count_days(parse_meeting_slots('9AM', 'Mon/Wed/Fri', 50)) == 3
+    assert parse_meeting_slots('TBA', 'Monday', 90) == 0
+    assert parse_meeting_slots('10:30AM', None, 90) == 0
+    assert slots & get_day_slots('tuesday') == slots
+    assert get_day_slots('someday') is None
+
+
+def test_overlapping_meetings_conflict():
+    monday = parse_meeting_slots('8:30AM', 'Monday', 90)
+    assert monday & parse_meeting_slots('9:45AM', 'Monday', 90)
+    assert not monday & parse_meeting_slots('10:00AM', 'Monday', 90)
+    assert not monday & parse_meeting_slots('8:30AM', 'Tuesday', 90)
+
+
+def test_conflicting_section_denied(facade):
+    facade.register_in_section('student0', 'Networks', 1)
+    result = facade.register_in_section('student0', 'Databases', 1)
+    assert result == 'Registration denied. Meeting time (Monday 8:30AM) ' \
+                     'conflicts with Networks (Monday 8:30AM) on ' \
+                     'student\'s schedule'
+    assert not facade.get_student('student0').get_schedule()\
+        .get_section('Databases')
+    # Meeting times are free again once dropped
+    facade.drop_course('student0', 'Networks')
+    assert facade.register_in_section('student0', 'Databases', 1) == \
+        'Student successfully registered for Databases Section 1'
+
+
+def test_conflicting_lab_denied(lab_facade):
+    lab_facade.register_in_section('student0', 'Networks', 1)
+    lab_facade.register_in_section('student0', 'Algorithms', 1)
+    assert lab_facade.register_in_lab('student0', 'Networks', 1).startswith(
+        'Registration denied. Meeting time (Tuesday 1:30PM) conflicts with '
+        'Algorithms')
+    assert lab_facade.register_in_lab('student0', 'Networks', 3).startswith(
+        'Student successfully registered for Networks Lab 3')
+
+
+def test_reschedule_ignores_lab_left(lab_facade):
+    lab_facade.register_in_section('student0', 'Networks', 1)
+    lab_facade.register_in_lab('student0', 'Networks', 2)
+    assert lab_facade.reschedule_lab('student0', 'Networks', 4) == \
+        'Student successfully rescheduled into Networks lab 4'
+    assert lab_facade.get_course('Networks').get_lab(2).version == 2
+    assert lab_facade.reschedule_lab('student0', 'Networks', 1) == \
+        'Student successfully rescheduled into Networks lab 1'
+    schedule = lab_facade.get_student('student0').get_schedule()
+    lab = lab_facade.get_course('Networks').get_lab(1)
+    assert schedule.get_lab('Networks') is lab
+    assert schedule.find_conflict(
+        lab_facade.get_course('Algorithms').get_section(1)) is lab
+    # Time slots of the labs left are free
+    assert lab_facade.register_in_section('student0', 'Databases', 1) == \
+        'Student successfully registered for Databases Section 1'
+
+
+def test_reschedule_into_same_lab_denied(lab_facade):
+    lab_facade.register_in_section('student0', 'Networks', 1)
+    lab_facade.register_in_lab('student0', 'Networks', 1)
+    lab = lab_facade.get_course('Networks').get_lab(1)
+    assert lab_facade.reschedule_lab('student0', 'Networks', 1) == \
+        'Student is already registered for Networks lab 1'
+    assert lab.version == 1  # no seat claimed
+    assert list(lab.registered_students) == ['student0']
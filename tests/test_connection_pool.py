@@ -0,0 +1,107 @@
+"""
+Tests of the SQL connection pool (see SQLConnection.checkout/checkin): idle
+connections are reused, no more than pool_size are open, a checkout waits
+for a connection to be checked in when all are in use, and connections
+failing their health check are replaced. Connections are fakes opened by the
+pool in place of MySQL connections.
+"""
+from threading import Thread
+import pytest
+from db_management import SQLConnection
+
+
+class FakeConnection:
+    """Pooled connection recording whether it was rolled back and closed"""
+
+    def __init__(self, number):
+        self.number = number
+        self.in_transaction = False
+        self.healthy = True
+        self.rolled_back = False
+        self.closed = False
+
+    def is_connected(self):
+        return self.healthy
+
+    def rollback(self):
+        self.in_transaction = False
+        self.rolled_back = True
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def opened():
+    """Connections opened by the pool of pool_conn"""
+    return []
+
+
+@pytest.fixture
+def pool_conn(monkeypatch, opened):
+    monkeypatch.setattr(SQLConnection, '__instance__', None)
+    sql_conn = SQLConnection(test_mode=True, pool_size=2)
+
+    def create_connection():
+        opened.append(FakeConnection(len(opened)))
+        return opened[-1]
+    monkeypatch.setattr(sql_conn, 'create_connection', create_connection)
+    return sql_conn
+
+
+def test_idle_connections_reused(pool_conn, opened):
+    with pool_conn.borrow_connection() as conn:
+        conn.in_transaction = True  # e.g. a read snapshot left open
+    assert conn.rolled_back
+    with pool_conn.borrow_connection() as other:
+        assert other is conn
+    assert len(opened) == 1
+    metrics = pool_conn.get_pool_metrics()
+    assert (metrics['open'], metrics['in_use'], metrics['checkouts'],
+            metrics['peak_in_use']) == (1, 0, 2, 1)
+
+
+def test_checkout_waits_for_checkin(pool_conn, opened):
+    first = pool_conn.checkout()
+    second = pool_conn.checkout()
+    assert first is not second
+    metrics = pool_conn.get_pool_metrics()
+    assert (metrics['open'], metrics['in_use'], metrics['utilization']) == \
+        (2, 2, 1.0)
+    waiting = []
+    waiter = Thread(target=lambda: waiting.append(pool_conn.checkout()))
+    waiter.start()
+    waiter.join(0.1)
+    assert waiter.is_alive() and not waiting  # the pool is full
+    pool_conn.checkin(second)
+    waiter.join(1)
+    assert waiting == [second]
+    assert len(opened) == 2
+    metrics = pool_conn.get_pool_metrics()
+    assert (metrics['open'], metrics['in_use'], metrics['checkouts'],
+            metrics['peak_in_use']) == (2, 2, 3, 2)
+    assert metrics['max_wait_time'] >= 0.1
+    assert metrics['average_wait_time'] == pytest.approx(
+        metrics['total_wait_time'] / 3)
+
+
+def test_unhealthy_connection_replaced(pool_conn, opened, monkeypatch):
+    monkeypatch.setattr(pool_conn, 'HEALTH_CHECK_INTERVAL', -1)  # always
+    # checked
+    with pool_conn.borrow_connection() as conn:
+        pass
+    conn.healthy = False  # e.g. closed by the server while idle
+    with pool_conn.borrow_connection() as other:
+        assert other is not conn
+    assert conn.closed and not other.closed
+    assert len(opened) == 2
+    assert pool_conn.get_pool_metrics()['open'] == 1
+
+
+def test_failed_open_not_counted(pool_conn, monkeypatch):
+    monkeypatch.setattr(pool_conn, 'create_connection', lambda: None)
+    with pool_conn.borrow_connection() as conn:
+        assert conn is None
+    metrics = pool_conn.get_pool_metrics()
+    assert (metrics['open'], metrics['in_use'], metrics['checkouts']) == \
+        (0, 0, 0)
@@ -0,0 +1,104 @@
+"""
+Tests of the course library's attribute indexes (see CourseLibrary
+find_courses/reindex_course): filtering by each indexed attribute and by
+several at once, and the indexes kept current as courses change, are
+replaced and are removed
+"""
+import pytest
+from conftest import build_data
+
+# (name, department, program, division) of each course
+COURSES = (
+    ('Algorithms', 'Computer Science', 'MPCS', 'Physical Sciences'),
+    ('Databases', 'Computer Science', 'MPCS', 'Physical Sciences'),
+    ('Statistics', 'Statistics', 'STAT', 'Physical Sciences'),
+    ('Econometrics', 'Economics', 'ECON', 'Social Sciences'),
+    ('Data Economics', 'Economics', 'MPCS', 'Social Sciences'))
+
+
+@pytest.fixture
+def index_facade(make_facade):
+    data = build_data(1, [(name, False, [(30, '10:30AM', 'Monday')], [])
+                          for name, _, _, _ in COURSES])
+    for row, (_, department, program, division) in zip(data['get_courses'],
+                                                       COURSES):
+        row.update(department=department, program=program,
+                   division=division)
+    return make_facade(data)
+
+
+def find(facade, **criteria):
+    return sorted(course.name for course in
+                  facade.course_library.find_courses(**criteria))
+
+
+def test_filter_by_attribute(index_facade):
+    assert find(index_facade, department='Economics') == [
+        'Data Economics', 'Econometrics']
+    assert find(index_facade, program='MPCS') == [
+        'Algorithms', 'Data Economics', 'Databases']
+    assert find(index_facade, division='Physical Sciences') == [
+        'Algorithms', 'Databases', 'Statistics']
+    assert find(index_facade, number=50002) == ['Statistics']
+    assert find(index_facade, instructor_name='Ada Lovelace') == sorted(
+        name for name, _, _, _ in COURSES)
+    assert find(index_facade, department='History') == []
+
+
+def test_combined_filters(index_facade):
+    assert find(index_facade, program='MPCS', division='Social Sciences') \
+        == ['Data Economics']
+    assert find(index_facade, department='Computer Science', program='MPCS',
+                number=50001) == ['Databases']
+    assert find(index_facade, department='Statistics', program='MPCS') == []
+    # Criteria of None are not filtered on
+    assert find(index_facade, department=None, program='ECON') == [
+        'Econometrics']
+    assert len(find(index_facade, department=None)) == len(COURSES)
+
+
+def test_reindexed_when_attributes_change(index_facade):
+    library = index_facade.course_library
+    statistics = index_facade.get_course('Statistics')
+    library.reindex_course(statistics, 'department', 'Mathematics')
+    assert statistics.department == 'Mathematics'
+    assert find(index_facade, department='Mathematics') == ['Statistics']
+    # The stale key is dropped with its last course
+    assert find(index_facade, department='Statistics') == []
+    assert 'Statistics' not in library.indexes['department']
+
+    index_facade.get_course('Databases').set_instructor('Grace Hopper')
+    assert find(index_facade, instructor_name='Grace Hopper') == [
+        'Databases']
+    assert 'Databases' not in find(index_facade,
+                                   instructor_name='Ada Lovelace')
+    index_facade.modify_approval_required('instructor', 'Algorithms', True)
+    assert find(index_facade, approval_required=True) == ['Algorithms']
+    assert 'Algorithms' not in find(index_facade, approval_required=False)
+
+
+def test_replaced_and_removed_courses_unindexed(index_facade):
+    library = index_facade.course_library
+    row = dict(course_id=6, instructor_name='Ada Lovelace', number=50009,
+               name='Algorithms', division='Physical Sciences',
+               department='Mathematics', program='MATH', lab_required=False,
+               approval_required=False)
+    library.add_course(**row)
+    assert find(index_facade, department='Computer Science') == [
+        'Databases']
+    assert find(index_facade, program='MATH') == ['Algorithms']
+    assert find(index_facade, number=50000) == []
+
+    library.remove_course(index_facade.get_course('Econometrics'))
+    assert find(index_facade, department='Economics') == ['Data Economics']
+    assert 'ECON' not in library.indexes['program']
+
+
+def test_view_filtered_courses(index_facade):
+    found = index_facade.course_library.view_filtered_courses(
+        '50004', None, None, department='Economics')
+    assert found.count('=== COURSE ===') == 1
+    assert 'Data Economics' in found
+    assert index_facade.course_library.view_filtered_courses(
+        '50004', 'Physical Sciences', None) == \
+        'No courses found matching criteria'
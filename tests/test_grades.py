@@ -0,0 +1,75 @@
+"""
+Tests of grade books and the grade statistics computed from them
+"""
+import pytest
+from courses import GradeBook, compute_grade_statistics, \
+    compute_grouped_grade_statistics, compute_percentile_rank
+
+
+@pytest.fixture
+def section(facade):
+    section = facade.get_course('Databases').get_section(1)
+    for username, grades in (('student0', [70, 70]), ('student1', [80]),
+                             ('student2', [90, 100])):
+        for grade in grades:
+            section.add_grade(username, grade)
+    return section
+
+
+def test_grades_kept_in_order_added(section):
+    section.add_grade('student0', 65)
+    assert section.get_grades('student0') == [70, 70, 65]
+    assert section.get_grades('student3') is None
+    assert section.grade_book.get_all_grades() == {
+        'student0': [70, 70, 65], 'student1': [80], 'student2': [90, 100]}
+    assert all(type(grade) is int for grade in section.get_grades('student0'))
+
+
+def test_fractional_grade_makes_grades_floats():
+    grade_book = GradeBook()
+    grade_book.add_grade('student0', 90)
+    grade_book.add_grade('student0', 85.5)
+    assert grade_book.get_grades('student0') == [90.0, 85.5]
+    assert grade_book.get_averages() == {'student0': 87.75}
+
+
+def test_grade_statistics(section):
+    statistics = section.get_grade_statistics()
+    assert statistics['count'] == 3
+    assert statistics['mean'] == pytest.approx(81.666, abs=1e-3)
+    assert statistics['median'] == 80
+    assert statistics['stddev'] == pytest.approx(10.274, abs=1e-3)
+    assert (statistics['min'], statistics['max']) == (70, 95)
+    assert statistics['histogram'] == {0: 0, 10: 0, 20: 0, 30: 0, 40: 0,
+                                       50: 0, 60: 0, 70: 1, 80: 1, 90: 1}
+
+
+def test_grade_statistics_edge_cases():
+    assert compute_grade_statistics([]) is None
+    statistics = compute_grade_statistics([100, 60, 90, 70])
+    assert statistics['median'] == 80
+    assert statistics['histogram'][90] == 2  # top bin includes 100
+    assert compute_grade_statistics([-5])['histogram'] == \
+        dict.fromkeys(range(0, 100, 10), 0)
+
+
+def test_grouped_statistics_match_separate_statistics():
+    groups = [1, 0, 1, 1, 0]
+    averages = [90, 60, 70, 85, 75]
+    grouped = compute_grouped_grade_statistics(groups, averages, 3)
+    assert grouped[0] == compute_grade_statistics([60, 75])
+    assert grouped[1] == compute_grade_statistics([90, 70, 85])
+    assert grouped[2] is None
+
+
+def test_percentile_rank(section):
+    assert section.get_percentile_rank('student0') == pytest.approx(100 / 6)
+    assert section.get_percentile_rank('student1') == 50
+    assert section.get_percentile_rank('student3') is None
+    assert compute_percentile_rank([80, 80, 90], 80) == pytest.approx(
+        100 / 3)
+    assert compute_percentile_rank([], 80) is None
+
+
+def test_grade_books_locked_separately():
+    assert GradeBook()._buffer_lock is not GradeBook()._buffer_lock
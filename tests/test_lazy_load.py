@@ -0,0 +1,72 @@
+"""
+Tests of lazy loading (retrieve_data with lazy_load): rosters, grade books and
+waitlists are loaded per course on first access and schedules per student
+"""
+import pytest
+from conftest import build_data
+
+
+@pytest.fixture
+def data():
+    data = build_data(3, [
+        ('Algorithms', False, [(1, '10:30AM', 'Monday')], []),
+        ('Networks', True, [(30, '8:30AM', 'Monday')],
+         [(30, '8:30AM', 'Wednesday')])
+    ])
+    data['get_all_section_students'] += [
+        {'section_id': 1, 'student_username': 'student0',
+         'status': 'Approved'},
+        {'section_id': 2, 'student_username': 'student1',
+         'status': 'Pending'}]
+    data['get_all_lab_students'].append(
+        {'lab_id': 1, 'student_username': 'student1', 'status': 'Approved'})
+    data['get_all_section_grades'].append(
+        {'section_id': 1, 'student_username': 'student0', 'grade': 90})
+    data['get_all_section_waitlists'].append(
+        {'section_id': 1, 'student_username': 'student2', 'priority': 0})
+    return data
+
+
+@pytest.fixture
+def lazy_facade(make_facade, serve_data, data):
+    facade = make_facade(None)
+    queries = serve_data(data)
+    facade.retrieve_data(lazy_load=True)
+    return facade, queries
+
+
+def test_rosters_not_loaded_at_startup(lazy_facade):
+    _, queries = lazy_facade
+    assert sorted(queries) == ['get_courses', 'get_instructors',
+                               'get_labs', 'get_last_change_id',
+                               'get_sections', 'get_students']
+
+
+def test_course_loaded_on_first_access(lazy_facade):
+    facade, queries = lazy_facade
+    del queries[:]
+    section = facade.get_course('Algorithms').get_section(1)
+    assert list(section.registered_students) == ['student0']
+    assert section.get_grades('student0') == [90]
+    assert section.waitlist.peek() is facade.get_student('student2')
+    # Loaded once, with one query per table
+    assert section.registered_students
+    assert queries.count('get_all_section_students') == 1
+    assert 'get_all_lab_students' not in queries  # Algorithms has no labs
+    networks = facade.get_course('Networks')
+    assert networks.loader
+    assert str(networks.get_section(1).get_student('student1')[1]) == \
+        'Pending'
+    assert list(networks.get_lab(1).registered_students) == ['student1']
+    assert not networks.loader
+
+
+def test_schedule_loaded_on_first_access(lazy_facade):
+    facade, queries = lazy_facade
+    schedule = facade.get_student('student1').get_schedule()
+    assert schedule.loader
+    networks = facade.get_course('Networks')
+    assert schedule.get_section('Networks') is networks.get_section(1)
+    assert schedule.get_lab('Networks') is networks.get_lab(1)
+    assert queries.count('get_student_registrations') == 1
+    assert not facade.get_student('student2').get_schedule().sections
@@ -0,0 +1,82 @@
+"""
+Tests of finding sections and labs with open seats (see OpenSeatIndex and
+CourseLibrary.find_open_seats): ordering by seats remaining, filters, and the
+index kept current as rosters and sections/labs change
+"""
+import pytest
+from conftest import build_data
+
+
+@pytest.fixture
+def seats_facade(make_facade):
+    data = build_data(2, [
+        ('Algorithms', False, [(2, '10:30AM', 'Monday'),
+                               (3, '1:30PM', 'Tuesday')], []),
+        ('Networks', True, [(1, '8:30AM', 'Monday')],
+         [(4, '8:30AM', 'Wednesday')]),
+        ('Economics', False, [(5, '3:30PM', 'Thursday')], [])
+    ])
+    data['get_courses'][2].update(department='Economics',
+                                  division='Social Sciences')
+    return make_facade(data)
+
+
+def find(facade, **kwargs):
+    # (course name, 'Section'/'Lab' and number, seats remaining) of each
+    # found
+    return [(registerable.course_name,
+             f'{type(registerable).__name__}{str(registerable.number)}',
+             registerable.seats_remaining) for registerable in
+            facade.course_library.find_open_seats(**kwargs)]
+
+
+def test_most_seats_remaining_first(seats_facade):
+    assert find(seats_facade) == [
+        ('Economics', 'Section1', 5), ('Networks', 'Lab1', 4),
+        ('Algorithms', 'Section2', 3), ('Algorithms', 'Section1', 2),
+        ('Networks', 'Section1', 1)]
+    assert find(seats_facade, min_seats=3, limit=2) == [
+        ('Economics', 'Section1', 5), ('Networks', 'Lab1', 4)]
+
+
+def test_filters(seats_facade):
+    assert find(seats_facade, department='Economics') == [
+        ('Economics', 'Section1', 5)]
+    assert find(seats_facade, division='Physical Sciences', min_seats=3) \
+        == [('Networks', 'Lab1', 4), ('Algorithms', 'Section2', 3)]
+    assert find(seats_facade, department='Economics',
+                division='Physical Sciences') == []
+    assert find(seats_facade, day='Monday') == [
+        ('Algorithms', 'Section1', 2), ('Networks', 'Section1', 1)]
+
+
+def test_index_follows_rosters(seats_facade):
+    seats_facade.register_in_section('student0', 'Networks', 1)
+    seats_facade.register_in_section('student1', 'Algorithms', 1)
+    assert find(seats_facade, day='Monday') == [
+        ('Algorithms', 'Section1', 1)]
+    seats_facade.drop_course('student0', 'Networks')
+    assert find(seats_facade, day='Monday') == [
+        ('Algorithms', 'Section1', 1), ('Networks', 'Section1', 1)]
+
+
+def test_index_follows_sections(seats_facade):
+    course = seats_facade.get_course('Algorithms')
+    course.update_registerable(course.get_section(2), 2, 6, '1:30PM',
+                               'Tuesday')
+    assert find(seats_facade, limit=1) == [('Algorithms', 'Section2', 6)]
+    seats_facade.course_library.remove_registerable(course.get_section(2))
+    assert ('Algorithms', 'Section2', 6) not in find(seats_facade)
+    assert len(seats_facade.course_library.open_seats) == 4
+
+
+def test_view_open_seats(seats_facade):
+    section = seats_facade.get_course('Economics').get_section(1)
+    assert seats_facade.view_open_seats(department='Economics') == \
+        '\n============ SECTIONS WITH OPEN SEATS ===========\n' \
+        f'{str(section)} - Seats Remaining: 5\n' \
+        '=============================================\n'
+    assert seats_facade.view_open_seats(day='Someday') == \
+        'Invalid day: Someday'
+    assert seats_facade.view_open_seats(min_seats=10) == \
+        'No sections or labs found with open seats matching criteria'
@@ -0,0 +1,84 @@
+"""
+Tests of loading the system with several workers (retrieve_data with
+workers, see ParallelRetrieve): the libraries are populated as by a serial
+load, and a failed query leaves them unpopulated
+"""
+import pytest
+from conftest import build_data
+
+
+class FailingRows:
+    """Rows of a query failing as they are read (e.g. a lost connection)"""
+
+    def __iter__(self):
+        raise RuntimeError('Lost connection to MySQL server during query')
+
+
+@pytest.fixture
+def data():
+    data = build_data(4, [
+        ('Algorithms', False, [(1, '10:30AM', 'Monday')], []),
+        ('Networks', True, [(30, '8:30AM', 'Monday'),
+                            (30, '1:30PM', 'Tuesday')],
+         [(30, '8:30AM', 'Wednesday'), (30, '1:30PM', 'Friday')])
+    ])
+    data['get_all_section_students'] += [
+        {'section_id': 1, 'student_username': 'student0',
+         'status': 'Approved'},
+        {'section_id': 2, 'student_username': 'student1',
+         'status': 'Approved'},
+        {'section_id': 3, 'student_username': 'student2',
+         'status': 'Pending'}]
+    data['get_all_lab_students'] += [
+        {'lab_id': 2, 'student_username': 'student1', 'status': 'Approved'}]
+    data['get_all_section_grades'] += [
+        {'section_id': 1, 'student_username': 'student0', 'grade': 90},
+        {'section_id': 1, 'student_username': 'student0', 'grade': 85.5}]
+    data['get_all_section_waitlists'] += [
+        {'section_id': 1, 'student_username': 'student3', 'priority': 0},
+        {'section_id': 1, 'student_username': 'student2', 'priority': 0}]
+    return data
+
+
+def get_views(facade):
+    # Schedules, grades, course rosters and waitlists of the system
+    return ([(facade.view_schedule(username), facade.view_grades(username))
+             for username in sorted(facade.student_library.students)],
+            [sorted(facade.view_course_students('instructor', name)
+                    .split('\n')) for name in ('Algorithms', 'Networks')],
+            [student.username for student, _ in facade.get_course(
+                'Algorithms').get_section(1).waitlist.get_all()])
+
+
+def test_same_as_serial_load(make_facade, serve_data, data):
+    facade = make_facade(None)
+    serve_data(data)
+    facade.retrieve_data()
+    views = get_views(facade)
+
+    facade = make_facade(None)
+    queries = serve_data(data)
+    report = facade.retrieve_data(workers=4)
+    assert report.startswith('Data retrieved from database using 11 queries')
+    assert '\n  fetch: ' in report and '\n  wiring: ' in report
+    # Each table queried once
+    assert sorted(queries) == sorted(
+        ['get_last_change_id', 'get_students', 'get_instructors',
+         'get_courses', 'get_sections', 'get_labs',
+         'get_all_section_students', 'get_all_lab_students',
+         'get_all_section_grades', 'get_all_section_waitlists',
+         'get_all_lab_waitlists'])
+    assert get_views(facade) == views
+    assert views[2] == ['student3', 'student2']  # in the order joined
+
+
+def test_failed_query_raised(make_facade, serve_data, data):
+    data['get_all_lab_students'] = FailingRows()
+    facade = make_facade(None)
+    serve_data(data)
+    with pytest.raises(RuntimeError, match='Lost connection'):
+        facade.retrieve_data(workers=4)
+    # Nothing populated from the queries that succeeded
+    assert not facade.student_library.students
+    assert not facade.instructor_library.instructors
+    assert not facade.course_library.courses
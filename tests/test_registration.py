@@ -0,0 +1,236 @@
+"""
+Tests of registration rules of the facade: waitlist promotion, all-or-nothing
+carts (and releasing them) and retrying optimistic seat claims
+"""
+import db_utils
+from conftest import build_data
+from services import CartRegistration, IRegistrationStrategy
+
+
+def is_registered(facade, username, course_name, section_number):
+    section = facade.get_course(course_name).get_section(section_number)
+    schedule = facade.get_student(username).get_schedule()
+    in_roster = section.is_student_in_registerable(username)
+    # Roster and schedule must agree
+    assert in_roster == (schedule.get_section(course_name) is section)
+    return in_roster
+
+
+def test_drop_promotes_waitlisted_student(facade):
+    facade.register_in_section('student0', 'Algorithms', 1)
+    result = facade.register_in_section('student1', 'Algorithms', 1)
+    assert 'added to the waitlist at position 1' in result
+    assert not is_registered(facade, 'student1', 'Algorithms', 1)
+
+    facade.drop_course('student0', 'Algorithms')
+
+    section = facade.get_course('Algorithms').get_section(1)
+    assert is_registered(facade, 'student1', 'Algorithms', 1)
+    assert not is_registered(facade, 'student0', 'Algorithms', 1)
+    assert not section.waitlist
+    assert section.version == 3  # claimed, released, claimed
+
+
+def test_cart_with_conflict_registers_nothing(facade):
+    result = facade.register_cart('student0', [('Algorithms', 1, None),
+                                               ('Networks', 1, 1),
+                                               ('Databases', 1, None)])
+    assert result.startswith('Cart not registered. Meeting time of '
+                             'Databases section 1')
+    for course_name in ('Algorithms', 'Networks', 'Databases'):
+        assert not is_registered(facade, 'student0', course_name, 1)
+    assert not facade.get_course('Networks').get_lab(1).registered_students
+    assert facade.get_course('Algorithms').get_section(1).version == 0
+
+
+def test_cart_with_full_section_registers_nothing(facade):
+    facade.register_in_section('student0', 'Algorithms', 1)
+    result = facade.register_cart('student1', [('Networks', 1, 1),
+                                               ('Algorithms', 1, None)])
+    assert result == 'Cart not registered. Algorithms section 1 is full: ' \
+                     '1 / 1 students registered'
+    assert not is_registered(facade, 'student1', 'Networks', 1)
+    assert not facade.get_course('Algorithms').get_section(1).waitlist
+
+
+def test_cart_registers_all_courses(facade):
+    result = facade.register_cart('student0', [('Algorithms', 1, None),
+                                               ('Networks', 1, 1)])
+    assert result.startswith('Student registered in all courses in cart:')
+    assert is_registered(facade, 'student0', 'Algorithms', 1)
+    assert is_registered(facade, 'student0', 'Networks', 1)
+    lab = facade.get_course('Networks').get_lab(1)
+    assert facade.get_student('student0').get_schedule().get_lab(
+        'Networks') is lab
+
+
+def test_stale_claim_is_retried_after_refresh(facade, monkeypatch):
+    claims = []
+    refreshed = []
+    claim_all = db_utils._claim_all
+
+    def claim_stale_once(sql_conn, claims_made, writes):
+        claims.append(claims_made)
+        if len(claims) == 1:
+            return False  # Another process changed the section
+        return claim_all(sql_conn, claims_made, writes)
+
+    monkeypatch.setattr(db_utils, '_claim_all', claim_stale_once)
+    monkeypatch.setattr(facade.incremental_retrieve, 'refresh_registerable',
+                        lambda registerable, *_: refreshed.append(
+                            registerable))
+    result = facade.register_in_section('student0', 'Databases', 1)
+
+    section = facade.get_course('Databases').get_section(1)
+    assert result == 'Student successfully registered for Databases ' \
+                     'Section 1'
+    assert len(claims) == 2
+    assert refreshed == [section]
+    assert is_registered(facade, 'student0', 'Databases', 1)
+
+
+def test_claim_gives_up_when_always_stale(facade, monkeypatch):
+    monkeypatch.setattr(db_utils, '_claim_all', lambda *_: False)
+    monkeypatch.setattr(facade.incremental_retrieve, 'refresh_registerable',
+                        lambda *_: None)
+    result = facade.register_in_section('student0', 'Databases', 1)
+    assert result == IRegistrationStrategy.CHANGED_MESSAGE
+    assert not is_registered(facade, 'student0', 'Databases', 1)
+
+
+def test_claim_error_fails_without_retrying(facade, monkeypatch):
+    claims = []
+
+    def fail_claim(*_):
+        claims.append(None)
+        raise db_utils.ClaimError('no connection to SQL database')
+
+    monkeypatch.setattr(db_utils, '_claim_all', fail_claim)
+    result = facade.register_cart('student0', [('Databases', 1, None)])
+    assert result == IRegistrationStrategy.UNAVAILABLE_MESSAGE
+    assert len(claims) == 1
+    assert not is_registered(facade, 'student0', 'Databases', 1)
+
+
+def test_cart_release_frees_seats_without_promoting(facade, monkeypatch):
+    cart = [('Algorithms', 1, None), ('Networks', 1, 1)]
+    facade.register_cart('student0', cart)
+    facade.register_in_section('student1', 'Algorithms', 1)  # waitlisted
+    logs = []
+    monkeypatch.setattr(facade.mongo_conn, 'insert_log', logs.append)
+    monkeypatch.setattr(facade.mongo_conn, 'insert_logs', logs.extend)
+
+    released = CartRegistration(
+        facade.get_student('student0'), cart,
+        {course_name: facade.get_course(course_name) for course_name, _, _
+         in cart}, facade.sql_conn, facade.mongo_conn).release()
+
+    section = facade.get_course('Algorithms').get_section(1)
+    assert released == ['Algorithms', 'Networks']
+    assert not is_registered(facade, 'student0', 'Algorithms', 1)
+    assert not is_registered(facade, 'student0', 'Networks', 1)
+    assert not facade.get_course('Networks').get_lab(1).registered_students
+    assert not is_registered(facade, 'student1', 'Algorithms', 1)
+    assert section.waitlist.peek() is facade.get_student('student1')
+    assert section.version == 2  # claimed, released
+    assert not logs
+
+
+def test_stale_cart_claim_retried_after_refresh(facade, monkeypatch):
+    claims = []
+    refreshed = []
+    claim_all = db_utils._claim_all
+
+    def claim_stale_once(sql_conn, claims_made, writes):
+        claims.append(claims_made)
+        if len(claims) == 1:
+            # Nothing is registered until the seats have been claimed
+            assert not is_registered(facade, 'student0', 'Algorithms', 1)
+            return False
+        return claim_all(sql_conn, claims_made, writes)
+
+    monkeypatch.setattr(db_utils, '_claim_all', claim_stale_once)
+    monkeypatch.setattr(facade.incremental_retrieve, 'refresh_registerable',
+                        lambda registerable, *_: refreshed.append(
+                            registerable))
+    result = facade.register_cart('student0', [('Algorithms', 1, None),
+                                               ('Networks', 1, 1)])
+
+    algorithms = facade.get_course('Algorithms').get_section(1)
+    networks = facade.get_course('Networks')
+    assert result.startswith(CartRegistration.REGISTERED_MESSAGE)
+    # One claim per table, of every section/lab in the cart
+    assert claims[0] == [('Section', [(1, 0), (2, 0)]), ('Lab', [(1, 0)])]
+    assert len(claims) == 2
+    assert refreshed == [algorithms, networks.get_section(1),
+                         networks.get_lab(1)]
+    assert is_registered(facade, 'student0', 'Algorithms', 1)
+    assert is_registered(facade, 'student0', 'Networks', 1)
+    assert algorithms.version == networks.get_lab(1).version == 1
+
+
+def test_cart_always_stale_registers_nothing(facade, monkeypatch):
+    monkeypatch.setattr(db_utils, '_claim_all', lambda *_: False)
+    monkeypatch.setattr(facade.incremental_retrieve, 'refresh_registerable',
+                        lambda *_: None)
+    result = facade.register_cart('student0', [('Algorithms', 1, None),
+                                               ('Networks', 1, 1)])
+    assert result == IRegistrationStrategy.CHANGED_MESSAGE
+    assert not is_registered(facade, 'student0', 'Algorithms', 1)
+    assert not is_registered(facade, 'student0', 'Networks', 1)
+    lab = facade.get_course('Networks').get_lab(1)
+    assert not lab.registered_students
+    assert not facade.get_student('student0').get_schedule().labs
+    assert lab.version == 0
+
+
+def test_cart_denials_register_nothing(facade):
+    facade.register_in_section('student1', 'Databases', 1)
+    for username, cart, reason in (
+            ('student0', [], 'Cart is empty'),
+            ('student0', [('Algorithms', 1, None), ('Chemistry', 1, None)],
+             'Course not found: Chemistry'),
+            ('student0', [('Databases', 1, None), ('Databases', 1, None)],
+             'Databases is in cart more than once'),
+            ('student0', [('Algorithms', 2, None)],
+             'Section not found: Algorithms section 2'),
+            ('student0', [('Algorithms', 1, None), ('Networks', 1, None)],
+             'Networks requires a lab'),
+            ('student0', [('Networks', 1, 2)],
+             'Lab not found: Networks lab 2'),
+            ('student1', [('Algorithms', 1, None), ('Databases', 1, None)],
+             'Student already registered for section in Databases')):
+        assert facade.register_cart(username, cart) == \
+            CartRegistration.DENIED_MESSAGE + reason
+    assert not is_registered(facade, 'student0', 'Algorithms', 1)
+    assert not is_registered(facade, 'student1', 'Algorithms', 1)
+    assert not is_registered(facade, 'student0', 'Databases', 1)
+
+
+def test_cart_sections_count_toward_load(make_facade):
+    # Full-time students may register in 3 sections before overloading
+    facade = make_facade(build_data(1, [
+        (f'Course{str(i)}', False, [(30, '10:30AM', day)], []) for i, day in
+        enumerate(('Monday', 'Tuesday', 'Wednesday', 'Thursday'))]))
+    result = facade.register_cart('student0', [
+        (f'Course{str(i)}', 1, None) for i in range(4)])
+    assert result.split('\n')[1:] == [
+        '  Course0 Section 1', '  Course1 Section 1', '  Course2 Section 1',
+        "  Course3 Section 1 - 'Pending' (overloading) before department "
+        "chair approval"]
+
+
+def test_cart_release_skips_courses_no_longer_registered(facade):
+    cart = [('Algorithms', 1, None), ('Databases', 1, None)]
+    facade.register_cart('student0', cart)
+    facade.drop_course('student0', 'Databases')
+
+    released = CartRegistration(
+        facade.get_student('student0'), cart,
+        {course_name: facade.get_course(course_name) for course_name, _, _
+         in cart}, facade.sql_conn, facade.mongo_conn).release()
+
+    assert released == ['Algorithms']
+    assert not is_registered(facade, 'student0', 'Algorithms', 1)
+    # Claimed by the cart and released by the drop only
+    assert facade.get_course('Databases').get_section(1).version == 2
@@ -0,0 +1,96 @@
+"""
+Tests of each course's registration index (Course.student_sections and
+student_labs, used by find_student_section/find_student_lab): it matches the
+rosters of the course's sections and labs after registrations, drops,
+waitlist promotions and carts registered, denied and released
+"""
+from itertools import chain
+import db_utils
+from services import CartRegistration
+
+
+def check_index(facade):
+    # Index of each course rebuilt by scanning its sections/labs must match
+    for course in facade.course_library.courses.values():
+        for index, registerables in (
+                (course.student_sections, course.sections.values()),
+                (course.student_labs, course.labs.values())):
+            assert index == {username: registerable for registerable in
+                             registerables for username in
+                             registerable.registered_students}
+        for username in chain(course.student_sections, course.student_labs):
+            assert course.find_student_section(username) is \
+                course.student_sections.get(username)
+            assert course.find_student_lab(username) is \
+                course.student_labs.get(username)
+
+
+def test_registrations_and_drops(facade):
+    networks = facade.get_course('Networks')
+    facade.register_in_section('student0', 'Networks', 1)
+    facade.register_in_lab('student0', 'Networks', 1)
+    facade.register_in_section('student1', 'Databases', 1)
+    check_index(facade)
+    assert networks.find_student_section('student0') is \
+        networks.get_section(1)
+    assert networks.find_student_lab('student0') is networks.get_lab(1)
+    assert networks.find_student_section('student1') is None
+
+    facade.drop_course('student0', 'Networks')
+    check_index(facade)
+    assert networks.find_student_section('student0') is None
+    assert networks.find_student_lab('student0') is None
+    facade.drop_all_courses('student1')
+    check_index(facade)
+    assert not facade.get_course('Databases').student_sections
+
+
+def test_waitlist_promotion(facade):
+    algorithms = facade.get_course('Algorithms')
+    facade.register_in_section('student0', 'Algorithms', 1)
+    facade.register_in_section('student1', 'Algorithms', 1)  # waitlisted
+    check_index(facade)
+    assert algorithms.find_student_section('student1') is None
+
+    facade.drop_course('student0', 'Algorithms')
+    check_index(facade)
+    assert algorithms.find_student_section('student0') is None
+    assert algorithms.find_student_section('student1') is \
+        algorithms.get_section(1)
+
+
+def test_cart_registered_and_released(facade):
+    cart = [('Algorithms', 1, None), ('Networks', 1, 1)]
+    facade.register_cart('student0', cart)
+    check_index(facade)
+    assert facade.get_course('Networks').find_student_lab('student0') is \
+        facade.get_course('Networks').get_lab(1)
+
+    # Rolled back, e.g. as another part of a cart split between shards was
+    # denied
+    CartRegistration(facade.get_student('student0'), cart,
+                     {course_name: facade.get_course(course_name) for
+                      course_name, _, _ in cart}, facade.sql_conn,
+                     facade.mongo_conn).release()
+    check_index(facade)
+    for course_name in ('Algorithms', 'Networks'):
+        course = facade.get_course(course_name)
+        assert course.find_student_section('student0') is None
+        assert course.find_student_lab('student0') is None
+
+
+def test_cart_denied(facade, monkeypatch):
+    facade.register_cart('student0', [('Networks', 1, 1),
+                                      ('Databases', 1, None)])  # conflict
+    check_index(facade)
+    assert facade.get_course('Networks').find_student_section('student0') \
+        is None
+
+    monkeypatch.setattr(db_utils, '_claim_all', lambda *_: False)
+    monkeypatch.setattr(facade.incremental_retrieve, 'refresh_registerable',
+                        lambda *_: None)
+    facade.register_cart('student0', [('Algorithms', 1, None),
+                                      ('Networks', 1, 1)])  # always stale
+    check_index(facade)
+    assert not facade.get_course('Algorithms').student_sections
+    assert not facade.get_course('Networks').student_labs
@@ -0,0 +1,90 @@
+"""
+Tests of building conflict-free schedules (see ScheduleBuilder): the
+combinations of sections and labs found, their ranking by days on campus,
+and the sections/labs left out for being full or meeting at the time of the
+student's other classes
+"""
+import pytest
+from conftest import build_data
+from services import ScheduleBuilder
+
+
+@pytest.fixture
+def builder_facade(make_facade):
+    # Algorithms section 1 meets at the time of Networks section 1 and
+    # Graphics, and section 2 at the time of Networks lab 1. Databases has
+    # one seat
+    return make_facade(build_data(2, [
+        ('Algorithms', False, [(30, '10:30AM', 'Monday'),
+                               (30, '10:30AM', 'Tuesday')], []),
+        ('Networks', True, [(30, '10:30AM', 'Monday'),
+                            (30, '1:30PM', 'Tuesday')],
+         [(30, '10:30AM', 'Tuesday'), (30, '8:30AM', 'Wednesday')]),
+        ('Databases', False, [(1, '3:30PM', 'Thursday')], []),
+        ('Graphics', False, [(30, '10:30AM', 'Monday')], [])
+    ]))
+
+
+def build(facade, username, course_names, limit=5, time_budget=0.5):
+    # (days on campus, set of (course name, section number, lab number))
+    # of each schedule built
+    builder = ScheduleBuilder(facade.get_student(username),
+                              [facade.get_course(name) for name in
+                               course_names], limit, time_budget)
+    return [(days, {(course.name, section.number, lab.number if lab else
+                     None) for course, section, lab in choices})
+            for days, choices in builder.build_schedules()]
+
+
+def test_fewest_days_first(builder_facade):
+    schedules = build(builder_facade, 'student0', ['Algorithms', 'Networks'])
+    assert [days for days, _ in schedules] == [2, 2, 3, 3]
+    assert {frozenset(choices) for days, choices in schedules[:2]} == {
+        frozenset({('Algorithms', 1, None), ('Networks', 2, 1)}),
+        frozenset({('Algorithms', 2, None), ('Networks', 2, 2)})}
+    assert {frozenset(choices) for days, choices in schedules[2:]} == {
+        frozenset({('Algorithms', 1, None), ('Networks', 2, 2)}),
+        frozenset({('Algorithms', 2, None), ('Networks', 1, 2)})}
+    assert [days for days, _ in build(builder_facade, 'student0',
+                                      ['Algorithms', 'Networks'], 2)] == \
+        [2, 2]
+
+
+def test_other_classes_avoided(builder_facade):
+    builder_facade.register_in_section('student0', 'Graphics', 1)
+    # Days on campus include those of the other classes
+    assert build(builder_facade, 'student0', ['Algorithms']) == [
+        (2, {('Algorithms', 2, None)})]
+
+
+def test_full_sections_left_out(builder_facade):
+    builder_facade.register_in_section('student1', 'Databases', 1)
+    assert build(builder_facade, 'student0', ['Databases']) == []
+    # Unless registered in them already
+    assert build(builder_facade, 'student1', ['Databases']) == [
+        (1, {('Databases', 1, None)})]
+
+
+def test_view_schedules(builder_facade):
+    algorithms = builder_facade.get_course('Algorithms')
+    assert builder_facade.build_schedules('student0', ['Algorithms'], 1) == \
+        '\n============= SCHEDULE OPTIONS =============\n' \
+        '---------------------------------------------\n' \
+        'Option 1 - 1 days on campus\n' \
+        '---------------------------------------------\n' \
+        f'{str(algorithms.get_section(1))}\n' \
+        '=============================================\n'
+    builder_facade.register_in_section('student1', 'Databases', 1)
+    assert builder_facade.build_schedules('student0', ['Databases']) == \
+        'No conflict-free schedule with open seats found for Databases'
+    assert builder_facade.build_schedules('student0', ['Chemistry']) == \
+        'Course not found: Chemistry'
+    assert builder_facade.build_schedules('student0', []) == \
+        'No courses given to build schedule from'
+
+
+def test_time_budget(builder_facade):
+    assert builder_facade.build_schedules(
+        'student0', ['Algorithms', 'Networks'], time_budget=0) == \
+        'Search time limit reached before any schedule was found for ' \
+        'Algorithms, Networks'
@@ -0,0 +1,70 @@
+"""
+Tests of ranked course search (see CourseSearchIndex): prefix matches of
+query words, similar (misspelled) words, ranking, and the index kept current
+as courses change
+"""
+import pytest
+from conftest import build_data
+
+COURSE_NAMES = ('Algorithms', 'Advanced Algorithms', 'Discrete Mathematics',
+                'Databases', 'Computer Networks')
+
+
+@pytest.fixture
+def search_facade(make_facade):
+    # Courses MPCS 50000 ... 50004, all taught by Ada Lovelace
+    return make_facade(build_data(1, [
+        (name, False, [(30, '10:30AM', 'Monday')], [])
+        for name in COURSE_NAMES]))
+
+
+def search(facade, query, limit=10):
+    return [course.name for course in
+            facade.course_library.search_index.search(query, limit)]
+
+
+def test_prefix_match_ranked_by_fewest_words(search_facade):
+    assert search(search_facade, 'algo') == ['Algorithms',
+                                             'Advanced Algorithms']
+    assert search(search_facade, 'ALGORITHMS adv') == [
+        'Advanced Algorithms', 'Algorithms']
+    assert search(search_facade, 'discrete math')[0] == \
+        'Discrete Mathematics'
+
+
+def test_misspelled_words_matched(search_facade):
+    assert search(search_facade, 'algoritms') == ['Algorithms',
+                                                  'Advanced Algorithms']
+    # Ranked by similarity
+    assert search(search_facade, 'databsaes netwrks') == [
+        'Computer Networks', 'Databases']
+    assert search(search_facade, 'zzzz') == []
+
+
+def test_numbers_matched_by_prefix(search_facade):
+    assert search(search_facade, '50003') == ['Databases']
+    assert len(search(search_facade, '5000')) == 5
+    assert search(search_facade, '50009') == []
+
+
+def test_limit(search_facade):
+    assert len(search(search_facade, 'lovelace', 2)) == 2
+    assert search(search_facade, 'lovelace', 0) == []
+
+
+def test_search_display(search_facade):
+    assert search_facade.search_courses('databases') == \
+        '\n=============== SEARCH RESULTS ==============\n' \
+        '(1) - MPCS 50003: Databases - Ada Lovelace\n' \
+        '=============================================\n'
+    assert search_facade.search_courses('zzzz') == \
+        'No courses found matching search'
+
+
+def test_index_kept_current(search_facade):
+    search_facade.get_course('Databases').set_instructor('Grace Hopper')
+    assert search(search_facade, 'hopper') == ['Databases']
+    assert 'Databases' not in search(search_facade, 'lovelace')
+    course_library = search_facade.course_library
+    course_library.remove_course(course_library.get_course('Algorithms'))
+    assert search(search_facade, 'algo') == ['Advanced Algorithms']
@@ -0,0 +1,193 @@
+"""
+Tests of the registration server (see RegistrationServer) over the
+JSON-over-TCP protocol: requests round-trip to the facade, pipelined requests
+are answered as each completes and matched to their ids, requests which
+cannot be handled are answered with an error, and many clients are served at
+once. The server runs on a free port on its own event loop in a thread.
+"""
+import asyncio
+import socket
+from threading import Event, Thread
+import pytest
+from protocol import RegistrationClient, RemoteError, encode_message, \
+    decode_message
+from server import RegistrationServer
+
+
+@pytest.fixture
+def server(facade):
+    reg_server = RegistrationServer(facade, port=0, threads=8)
+    loop = asyncio.new_event_loop()
+    ready = Event()
+
+    async def serve():
+        started = asyncio.Event()
+        serving = asyncio.create_task(reg_server.serve(started))
+        await started.wait()
+        ready.set()
+        await serving
+
+    task = loop.create_task(serve())
+
+    def run():
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+
+    thread = Thread(target=run)
+    thread.start()
+    assert ready.wait(5)
+    yield reg_server
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join(5)
+    loop.close()
+    reg_server.close()
+
+
+@pytest.fixture
+def connect(server):
+    """Function returning a client connected to the server"""
+    clients = []
+
+    def connect_client():
+        clients.append(RegistrationClient('localhost', server.port))
+        return clients[-1]
+    yield connect_client
+    for client in clients:
+        client.close()
+
+
+@pytest.fixture
+def raw_connection(server):
+    """File reading and writing lines over a connection to the server"""
+    conn = socket.create_connection(('localhost', server.port))
+    file = conn.makefile('rwb')
+    yield file
+    file.close()
+    conn.close()
+
+
+def send(file, *lines):
+    for line in lines:
+        file.write(line)
+    file.flush()
+
+
+def test_register_and_drop(facade, connect):
+    client = connect()
+    assert client.get_user_type('student0') == 'student'
+    assert client.get_user_type('nobody') is None
+    assert client.register_in_section('student0', 'Algorithms', 1) == \
+        'Student successfully registered for Algorithms Section 1'
+    assert 'Algorithms' in client.view_schedule('student0')
+    assert facade.get_course('Algorithms').get_section(1)\
+        .is_student_in_registerable('student0')
+    assert client.drop_course('student0', 'Algorithms') == \
+        'Student has successfully dropped Algorithms'
+    assert not facade.get_course('Algorithms').get_section(1)\
+        .is_student_in_registerable('student0')
+
+
+def test_pipelined_requests_matched_by_id(facade, connect, raw_connection,
+                                          monkeypatch):
+    results = connect().pipeline([
+        ('register_in_section', ('student0', 'Algorithms', 1)),
+        ('register_in_section', ('student1', 'Algorithms', 1)),
+        ('get_user_type', ('instructor',)),
+        ('drop_course', ('student0', 'Algorithms'))])
+    assert results[0] == \
+        'Student successfully registered for Algorithms Section 1'
+    assert results[1].startswith('Section is full')
+    assert results[2] == 'instructor'
+    assert results[3] == 'Student has successfully dropped Algorithms'
+
+    # A request still in progress does not hold up the answers to later
+    # requests, which are matched to their ids
+    release = Event()
+    view_schedule = facade.view_schedule
+
+    def slow_view_schedule(username):
+        assert release.wait(5)
+        return view_schedule(username)
+    monkeypatch.setattr(facade, 'view_schedule', slow_view_schedule)
+    send(raw_connection,
+         encode_message({'id': 'slow', 'method': 'view_schedule',
+                         'args': ['student1']}),
+         encode_message({'id': 'fast', 'method': 'get_user_type',
+                         'args': ['student1']}))
+    assert decode_message(raw_connection.readline()) == {
+        'id': 'fast', 'result': 'student'}
+    release.set()
+    response = decode_message(raw_connection.readline())
+    assert response['id'] == 'slow'
+    assert 'Algorithms' in response['result']  # promoted from the waitlist
+
+
+def test_unknown_method(connect, raw_connection):
+    client = connect()
+    result = client.call('load_data', {})
+    assert isinstance(result, RemoteError)
+    assert str(result) == 'ValueError: Unknown method load_data'
+    with pytest.raises(AttributeError):
+        client.load_data
+    send(raw_connection, encode_message({'id': 7, 'method': '__init__'}))
+    assert decode_message(raw_connection.readline()) == {
+        'id': 7, 'error': 'ValueError: Unknown method __init__'}
+
+
+def test_malformed_request(connect, raw_connection):
+    send(raw_connection, b'{"id": 1, "method": \n')
+    response = decode_message(raw_connection.readline())
+    assert response['id'] is None
+    assert response['error'].startswith('JSONDecodeError: ')
+    send(raw_connection, encode_message({'id': 2, 'args': []}))
+    assert decode_message(raw_connection.readline()) == {
+        'id': 2, 'error': "KeyError: 'method'"}
+    # The connection is still served
+    send(raw_connection, encode_message({'id': 3, 'method': 'get_user_type',
+                                         'args': ['student0']}))
+    assert decode_message(raw_connection.readline()) == {
+        'id': 3, 'result': 'student'}
+
+    # The blocking client raises errors of requests it cannot match
+    client = connect()
+    send(client._file, b'not json\n')
+    with pytest.raises(RemoteError, match='JSONDecodeError'):
+        client.get_user_type('student0')
+
+
+def test_concurrent_clients(facade, server, connect):
+    clients = [connect() for _ in range(10)]
+    results = {}
+    errors = []
+
+    def register(client, username):
+        try:
+            results[username] = client.pipeline([
+                ('register_in_section', (username, 'Algorithms', 1)),
+                ('register_in_section', (username, 'Networks', 1)),
+                ('register_in_lab', (username, 'Networks', 1))])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [Thread(target=register, args=(client, f'student{str(i)}'))
+               for i, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert not errors
+    assert len(results) == 10
+    # One seat in Algorithms: the other students are waitlisted
+    algorithms = [result[0] for result in results.values()]
+    assert algorithms.count(
+        'Student successfully registered for Algorithms Section 1') == 1
+    assert sum(result.startswith('Section is full') for result in
+               algorithms) == 9
+    networks = facade.get_course('Networks')
+    assert len(networks.get_section(1).registered_students) == 10
+    assert len(networks.get_lab(1).registered_students) == 10
+    assert len(facade.get_course('Algorithms').get_section(1)
+               .registered_students) == 1
+    assert server.request_count == 30
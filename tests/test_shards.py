@@ -0,0 +1,186 @@
+"""
+Tests of sharded execution: requests routed to the shard owning each course
+and changes replicated to the other shards. The shards are ShardWorkers in
+this process, with requests handled by them in turn rather than sent to
+worker processes
+"""
+import pytest
+from conftest import build_data
+from shards import ShardRouter, ShardWorker, get_shard_index
+
+COURSES = [
+    ('Algorithms', False, [(1, '10:30AM', 'Monday')], []),
+    ('Networks', True, [(30, '8:30AM', 'Monday')],
+     [(30, '8:30AM', 'Wednesday')]),
+    ('Databases', False, [(30, '1:30PM', 'Tuesday')], []),
+    ('Graphics', False, [(30, '3:30PM', 'Thursday')], [])
+]
+
+
+class InProcessRouter(ShardRouter):
+    """ShardRouter whose shards are ShardWorkers in this process"""
+
+    def __init__(self, facades):
+        self._shards = [ShardWorker(facade) for facade in facades]
+        self._student_locks = {}
+
+    def _call(self, shard, method_name, args, kwargs):
+        result, changes = shard.handle(method_name, args, kwargs)
+        for other in self._shards:
+            if other is not shard:
+                for course_changes in changes or []:
+                    other.apply_changes(course_changes)
+        return result
+
+
+@pytest.fixture
+def router(make_facade):
+    return InProcessRouter([make_facade(build_data(4, COURSES)) for _ in
+                            range(2)])
+
+
+def get_owner(router, course_name):
+    return router._shards[get_shard_index(course_name, 2)]
+
+
+def assert_replicas_agree(router, username):
+    # Schedules may list courses in a different order on each shard
+    views = [(sorted(str(registerable) for registerable in (
+        *shard.facade.get_student(username).get_schedule().sections.values(),
+        *shard.facade.get_student(username).get_schedule().labs.values())),
+              [str(registerable) for course in
+               shard.facade.course_library.courses.values() for registerable
+               in (*course.sections.values(), *course.labs.values())])
+             for shard in router._shards]
+    assert views[0] == views[1]
+
+
+def test_courses_owned_by_both_shards():
+    # The tests below need courses owned by each shard
+    assert {get_shard_index(course[0], 2) for course in COURSES} == {0, 1}
+
+
+def test_registration_replicated(router):
+    assert router.route('register_in_section', ('student0', 'Networks', 1),
+                        {}).startswith('Student successfully registered for '
+                                       'Networks Section 1')
+    router.route('register_in_lab', ('student0', 'Networks', 1), {})
+    router.route('register_in_section', ('student0', 'Algorithms', 1), {})
+    for shard in router._shards:
+        schedule = shard.facade.get_student('student0').get_schedule()
+        course = shard.facade.get_course('Networks')
+        assert schedule.get_section('Networks') is course.get_section(1)
+        assert schedule.get_lab('Networks') is course.get_lab(1)
+        assert course.get_section(1).version == 1
+    assert_replicas_agree(router, 'student0')
+
+
+def test_drop_promotion_replicated(router):
+    router.route('register_in_section', ('student0', 'Algorithms', 1), {})
+    router.route('register_in_section', ('student1', 'Algorithms', 1), {})
+    router.route('drop_course', ('student0', 'Algorithms'), {})
+    for shard in router._shards:
+        section = shard.facade.get_course('Algorithms').get_section(1)
+        assert list(section.registered_students) == ['student1']
+        assert not section.waitlist
+    assert_replicas_agree(router, 'student0')
+    assert_replicas_agree(router, 'student1')
+
+
+def test_grade_replicated(router):
+    router.route('register_in_section', ('student0', 'Databases', 1), {})
+    router.route('add_grade', ('instructor', 'student0', 'Databases', 95),
+                 {})
+    for shard in router._shards:
+        assert shard.facade.get_course('Databases').get_section(1)\
+            .get_grades('student0') == [95]
+
+
+def test_cart_across_shards(router):
+    cart = [(course[0], 1, 1 if course[3] else None) for course in COURSES]
+    result = router.route('register_cart', ('student0', cart), {})
+    assert result.startswith('Student registered in all courses in cart:')
+    assert_replicas_agree(router, 'student0')
+    assert router.route('drop_all_courses', ('student0',), {}) == \
+        'Student has successfully dropped all courses from schedule'
+    for shard in router._shards:
+        assert not shard.facade.get_student('student0').get_schedule()\
+            .sections
+
+
+def test_cart_denied_by_owner_released(router, monkeypatch):
+    # The seat in Algorithms is taken once the cart has been validated, so
+    # Graphics is registered by its owner before the other shard denies
+    # Databases and Algorithms
+    cart = [('Graphics', 1, None), ('Databases', 1, None),
+            ('Algorithms', 1, None)]
+    owner = get_owner(router, 'Algorithms')
+    validate_cart = ShardWorker.validate_cart
+
+    def validate_then_take_seat(worker, username, cart_items):
+        denial = validate_cart(worker, username, cart_items)
+        router.route('register_in_section', ('student1', 'Algorithms', 1),
+                     {})
+        return denial
+
+    monkeypatch.setattr(ShardWorker, 'validate_cart', validate_then_take_seat)
+    result = router.route('register_cart', ('student0', cart), {})
+    assert result.startswith('Cart not registered.')
+    assert owner.facade.get_course('Algorithms').get_section(1)\
+        .registered_students.keys() == {'student1'}
+    for shard in router._shards:
+        assert not shard.facade.get_student('student0').get_schedule()\
+            .sections
+    assert_replicas_agree(router, 'student0')
+
+
+def test_drop_all_stops_at_failed_drop(router, monkeypatch):
+    for course_name in ('Algorithms', 'Databases', 'Graphics'):
+        router.route('register_in_section', ('student0', course_name, 1), {})
+    owner = get_owner(router, 'Graphics').facade
+
+    def fail_drop(username, course_name):
+        raise RuntimeError('Shard registration-shard-0 stopped')
+
+    monkeypatch.setattr(owner, 'drop_course', fail_drop)
+    result = router.route('drop_all_courses', ('student0',), {})
+    # Courses are dropped in order of name
+    assert result == 'Could not drop Graphics: Shard ' \
+                     'registration-shard-0 stopped\nCourses dropped: ' \
+                     'Algorithms, Databases'
+    for shard in router._shards:
+        schedule = shard.facade.get_student('student0').get_schedule()
+        assert list(schedule.sections) == ['Graphics']
+
+
+def test_cart_released_when_owner_stops(router, monkeypatch):
+    # Graphics is registered by its owner before the owner of Databases and
+    # Algorithms stops
+    cart = [('Graphics', 1, None), ('Databases', 1, None),
+            ('Algorithms', 1, None)]
+    owner = get_owner(router, 'Algorithms').facade
+
+    def stop(username, cart_items):
+        raise RuntimeError('Shard registration-shard-1 stopped')
+
+    monkeypatch.setattr(owner, 'register_cart', stop)
+    result = router.route('register_cart', ('student0', cart), {})
+    assert result == 'Cart not registered. Shard registration-shard-1 stopped'
+    for shard in router._shards:
+        assert not shard.facade.get_student('student0').get_schedule()\
+            .sections
+        assert not shard.facade.get_course('Graphics').get_section(1)\
+            .registered_students
+    assert_replicas_agree(router, 'student0')
+
+    # Parts which could not be released are reported
+    release_cart = ShardWorker.release_cart
+
+    def release_then_stop(worker, username, cart_items):
+        release_cart(worker, username, cart_items)
+        raise RuntimeError('Shard registration-shard-0 stopped')
+
+    monkeypatch.setattr(ShardWorker, 'release_cart', release_then_stop)
+    assert router.route('register_cart', ('student0', cart), {}) == \
+        'Cart not registered. Shard registration-shard-1 stopped\n' \
+        'Could not release Graphics: Shard registration-shard-0 stopped'
@@ -0,0 +1,94 @@
+"""
+Tests of warm restarts from a binary snapshot of the libraries (see
+LibrarySnapshot): the system is rebuilt from an up to date snapshot without
+querying rosters, and from the database (rewriting the snapshot) when the
+database fingerprint has changed
+"""
+import pytest
+from conftest import build_data
+from snapshot import LibrarySnapshot
+
+FINGERPRINT = [17, 17, 12345]
+
+
+@pytest.fixture
+def data():
+    data = build_data(3, [
+        ('Algorithms', False, [(1, '10:30AM', 'Monday')], []),
+        ('Networks', True, [(30, '8:30AM', 'Monday')],
+         [(30, '8:30AM', 'Wednesday'), (30, '1:30PM', 'Friday')])
+    ])
+    data['fingerprint'] = FINGERPRINT
+    return data
+
+
+@pytest.fixture
+def saved(make_facade, data, tmp_path):
+    # Snapshot of a system with registrations, statuses, grades and a
+    # waitlist, and the student views it is expected to restore
+    facade = make_facade(data)
+    facade.register_in_section('student0', 'Algorithms', 1)
+    facade.register_in_section('student1', 'Algorithms', 1)  # waitlisted
+    facade.register_in_section('student1', 'Networks', 1)
+    facade.register_in_lab('student1', 'Networks', 2)
+    facade.modify_approval_required('instructor', 'Networks', True)
+    facade.register_in_section('student2', 'Networks', 1)  # tentative
+    facade.add_grade('instructor', 'student0', 'Algorithms', 91)
+    facade.add_grade('instructor', 'student0', 'Algorithms', 87.5)
+    path = str(tmp_path / 'libraries.snapshot')
+    LibrarySnapshot(path).save(FINGERPRINT, facade.student_library,
+                               facade.instructor_library,
+                               facade.course_library)
+    return path, get_views(facade)
+
+
+def get_views(facade):
+    algorithms = facade.get_course('Algorithms').get_section(1)
+    return ([(facade.view_schedule(username), facade.view_grades(username))
+             for username in ('student0', 'student1', 'student2')],
+            # Students of a course are listed in no particular order
+            sorted(facade.view_course_students('instructor', 'Networks')
+                   .split('\n')),
+            [student.username for student, _ in
+             algorithms.waitlist.get_all()], algorithms.version,
+            facade.get_course('Networks').approval_required)
+
+
+@pytest.mark.parametrize('use_mmap', [False, True])
+def test_restored_from_snapshot(make_facade, serve_data, data, saved,
+                                use_mmap):
+    path, views = saved
+    facade = make_facade(None)
+    queries = serve_data(data)
+    report = facade.retrieve_data(snapshot_path=path, use_mmap=use_mmap)
+    assert report.startswith('Data retrieved from snapshot using 2 queries')
+    assert sorted(queries) == ['get_fingerprint', 'get_last_change_id']
+    assert get_views(facade) == views
+
+
+def test_stale_snapshot_reloaded_and_rewritten(make_facade, serve_data,
+                                               data, saved):
+    path, _ = saved
+    data['fingerprint'] = FINGERPRINT[:-1] + [54321]  # a row was edited
+    facade = make_facade(None)
+    serve_data(data)
+    assert facade.retrieve_data(snapshot_path=path).startswith(
+        'Data retrieved from database')
+    # Nothing registered in the database rows
+    assert not facade.get_course('Algorithms').get_section(1)\
+        .registered_students
+    assert LibrarySnapshot(path).load(FINGERPRINT) is None
+    assert LibrarySnapshot(path).load(data['fingerprint'])['get_students'] \
+        == data['get_students']
+
+
+def test_unreadable_snapshot_ignored(saved, tmp_path):
+    path, _ = saved
+    assert LibrarySnapshot(str(tmp_path / 'missing')).load(FINGERPRINT) is \
+        None
+    with open(path, 'r+b') as f:
+        f.write(b'XXSNAP')  # not a snapshot
+    assert LibrarySnapshot(path).load(FINGERPRINT) is None
+    with open(path, 'wb') as f:
+        f.write(b'CRSNAP')  # truncated
+    assert LibrarySnapshot(path).load(FINGERPRINT) is None
@@ -0,0 +1,102 @@
+"""
+Tests of syncing changes made by other processes from the ChangeLog table
+(IncrementalRetrieve), with the SQL database replaced by in-memory rows
+"""
+from contextlib import contextmanager
+import pytest
+import db_management
+from db_management import IncrementalRetrieve
+
+
+class FakeRetrieve:
+    """Stands in for SQLRetrieve, serving the committed ChangeLog entries and
+    section registrations of a FakeDatabase"""
+
+    def __init__(self, database):
+        self._database = database
+
+    def get_changes(self, after_change_id):
+        return sorted((c for c in self._database.changes if
+                       c['change_id'] > after_change_id),
+                      key=lambda c: c['change_id'])
+
+    def get_versions(self, table_name, ids):
+        return {registerable_id: 1 for registerable_id in ids}
+
+    def get_all_section_students(self, section_ids=None):
+        return [st for st in self._database.section_students if
+                st['section_id'] in section_ids]
+
+
+class FakeDatabase:
+
+    def __init__(self):
+        self.changes = []
+        self.section_students = []
+
+    def commit_registration(self, change_id, section_id, username):
+        # Commit a student's registration in a section with its ChangeLog
+        # entry
+        self.section_students.append({'section_id': section_id,
+                                      'student_username': username,
+                                      'status': 'Approved'})
+        self.changes.append({'change_id': change_id,
+                             'table_name': 'SectionStudent',
+                             'row_id': 0, 'parent_id': section_id,
+                             'student_username': username})
+
+
+@pytest.fixture
+def database(facade, monkeypatch):
+    database = FakeDatabase()
+
+    @contextmanager
+    def borrow_connection():
+        yield object()
+
+    monkeypatch.setattr(facade.sql_conn, 'borrow_connection',
+                        borrow_connection)
+    monkeypatch.setattr(db_management, 'SQLRetrieve',
+                        lambda conn: FakeRetrieve(database))
+    return database
+
+
+def is_registered(facade, username, course_name):
+    section = facade.get_course(course_name).get_section(1)
+    return section.is_student_in_registerable(username) and \
+        facade.get_student(username).get_schedule().get_section(
+            course_name) is section
+
+
+def test_sync_applies_changes_in_order(facade, database):
+    database.commit_registration(1, 1, 'student0')
+    database.commit_registration(2, 3, 'student1')
+    assert facade.refresh_data() == '2 changes synchronized from database'
+    assert is_registered(facade, 'student0', 'Algorithms')
+    assert is_registered(facade, 'student1', 'Databases')
+    assert facade.incremental_retrieve.last_change_id == 2
+    assert facade.refresh_data() == '0 changes synchronized from database'
+
+
+def test_sync_applies_change_committed_after_later_change(facade, database):
+    # The transaction of change 1 commits after change 2 has been synced
+    database.commit_registration(2, 3, 'student1')
+    assert facade.refresh_data() == '1 changes synchronized from database'
+    assert facade.incremental_retrieve.last_change_id == 0
+
+    database.commit_registration(1, 1, 'student0')
+    assert facade.refresh_data() == '1 changes synchronized from database'
+    assert is_registered(facade, 'student0', 'Algorithms')
+    assert is_registered(facade, 'student1', 'Databases')
+    assert facade.incremental_retrieve.last_change_id == 2
+
+
+def test_sync_gives_up_on_missing_change(facade, database, monkeypatch):
+    # Change 1 is never committed (its transaction rolled back)
+    monkeypatch.setattr(IncrementalRetrieve, 'GAP_TIMEOUT', 0)
+    database.commit_registration(2, 3, 'student1')
+    assert facade.refresh_data() == '1 changes synchronized from database'
+    assert facade.incremental_retrieve.last_change_id == 2
+    database.commit_registration(3, 1, 'student0')
+    assert facade.refresh_data() == '1 changes synchronized from database'
+    assert is_registered(facade, 'student0', 'Algorithms')
@@ -0,0 +1,73 @@
+"""
+Tests of the batch transcript and GPA export (see TranscriptReport): the
+rows written to each CSV file, letter grades and academic standing
+"""
+import csv
+import pytest
+from conftest import build_data
+from transcripts import get_letter_grade, get_standing
+
+
+@pytest.fixture
+def graded_facade(make_facade):
+    facade = make_facade(build_data(3, [
+        ('Algorithms', False, [(30, '10:30AM', 'Monday')], []),
+        ('Databases', False, [(30, '1:30PM', 'Tuesday')], [])
+    ]))
+    for username, course_name, grades in (
+            ('student1', 'Algorithms', [59.5]),
+            ('student0', 'Databases', [80]),
+            ('student0', 'Algorithms', [95, 90])):
+        facade.register_in_section(username, course_name, 1)
+        for grade in grades:
+            facade.add_grade('instructor', username, course_name, grade)
+    facade.register_in_section('student2', 'Databases', 1)
+    return facade
+
+
+def read_rows(path):
+    with open(path, newline='') as f:
+        return list(csv.reader(f))
+
+
+def test_export(graded_facade, tmp_path):
+    transcript_path = str(tmp_path / 'transcripts.csv')
+    gpa_path = str(tmp_path / 'gpa.csv')
+    assert graded_facade.export_transcripts(transcript_path, gpa_path) == \
+        f'3 transcript rows written to {transcript_path}, 3 student GPAs ' \
+        f'written to {gpa_path}'
+    # Grouped by section, in order of first grade within each section
+    assert read_rows(transcript_path) == [
+        ['username', 'course_name', 'section_number', 'grade_count',
+         'average', 'letter_grade', 'grade_points'],
+        ['student1', 'Algorithms', '1', '1', '59.5', 'F', '0.0'],
+        ['student0', 'Algorithms', '1', '2', '92.5', 'A-', '3.7'],
+        ['student0', 'Databases', '1', '1', '80.0', 'B-', '2.7']]
+    # Every student, including those without grades
+    assert read_rows(gpa_path) == [
+        ['username', 'first_name', 'last_name', 'program', 'courses_graded',
+         'average', 'gpa', 'standing'],
+        ['student0', 'Student', '0', 'MPCS', '2', '86.25', '3.2',
+         'Good Standing'],
+        ['student1', 'Student', '1', 'MPCS', '1', '59.5', '0.0',
+         'Academic Probation'],
+        ['student2', 'Student', '2', 'MPCS', '0', '', '', 'No Grades']]
+
+
+def test_empty_export(make_facade, tmp_path):
+    facade = make_facade(build_data(0, []))
+    assert facade.export_transcripts(str(tmp_path / 'transcripts.csv'),
+                                     str(tmp_path / 'gpa.csv')).startswith(
+        '0 transcript rows written')
+    assert len(read_rows(tmp_path / 'transcripts.csv')) == 1
+
+
+def test_letter_grades_and_standing():
+    assert get_letter_grade(93) == ('A', 4.0)
+    assert get_letter_grade(92.99) == ('A-', 3.7)
+    assert get_letter_grade(60) == ('D', 1.0)
+    assert get_letter_grade(59.9) == ('F', 0.0)
+    assert get_standing(3.5) == "Dean's List"
+    assert get_standing(2.0) == 'Good Standing'
+    assert get_standing(1.99) == 'Academic Probation'
+    assert get_standing(None) == 'No Grades'
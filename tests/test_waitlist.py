@@ -0,0 +1,57 @@
+"""
+Tests of section/lab waitlists: promotion order by priority then order of
+joining, positions and promotion when seats are freed
+"""
+from courses import Waitlist
+
+
+def test_promoted_by_priority_then_order_joined(facade):
+    students = [facade.get_student(f'student{str(i)}') for i in range(5)]
+    waitlist = Waitlist()
+    for student, priority in zip(students, (0, 1, 0, 1, 0)):
+        assert waitlist.add(student, priority)
+    assert not waitlist.add(students[0])
+    assert [waitlist.get_position(s.username) for s in students] == \
+        [3, 1, 4, 2, 5]
+    assert waitlist.get_all() == [(students[1], 1), (students[3], 1),
+                                  (students[0], 0), (students[2], 0),
+                                  (students[4], 0)]
+
+    waitlist.remove('student3')
+    assert 'student3' not in waitlist
+    assert waitlist.get_position('student3') is None
+    assert waitlist.get_position('student0') == 2
+    assert [waitlist.pop() for _ in range(4)] == \
+        [students[1], students[0], students[2], students[4]]
+    assert waitlist.pop() is None
+    assert not waitlist
+
+
+def test_positions_after_many_removals(facade):
+    students = list(facade.student_library.students.values())
+    waitlist = Waitlist()
+    for student in students:
+        waitlist.add(student)
+    for student in students[:-1]:
+        waitlist.remove(student.username)
+        waitlist.add(student)  # rejoins at the back
+    assert waitlist.get_position(students[-1].username) == 1
+    assert [waitlist.get_position(s.username) for s in students[:-1]] == \
+        list(range(2, len(students) + 1))
+    assert waitlist.peek() is students[-1]
+
+
+def test_drops_promote_in_order_joined(facade):
+    facade.register_in_section('student0', 'Algorithms', 1)
+    for i in range(1, 4):
+        assert f'added to the waitlist at position {str(i)}' in \
+            facade.register_in_section(f'student{str(i)}', 'Algorithms', 1)
+    section = facade.get_course('Algorithms').get_section(1)
+
+    facade.drop_course('student0', 'Algorithms')
+    assert list(section.registered_students) == ['student1']
+    assert section.waitlist.get_position('student2') == 1
+    assert section.waitlist.get_position('student3') == 2
+    facade.drop_course('student1', 'Algorithms')
+    assert list(section.registered_students) == ['student2']
+    assert section.waitlist.get_position('student3') == 1
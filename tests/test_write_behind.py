@@ -0,0 +1,129 @@
+"""
+Tests of the write-behind queue (see WriteBehindQueue): operations queued
+together are committed in one transaction with consecutive writes of the
+same statement combined, and when a batch fails each operation is retried in
+its own transaction so that only the failing operation is lost. The SQL
+connection is a fake recording the statements committed.
+"""
+from contextlib import contextmanager
+import pytest
+from db_management import WriteBehindQueue
+
+STATEMENT = 'INSERT INTO Grade (StudentID, SectionID, Grade) VALUES ' \
+            '(%s, %s, %s)'
+MULTI_ROW = ('INSERT INTO Grade (StudentID, SectionID, Grade) VALUES ',
+             '(%s, %s, %s)', '')
+
+
+class FakeConnection:
+    """Connection (and cursor) whose transactions record the statements
+    executed. Statements with a negative grade fail"""
+
+    def __init__(self):
+        self.pending = []
+        self.committed = []  # list of transactions: list of (statement,
+        # params)
+
+    def cursor(self):
+        return self
+
+    def execute(self, statement, params):
+        if any(isinstance(p, int) and p < 0 for p in params):
+            raise ValueError('Grade out of range')
+        self.pending.append((statement, params))
+
+    def commit(self):
+        self.committed.append(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class FakeSQLConnection:
+
+    def __init__(self):
+        self.conn = FakeConnection()
+        self.available = True
+
+    @contextmanager
+    def borrow_connection(self):
+        yield self.conn if self.available else None
+
+    def get_prepared_cursor(self, conn, statement):
+        return conn
+
+
+@pytest.fixture
+def sql_conn():
+    return FakeSQLConnection()
+
+
+@pytest.fixture
+def queue(sql_conn):
+    # Lingers long enough that operations queued by a test form one batch,
+    # committed when the test flushes
+    return WriteBehindQueue(sql_conn, linger_time=5)
+
+
+def grade(student_id, value):
+    return [(STATEMENT, (student_id, 1, value), MULTI_ROW)]
+
+
+def test_batch_combined(queue, sql_conn):
+    for student_id in (1, 2, 3):
+        queue.enqueue(grade(student_id, 90))
+    queue.flush()
+    assert sql_conn.conn.committed == [[
+        (MULTI_ROW[0] + ', '.join([MULTI_ROW[1]] * 3),
+         (1, 1, 90, 2, 1, 90, 3, 1, 90))]]
+    assert (queue.batch_count, queue.operation_count,
+            queue.statement_count, queue.failed_count) == (1, 3, 1, 0)
+
+
+def test_failed_batch_retried_per_operation(queue, sql_conn, capsys):
+    queue.enqueue(grade(1, 90))
+    queue.enqueue(grade(2, -1))
+    queue.enqueue(grade(3, 85))
+    queue.flush()
+    # The combined statement is rolled back, and each operation but the
+    # failing one committed on its own
+    assert sql_conn.conn.committed == [[(STATEMENT, (1, 1, 90))],
+                                       [(STATEMENT, (3, 1, 85))]]
+    assert (queue.batch_count, queue.operation_count,
+            queue.statement_count, queue.failed_count) == (2, 2, 2, 1)
+    assert 'Queued operation not written to SQL database (Grade out of ' \
+           f'range): {STATEMENT} (2, 1, -1)' in capsys.readouterr().out
+
+
+def test_batch_failed_without_connection(queue, sql_conn, capsys):
+    sql_conn.available = False
+    queue.enqueue(grade(1, 90))
+    queue.enqueue(grade(2, 85))
+    queue.flush()
+    assert queue.failed_count == 2
+    assert not sql_conn.conn.committed
+    assert capsys.readouterr().out.count('(no connection to SQL database)') \
+        == 2
+
+
+def test_flush_released_after_error(queue, sql_conn, monkeypatch):
+    # An error outside the retried writes still releases the flush and
+    # leaves the queue committing later operations
+    def fail_borrow():
+        raise RuntimeError('Pool closed')
+
+    monkeypatch.setattr(sql_conn, 'borrow_connection', fail_borrow)
+    queue.enqueue(grade(1, 90))
+    queue.flush()
+    monkeypatch.undo()
+    queue.enqueue(grade(2, 85))
+    queue.flush()
+    assert sql_conn.conn.committed == [[(STATEMENT, (2, 1, 85))]]
+    queue.flush()  # nothing pending